@@ -1,50 +1,69 @@
-
 ###
 #  Autor : Jairo Monassa
 import os
-import json
+import asyncio
 from dotenv import load_dotenv
 import openai
+from rate_limiter import get_rate_limiter
+from resilience import Endpoint, ResilientClient, ResilientCompletions
+from transport import async_openai_client
+from planning_session import PlanningSession, TextDelta, ToolCallStarted, ToolResult, Confirmation, TurnDone
+from study_plan_stream import PlanWeek, BlockError
+from plan_repository import get_repository
+from structured_plan import CREATE_TOOL_NAME, RESPONSE_FORMAT, parse_plan, plan_messages, render_plan
 # import azure.identity # Removido pois não está sendo usado
 
 load_dotenv(override=True)
-OUTPUT_FOLDER = "study_plans"
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
-# Inicializa gitmodel
-client = None
-MODEL_NAME = None
-
-api_key = os.getenv("GITHUB_TOKEN")
-if not api_key:
-    raise ValueError("Variável de ambiente GITHUB_TOKEN não definida.")
-client = openai.OpenAI(
-    base_url="https://models.inference.ai.azure.com",
-    api_key=api_key,
-)
+
 MODEL_NAME = os.getenv("GITHUB_MODEL", "gpt-4o")
-print(f"Usando GitHub Models com modelo: {MODEL_NAME}")
+# O mesmo modelo no outro endpoint do GitHub Models, usado quando o primeiro falha ou demora
+FALLBACK_MODEL = os.getenv("GITHUB_FALLBACK_MODEL", f"openai/{MODEL_NAME}")
+
 
-# --- Definição da Ferramenta (Função Python) --- (Sem alterações)
-def save_study_plan_to_json(study_plan: dict) -> str:
+def create_client():
+    """Cliente assíncrono no pool de conexões compartilhado (keep-alive entre chamadas).
+
+    As chamadas passam por ``resilience``: novas tentativas com backoff, failover
+    para ``models.github.ai`` e, com MODEL_HEDGE=on, requisições redundantes.
+    Criado sob demanda para que o módulo possa ser importado (ferramenta, schema e
+    prompt) pelos apps Chainlit sem efeitos colaterais.
     """
-    Salva um plano de estudos estruturado (dicionário) em um arquivo JSON
-    com nome fixo 'plano.json'.
+    api_key = os.getenv("GITHUB_TOKEN")
+    if not api_key:
+        raise ValueError("Variável de ambiente GITHUB_TOKEN não definida.")
+    endpoints = [
+        Endpoint("models.inference.ai.azure.com", async_openai_client(
+            base_url="https://models.inference.ai.azure.com", api_key=api_key, max_retries=0,
+        ), MODEL_NAME),
+        Endpoint("models.github.ai", async_openai_client(
+            base_url="https://models.github.ai/inference", api_key=api_key, max_retries=0,
+        ), FALLBACK_MODEL),
+    ]
+    return ResilientClient(ResilientCompletions(endpoints, limiter=get_rate_limiter()))
+
+# --- Definição da Ferramenta (Função Python) ---
+STUDENT_ID = os.getenv("STUDENT_ID", "local")
+
+
+def save_study_plan_to_json(study_plan: dict, student_id: str = None) -> str:
+    """
+    Salva uma nova versão do plano de estudos do estudante no repositório de planos
+    (escrita atômica, com índice para carregar a versão mais recente).
 
     Args:
         study_plan: O dicionário Python contendo o plano de estudos estruturado.
+        student_id: Identificador do estudante (padrão: variável STUDENT_ID).
 
     Returns:
         Uma string indicando sucesso ou falha.
     """
     try:
-        filename = "planning2.json"
-        filepath = os.path.join(OUTPUT_FOLDER, filename)
-        print(f"dict: {study_plan}")
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(study_plan, f, indent=2, ensure_ascii=False)
-        print(f"\n[INFO] Plano de estudos salvo com sucesso em: {filepath}")
-        return f"Plano de estudos salvo com sucesso em {filepath}"
+        # O modelo às vezes envia os argumentos inteiros ({"study_plan": {...}})
+        if set(study_plan) == {"study_plan"} and isinstance(study_plan["study_plan"], dict):
+            study_plan = study_plan["study_plan"]
+        record = get_repository().save(student_id or STUDENT_ID, study_plan)
+        print(f"\n[INFO] Plano de estudos salvo com sucesso em: {record.path} (versão {record.version})")
+        return f"Plano de estudos salvo com sucesso em {record.path}"
     except Exception as e:
         print(f"\n[ERRO] Erro ao salvar o arquivo JSON: {e}")
         return f"Erro ao salvar o arquivo: {e}"
@@ -55,7 +74,7 @@ tools = [
         "type": "function",
         "function": {
             "name": "save_study_plan_to_json",
-            "description": "Salva o plano de estudos estruturado gerado em um arquivo JSON local chamado 'plano.json'. Deve ser chamada APENAS DEPOIS de coletar as informações do usuário e gerar o plano.",
+            "description": "Salva o plano de estudos estruturado gerado como uma nova versão do plano do estudante. Deve ser chamada APENAS DEPOIS de coletar as informações do usuário e gerar o plano.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -76,11 +95,89 @@ tools = [
     }
 ]
 
-# --- Função Principal --- MODIFICADA (Loop de Conversa e System Prompt) ---
-def main():
-    subject = input("Olá! Sou seu assistente de planejamento de estudos. Qual assunto você gostaria de planejar? ")
 
-    messages = [
+# --- Geração estruturada (PLAN_GENERATION=structured): o plano é gerado uma única vez ---
+structured_tools = [
+    {
+        "type": "function",
+        "function": {
+            "name": CREATE_TOOL_NAME,
+            "description": "Gera o plano de estudos estruturado, salva como nova versão do plano do estudante e o mostra ao usuário. Deve ser chamada APENAS DEPOIS de coletar as informações do usuário.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "brief": {
+                        "type": "string",
+                        "description": (
+                            "Resumo do que o plano deve atender: assunto, disponibilidade semanal, prazo/milestone, "
+                            "nível, metas e ajustes pedidos pelo usuário."
+                        ),
+                    },
+                },
+                "required": ["brief"],
+            },
+        },
+    }
+]
+
+
+async def create_study_plan(client, model: str, conversation: list, arguments: dict) -> str:
+    """Gera o plano com saída estruturada (uma única chamada), salva e devolve a prévia renderizada localmente."""
+    response = await client.chat.completions.create(
+        model=model,
+        messages=plan_messages(arguments.get("brief", ""), conversation, language="pt"),
+        response_format=RESPONSE_FORMAT,
+    )
+    try:
+        plan = parse_plan(response.choices[0].message.content or "", language="pt")
+    except ValueError as e:
+        return f"Erro: {e}"
+    result = await asyncio.to_thread(save_study_plan_to_json, plan)
+    if result.startswith("Erro"):
+        return result
+    return f"{render_plan(plan)}\n\n{result}."
+
+
+def structured_confirmation(result: str):
+    """Prévia do plano e confirmação, sem nova chamada ao modelo (None se a geração ou o salvamento falhou)."""
+    if result.startswith("Erro"):
+        return None
+    return (
+        f"Pronto! Seu plano de estudos foi criado com base nas informações fornecidas:\n\n{result}\n\n"
+        "Gostaria de adicionar ou remover algum tópico, ou ajustar a carga horária?"
+    )
+
+
+def build_messages(subject: str, structured: bool = False) -> list:
+    """Prompt do sistema e primeira mensagem do usuário para o assunto escolhido."""
+    if structured:
+        generation = (
+            "**ETAPA 2: Geração do Plano**\n"
+            "SOMENTE APÓS coletar informações suficientes sobre disponibilidade e metas, chame a ferramenta "
+            f"'{CREATE_TOOL_NAME}' com um resumo dessas informações. NÃO escreva o plano você mesmo: a ferramenta "
+            "gera o plano, salva e o mostra ao usuário.\n"
+            "**ETAPA 3: Ajustes**\n"
+            "Se o usuário quiser adicionar ou remover tópicos ou ajustar a carga horária, chame a ferramenta "
+            "de novo com o resumo atualizado."
+        )
+        return [
+            {
+                "role": "system",
+                "content": (
+                    "Você é um assistente especialista em planejamento de estudos. Seu objetivo é criar um plano de estudos personalizado e estruturado. "
+                    f"O assunto principal é '{subject}'.\n"
+                    "**ETAPA 1: Coleta de Informações**\n"
+                    "Antes de criar o plano, você DEVE conversar com o usuário para entender:\n"
+                    "1. Disponibilidade de estudo: Pergunte quantas horas por semana ou quais dias/horários o usuário pode dedicar aos estudos.\n"
+                    "2. Milestone: Pergunte se tem algum prazo para estudo como um exame ou certificado.\n"
+                    "3. Crie metas de acordo com os tópicos que vai apreender "
+                    "Faça perguntas claras e aguarde as respostas do usuário. Você pode fazer perguntas de acompanhamento se necessário.\n"
+                    + generation
+                ),
+            },
+            {"role": "user", "content": f"Gostaria de um plano de estudos para {subject}."},
+        ]
+    return [
         {
             "role": "system",
             # --- PROMPT DO SISTEMA MODIFICADO ---
@@ -107,7 +204,7 @@ def main():
                 "}\n"
                 "Adapte a quantidade de semanas e a distribuição de tópicos com base na disponibilidade e metas informadas pelo usuário.\n"
                 "**ETAPA 3: Salvamento e Confirmação**\n"
-                "Após gerar o objeto JSON do plano, você DEVE OBRIGATORIAMENTE usar a ferramenta 'save_study_plan_to_json' passando o json como argumento para salvar este objeto no arquivo 'plano.json'.\n"
+                "Após gerar o objeto JSON do plano, você DEVE OBRIGATORIAMENTE usar a ferramenta 'save_study_plan_to_json' passando o json como argumento para salvar este objeto.\n"
                 "Finalmente, informe ao usuário que o plano foi criado com base nas informações fornecidas e salvo com sucesso."
             ),
         },
@@ -118,122 +215,80 @@ def main():
         },
     ]
 
+
+def save_confirmation(result: str):
+    """Confirmação final gerada localmente, sem nova chamada ao modelo (None se o salvamento falhou)."""
+    if result.startswith("Erro"):
+        return None
+    return f"Pronto! Seu plano de estudos foi criado com base nas informações fornecidas. {result}."
+
+
+# --- Função Principal --- Loop de conversa assíncrono e com streaming ---
+async def run():
+    subject = (await asyncio.to_thread(
+        input, "Olá! Sou seu assistente de planejamento de estudos. Qual assunto você gostaria de planejar? "
+    )).strip()
+    print(f"Usando GitHub Models com modelo: {MODEL_NAME}")
+    session = PlanningSession.for_subject(create_client(), MODEL_NAME, subject)
+
     print(f"\nOk, vamos planejar seus estudos para {subject}.")
-    plan_saved = False # Flag para controlar se o plano já foi salvo
+    user_input = None  # A primeira mensagem do usuário já está em build_messages()
 
     while True:
         try:
-            # --- Chamada à API OpenAI ---
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=messages,
-                tools=tools,
-                tool_choice="auto", # Deixa o modelo decidir quando chamar a ferramenta
-            )
-
-            response_message = response.choices[0].message
-            messages.append(response_message) # Adiciona a resposta do assistente ao histórico
-
-            # --- Processamento da Resposta ---
-
-            # 1. Verificar se o modelo quer chamar a ferramenta
-            tool_calls = response_message.tool_calls
-            if tool_calls:
-                print("\n[INFO] O assistente está tentando salvar o plano...")
-                available_functions = {
-                    "save_study_plan_to_json": save_study_plan_to_json,
-                }
-
-                for tool_call in tool_calls:
-                    function_name = tool_call.function.name
-                    function_to_call = available_functions.get(function_name)
-
-                    if function_name == "save_study_plan_to_json" and function_to_call:
-                        try:
-                            print(f"[DEBUG] Arguments : {tool_call.function.arguments}")
-                            function_args = json.loads(tool_call.function.arguments)
-                      
-                            print(f"[DEBUG] Parsed arguments dict: {function_args}")
-
-                            # Chama a função Python real
-                            function_response = function_to_call(
-                                study_plan=function_args   ## [DEBUG] passar todo o argumento, pois não tem a chave .get("study_plan")
-                            )
-
-                            # Adiciona o resultado da ferramenta ao histórico
-                            messages.append(
-                                {
-                                    "tool_call_id": tool_call.id,
-                                    "role": "tool",
-                                    "name": function_name,
-                                    "content": function_response,
-                                }
-                            )
-                            plan_saved = True # Marca que o plano foi salvo
-
-                        except json.JSONDecodeError:
-                            error_msg = f"Erro: Argumentos inválidos (não JSON) para {function_name}."
-                            print(f"\n[ERRO] {error_msg}")
-                            messages.append({
-                                "tool_call_id": tool_call.id, "role": "tool", "name": function_name, "content": error_msg,
-                            })
-                        except Exception as e:
-                             error_msg = f"Erro ao executar a função {function_name}: {e}"
-                             print(f"\n[ERRO] {error_msg}")
-                             messages.append({
-                                 "tool_call_id": tool_call.id, "role": "tool", "name": function_name, "content": error_msg,
-                             })
-                    else:
-                        # Função desconhecida ou não é a de salvar
-                        print(f"\n[AVISO] Modelo tentou chamar função desconhecida: {function_name}")
-                        messages.append({
-                            "tool_call_id": tool_call.id, "role": "tool", "name": function_name,
-                            "content": f"Erro: Função '{function_name}' não encontrada.",
-                        })
-
-
-                if plan_saved:
-                    print("[INFO] Obtendo confirmação final do assistente...")
-                    final_response = client.chat.completions.create(
-                        model=MODEL_NAME,
-                        messages=messages # Envia histórico incluindo resultado da ferramenta
-                    )
-                    final_message = final_response.choices[0].message
-                    messages.append(final_message) # Adiciona confirmação final ao histórico
-                    print(f"\nAssistente: {final_message.content}")
-                    print("\n[INFO] Processo concluído.")
-                    break # Termina o loop principal
-
-            # 2. Se não chamou ferramenta, apenas exibe a mensagem (provavelmente uma pergunta)
-            else:
-                assistant_message_content = response_message.content
-                if assistant_message_content:
-                    print(f"\nAssistente: {assistant_message_content}")
-                else:
-                    # Pode acontecer se o modelo só decidiu chamar a ferramenta mas falhou antes
+            print("\nAssistente: ", end="", flush=True)
+            async for event in session.send(user_input):
+                if isinstance(event, TextDelta):
+                    # Tokens exibidos assim que chegam
+                    print(event.text, end="", flush=True)
+                elif isinstance(event, ToolCallStarted):
+                    print("\n[INFO] O assistente está tentando salvar o plano...")
+                elif isinstance(event, PlanWeek):
+                    # Semanas exibidas assim que são validadas
+                    print(f"[INFO] {event.week}: {', '.join(b.get('topico', b.get('topic', '')) for b in event.days.values())}")
+                elif isinstance(event, BlockError):
+                    print(f"[AVISO] Bloco inválido {event.week}/{event.day or '*'} ({event.reason}), pedindo correção...")
+                elif isinstance(event, ToolResult) and event.content.startswith("Erro"):
+                    print(f"\n[ERRO] {event.content}")
+                elif isinstance(event, Confirmation):
+                    print(f"\nAssistente: {event.text}")
+                elif isinstance(event, TurnDone) and not event.text:
                     print("\n[INFO] O assistente não forneceu uma resposta textual.")
-                    # Poderia adicionar uma lógica para tentar novamente ou sair
+            print()
 
-                # --- Coleta a próxima entrada do usuário ---
-                user_input = input("Você: ").strip()
-                if user_input.lower() == "sair":
-                    print("\nEncerrando a conversa.")
-                    break
-                if not user_input:
-                    continue
+            if session.plan_saved:
+                print("\n[INFO] Processo concluído.")
+                break
 
-                messages.append({"role": "user", "content": user_input})
+            # --- Coleta a próxima entrada do usuário (sem bloquear o event loop) ---
+            # Entrada vazia pergunta de novo antes de testar "sair"
+            user_input = ""
+            while not user_input:
+                user_input = (await asyncio.to_thread(input, "Você: ")).strip()
+            if user_input.lower() == "sair":
+                print("\nEncerrando a conversa.")
+                break
 
+        except openai.AuthenticationError as e:
+            print(f"\n[ERRO] Erro de Autenticação OpenAI: {e}")
+            print("Verifique sua API Key ou Token.")
+            break
         except openai.APIError as e:
+            # As novas tentativas e o failover já falharam; a conversa continua e o
+            # usuário decide se reenvia a mesma mensagem
             print(f"\n[ERRO] Erro na API OpenAI: {e}")
-            break
-        except openai.AuthenticationError as e:
-             print(f"\n[ERRO] Erro de Autenticação OpenAI: {e}")
-             print("Verifique sua API Key ou Token.")
-             break
+            retry = (await asyncio.to_thread(input, "Tentar novamente? (Enter = sim, 'sair' = encerrar) ")).strip()
+            if retry.lower() == "sair":
+                break
+            user_input = None  # Responde ao histórico atual, que já termina com a mensagem do usuário
         except Exception as e:
             print(f"\n[ERRO] Ocorreu um erro inesperado: {e}")
             break
 
+
+def main():
+    asyncio.run(run())
+
+
 if __name__ == "__main__":
     main()
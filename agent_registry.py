@@ -0,0 +1,432 @@
+# author: Jairo Monassa
+"""Process-wide registry for the tutor agent roster.
+
+The kernel, the chat completion services and the specialist agents hold no
+per-user state (only ``ChatHistoryAgentThread`` does), so they are built once
+per process and shared by every Chainlit session. Sessions only keep a
+reference to the main agent plus their own thread.
+
+Most sessions only ever talk to the main agent and maybe the planner, so a
+specialist is built the first time it is used: the main agent's tools are
+lightweight forwarding functions with the same schema, and the roster builds
+the agent behind one on first lookup. ``warm_up`` pays the remaining one-off
+costs of a first turn at server boot.
+
+Each agent uses the service of its model tier (see ``model_backends``); all
+tier services live on the one shared kernel.
+"""
+
+import logging
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import Annotated, Any, Callable, Iterable, Iterator
+
+import semantic_kernel as sk
+from openai import AsyncOpenAI
+from semantic_kernel.agents import ChatCompletionAgent
+from semantic_kernel.connectors.ai import FunctionChoiceBehavior
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion
+from semantic_kernel.functions import kernel_function
+
+from document_index import DOCUMENT_PLUGIN_NAME, DocumentPlugin
+from model_backends import MEMORY_ROLE, SCREENING_ROLE, ModelConfig, ModelServices
+from quiz_engine import QUIZ_PLUGIN_NAME, QuizPlugin
+from structured_plan import CREATE_TOOL_NAME, structured_mode
+from study_plan_plugin import STUDY_PLAN_PLUGIN_NAME, StructuredStudyPlanPlugin, StudyPlanPlugin
+from tracing import trace_function_invocation
+
+logger = logging.getLogger(__name__)
+
+# --- Constants (Translated Names) ---
+MOTIVATION_AGENT_NAME = "Motivation_Agent"
+PLANNING_AGENT_NAME = "Planning_Agent"
+MAIN_AGENT_NAME = "Main_Tutor_Agent"
+BULLYING_AGENT_NAME = "Bullying_Support_Agent"
+SELF_HARM_PREVENTION_AGENT_NAME = "Self_Harm_Prevention_Agent"
+BURNOUT_AGENT_NAME = "Burnout_Support_Agent"
+SIMULATION_AGENT_NAME = "Quiz_Simulation_Agent"
+CONFLICTS_AGENT_NAME = "Conflict_Resolution_Agent"
+PROGRESS_MONITORING_AGENT_NAME = "Progress_Monitoring_Agent"
+EVALUATION_CONTENT_AGENT_NAME = "Evaluation_Content_Agent"
+
+# --- Agent Instructions ---
+SPECIALIST_INSTRUCTIONS = {
+    MOTIVATION_AGENT_NAME: (
+        "Your role is to check the student's motivation level and suggest a motivational plan. "
+        "You should ask open-ended questions to understand the student's motivation level and suggest a concise motivational plan."
+    ),
+    PLANNING_AGENT_NAME: (
+        "You are an expert study planning assistant. Your goal is to create a personalized and structured study plan.\n"
+        "**STEP 1: Information Gathering**\n"
+        "Before creating the plan, you MUST talk to the user to understand:\n"
+        "1. Study Availability: Ask how many hours per week or which days/times the user can dedicate to studying.\n"
+        "2. Milestone: Ask if there is any deadline for studying, like an exam or certification.\n"
+        "3. Create goals according to the topics to be learned.\n"
+        "Ask clear questions and wait for the user's answers. You can ask follow-up questions if necessary.\n"
+        "4. Show the user the final study plan, including the structure and topics covered.\n"
+        "5. After showing the study plan, ask if the user would like to add or remove any topics or adjust the workload.\n"
+        "**STEP 2: Plan Generation**\n"
+        "ONLY AFTER gathering sufficient information about availability and goals, inform the user that you will generate the plan.\n"
+        "Generate the plan in the following structured JSON format:\n"
+        "{\n"
+        '  "week1": {\n'
+        '    "days1and2": { "topic": "...", "subtopics": ["...", "..."], "goal": "..." },\n'
+        '    "day3": { "topic": "...", "subtopics": ["...", "..."], "goal": "..." }\n'
+        '  },\n'
+        '  "week2": { ... }\n'
+        "}\n"
+        "Adapt the number of weeks and the distribution of topics based on the availability and goals provided by the user.\n"
+        "**STEP 3: Saving and Confirmation**\n"
+        "After generating the JSON object for the plan, you MUST use the 'save_study_plan_to_json' tool, passing the json as an argument, to save this object as the student's current plan.\n"
+        "Finally, inform the user that the plan was created based on the provided information and saved successfully."
+    ),
+    BULLYING_AGENT_NAME: "Your role is to check if the student is a victim of bullying and suggest an action plan.",
+    SELF_HARM_PREVENTION_AGENT_NAME: "Your role is to support students with suicidal thoughts and suggest an action plan.",
+    BURNOUT_AGENT_NAME: (
+        "Your role is to check for student burnout and suggest an action plan. "
+        "Recommend breaks and relaxation techniques to prevent burnout."
+    ),
+    CONFLICTS_AGENT_NAME: (
+        "Your role is to identify if the student has any personal conflict with the teacher "
+        "or a conflict within the family: "
+        "- Give advice to resolve according to the student's situation."
+    ),
+    SIMULATION_AGENT_NAME: (
+        "Your role is to create about 5 questions on the study plan topic. "
+        "Create 3 multiple-choice questions and 2 open-ended questions. "
+        "Register them with the 'create_quiz' tool (with the answer keys) before showing them, "
+        "and show them without the answers. When the student answers, call 'grade_quiz_answers' "
+        "with their reply for the multiple-choice part and evaluate the open-ended answers yourself."
+    ),
+    PROGRESS_MONITORING_AGENT_NAME: (
+        "Your role is to summarize all test simulations and check how many questions were answered correctly and incorrectly. "
+        "Call the 'get_student_progress' tool and summarize its numbers; do not recount them from the conversation."
+    ),
+    EVALUATION_CONTENT_AGENT_NAME: (
+        "Your role is to evaluate the text from student"
+        "  and provide feedback. For exemple, the student can ask you to evaluate a text he wrote, "
+        "and you will provide feedback on the tinformation is correct. "
+        "When the student refers to a file they uploaded, call 'search_uploaded_files' and evaluate those passages."
+    ),
+}
+
+# Planning_Agent when the plan is generated with structured output (structured_mode)
+STRUCTURED_PLANNING_INSTRUCTIONS = (
+    "You are an expert study planning assistant. Your goal is to create a personalized and structured study plan.\n"
+    "**STEP 1: Information Gathering**\n"
+    "Before creating the plan, you MUST talk to the user to understand:\n"
+    "1. Study Availability: Ask how many hours per week or which days/times the user can dedicate to studying.\n"
+    "2. Milestone: Ask if there is any deadline for studying, like an exam or certification.\n"
+    "3. Create goals according to the topics to be learned.\n"
+    "Ask clear questions and wait for the user's answers. You can ask follow-up questions if necessary.\n"
+    "**STEP 2: Plan Generation**\n"
+    f"ONLY AFTER gathering sufficient information about availability and goals, call the '{CREATE_TOOL_NAME}' tool "
+    "with a brief of that information. Do NOT write the plan or its JSON yourself: the tool generates the plan, "
+    "saves it as the student's current plan and returns it rendered for the student.\n"
+    "**STEP 3: Confirmation**\n"
+    "When the tool says the student already sees the plan, do NOT repeat it; otherwise reply with the plan it "
+    "returned, as is. Then ask if the user would like to add or remove any topics or adjust the workload. "
+    "For adjustments, call the tool again with the updated brief."
+)
+
+
+def specialist_instructions(name: str, structured: bool = False) -> str:
+    """Instructions of specialist ``name``; ``structured``: plans come from ``create_study_plan``."""
+    if name == PLANNING_AGENT_NAME and structured:
+        return STRUCTURED_PLANNING_INSTRUCTIONS
+    return SPECIALIST_INSTRUCTIONS[name]
+
+
+# Forward rules of the main agent, in the order they appear in its instructions
+FORWARD_RULES = {
+    MOTIVATION_AGENT_NAME: f"If you notice the student is unmotivated, forward them to the '{MOTIVATION_AGENT_NAME}'. ",
+    PLANNING_AGENT_NAME: f"If you notice they need help planning their studies, forward them to the '{PLANNING_AGENT_NAME}'. ",
+    BULLYING_AGENT_NAME: f"If you suspect the student is a victim of bullying, forward them to the '{BULLYING_AGENT_NAME}'. ",
+    SELF_HARM_PREVENTION_AGENT_NAME: f"If you notice the student is having suicidal thoughts, feelings, or behaviors, forward them to the '{SELF_HARM_PREVENTION_AGENT_NAME}'. ",
+    BURNOUT_AGENT_NAME: f"If you notice the student is experiencing physical or mental exhaustion (burnout), forward them to the '{BURNOUT_AGENT_NAME}'. ",
+    SIMULATION_AGENT_NAME: f"If the student wants to take a practice exam/quiz on specific topics, forward them to the '{SIMULATION_AGENT_NAME}'. ",
+    CONFLICTS_AGENT_NAME: f"If the student indicates they have a conflict with teachers or family, forward them to the '{CONFLICTS_AGENT_NAME}'. ",
+    PROGRESS_MONITORING_AGENT_NAME: f"If the student wants to check their progress, forward them to the '{PROGRESS_MONITORING_AGENT_NAME}'. ",
+    EVALUATION_CONTENT_AGENT_NAME: f"If the student wants to evaluate a text, forward them to the '{EVALUATION_CONTENT_AGENT_NAME}'. ",
+}
+
+MAIN_AGENT_PREAMBLE = (
+    "You are an online tutor who helps students study. "
+    "Always greet the student, and pay attention to their tone of response to assess how they are feeling. "
+    "After they study a topic and let you know, ask them how they are doing. "
+    "After they take a simulation/quiz, ask them if they are feeling more confident. "
+    "Try to understand the student by asking about their difficulties and goals. "
+)
+
+# Plugin order of the main agent (Evaluation_Content_Agent only in app_v1)
+SPECIALIST_ORDER = [
+    MOTIVATION_AGENT_NAME,
+    PLANNING_AGENT_NAME,
+    BULLYING_AGENT_NAME,
+    SELF_HARM_PREVENTION_AGENT_NAME,
+    BURNOUT_AGENT_NAME,
+    CONFLICTS_AGENT_NAME,
+    SIMULATION_AGENT_NAME,
+    PROGRESS_MONITORING_AGENT_NAME,
+]
+
+# Always offered to Main_Tutor_Agent, whatever the turn is about (see tool_selection)
+SAFETY_AGENTS = [
+    BULLYING_AGENT_NAME,
+    SELF_HARM_PREVENTION_AGENT_NAME,
+    BURNOUT_AGENT_NAME,
+    CONFLICTS_AGENT_NAME,
+]
+
+# Tool plugins a specialist's work needs; the main agent only sees them alongside it
+SPECIALIST_PLUGINS = {
+    PLANNING_AGENT_NAME: [STUDY_PLAN_PLUGIN_NAME],
+    SIMULATION_AGENT_NAME: [QUIZ_PLUGIN_NAME],
+    PROGRESS_MONITORING_AGENT_NAME: [QUIZ_PLUGIN_NAME],
+    EVALUATION_CONTENT_AGENT_NAME: [DOCUMENT_PLUGIN_NAME],
+}
+
+
+class SpecialistRoster(Mapping[str, ChatCompletionAgent]):
+    """The specialist agents by name, each built the first time it is looked up.
+
+    Iterating and ``in`` only see the names, so routing and the main agent's
+    tool list build nothing.
+    """
+
+    def __init__(self, names: list[str], build: Callable[[str], ChatCompletionAgent]):
+        self._names = list(names)
+        self._build = build
+        self._agents: dict[str, ChatCompletionAgent] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> ChatCompletionAgent:
+        agent = self._agents.get(name)
+        if agent is None:
+            if name not in self._names:
+                raise KeyError(name)
+            with self._lock:
+                agent = self._agents.get(name)
+                if agent is None:
+                    agent = self._agents[name] = self._build(name)
+                    logger.debug("Built specialist %s", name)
+        return agent
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @property
+    def built(self) -> list[str]:
+        """Names of the specialists built so far."""
+        return list(self._agents)
+
+
+@dataclass
+class AgentRegistry:
+    """Shared kernel, chat service and agent roster for one model configuration."""
+
+    kernel: sk.Kernel
+    service: OpenAIChatCompletion  # the profile's default tier
+    main_agent: ChatCompletionAgent
+    agents: Mapping[str, ChatCompletionAgent] = field(default_factory=dict)
+    services: ModelServices | None = None
+    # Main_Tutor_Agent variants offering a subset of the specialists, by subset
+    main_agents: dict[tuple[str, ...], ChatCompletionAgent] = field(default_factory=dict, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def get(self, name: str) -> ChatCompletionAgent:
+        """Return the agent registered under ``name`` (main agent included)."""
+        if name == self.main_agent.name:
+            return self.main_agent
+        return self.agents[name]
+
+    def service_for(self, agent_or_role: str) -> OpenAIChatCompletion:
+        """The service of an agent's (or the screening/memory role's) model tier."""
+        return self.services.for_agent(agent_or_role) if self.services is not None else self.service
+
+    def structured_output(self, agent_or_role: str) -> bool:
+        """Whether the agent's tier takes strict ``json_schema`` response formats (``Tier.structured_output``)."""
+        return self.services is not None and self.services.tier(agent_or_role).structured_output
+
+    def main_agent_for(self, specialists: Iterable[str]) -> ChatCompletionAgent:
+        """Main_Tutor_Agent offering only ``specialists``: their tools and forward rules.
+
+        The variants share the kernel and are cached per subset; the whole
+        roster is the main agent itself.
+        """
+        wanted = set(specialists)
+        selected = tuple(name for name in self.agents if name in wanted)
+        if len(selected) == len(self.agents):
+            return self.main_agent
+        agent = self.main_agents.get(selected)
+        if agent is None:
+            with self._lock:
+                agent = self.main_agents.get(selected)
+                if agent is None:
+                    agent = self.main_agents[selected] = ChatCompletionAgent(
+                        kernel=self.kernel,
+                        name=MAIN_AGENT_NAME,
+                        instructions=main_agent_instructions(list(selected)),
+                        function_choice_behavior=FunctionChoiceBehavior.Auto(
+                            filters={"included_plugins": offered_plugins(selected)}
+                        ),
+                        arguments=self.services.arguments_for(MAIN_AGENT_NAME),
+                    )
+        return agent
+
+
+def offered_plugins(specialists: Iterable[str]) -> list[str]:
+    """Kernel plugins Main_Tutor_Agent sees when it offers ``specialists``."""
+    plugins = []
+    for name in specialists:
+        for plugin in [name, *SPECIALIST_PLUGINS.get(name, [])]:
+            if plugin not in plugins:
+                plugins.append(plugin)
+    return plugins
+
+
+def main_agent_instructions(specialists: list[str]) -> str:
+    """Build the main agent instructions with the forward rules of ``specialists``."""
+    rules = [FORWARD_RULES[name] for name in FORWARD_RULES if name in specialists]
+    return (MAIN_AGENT_PREAMBLE + "".join(rules)).rstrip()
+
+
+def forward_function(agents: Mapping[str, ChatCompletionAgent], name: str):
+    """The kernel function the main agent calls to hand over to specialist ``name``.
+
+    It has the name, description and parameters of the function Semantic Kernel
+    derives from an agent used as a plugin, so the model sees the same tools, but
+    looks the agent up in ``agents`` (building it) only when it is called.
+    """
+
+    @kernel_function(name=name, description=SPECIALIST_INSTRUCTIONS[name])
+    async def forward(
+        messages: Annotated[str | list[str], "The user messages for the agent."],
+        instructions_override: Annotated[str | None, "Override agent instructions."] = None,
+    ) -> Annotated[Any, "Agent response."]:
+        response = await agents[name].get_response(
+            messages=[messages] if isinstance(messages, str) else messages,
+            instructions_override=instructions_override or None,
+        )
+        return response.content
+
+    return forward
+
+
+def build_registry(services: ModelServices, include_evaluation: bool = False) -> AgentRegistry:
+    """Build the kernel, the chat services and the main agent; specialists are built on first use.
+
+    Args:
+        services: The tier services of the model profile (``ModelServices.single``
+            puts every agent on one model).
+        include_evaluation: Whether to add the Evaluation_Content_Agent (app_v1).
+
+    Returns:
+        A new AgentRegistry.
+    """
+    specialists = list(SPECIALIST_ORDER)
+    if include_evaluation:
+        specialists.append(EVALUATION_CONTENT_AGENT_NAME)
+
+    # Configure the Semantic Kernel
+    # It's important to add the services to the kernel so the agents can use them;
+    # each agent selects its tier's service through its execution settings
+    kernel = sk.Kernel()
+    kernel.add_service(services.default)
+    for name in [MAIN_AGENT_NAME, *specialists, SCREENING_ROLE, MEMORY_ROLE]:
+        service = services.for_agent(name)
+        if service.service_id not in kernel.services:
+            kernel.add_service(service)
+    # One span per kernel function call: specialists invoked as plugins and the StudyPlan/Quiz tools
+    kernel.add_filter("function_invocation", trace_function_invocation)
+    # The tool Planning_Agent is told to call after generating the plan, or that generates it
+    structured = structured_mode(services.tier(PLANNING_AGENT_NAME))
+    if structured:
+        plan_plugin = StructuredStudyPlanPlugin(services.for_agent(PLANNING_AGENT_NAME))
+    else:
+        plan_plugin = StudyPlanPlugin()
+    kernel.add_plugin(plan_plugin, plugin_name=STUDY_PLAN_PLUGIN_NAME)
+    # Structured quizzes graded locally, and the progress aggregates they feed
+    kernel.add_plugin(QuizPlugin(), plugin_name=QUIZ_PLUGIN_NAME)
+    # Passage search over the student's uploaded files (document_index)
+    kernel.add_plugin(DocumentPlugin(), plugin_name=DOCUMENT_PLUGIN_NAME)
+
+    agents = SpecialistRoster(
+        specialists,
+        lambda name: ChatCompletionAgent(
+            kernel=kernel,
+            name=name,
+            instructions=specialist_instructions(name, structured),
+            arguments=services.arguments_for(name),
+        ),
+    )
+    # The agents as plugins, one forwarding function each (in the main agent's plugin order)
+    for name in specialists:
+        kernel.add_function(plugin_name=name, function=forward_function(agents, name))
+
+    main_agent = ChatCompletionAgent(
+        kernel=kernel,
+        name=MAIN_AGENT_NAME,
+        instructions=main_agent_instructions(specialists),
+        arguments=services.arguments_for(MAIN_AGENT_NAME),
+    )
+    return AgentRegistry(
+        kernel=kernel, service=services.default, main_agent=main_agent, agents=agents, services=services
+    )
+
+
+# --- Process-wide cache ---
+_registries: dict[tuple[str, bool], AgentRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def _cached_registry(key: tuple[str, bool], build: Callable[[], AgentRegistry]) -> AgentRegistry:
+    registry = _registries.get(key)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.get(key)
+            if registry is None:
+                registry = _registries[key] = build()
+    return registry
+
+
+def get_registry(
+    model_id: str,
+    make_client: Callable[[], AsyncOpenAI],
+    include_evaluation: bool = False,
+) -> AgentRegistry:
+    """Return the shared registry with every agent on ``model_id``, building it on first use.
+
+    ``make_client`` is only called when the registry does not exist yet.
+    """
+    return _cached_registry(
+        (model_id, include_evaluation),
+        lambda: build_registry(ModelServices.single(make_client(), model_id), include_evaluation),
+    )
+
+
+def get_profile_registry(profile: str, include_evaluation: bool = False) -> AgentRegistry:
+    """Return the shared registry of a ``models.toml`` profile, building it on first use."""
+    return _cached_registry(
+        (f"profile:{profile}", include_evaluation),
+        lambda: build_registry(ModelServices(ModelConfig.load(), profile), include_evaluation),
+    )
+
+
+async def warm_up(registry: AgentRegistry, connections: int = 1) -> None:
+    """Pay the one-off costs of a first turn before any student arrives (server boot).
+
+    Builds the tool schemas Main_Tutor_Agent sends with each request and opens
+    ``connections`` pooled connections (the concurrent requests of one turn) to
+    each model backend in use.
+    """
+    from semantic_kernel.connectors.ai.function_calling_utils import kernel_function_metadata_to_function_call_format
+
+    for metadata in registry.kernel.get_full_list_of_function_metadata():
+        kernel_function_metadata_to_function_call_format(metadata)
+    if registry.services is not None:
+        await registry.services.connect(connections)
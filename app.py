@@ -1,178 +1,69 @@
 # author: Jairo Monassa
 
 import chainlit as cl
-import semantic_kernel as sk
 from dotenv import load_dotenv
 import os
-from openai import AsyncOpenAI
-from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion
-from semantic_kernel.agents import ChatCompletionAgent, ChatHistoryAgentThread
+
+from agent_registry import MAIN_AGENT_NAME, PROGRESS_MONITORING_AGENT_NAME, SIMULATION_AGENT_NAME, get_profile_registry, warm_up
+from conversation_memory import ConversationMemory, current_memory
+from document_index import forget_context, get_document_index, ingest_elements, ingest_summary
+from intent_router import build_routing_stage
+from model_backends import MEMORY_ROLE, SCREENING_ROLE
+from quiz_bank import get_quiz_bank, serve_quiz
+from quiz_engine import progress_turn
+from rate_limiter import current_session, get_rate_limiter, queue_listener
+from stream_buffer import TokenCoalescer
+from study_plan_plugin import current_student, plan_listener
+from thread_store import build_thread_cache
+from tool_selection import build_tool_selector
+from tracing import annotate_turn, trace_turn
+from turn_manager import build_turn_manager, current_turn
+from wellbeing_screening import SCREENING_PROMPTS, await_screening, forget_screening, screening_wait, start_screening
 
 # Load environment variables from .env
 load_dotenv(override=True)
 
 # --- Constants (Translated Names) ---
 AVATAR_IMAGE_PATH = "./public/avatar.png" # Keep path as is
-MOTIVATION_AGENT_NAME = "Motivation_Agent"
-PLANNING_AGENT_NAME = "Planning_Agent"
-MAIN_AGENT_NAME = "Main_Tutor_Agent"
-BULLYING_AGENT_NAME = "Bullying_Support_Agent"
-SELF_HARM_PREVENTION_AGENT_NAME = "Self_Harm_Prevention_Agent"
-BURNOUT_AGENT_NAME = "Burnout_Support_Agent"
-SIMULATION_AGENT_NAME = "Quiz_Simulation_Agent" # Changed to be more specific
-CONFLICTS_AGENT_NAME = "Conflict_Resolution_Agent" # Changed to be more descriptive
-PROGRESS_MONITORING_AGENT_NAME = "Progress_Monitoring_Agent" # Changed name for clarity and consistency
-endpoint = "https://models.github.ai/inference"
-model_name = "gpt-4o-mini"
-token = os.getenv("GITHUB_TOKEN")
+# Model backends and per-agent tiers come from models.toml; MODEL_PROFILE picks the profile
+# (app_deepseek.py is this app with the "deepseek" profile)
+MODEL_PROFILE = os.getenv("MODEL_PROFILE", "github")
+# Local fast-path routing of obvious intents in front of Main_Tutor_Agent
+routing = build_routing_stage()
+# Main_Tutor_Agent only sees the specialists that can matter this turn (safety ones always)
+tool_selector = build_tool_selector()
+# Durable threads: recently active ones in an LRU, the rest rehydrated from SQLite.
+# Each thread's history is a token-budgeted memory with a rolling summary.
+threads = build_thread_cache(lambda: ConversationMemory.from_env(service=get_agents().service_for(MEMORY_ROLE)))
+# One turn in flight per student: a new message or closing the tab cancels the previous one
+turns = build_turn_manager(lambda: cl.context.session.thread_id)
+
+
+def get_agents():
+    # The kernel, services and agent roster are built once per process and shared
+    # by every session; only the thread is per-user state.
+    return get_profile_registry(MODEL_PROFILE)
+
+
+@cl.on_app_startup
+async def prewarm():
+    # Build the registry and connect to the model backends at boot, so the first student
+    # after a deploy or scale-out does not wait for them (AGENT_PREWARM=off skips it).
+    # One connection per screening prompt, the requests a turn sends at once.
+    if os.getenv("AGENT_PREWARM", "on").lower() != "off":
+        await warm_up(get_agents(), connections=len(SCREENING_PROMPTS))
+
 
 @cl.on_chat_start
 async def on_chat_start():
-    # --- Client and Service Configuration ---
-    # Configure the AsyncOpenAI client for GitHub Models
-    chat_client = AsyncOpenAI(
-        api_key=token,
-        base_url="https://models.inference.ai.azure.com"
-    )
-    # Configure the Semantic Kernel OpenAIChatCompletion service
-    chat_completion_service = OpenAIChatCompletion(
-        ai_model_id=model_name,
-        async_client=chat_client # Pass the AsyncOpenAI client
-    )
-    # --- End of Configuration ---
-
-    # Configure the Semantic Kernel
-    kernel = sk.Kernel()
-    # Add the chat service to the kernel
-    # It's important to add the service to the kernel so the agent can use it
-    kernel.add_service(chat_completion_service)
+    registry = get_agents()
     # Define the avatar image element
     image = cl.Image(path=AVATAR_IMAGE_PATH, name="avatar", display="inline", size="small")
 
-    # --- Agent Definitions (Translated Instructions) ---
-
-    motivation_agent = ChatCompletionAgent(
-        kernel=kernel, # Pass the kernel to the agent
-        name=MOTIVATION_AGENT_NAME,
-        instructions=(
-            "Your role is to check the student's motivation level and suggest a motivational plan. "
-            "You should ask open-ended questions to understand the student's motivation level and suggest a concise motivational plan."
-        )
-    )
-
-    bullying_agent = ChatCompletionAgent(
-        kernel=kernel, # Pass the kernel to the agent
-        name=BULLYING_AGENT_NAME,
-        instructions="Your role is to check if the student is a victim of bullying and suggest an action plan."
-    )
-
-    self_harm_prevention_agent = ChatCompletionAgent(
-        kernel=kernel, # Pass the kernel
-        name=SELF_HARM_PREVENTION_AGENT_NAME,
-        instructions="Your role is to support students with suicidal thoughts and suggest an action plan."
-    )
-
-    burnout_agent = ChatCompletionAgent(
-        kernel=kernel,
-        name=BURNOUT_AGENT_NAME,
-        instructions=(
-            "Your role is to check for student burnout and suggest an action plan. "
-            "Recommend breaks and relaxation techniques to prevent burnout."
-        )
-    )
-
-    simulation_agent = ChatCompletionAgent(
-        kernel=kernel, # Pass the kernel to the agent
-        name=SIMULATION_AGENT_NAME,
-        instructions=(
-            "Your role is to create about 5 questions on the study plan topic. "
-            "Create 3 multiple-choice questions and 2 open-ended questions."
-        )
-    )
-
-    conflicts_agent = ChatCompletionAgent(
-        kernel=kernel, # Pass the kernel
-        name=CONFLICTS_AGENT_NAME,
-        instructions=(
-            "Your role is to identify if the student has any personal conflict with the teacher "
-            "or a conflict within the family: "
-            "- Give advice to resolve according to the student's situation."
-        )
-    )
-
-    progress_monitoring_agent = ChatCompletionAgent(
-        kernel=kernel, # Pass the kernel
-        name=PROGRESS_MONITORING_AGENT_NAME,
-        instructions="Your role is to summarize all test simulations and check how many questions were answered correctly and incorrectly."
-    )
-
-    planning_agent = ChatCompletionAgent(
-        kernel=kernel, # Pass the kernel to the agent
-        name=PLANNING_AGENT_NAME,
-        instructions=(
-            "You are an expert study planning assistant. Your goal is to create a personalized and structured study plan.\n"
-            "**STEP 1: Information Gathering**\n"
-            "Before creating the plan, you MUST talk to the user to understand:\n"
-            "1. Study Availability: Ask how many hours per week or which days/times the user can dedicate to studying.\n"
-            "2. Milestone: Ask if there is any deadline for studying, like an exam or certification.\n"
-            "3. Create goals according to the topics to be learned.\n" # Note: Original had '3.' twice, kept structure but might need review
-            "Ask clear questions and wait for the user's answers. You can ask follow-up questions if necessary.\n"
-            "4. Show the user the final study plan, including the structure and topics covered.\n" # Note: Original numbering was off, adjusted here
-            "5. After showing the study plan, ask if the user would like to add or remove any topics or adjust the workload.\n" # Adjusted numbering
-            "**STEP 2: Plan Generation**\n"
-            "ONLY AFTER gathering sufficient information about availability and goals, inform the user that you will generate the plan.\n"
-            "Generate the plan in the following structured JSON format:\n"
-            "{\n"
-            '  "week1": {\n'
-            '    "days1and2": { "topic": "...", "subtopics": ["...", "..."], "goal": "..." },\n' # Changed 'meta' to 'goal' for clarity
-            '    "day3": { "topic": "...", "subtopics": ["...", "..."], "goal": "..." }\n'
-            '  },\n'
-            '  "week2": { ... }\n'
-            "}\n"
-            "Adapt the number of weeks and the distribution of topics based on the availability and goals provided by the user.\n"
-            "**STEP 3: Saving and Confirmation**\n"
-            "After generating the JSON object for the plan, you MUST use the 'save_study_plan_to_json' tool, passing the json as an argument, to save this object to the 'plano.json' file.\n" # IMPORTANT: This tool is not defined in this script. It needs to be added or this instruction removed/modified.
-            "Finally, inform the user that the plan was created based on the provided information and saved successfully."
-        )
-    )
-
-    # --- Main Agent Definition ---
-    main_agent = ChatCompletionAgent(
-        kernel=kernel, # Pass the kernel to the agent
-        # service=chat_completion_service, # Service is already in the kernel, no need to pass again here
-        name=MAIN_AGENT_NAME,
-        instructions=(
-            "You are an online tutor who helps students study. "
-            "Always greet the student, and pay attention to their tone of response to assess how they are feeling. "
-            "After they study a topic and let you know, ask them how they are doing. "
-            "After they take a simulation/quiz, ask them if they are feeling more confident. "
-            "Try to understand the student by asking about their difficulties and goals. "
-            f"If you notice the student is unmotivated, forward them to the '{MOTIVATION_AGENT_NAME}'. "
-            f"If you notice they need help planning their studies, forward them to the '{PLANNING_AGENT_NAME}'. "
-            f"If you suspect the student is a victim of bullying, forward them to the '{BULLYING_AGENT_NAME}'. "
-            f"If you notice the student is having suicidal thoughts, feelings, or behaviors, forward them to the '{SELF_HARM_PREVENTION_AGENT_NAME}'. "
-            f"If you notice the student is experiencing physical or mental exhaustion (burnout), forward them to the '{BURNOUT_AGENT_NAME}'. "
-            f"If the student wants to take a practice exam/quiz on specific topics, forward them to the '{SIMULATION_AGENT_NAME}'. "
-            f"If the student indicates they have a conflict with teachers or family, forward them to the '{CONFLICTS_AGENT_NAME}'. "
-            f"If the student wants to check their progress, forward them to the '{PROGRESS_MONITORING_AGENT_NAME}'."
-        ),
-        plugins=[
-            motivation_agent,
-            planning_agent,
-            bullying_agent,
-            self_harm_prevention_agent,
-            burnout_agent,
-            conflicts_agent,
-            simulation_agent,
-            progress_monitoring_agent
-        ] # Add the agents as plugins using their new variable names
-    )
-
-    # Initialize the conversation history (thread) as None
-    thread: ChatHistoryAgentThread = None
-    # Store the main agent and thread in the Chainlit user session
-    cl.user_session.set("agent", main_agent) # Store the main_agent
-    cl.user_session.set("thread", thread)
+    # The conversation history (thread) is loaded from the thread cache on the first
+    # message, so a reconnect after a restart picks up the stored conversation
+    # Store the main agent in the Chainlit user session
+    cl.user_session.set("agent", registry.main_agent) # Store the main_agent
 
     # Optional welcome message
     await cl.Message(
@@ -181,11 +72,105 @@ async def on_chat_start():
         elements=[image] # Include avatar image element
     ).send()
 
+async def show_queue_position(position: int | None):
+    # While the shared model quota is exhausted the student's requests wait in line
+    notice = cl.user_session.get("queue_notice")
+    if position is None:
+        if notice is not None:
+            cl.user_session.set("queue_notice", None)
+            await notice.remove()
+        return
+    content = f"Many students are studying right now, you are #{position} in line..."
+    if notice is None:
+        notice = cl.Message(content=content, author=MAIN_AGENT_NAME)
+        cl.user_session.set("queue_notice", notice)
+        await notice.send()
+    elif notice.content != content:
+        notice.content = content
+        await notice.update()
+
+async def escalate_late_screening(late, registry, entry, answered_by: str):
+    # The screening outlasted WELLBEING_WAIT, so the answer went out without it:
+    # a high risk it finds still reaches its specialist, right after the answer
+    assessment = await late if late is not None else None
+    if assessment is None or assessment.escalate_to in (None, answered_by):
+        return
+    specialist = registry.get(assessment.escalate_to)
+    annotate_turn(screening="late", escalated_to=specialist.name)
+    follow_up = cl.Message(content="", author=specialist.name)
+    await follow_up.send()
+    thread = entry.thread
+    async with TokenCoalescer(follow_up) as stream:
+        current_turn().watch(stream, specialist.name)
+        async for response in specialist.invoke_stream(messages=assessment.note(), thread=thread):
+            if response.content:
+                await stream.push(str(response.content))
+            thread = response.thread
+    forget_screening(entry.memory)
+
+async def show_study_plan(preview: str):
+    # The plan rendered by create_study_plan goes straight into the answer instead of
+    # being written out again by Planning_Agent and then by Main_Tutor_Agent
+    await current_turn().stream.push(f"{preview}\n\n")
+
+@cl.on_chat_end
+async def on_chat_end():
+    # The student closed the tab: stop generating an answer nobody will read
+    turns.cancel(cl.context.session.thread_id, "disconnect")
+
 @cl.on_message
+@trace_turn  # One span tree per turn: route, agents, tools, completions, TTFT and tokens
+@turns.exclusive  # Cancels the student's turn in flight; only completed turns reach the thread
 async def on_message(message: cl.Message):
-    # Retrieve the agent and thread from the user session
-    agent = cl.user_session.get("agent") # type: ChatCompletionAgent
-    thread = cl.user_session.get("thread") # type: ChatHistoryAgentThread
+    # Retrieve the student's thread: from the in-memory LRU, or rehydrated from the store
+    thread_key = cl.context.session.thread_id
+    turn = current_turn()
+    current_student.set(thread_key)  # Whose plan save_study_plan_to_json stores
+    # Model requests of this turn take their fair share of the quota and report their place in line
+    current_session.set(thread_key)
+    queue_listener.set(show_queue_position)
+    plan_listener.set(show_study_plan)
+    limiter = get_rate_limiter()
+    if limiter is not None and limiter.full:
+        # Backpressure: say so now instead of queueing a turn that would time out
+        await cl.Message(content="Too many students are studying right now. Please try again in a minute.", author=MAIN_AGENT_NAME).send()
+        return
+    documents = get_document_index()
+    if documents is not None and message.elements:
+        # Uploads are streamed to disk and indexed; the agents only get the passages relevant to each turn
+        results = await ingest_elements(documents, thread_key, message.elements)
+        annotate_turn(uploads=len(results))
+        await cl.Message(content=ingest_summary(results), author=MAIN_AGENT_NAME).send()
+        if not message.content.strip():
+            return
+    registry = get_agents()
+    # Quizzes on the topics of the student's plan are generated in the background, before they are asked for
+    bank = get_quiz_bank(registry.service_for(SIMULATION_AGENT_NAME), registry.structured_output(SIMULATION_AGENT_NAME))
+    if bank is not None:
+        bank.prefetch_student(thread_key)
+    # Screen for bullying, self-harm, burnout and conflicts concurrently while the turn is prepared
+    screening = turn.link(start_screening(registry.service_for(SCREENING_ROLE), message.content))
+    entry = await threads.get(thread_key)
+    current_memory.set(entry.memory)  # Where the plan and quiz tools pin what they produced
+    thread = entry.thread
+    # Keep the history under the token budget before it is sent again
+    await entry.memory.prepare_turn()
+    turn.guard(entry.memory)  # Put back as it is now if the turn does not complete
+    # Obvious intents go straight to the specialist; everything else to the main agent
+    agent = routing.select_agent(message.content, registry)
+    route = "main" if agent is registry.main_agent else "router"
+    if tool_selector is not None and route == "main":
+        selection = await tool_selector.select_turn(message.content, entry.memory.messages, thread_key, registry)
+        agent = registry.main_agent_for(selection.agents)
+        annotate_turn(tools=len(selection.agents))
+    # The answer waits for the screening only so long; a high risk found later is escalated after it
+    assessment, late = await await_screening(screening, screening_wait())
+    if assessment is not None and assessment.escalate_to:
+        # A high risk goes straight to its specialist instead of waiting for the tutor to forward
+        agent = registry.get(assessment.escalate_to)
+        route = "screening"
+    note = assessment.note() if assessment is not None else None
+    annotate_turn(agent.name, route=route)
 
     # Create an empty message for the agent's response (for streaming)
     answer = cl.Message(
@@ -194,17 +179,56 @@ async def on_message(message: cl.Message):
         )
     await answer.send() # Send the message container to the UI
 
+    if agent.name == PROGRESS_MONITORING_AGENT_NAME:
+        # Progress comes from the quiz aggregates plus one short rendering call, not from re-reading the thread
+        async with TokenCoalescer(answer) as stream:
+            turn.watch(stream, agent.name)
+            await progress_turn(registry.service_for(agent.name), thread_key, message.content, entry.memory, stream.push, agent.name)
+        annotate_turn(stream=stream)
+        await escalate_late_screening(late, registry, entry, agent.name)
+        turn.commit()
+        await threads.save(thread_key, entry)
+        return
+
+    quiz = await bank.quiz_for(thread_key, message.content) if bank is not None and agent.name == SIMULATION_AGENT_NAME else None
+    if quiz is not None:
+        # A ready quiz from the bank: no generation while the student waits (cold topics go to the agent below)
+        async with TokenCoalescer(answer) as stream:
+            turn.watch(stream, agent.name)
+            await serve_quiz(quiz, thread_key, message.content, entry.memory, stream.push, agent.name)
+        annotate_turn(stream=stream, quiz_bank="hit")
+        await escalate_late_screening(late, registry, entry, agent.name)
+        turn.commit()
+        await threads.save(thread_key, entry)
+        return
+
+    # The passages of the student's files that match this message, for this turn only
+    context = await documents.context_for(thread_key, message.content) if documents is not None else None
+    notes = [m for m in (note, context) if m is not None]
+
     # Invoke the agent asynchronously and stream the response
     # Use invoke_stream to get partial responses and update the UI
-    async for response in agent.invoke_stream(messages=message.content, thread=thread):
-
-        # If there is content in the partial response, add it to the message in the UI
-        if response.content:
-            await answer.stream_token(str(response.content))
-
-        # Update the thread with the latest interaction history
-        # It's crucial to update the thread to maintain conversation context
-        thread = response.thread
-        cl.user_session.set("thread", thread) # Save the updated thread in the session
+    # Tokens are coalesced into fewer websocket frames (size, time window or end of stream)
+    async with TokenCoalescer(answer) as stream:
+        turn.watch(stream, agent.name)
+        async for response in agent.invoke_stream(messages=[*notes, message.content] if notes else message.content, thread=thread):
+
+            # If there is content in the partial response, add it to the message in the UI
+            if response.content:
+                await stream.push(str(response.content))
+
+            # Update the thread with the latest interaction history
+            # It's crucial to update the thread to maintain conversation context
+            thread = response.thread
+    if context is not None:
+        forget_context(entry.memory)
+    if note is not None:
+        forget_screening(entry.memory)
+    annotate_turn(stream=stream)
+    await escalate_late_screening(late, registry, entry, agent.name)
+    turn.commit()
+
+    # Persist the thread after each turn so a restart does not lose the conversation
+    await threads.save(thread_key, entry)
 
     # await answer.update() # Usually not needed when using stream_token
@@ -0,0 +1,276 @@
+# author: Jairo Monassa
+"""Load test of the Chainlit apps against the offline stub model server.
+
+Each app is started with ``chainlit run --headless`` and ``MODEL_BASE_URL``
+pointing at ``stub_server.py``, with its SQLite stores and plan folder in a
+temporary directory. ``--sessions`` simulated students connect over the
+Socket.IO protocol the browser uses and play a script: ask for a study plan,
+ask for a quiz, answer it, check their progress. The stub answers the plan,
+quiz and answer turns with the matching tool calls, so the plugins run too.
+
+Reported per app and per turn: p50/p95/p99 time to first token (first
+streamed token of the answer), full response latency (until the turn's
+``task_end``), plus time to the welcome message, throughput and the RSS of
+the server process (before, peak, per session).
+
+    python benchmarks/bench_chainlit_load.py --sessions 50 --apps app.py,app_deepseek.py,app_v1.py
+    python benchmarks/bench_chainlit_load.py --sessions 200 --error-rate 0.05 --drop-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio  # noqa: E402
+
+from stub_server import stub_server_process  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TURNS = [
+    ("plan", "I want to make a study plan for Calculus I: 4 weeks, 1 hour a day, exam on derivatives"),
+    ("quiz", "Give me a quiz on derivatives"),
+    ("answers", "1-A, 2-C, 3-B"),
+    ("progress", "Check my progress"),
+]
+
+PLAN = {f"week{w}": {"days1and2": {"topic": f"Derivatives {w}", "subtopics": ["rules", "chain rule"],
+                                   "goal": "solve the exercise list"},
+                     "day3": {"topic": "Review", "subtopics": ["exercises"], "goal": "fix the mistakes"}}
+        for w in range(1, 5)}
+QUESTIONS = [{"question": f"Derivative of x^{n}?", "choices": [f"{n}x^{n - 1}", "x", "1", "0"], "answer": "A"}
+             for n in range(2, 5)] + [{"question": "Explain the chain rule."}]
+STUB_SCRIPT = [
+    {"match": r"study plan", "name": "save_study_plan_to_json", "arguments": json.dumps({"study_plan": PLAN})},
+    {"match": r"\bquiz\b", "name": "create_quiz",
+     "arguments": json.dumps({"topic": "derivatives", "questions": QUESTIONS, "week": "week1"})},
+    {"match": r"^\s*1\s*-", "name": "grade_quiz_answers", "arguments": json.dumps({"answers": TURNS[2][1]})},
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+class Session:
+    """One simulated browser tab."""
+
+    def __init__(self, url: str, stats: dict, turn_timeout: float):
+        self.url = url
+        self.stats = stats
+        self.turn_timeout = turn_timeout
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.welcome = asyncio.Event()
+        self.started = asyncio.Event()
+        self.turn_done = asyncio.Event()
+        self.sent_at = 0.0
+        self.first_token: float | None = None
+        self.chars = 0
+        self.waiting = False
+        self.client.on("new_message", self._on_message)
+        self.client.on("stream_token", self._on_token)
+        self.client.on("task_end", self._on_task_end)
+
+    async def _on_message(self, step: dict) -> None:
+        if not self.welcome.is_set() and step.get("output"):
+            self.welcome.set()
+        elif self.waiting and step.get("isError"):
+            self.stats["errors"] += 1
+        elif self.waiting and step.get("output") and step.get("type") != "user_message" and self.first_token is None:
+            # Short local answers are sent whole instead of streamed
+            self.first_token = time.perf_counter()
+            self.chars += len(step["output"])
+
+    async def _on_token(self, data: dict) -> None:
+        if self.waiting and data.get("token"):
+            if self.first_token is None:
+                self.first_token = time.perf_counter()
+            self.chars += len(data["token"])
+
+    async def _on_task_end(self, data) -> None:
+        if self.waiting:
+            self.turn_done.set()
+        elif self.welcome.is_set():
+            self.started.set()
+
+    async def connect(self) -> None:
+        """Open the session and wait for the welcome message."""
+        t0 = time.perf_counter()
+        await self.client.connect(
+            self.url, socketio_path="/ws/socket.io", transports=["websocket"],
+            auth={"sessionId": str(uuid.uuid4()), "clientType": "webapp", "userEnv": "{}",
+                  "chatProfile": None, "threadId": None},
+        )
+        await self.client.emit("connection_successful")
+        await asyncio.wait_for(self.welcome.wait(), self.turn_timeout)
+        self.stats["welcome"].append(time.perf_counter() - t0)
+        # The task_end of on_chat_start must not be taken for the end of the first turn
+        await asyncio.wait_for(self.started.wait(), self.turn_timeout)
+
+    async def run(self, think: float) -> None:
+        try:
+            await self.connect()
+            for kind, text in TURNS:
+                await asyncio.sleep(think)
+                await self.turn(kind, text)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+        finally:
+            await self.client.disconnect()
+
+    async def turn(self, kind: str, text: str) -> None:
+        self.turn_done.clear()
+        self.first_token, self.chars, self.waiting = None, 0, True
+        self.sent_at = time.perf_counter()
+        await self.client.emit("client_message", {"message": {
+            "id": str(uuid.uuid4()), "threadId": "", "name": "User", "type": "user_message", "output": text,
+            "createdAt": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        }, "fileReferences": None})
+        await asyncio.wait_for(self.turn_done.wait(), self.turn_timeout)
+        self.waiting = False
+        done = time.perf_counter()
+        if self.first_token is not None:
+            self.stats["ttft"][kind].append(self.first_token - self.sent_at)
+        self.stats["latency"][kind].append(done - self.sent_at)
+        self.stats["chars"] += self.chars
+        self.stats["turns"] += 1
+
+
+async def drive(port: int, args) -> dict:
+    stats = {"ttft": defaultdict(list), "latency": defaultdict(list), "welcome": [],
+             "errors": 0, "timeouts": 0, "turns": 0, "chars": 0}
+    url = f"http://127.0.0.1:{port}"
+
+    async def student(index: int) -> None:
+        await asyncio.sleep(args.ramp * index / max(1, args.sessions))
+        try:
+            await Session(url, stats, args.turn_timeout).run(args.think)
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"  session {index} failed: {e!r}", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(student(i) for i in range(args.sessions)))
+    stats["seconds"] = time.perf_counter() - t0
+    return stats
+
+
+def start_app(app: str, port: int, base_url: str, folder: str, **extra_env: str) -> subprocess.Popen:
+    env = dict(os.environ, MODEL_BASE_URL=base_url, GITHUB_TOKEN="stub",
+               THREAD_STORE_PATH=os.path.join(folder, "threads.db"),
+               QUIZ_STORE_PATH=os.path.join(folder, "quizzes.db"),
+               PLAN_STORE_DIR=os.path.join(folder, "plans"), **extra_env)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "chainlit", "run", app, "--headless", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=open(os.path.join(folder, "server.log"), "wb"),
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{app} exited with {process.returncode}; see {folder}/server.log")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError(f"{app} did not start within 60s")
+
+
+async def measure(app: str, base_url: str, args) -> None:
+    with tempfile.TemporaryDirectory() as folder:
+        port = free_port()
+        process = start_app(app, port, base_url, folder)
+        try:
+            idle = rss_mb(process.pid)
+            peak = [idle]
+
+            async def sample():
+                while True:
+                    peak[0] = max(peak[0], rss_mb(process.pid))
+                    await asyncio.sleep(0.2)
+
+            sampler = asyncio.create_task(sample())
+            stats = await drive(port, args)
+            sampler.cancel()
+            after = rss_mb(process.pid)
+        finally:
+            process.terminate()
+            process.wait()
+    report(app, stats, idle, peak[0], after, args.sessions)
+
+
+def report(app: str, stats: dict, idle: float, peak: float, after: float, sessions: int) -> None:
+    print(f"\n{app}: {sessions} sessions, {stats['turns']} turns in {stats['seconds']:.1f}s "
+          f"({stats['turns'] / stats['seconds']:.2f} turns/s, {stats['chars'] / stats['seconds'] / 1024:.1f} KB/s "
+          f"of answers), errors={stats['errors']} timeouts={stats['timeouts']}")
+    welcome = [w * 1000 for w in stats["welcome"]]
+    print(f"  welcome   p50={percentile(welcome, .5):7.0f}ms p95={percentile(welcome, .95):7.0f}ms "
+          f"p99={percentile(welcome, .99):7.0f}ms")
+    for kind, _ in TURNS:
+        ttft = [t * 1000 for t in stats["ttft"][kind]]
+        latency = [t * 1000 for t in stats["latency"][kind]]
+        print(f"  {kind:<9} ttft p50={percentile(ttft, .5):7.0f}ms p95={percentile(ttft, .95):7.0f}ms "
+              f"p99={percentile(ttft, .99):7.0f}ms | latency p50={percentile(latency, .5):7.0f}ms "
+              f"p95={percentile(latency, .95):7.0f}ms p99={percentile(latency, .99):7.0f}ms")
+    print(f"  rss idle={idle:.0f}MB peak={peak:.0f}MB after={after:.0f}MB "
+          f"(+{(peak - idle) * 1024 / max(1, sessions):.0f}KB per session at peak)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apps", default="app.py,app_deepseek.py,app_v1.py")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which the sessions connect")
+    parser.add_argument("--think", type=float, default=0.5, help="seconds between a student's turns")
+    parser.add_argument("--turn-timeout", type=float, default=120.0)
+    parser.add_argument("--ttft", type=float, default=0.4)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    stub = dict(ttft=args.ttft, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec, script=STUB_SCRIPT,
+                error_rate=args.error_rate, drop_rate=args.drop_rate, seed=13)
+
+    # chainlit run writes a default chainlit.md next to the apps when there is none
+    readme = os.path.join(ROOT, "chainlit.md")
+    had_readme = os.path.exists(readme)
+    with stub_server_process(**stub) as base_url:
+        for app in args.apps.split(","):
+            asyncio.run(measure(app.strip(), base_url, args))
+        with urllib.request.urlopen(base_url.rsplit("/v1", 1)[0] + "/stats") as response:
+            print(f"\nstub: {json.loads(response.read())}")
+    if not had_readme and os.path.exists(readme):
+        os.remove(readme)
+
+
+if __name__ == "__main__":
+    main()
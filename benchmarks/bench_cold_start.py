@@ -0,0 +1,154 @@
+# author: Jairo Monassa
+"""Cold start of the Chainlit apps: import time, first welcome message and steady-state memory.
+
+Import time is measured in a fresh interpreter per run (``--repeat``):
+``chainlit`` itself (which ``chainlit run`` imports before the app), the app
+module on top of it, and the first build of the agent registry.
+
+Then each app is started with ``chainlit run --headless`` against the offline
+stub (``--connect-delay`` stands in for the TLS handshake of a new connection
+to the model endpoint), with and without the boot pre-warm
+(``AGENT_PREWARM``): the time until the server answers HTTP, the welcome
+message and first answer of the first student after boot, the same for a
+second student, and the RSS of the server once ``--sessions`` more students
+have each had one turn.
+
+    python benchmarks/bench_cold_start.py --apps app.py,app_v1.py --repeat 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_chainlit_load import ROOT, Session, free_port, rss_mb, start_app  # noqa: E402
+from stub_server import stub_server_process  # noqa: E402
+
+MESSAGE = "Can you explain what a derivative is?"
+
+IMPORT_PROBE = """
+import importlib, json, os, sys, time
+sys.path.insert(0, os.getcwd())
+t0 = time.perf_counter()
+import chainlit
+t1 = time.perf_counter()
+app = importlib.import_module(sys.argv[1])
+t2 = time.perf_counter()
+registry = app.get_agents()
+t3 = time.perf_counter()
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) / 1024 for line in f if line.startswith("VmRSS:"))
+built = getattr(registry.agents, "built", registry.agents)
+print(json.dumps({"chainlit": t1 - t0, "app": t2 - t1, "registry": t3 - t2, "rss": rss,
+                  "agents": f"{len(built)}/{len(registry.agents)}"}))
+"""
+
+
+def import_times(app: str, base_url: str, repeat: int) -> None:
+    runs = defaultdict(list)
+    with tempfile.TemporaryDirectory() as folder:
+        env = dict(os.environ, MODEL_BASE_URL=base_url, GITHUB_TOKEN="stub",
+                   THREAD_STORE_PATH=os.path.join(folder, "threads.db"),
+                   QUIZ_STORE_PATH=os.path.join(folder, "quizzes.db"), PLAN_STORE_DIR=os.path.join(folder, "plans"))
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, "-c", IMPORT_PROBE, app.removesuffix(".py")], cwd=ROOT, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            for key, value in json.loads(output.splitlines()[-1]).items():
+                runs[key].append(value)
+    print(f"{app:<16} import chainlit={statistics.median(runs['chainlit']) * 1000:5.0f}ms "
+          f"app={statistics.median(runs['app']) * 1000:5.0f}ms "
+          f"registry={statistics.median(runs['registry']) * 1000:4.0f}ms "
+          f"rss={statistics.median(runs['rss']):4.0f}MB specialists built={runs['agents'][-1]}")
+
+
+async def first_students(port: int, args) -> dict:
+    stats = {"ttft": defaultdict(list), "latency": defaultdict(list), "welcome": [],
+             "errors": 0, "timeouts": 0, "turns": 0, "chars": 0}
+    url = f"http://127.0.0.1:{port}"
+    result = {}
+    for label in ("first", "second"):
+        session = Session(url, stats, args.turn_timeout)
+        try:
+            await session.connect()
+            await session.turn(label, MESSAGE)
+        finally:
+            await session.client.disconnect()
+        result[label] = (stats["welcome"][-1], stats["ttft"][label][-1], stats["latency"][label][-1])
+
+    async def student() -> None:
+        session = Session(url, stats, args.turn_timeout)
+        try:
+            await session.connect()
+            await session.turn("steady", MESSAGE)
+        finally:
+            await session.client.disconnect()
+
+    await asyncio.gather(*(student() for _ in range(args.sessions)))
+    result["errors"] = stats["errors"]
+    return result
+
+
+async def measure(app: str, base_url: str, label: str, args, **env: str) -> None:
+    with tempfile.TemporaryDirectory() as folder:
+        port = free_port()
+        t0 = time.perf_counter()
+        process = start_app(app, port, base_url, folder, **env)
+        boot = time.perf_counter() - t0
+        try:
+            idle = rss_mb(process.pid)
+            result = await first_students(port, args)
+            await asyncio.sleep(args.settle)
+            steady = rss_mb(process.pid)
+        finally:
+            process.terminate()
+            process.wait()
+    line = f"{app:<16} {label:<11} boot={boot * 1000:5.0f}ms"
+    for student in ("first", "second"):
+        welcome, ttft, latency = result[student]
+        line += (f" | {student}: welcome={welcome * 1000:4.0f}ms ttft={ttft * 1000:5.0f}ms"
+                 f" answer={latency * 1000:5.0f}ms")
+    print(line)
+    print(f"{'':<16} {'':<11} rss idle={idle:.0f}MB steady={steady:.0f}MB after {args.sessions + 2} students "
+          f"errors={result['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apps", default="app.py,app_v1.py")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per import measurement")
+    parser.add_argument("--sessions", type=int, default=20, help="students after the first two, for the RSS")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds before the steady-state RSS")
+    parser.add_argument("--turn-timeout", type=float, default=60.0)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--connect-delay", type=float, default=0.15)
+    args = parser.parse_args()
+
+    # chainlit run writes a default chainlit.md next to the apps when there is none
+    readme = os.path.join(ROOT, "chainlit.md")
+    had_readme = os.path.exists(readme)
+    with stub_server_process(ttft=args.ttft, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec,
+                             connect_delay=args.connect_delay) as base_url:
+        apps = [app.strip() for app in args.apps.split(",")]
+        for app in apps:
+            import_times(app, base_url, args.repeat)
+        print()
+        for app in apps:
+            asyncio.run(measure(app, base_url, "no prewarm", args, AGENT_PREWARM="off"))
+            asyncio.run(measure(app, base_url, "prewarm", args))
+    if not had_readme and os.path.exists(readme):
+        os.remove(readme)
+
+
+if __name__ == "__main__":
+    main()
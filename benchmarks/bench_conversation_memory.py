@@ -0,0 +1,68 @@
+# author: Jairo Monassa
+"""Per-turn history prompt tokens: unbounded ChatHistory vs ConversationMemory.
+
+Replays a long synthetic tutoring session through a ChatHistoryAgentThread and
+prints the estimated history tokens resent on every ``invoke_stream``. The
+memory folds with its local summarizer, so no model calls are made.
+
+    python benchmarks/bench_conversation_memory.py --turns 80 --budget 3000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_kernel.agents import ChatHistoryAgentThread  # noqa: E402
+from semantic_kernel.contents import ChatHistory, ChatMessageContent  # noqa: E402
+from semantic_kernel.contents.utils.author_role import AuthorRole  # noqa: E402
+
+from conversation_memory import PINNED_METADATA_KEY, ConversationMemory  # noqa: E402
+from token_counting import estimate_message_tokens  # noqa: E402
+
+WORDS = ("derivative limit function slope graph practice exam week topic goal review "
+         "hours motivation tired quiz answer correct example chapter exercise").split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + "."
+
+
+async def replay(history: ChatHistory, turns: int, seed: int) -> list[int]:
+    rng = random.Random(seed)
+    thread = ChatHistoryAgentThread(chat_history=history)
+    tokens = []
+    for _ in range(turns):
+        if isinstance(history, ConversationMemory):
+            await history.prepare_turn()
+        tokens.append(estimate_message_tokens(history.messages))
+        await thread.on_new_message(ChatMessageContent(role=AuthorRole.USER, content=sentence(rng, rng.randint(8, 40))))
+        reply = " ".join(sentence(rng, rng.randint(10, 25)) for _ in range(rng.randint(3, 12)))
+        await thread.on_new_message(ChatMessageContent(role=AuthorRole.ASSISTANT, content=reply, name="Main_Tutor_Agent"))
+    return tokens
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=80)
+    parser.add_argument("--budget", type=int, default=3000)
+    parser.add_argument("--keep-turns", type=int, default=6)
+    args = parser.parse_args()
+
+    plain = await replay(ChatHistory(), args.turns, seed=1)
+    memory = ConversationMemory(token_budget=args.budget, keep_turns=args.keep_turns)
+    memory.pin("study_plan", "Current study plan: " + sentence(random.Random(0), 120))
+    bounded = await replay(memory, args.turns, seed=1)
+
+    print(f"{'turn':>5} {'unbounded':>10} {'memory':>8}")
+    for turn in range(0, args.turns, max(1, args.turns // 10)):
+        print(f"{turn + 1:>5} {plain[turn]:>10} {bounded[turn]:>8}")
+    print(f"total  {sum(plain):>10} {sum(bounded):>8}  ({1 - sum(bounded) / sum(plain):.0%} fewer history tokens)")
+    print("study plan still pinned:", any(m.metadata.get(PINNED_METADATA_KEY) == "study_plan" for m in memory.messages))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
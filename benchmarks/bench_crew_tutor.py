@@ -0,0 +1,163 @@
+# author: Jairo Monassa
+"""Cost of the CrewAI tutor's turns: notebook loop vs ``crew_tutor.CrewTutor``, with a stubbed LLM.
+
+Two parts:
+
+- history: building the prompt history of a long conversation the way the
+  notebook does (``history_txt`` rebuilt from the whole ``history`` list on
+  every follow-up) against ``CrewMemory``, which appends each turn once;
+- turns: ``--students`` students play the same follow-up conversation
+  against a stub ``BaseLLM`` that sleeps ``--ttft`` plus ``--tokens`` at
+  ``--tokens-per-sec`` per call, in three modes:
+
+  - ``rerun, 1 at a time``: every turn reruns both specialist tasks and the
+    kickoffs run one after the other, as the notebook's ``crew.kickoff``;
+  - ``rerun, concurrent``: the same with ``--concurrency`` kickoffs at once;
+  - ``cached, concurrent``: specialist outputs are reused until a message
+    brings new facts for them.
+
+Needs ``crewai`` (``pip install crewai``).
+
+    python benchmarks/bench_crew_tutor.py --students 8 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# No telemetry or trace prompts from CrewAI during the benchmark
+os.environ.setdefault("CREWAI_TELEMETRY_OPT_OUT", "true")
+os.environ.setdefault("CREWAI_TRACING_ENABLED", "false")
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+
+from crewai.llms.base_llm import BaseLLM  # noqa: E402
+
+from crew_tutor import CrewMemory, CrewTutor  # noqa: E402
+from token_counting import estimate_tokens  # noqa: E402
+
+CONVERSATION = [
+    "Hello, I need to study math for exam next month, my level is zero, I need to become a hero. "
+    "I have 10 hours by week for study",
+    "What is the best material to start from scratch?",
+    "Can you explain what a derivative is?",
+    "Give me an example with x squared",
+    "I feel a bit anxious, I don't know if I can do it",
+    "Actually I can only study 5 hours per week now",
+    "Thanks, that helps!",
+    "What should I do first tomorrow?",
+]
+
+
+class StubCounters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+
+    def reset(self) -> None:
+        with self.lock:
+            self.calls = self.prompt_tokens = 0
+
+
+class StubLLM(BaseLLM):
+    """Answers every call with ``tokens`` words after a fixed delay; counts calls and prompt tokens."""
+
+    counters: StubCounters
+    ttft: float = 0.3
+    tokens: int = 200
+    tokens_per_sec: float = 100.0
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None,
+             from_agent=None, response_model=None, **kwargs) -> str:
+        text = messages if isinstance(messages, str) else "\n".join(str(m.get("content") or "") for m in messages)
+        with self.counters.lock:
+            self.counters.calls += 1
+            self.counters.prompt_tokens += estimate_tokens(text)
+        time.sleep(self.ttft + self.tokens / self.tokens_per_sec)
+        return "Thought: I now can give a great answer\nFinal Answer: " + "tok " * self.tokens
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+def bench_history(turns: int, answer_chars: int) -> None:
+    answer = "x" * answer_chars
+    t0 = time.perf_counter()
+    history = []
+    for index in range(turns):
+        history_txt = ""
+        for turn in history:
+            history_txt += f"User: {turn['user']}\nAgent: {turn['agent']}\n"
+        history.append({"user": f"question {index}", "agent": answer})
+    notebook = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    memory = CrewMemory(max_chars=12000)
+    for index in range(turns):
+        memory.text
+        memory.add_turn(f"question {index}", answer)
+    incremental = time.perf_counter() - t0
+    print(f"history of {turns} turns ({answer_chars} chars per answer): notebook rebuild {notebook * 1000:8.1f}ms "
+          f"({len(history_txt) // 1024}KB prompt at the end) | CrewMemory {incremental * 1000:6.1f}ms "
+          f"({len(memory.text) // 1024}KB, {memory.trimmed} turns trimmed)")
+
+
+async def play(label: str, tutor: CrewTutor, counters: StubCounters, students: int) -> None:
+    counters.reset()
+    latencies = []
+
+    async def student(index: int) -> None:
+        for message in CONVERSATION:
+            t0 = time.perf_counter()
+            await tutor.turn(f"student-{index}", message)
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(student(i) for i in range(students)))
+    elapsed = time.perf_counter() - t0
+    turns = len(latencies)
+    print(f"{label:<20} turns={turns} llm calls/turn={counters.calls / turns:4.2f} "
+          f"prompt tokens/turn={counters.prompt_tokens / turns:6.0f} turn p50={percentile(latencies, .5):5.2f}s "
+          f"p95={percentile(latencies, .95):5.2f}s throughput={turns / elapsed * 60:6.1f} turns/min "
+          f"tasks run={tutor.stats.tasks_run} cached={tutor.stats.tasks_cached}")
+
+
+async def run(args) -> None:
+    counters = StubCounters()
+    llm = StubLLM(model="stub", counters=counters, ttft=args.ttft, tokens=args.tokens,
+                  tokens_per_sec=args.tokens_per_sec)
+    print(f"{args.students} students x {len(CONVERSATION)} turns, stub {args.ttft * 1000:.0f}ms + "
+          f"{args.tokens} tokens at {args.tokens_per_sec:.0f}/s per call")
+    await play("rerun, 1 at a time", CrewTutor(llm, max_concurrency=1, cache=False), counters, args.students)
+    await play("rerun, concurrent", CrewTutor(llm, max_concurrency=args.concurrency, cache=False), counters,
+               args.students)
+    await play("cached, concurrent", CrewTutor(llm, max_concurrency=args.concurrency), counters, args.students)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--tokens-per-sec", type=float, default=100.0)
+    parser.add_argument("--history-turns", type=int, default=2000)
+    parser.add_argument("--answer-chars", type=int, default=2000)
+    args = parser.parse_args()
+    bench_history(args.history_turns, args.answer_chars)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# author: Jairo Monassa
+"""Upload ingestion throughput and passage retrieval latency of ``document_index`` on a large corpus.
+
+Writes ``--files`` synthetic text files of ``--mb`` MB in total (Zipf
+distributed words, with ``--needles`` planted sentences on made-up terms per
+file) and uploads them all for one student, as the 20 files of up to 500 MB
+``config.toml`` allows. Reported:
+
+- ingestion: MB/s and passages/s (copy in chunks, extraction, splitting and
+  FTS5 indexing), peak memory of the process, and index size on disk;
+- retrieval: latency p50/p95 of ``search`` for the student with the large
+  corpus and for a student with one small file (the corpus must not slow the
+  other students down), and whether the planted sentence of each needle query
+  is in the top-k;
+- prompt tokens per turn: the student's notes pasted in the chat (and so
+  resent every turn) vs the top-k passages.
+
+    python benchmarks/bench_document_index.py --mb 500 --files 20
+"""
+
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_index import DocumentIndex, render_passages  # noqa: E402
+from token_counting import estimate_tokens  # noqa: E402
+
+SYLLABLES = "ba be bi bo bu da de di do du fa fe fi ka ke ki la le li lo ma me mi mo na ne ni no pa pe po ra re ri ro sa se si so ta te ti to va ve vi".split()
+COMMON = "the of and to in is that for on with as by this are from at or which an be".split()
+BLOCK_BYTES = 1 << 20
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+def vocabulary(rng: random.Random, size: int) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))))
+    return COMMON + sorted(words)
+
+
+def text_blocks(rng: random.Random, words: list[str], count: int) -> list[str]:
+    """``count`` distinct ~1 MB blocks of sentences with Zipf distributed words."""
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    blocks = []
+    for _ in range(count):
+        sentences, size = [], 0
+        while size < BLOCK_BYTES:
+            sentence = " ".join(rng.choices(words, weights, k=2000)).replace(" the ", ". The ")
+            sentences.append(sentence)
+            size += len(sentence) + 1
+        blocks.append("\n".join(sentences) + "\n")
+    return blocks
+
+
+def write_corpus(folder: str, total_mb: int, files: int, needles: int, rng: random.Random) -> list[tuple[str, str, str]]:
+    """The corpus files; returns the planted (file, term, sentence) needles."""
+    words = vocabulary(rng, 50_000)
+    blocks = text_blocks(rng, words, 48)
+    per_file = max(1, total_mb // files)
+    planted = []
+    for index in range(files):
+        path = os.path.join(folder, f"notes-{index:02d}.txt")
+        positions = set(rng.sample(range(per_file), min(needles, per_file)))
+        with open(path, "w", encoding="utf-8") as f:
+            for block in range(per_file):
+                f.write(rng.choice(blocks))
+                if block in positions:
+                    term = f"zq{index:02d}x{block:04d}"
+                    sentence = f"The {term} theorem relates the {rng.choice(words)} to the {rng.choice(words)} rate."
+                    f.write(sentence + "\n")
+                    planted.append((path, term, sentence))
+    return planted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=int, default=500)
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--needles", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=4)
+    args = parser.parse_args()
+    rng = random.Random(25)
+
+    with tempfile.TemporaryDirectory() as folder:
+        corpus = os.path.join(folder, "corpus")
+        os.makedirs(corpus)
+        t0 = time.perf_counter()
+        planted = write_corpus(corpus, args.mb, args.files, args.needles, rng)
+        files = sorted(os.path.join(corpus, name) for name in os.listdir(corpus))
+        total = sum(os.path.getsize(path) for path in files)
+        print(f"corpus: {len(files)} files, {total / 1e6:.0f} MB written in {time.perf_counter() - t0:.1f}s")
+
+        index = DocumentIndex(os.path.join(folder, "uploads"))
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t0 = time.perf_counter()
+        passages = 0
+        for path in files:
+            result = index.ingest("student-big", os.path.basename(path), path, "text/plain")
+            if result.error:
+                raise RuntimeError(result.error)
+            passages += result.passages
+        seconds = time.perf_counter() - t0
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        student_dir = index.student_dir("student-big")
+        size = sum(os.path.getsize(os.path.join(student_dir, name)) for name in os.listdir(student_dir)
+                   if name.startswith(DocumentIndex.INDEX_FILE))
+        print(f"ingest: {total / 1e6 / seconds:6.1f} MB/s  {passages / seconds:8.0f} passages/s  "
+              f"({passages} passages in {seconds:.1f}s)  peak RSS {rss_before / 1024:.0f} -> {rss_after / 1024:.0f} MB  "
+              f"index {size / 1e6:.0f} MB")
+
+        small = os.path.join(folder, "essay.txt")
+        with open(small, "w", encoding="utf-8") as f:
+            f.write(open(files[0], encoding="utf-8").read(40_000))
+            f.write("\nMy essay argues that the zqessay theorem explains the cooling rate.\n")
+        index.ingest("student-small", "essay.txt", small)
+
+        needles = [rng.choice(planted) for _ in range(args.queries)]
+        found, latencies = 0, []
+        for path, term, sentence in needles:
+            t0 = time.perf_counter()
+            results = index.search("student-big", f"Can you check what my notes say about the {term} theorem?", args.top_k)
+            latencies.append(time.perf_counter() - t0)
+            found += any(term in p.text for p in results)
+        print(f"search needle  (big)   p50={percentile(latencies, 50) * 1000:7.1f}ms p95={percentile(latencies, 95) * 1000:7.1f}ms "
+              f"found in top-{args.top_k}: {found}/{len(needles)}")
+
+        words = vocabulary(random.Random(25), 50_000)
+        common = [" ".join(rng.sample(words[20:400], 4)) for _ in range(args.queries)]
+        for student, label in (("student-big", "broad   (big)  "), ("student-small", "broad   (small)")):
+            latencies = []
+            for query in common:
+                t0 = time.perf_counter()
+                results = index.search(student, query, args.top_k)
+                latencies.append(time.perf_counter() - t0)
+            print(f"search {label} p50={percentile(latencies, 50) * 1000:7.1f}ms p95={percentile(latencies, 95) * 1000:7.1f}ms")
+
+        results = index.search("student-small", "what does my essay say about the cooling rate", args.top_k)
+        essay = open(small, encoding="utf-8").read()
+        print(f"prompt tokens per turn: essay pasted in the chat {estimate_tokens(essay)} (every later turn too), "
+              f"top-{args.top_k} passages {estimate_tokens(render_passages(results))} (this turn only)")
+
+
+if __name__ == "__main__":
+    main()
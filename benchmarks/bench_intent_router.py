@@ -0,0 +1,106 @@
+# author: Jairo Monassa
+"""Route-hit rate, tokens and latency saved by the local intent router.
+
+Runs a labelled sample of student messages through the routing stage. The
+expected label is the specialist Main_Tutor_Agent should forward to, or None
+when the message must stay with the LLM router. Tokens saved are the router
+prompt (instructions + plugin schemas of the real roster) times the two
+Main_Tutor_Agent calls a forward costs; latency saved uses the measured
+``--router-roundtrip-ms`` of one Main_Tutor_Agent tool-call round-trip.
+
+    python benchmarks/bench_intent_router.py --router-roundtrip-ms 900
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import AsyncOpenAI  # noqa: E402
+
+from agent_registry import (  # noqa: E402
+    EVALUATION_CONTENT_AGENT_NAME,
+    PLANNING_AGENT_NAME,
+    PROGRESS_MONITORING_AGENT_NAME,
+    SIMULATION_AGENT_NAME,
+    build_registry,
+)
+from intent_router import KeywordRouter, NaiveBayesRouter, RoutingStage, router_prompt_tokens  # noqa: E402
+from model_backends import ModelServices  # noqa: E402
+
+SAMPLES = [
+    ("Quiz me on photosynthesis", SIMULATION_AGENT_NAME),
+    ("Can you give me a practice test about fractions?", SIMULATION_AGENT_NAME),
+    ("I want to take a quiz on the French revolution", SIMULATION_AGENT_NAME),
+    ("quero fazer um simulado de matemática", SIMULATION_AGENT_NAME),
+    ("Make me a study plan for the SAT", PLANNING_AGENT_NAME),
+    ("I need a study plan, my exam is in 3 weeks", PLANNING_AGENT_NAME),
+    ("Help me plan my studies for calculus", PLANNING_AGENT_NAME),
+    ("crie um plano de estudos de física", PLANNING_AGENT_NAME),
+    ("Check my progress", PROGRESS_MONITORING_AGENT_NAME),
+    ("Can you show my results from the last quizzes?", PROGRESS_MONITORING_AGENT_NAME),
+    ("how am I doing on my quizzes?", PROGRESS_MONITORING_AGENT_NAME),
+    ("Please evaluate my essay about climate change", EVALUATION_CONTENT_AGENT_NAME),
+    ("Hi!", None),
+    ("I don't feel like studying anything today", None),
+    ("My teacher keeps yelling at me", None),
+    ("I'm exhausted, I slept 4 hours this week", None),
+    ("What is a derivative?", None),
+    ("Explain the difference between mitosis and meiosis", None),
+    ("I finished chapter 3", None),
+    ("Can we review what I studied yesterday?", None),
+    ("Make me a study plan and then quiz me on it", None),
+    ("thanks, that helps", None),
+    ("I failed the quiz and my parents are angry", None),
+    ("What should I study first for the exam?", None),
+]
+
+
+def report(label: str, stage: RoutingStage, correct: int, wrong: int, roundtrip_ms: float) -> None:
+    stats = stage.stats.as_dict()
+    routable = sum(1 for _, expected in SAMPLES if expected)
+    print(
+        f"{label:<9} hit_rate={stats['hit_rate']:.0%} ({correct}/{routable} routable caught, {wrong} misroutes) "
+        f"local={stats['local_routing_ms_per_message']:.3f}ms/msg "
+        f"tokens_saved/msg={stats['tokens_saved_per_message']} "
+        f"latency_saved/msg={stage.stats.hits * roundtrip_ms / stage.stats.messages:.0f}ms"
+    )
+
+
+def score(stage: RoutingStage, message: str, expected: str | None, available: list[str]) -> tuple[int, int]:
+    decision = stage.route(message, available)
+    if decision is None:
+        return 0, 0
+    return (1, 0) if decision.agent_name == expected else (0, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--router-roundtrip-ms", type=float, default=900.0)
+    args = parser.parse_args()
+
+    client = AsyncOpenAI(api_key="bench", base_url="http://127.0.0.1:9/v1")
+    registry = build_registry(ModelServices.single(client, "gpt-4o-mini"), include_evaluation=True)
+    prompt_tokens = router_prompt_tokens(registry.main_agent)
+    available = list(registry.agents)
+    print(f"router prompt ~{prompt_tokens} tokens per Main_Tutor_Agent call, {len(SAMPLES)} messages")
+
+    stage = RoutingStage([KeywordRouter()])
+    stage.stats.router_prompt_tokens = prompt_tokens
+    results = [score(stage, message, expected, available) for message, expected in SAMPLES]
+    report("keywords", stage, sum(r[0] for r in results), sum(r[1] for r in results), args.router_roundtrip_ms)
+
+    # Keywords then the classifier, scored leave-one-out so it never sees the message under test
+    stage = RoutingStage([])
+    stage.stats.router_prompt_tokens = prompt_tokens
+    results = []
+    for index, (message, expected) in enumerate(SAMPLES):
+        training = [sample for i, sample in enumerate(SAMPLES) if i != index]
+        stage.routers = [KeywordRouter(), NaiveBayesRouter(min_confidence=0.8).fit(training)]
+        results.append(score(stage, message, expected, available))
+    report("kw+nb", stage, sum(r[0] for r in results), sum(r[1] for r in results), args.router_roundtrip_ms)
+
+
+if __name__ == "__main__":
+    main()
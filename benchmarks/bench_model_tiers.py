@@ -0,0 +1,215 @@
+# author: Jairo Monassa
+"""Latency and cost of the model profiles of ``models.toml`` on recorded conversations.
+
+The student messages of the threads in the thread store (``THREAD_STORE_PATH``,
+or ``--threads``) are replayed turn by turn: the wellbeing screening prompts
+run on the profile's screening tier, the message is routed by the local
+keyword router (anything it does not catch goes to Main_Tutor_Agent) and the
+answer streams from that agent's tier with the thread's history so far. With
+no recorded threads a small synthetic set is replayed instead.
+
+Each tier is served by its own stub with that tier's latency (``--tier``
+``name=ttft:tokens_per_sec``), so the profiles differ the way the real models
+do; token counts come from the stub's ``usage`` and are priced with the
+tier prices of the config.
+
+    python benchmarks/bench_model_tiers.py --profiles github,single-small,single-large,deepseek
+"""
+
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from openai import AsyncOpenAI  # noqa: E402
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings  # noqa: E402
+from semantic_kernel.contents import AuthorRole, ChatHistory  # noqa: E402
+
+from agent_registry import MAIN_AGENT_NAME, SPECIALIST_INSTRUCTIONS, SPECIALIST_ORDER, main_agent_instructions  # noqa: E402
+from intent_router import KeywordRouter, RoutingStage  # noqa: E402
+from model_backends import SCREENING_ROLE, Backend, ModelConfig, ModelServices  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+from wellbeing_screening import SCREENING_PROMPTS  # noqa: E402
+
+# Time to first token and streaming rate per tier, roughly as observed on GitHub Models
+TIER_LATENCY = {
+    "small": (0.35, 110.0),
+    "large": (0.70, 50.0),
+    "deepseek": (1.10, 30.0),
+    "mai": (1.80, 25.0),
+    "azure": (0.60, 60.0),
+}
+
+SYNTHETIC_CONVERSATIONS = [
+    ["Hi! I have my calculus exam in three weeks.",
+     "Can you make me a study plan? I can study 2 hours on weekdays.",
+     "Add more practice on integrals please",
+     "Thanks, I'm not very motivated lately though"],
+    ["I want to test my knowledge of photosynthesis",
+     "Give me a quiz with 3 questions",
+     "1-A, 2-C, 3-B",
+     "How am I doing so far?"],
+    ["I feel exhausted, I study until 2am every day and can't rest",
+     "My parents keep fighting about my grades",
+     "Can you help me organise my week so I sleep more?"],
+    ["What is the difference between mitosis and meiosis?",
+     "Explain it like I'm 12",
+     "Can you quiz me on it?",
+     "I don't feel like studying anymore, what's the point"],
+]
+
+
+def load_conversations(path: str, limit: int) -> list[list[str]]:
+    """Student messages of up to ``limit`` recorded threads, most recent first."""
+    if not os.path.exists(path):
+        return []
+    with sqlite3.connect(path) as db:
+        rows = db.execute("SELECT data FROM threads ORDER BY updated_at DESC LIMIT ?", (limit,)).fetchall()
+    conversations = []
+    for (data,) in rows:
+        messages = [str(m.content) for m in ChatHistory.restore_chat_history(data).messages
+                    if m.role == AuthorRole.USER and m.content]
+        if messages:
+            conversations.append(messages)
+    return conversations
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def bench_config(config: ModelConfig, stubs: dict[str, str]) -> tuple[ModelConfig, dict[str, AsyncOpenAI]]:
+    """The config with one backend per tier, each pointing at that tier's stub (no fallbacks)."""
+    tiers = {name: dataclasses.replace(tier, backend=name, model=tier.model or name, model_env=None, fallbacks=[])
+             for name, tier in config.tiers.items()}
+    backends = {name: Backend(name=name) for name in tiers}
+    clients = {name: AsyncOpenAI(api_key="bench", base_url=stubs[name], max_retries=0) for name in tiers}
+    return ModelConfig(backends=backends, tiers=tiers, profiles=config.profiles), clients
+
+
+class Replay:
+    def __init__(self, services: ModelServices, routing: RoutingStage, answer_tokens: int):
+        self.services = services
+        self.routing = routing
+        self.answer_tokens = answer_tokens
+        self.latencies: list[float] = []
+        self.ttfts: list[float] = []
+        self.screening: list[float] = []
+        self.tokens: dict[str, list[int]] = {}
+        self.agents: dict[str, int] = {}
+
+    def _count(self, tier: str, response) -> None:
+        usage = (response.metadata or {}).get("usage") if response is not None else None
+        if usage is not None:
+            counts = self.tokens.setdefault(tier, [0, 0])
+            counts[0] += usage.prompt_tokens or 0
+            counts[1] += usage.completion_tokens or 0
+
+    async def _screen_one(self, prompt: str, message: str) -> None:
+        service = self.services.for_agent(SCREENING_ROLE)
+        history = ChatHistory(system_message=prompt)
+        history.add_user_message(message)
+        settings = OpenAIChatPromptExecutionSettings(max_tokens=60, temperature=0, response_format={"type": "json_object"})
+        self._count(service.service_id, await service.get_chat_message_content(history, settings))
+
+    async def turn(self, history: ChatHistory, message: str) -> None:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(self._screen_one(prompt, message) for prompt in SCREENING_PROMPTS.values()))
+        self.screening.append(time.perf_counter() - t0)
+
+        decision = self.routing.route(message, SPECIALIST_INSTRUCTIONS)
+        agent = decision.agent_name if decision else MAIN_AGENT_NAME
+        self.agents[agent] = self.agents.get(agent, 0) + 1
+        service = self.services.for_agent(agent)
+        prompt = ChatHistory(system_message=SPECIALIST_INSTRUCTIONS.get(agent) or main_agent_instructions(SPECIALIST_ORDER),
+                             messages=list(history.messages))
+        prompt.add_user_message(message)
+        settings = OpenAIChatPromptExecutionSettings(max_tokens=self.answer_tokens)
+        answer, last, first = [], None, None
+        async for chunks in service.get_streaming_chat_message_contents(prompt, settings):
+            for chunk in chunks:
+                if chunk.content and first is None:
+                    first = time.perf_counter()
+                answer.append(chunk.content or "")
+                last = chunk
+        self._count(service.service_id, last)
+        self.ttfts.append((first or time.perf_counter()) - t0)
+        self.latencies.append(time.perf_counter() - t0)
+        history.add_user_message(message)
+        history.add_assistant_message("".join(answer))
+
+    async def conversation(self, messages: list[str], semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            history = ChatHistory()
+            for message in messages:
+                await self.turn(history, message)
+
+
+async def run_profile(config: ModelConfig, clients: dict, profile: str, conversations: list[list[str]],
+                      concurrency: int, answer_tokens: int) -> None:
+    replay = Replay(ModelServices(config, profile, clients=clients), RoutingStage([KeywordRouter()]), answer_tokens)
+    semaphore = asyncio.Semaphore(concurrency)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(replay.conversation(messages, semaphore) for messages in conversations))
+    elapsed = time.perf_counter() - t0
+    turns = len(replay.latencies)
+    cost = sum(config.tiers[tier].cost(*counts) for tier, counts in replay.tokens.items())
+    prompt = sum(counts[0] for counts in replay.tokens.values())
+    completion = sum(counts[1] for counts in replay.tokens.values())
+    print(f"{profile:<13} turns={turns} ttft p50={percentile(replay.ttfts, .5) * 1000:5.0f}ms "
+          f"p95={percentile(replay.ttfts, .95) * 1000:5.0f}ms latency p50={percentile(replay.latencies, .5) * 1000:5.0f}ms "
+          f"p95={percentile(replay.latencies, .95) * 1000:5.0f}ms screening p50={percentile(replay.screening, .5) * 1000:4.0f}ms "
+          f"tokens={prompt}+{completion} cost/1k turns=${cost / turns * 1000:.3f} wall={elapsed:.1f}s")
+    tiers = ", ".join(f"{tier}:{counts[0] + counts[1]}" for tier, counts in sorted(replay.tokens.items()))
+    print(f"{'':<13} tokens by tier {tiers}")
+
+
+async def run(args) -> None:
+    latency = dict(TIER_LATENCY)
+    for spec in args.tier:
+        name, value = spec.split("=", 1)
+        ttft, tps = value.split(":")
+        latency[name] = (float(ttft), float(tps))
+
+    config = ModelConfig.load(args.config)
+    conversations = load_conversations(args.threads, args.limit)
+    source = f"{len(conversations)} recorded threads from {args.threads}"
+    if not conversations:
+        conversations = SYNTHETIC_CONVERSATIONS * max(1, args.limit // len(SYNTHETIC_CONVERSATIONS))
+        source = f"no recorded threads, {len(conversations)} synthetic conversations"
+    print(f"{source}, {sum(map(len, conversations))} turns, answers of {args.answer_tokens} tokens")
+
+    stubs = {}
+    async with contextlib.AsyncExitStack() as stack:
+        for name in config.tiers:
+            ttft, tps = latency.get(name, (0.5, 60.0))
+            server = await stack.enter_async_context(StubServer(ttft=ttft, tokens=args.answer_tokens, tokens_per_sec=tps))
+            stubs[name] = server.base_url
+        bench, clients = bench_config(config, stubs)
+        for profile in args.profiles.split(","):
+            await run_profile(bench, clients, profile, conversations, args.concurrency, args.answer_tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", help="models.toml to compare (default: MODEL_CONFIG or the repo's)")
+    parser.add_argument("--profiles", default="github,single-small,single-large,deepseek,mai")
+    parser.add_argument("--threads", default=os.getenv("THREAD_STORE_PATH", os.path.join("sessions", "threads.db")))
+    parser.add_argument("--limit", type=int, default=40, help="conversations to replay")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--answer-tokens", type=int, default=150)
+    parser.add_argument("--tier", action="append", default=[], help="override a tier's latency: name=ttft:tokens_per_sec")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
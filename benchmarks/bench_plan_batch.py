@@ -0,0 +1,133 @@
+# author: Jairo Monassa
+"""Plans per minute and tokens per plan of ``plan_batch`` on a synthetic roster, and its resume.
+
+A ``--students`` roster is written to a CSV and planned against the offline
+stub, which answers every request with the ``save_study_plan_to_json`` call
+of an ``--weeks`` week plan streamed in ``--tokens`` pieces:
+
+- ``1 at a time``: what walking the students through the interactive loop
+  costs at best (no questions asked);
+- ``concurrency N``: the batch with ``--concurrency`` plans in flight;
+- ``crash + resume``: the batch is cancelled after ``--crash-after`` seconds
+  and started again on the same output, which must end with every student
+  planned once and only the plans in flight at the crash generated twice.
+
+Cost uses the prices of the ``large`` tier of ``models.toml`` (gpt-4o).
+
+    python benchmarks/bench_plan_batch.py --students 200 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import AsyncOpenAI  # noqa: E402
+
+from model_backends import ModelConfig  # noqa: E402
+from plan_batch import PlanBatch, load_roster  # noqa: E402
+from stub_server import stub_server_process  # noqa: E402
+
+SUBJECTS = ["Cálculo I", "Física básica", "Python", "Inglês para TOEFL", "Estatística", "Química orgânica"]
+
+
+def write_roster(path: str, students: int) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["student_id", "subject", "weekly_hours", "deadline", "level"])
+        writer.writeheader()
+        for index in range(students):
+            writer.writerow({"student_id": f"student-{index:04d}", "subject": SUBJECTS[index % len(SUBJECTS)],
+                             "weekly_hours": 4 + index % 12, "deadline": f"2026-{1 + index % 12:02d}-15",
+                             "level": "iniciante"})
+
+
+def plan(weeks: int) -> dict:
+    return {f"semana{w}": {
+        "dias1e2": {"topico": f"Tópico {w}", "subtopicos": ["teoria", "exercícios"], "meta": "resolver a lista"},
+        "dia3": {"topico": f"Revisão {w}", "subtopicos": ["resumo"], "meta": "revisar a semana"},
+    } for w in range(1, weeks + 1)}
+
+
+def stub_requests(base_url: str) -> int:
+    with urllib.request.urlopen(base_url.rsplit("/v1", 1)[0] + "/stats") as response:
+        return json.loads(response.read())["requests"]
+
+
+def planned_once(path: str, students: int) -> bool:
+    with open(path, encoding="utf-8") as f:
+        ok = [json.loads(line)["student_id"] for line in f if '"status": "ok"' in line]
+    return len(ok) == len(set(ok)) == students
+
+
+async def run_batch(base_url: str, roster, out: str, concurrency: int, tier, timeout: float | None = None):
+    client = AsyncOpenAI(base_url=base_url, api_key="stub", max_retries=0)
+    batch = PlanBatch(client, "stub", out, concurrency=concurrency, tier=tier)
+    try:
+        await asyncio.wait_for(batch.run(roster), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        await client.close()
+    return batch.stats
+
+
+def report(label: str, stats, requests: int) -> None:
+    print(f"{label:<16} planned={stats.planned:4d} skipped={stats.skipped:4d} failed={stats.failed} "
+          f"in {stats.seconds:6.1f}s  {stats.plans_per_minute:7.1f} plans/min  "
+          f"completions/plan={stats.completions / max(1, stats.planned):4.2f} "
+          f"tokens/plan={stats.tokens_per_plan:6.0f} cost/plan=${stats.cost_per_plan:.4f} stub requests={requests}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--weeks", type=int, default=8)
+    parser.add_argument("--crash-after", type=float, default=3.0)
+    parser.add_argument("--ttft", type=float, default=0.4)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    args = parser.parse_args()
+    tier = ModelConfig.load().tiers["large"]
+    tool_call = {"name": "save_study_plan_to_json",
+                 "arguments": json.dumps({"study_plan": plan(args.weeks)}, ensure_ascii=False)}
+
+    with tempfile.TemporaryDirectory() as folder:
+        roster_path = os.path.join(folder, "roster.csv")
+        write_roster(roster_path, args.students)
+        t0 = time.perf_counter()
+        roster = load_roster(roster_path)
+        print(f"roster of {len(roster)} students read in {(time.perf_counter() - t0) * 1000:.1f}ms")
+        with stub_server_process(ttft=args.ttft, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec,
+                                 tool_call=tool_call) as base_url:
+            # One at a time only over a slice of the roster, it is the slow baseline
+            serial = roster[:max(1, args.students // 10)]
+            before = stub_requests(base_url)
+            stats = asyncio.run(run_batch(base_url, serial, os.path.join(folder, "serial.jsonl"), 1, tier))
+            report("1 at a time", stats, stub_requests(base_url) - before)
+
+            before = stub_requests(base_url)
+            out = os.path.join(folder, "batch.jsonl")
+            stats = asyncio.run(run_batch(base_url, roster, out, args.concurrency, tier))
+            report(f"concurrency {args.concurrency}", stats, stub_requests(base_url) - before)
+
+            before = stub_requests(base_url)
+            out = os.path.join(folder, "resumed.jsonl")
+            crashed = asyncio.run(run_batch(base_url, roster, out, args.concurrency, tier, args.crash_after))
+            report("crash", crashed, stub_requests(base_url) - before)
+            resumed = asyncio.run(run_batch(base_url, roster, out, args.concurrency, tier))
+            requests = stub_requests(base_url) - before
+            report("resume", resumed, requests)
+            print(f"every student planned once: {planned_once(out, args.students)}; "
+                  f"plans generated twice (in flight at the crash): {requests - args.students}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# author: Jairo Monassa
+"""Throughput of concurrent plan saves and cost of loading a student's latest plan.
+
+"legacy" is the old ``save_study_plan_to_json``: every save goes to the same
+``planning2.json`` with ``indent=2``, so all but the last student lose their
+plan. The repository saves one version per student atomically, in each format
+with and without fsync. Afterwards the latest plan of every student is loaded
+through the index and, for comparison, by scanning the student's directory
+(students with ``--versions`` saved versions).
+
+    python benchmarks/bench_plan_repository.py --students 10000 --workers 32
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plan_repository import PlanRepository  # noqa: E402
+
+WORDS = "derivadas limites integrais séries vetores matrizes revisão exercícios prova capítulo".split()
+
+
+def synthetic_plan(weeks: int, rng: random.Random) -> dict:
+    return {
+        f"week{w}": {
+            f"day{d}": {
+                "topic": " ".join(rng.choices(WORDS, k=3)),
+                "subtopics": [" ".join(rng.choices(WORDS, k=4)) for _ in range(3)],
+                "goal": " ".join(rng.choices(WORDS, k=8)),
+            }
+            for d in (1, 3, 5)
+        }
+        for w in range(1, weeks + 1)
+    }
+
+
+def legacy_save(folder: str, plan: dict) -> None:
+    with open(os.path.join(folder, "planning2.json"), "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2, ensure_ascii=False)
+
+
+def run(label: str, save, jobs: list, workers: int) -> float:
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(lambda job: save(*job), jobs))
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<30} {len(jobs) / elapsed:8.0f} saves/s  ({elapsed:.1f}s)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--weeks", type=int, default=12)
+    parser.add_argument("--versions", type=int, default=100)
+    args = parser.parse_args()
+    rng = random.Random(3)
+    plans = [synthetic_plan(args.weeks, rng) for _ in range(50)]
+    jobs = [(f"student-{i}", plans[i % len(plans)]) for i in range(args.students)]
+    print(f"{args.students} students, {args.workers} threads, "
+          f"plan ~{len(json.dumps(plans[0], indent=2, ensure_ascii=False)) / 1024:.1f}KB pretty")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run("legacy planning2.json", lambda student, plan: legacy_save(tmp, plan), jobs, args.workers)
+        print(f"{'':<30} plans kept: 1 of {args.students}")
+
+    for fmt, fsync in (("pretty", True), ("pretty", False), ("compact", False), ("gzip", False)):
+        with tempfile.TemporaryDirectory() as tmp:
+            repository = PlanRepository(tmp, format=fmt, fsync=fsync)
+            run(f"repository {fmt} fsync={'on' if fsync else 'off'}", repository.save, jobs, args.workers)
+            size = sum(r.size for r in (repository.record(s) for s, _ in jobs[:1000])) / 1000
+            print(f"{'':<30} {size / 1024:.1f}KB/plan")
+            repository.close()
+
+    # --- latest plan lookup for students with a long history ---
+    with tempfile.TemporaryDirectory() as tmp:
+        repository = PlanRepository(tmp, format="compact", fsync=False)
+        history = [(f"student-{i}", plans[(i + v) % len(plans)]) for v in range(args.versions) for i in range(200)]
+        with ThreadPoolExecutor(args.workers) as pool:
+            list(pool.map(lambda job: repository.save(*job), history))
+        students = [f"student-{i}" for i in range(200)]
+        t0 = time.perf_counter()
+        for i, student in enumerate(students):
+            assert repository.load(student) == plans[(i + args.versions - 1) % len(plans)]
+        indexed = (time.perf_counter() - t0) / len(students)
+        t0 = time.perf_counter()
+        for student in students:
+            latest = max(glob.glob(os.path.join(repository.student_dir(student), "v*.json")))
+            with open(latest, "rb") as f:
+                json.loads(f.read())
+        scanned = (time.perf_counter() - t0) / len(students)
+        print(f"latest of {args.versions} versions     indexed {indexed * 1e6:.0f}us  directory scan {scanned * 1e6:.0f}us")
+        repository.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# author: Jairo Monassa
+"""Event-loop latency while many students save large study plans at once.
+
+A probe task sleeps 1ms in a loop and records how late it wakes up, which is
+what every other student's token stream would feel. The saves run either
+inline on the loop (a plain synchronous tool) or through the
+``StudyPlanPlugin`` kernel function, which writes in a worker thread.
+
+The run fails when the worst lag during the kernel function saves is more
+than ``--max-lag-ms`` above the worst lag of the idle loop, or more than
+``--max-lag-share`` of the worst lag of the inline saves, so offloading has
+to beat writing on the loop whatever the machine and the plan size.
+
+    python benchmarks/bench_plan_save_loop.py --saves 200 --weeks 52 --max-lag-ms 100 --max-lag-share 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_kernel import Kernel  # noqa: E402
+from semantic_kernel.functions import KernelArguments  # noqa: E402
+
+from plan_repository import PlanRepository  # noqa: E402
+from study_plan_plugin import STUDY_PLAN_PLUGIN_NAME, StudyPlanPlugin, current_student  # noqa: E402
+
+WORDS = "derivadas limites integrais séries vetores matrizes revisão exercícios prova capítulo".split()
+
+
+def synthetic_plan(weeks: int, rng: random.Random) -> dict:
+    return {
+        f"week{w}": {
+            f"day{d}": {
+                "topic": " ".join(rng.choices(WORDS, k=3)),
+                "subtopics": [" ".join(rng.choices(WORDS, k=4)) for _ in range(4)],
+                "goal": " ".join(rng.choices(WORDS, k=10)),
+            }
+            for d in range(1, 6)
+        }
+        for w in range(1, weeks + 1)
+    }
+
+
+async def probe(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - t0 - 0.001)
+
+
+async def measure(label: str, save_all) -> float:
+    """Run ``save_all`` under the probe; returns the worst lag in seconds."""
+    lags: list[float] = []
+    stop = asyncio.Event()
+    probing = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.05)
+    t0 = time.perf_counter()
+    await save_all()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await probing
+    lags.sort()
+    ms = [lag * 1000 for lag in lags]
+    print(f"{label:<18} saves took {elapsed:5.2f}s  loop lag p50={ms[len(ms) // 2]:6.2f}ms "
+          f"p99={ms[int(len(ms) * 0.99)]:7.2f}ms max={ms[-1]:7.2f}ms  probe wakeups={len(ms)}")
+    return lags[-1]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--saves", type=int, default=200)
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--max-lag-ms", type=float, default=100.0,
+                        help="allowed worst loop lag above the idle one while the kernel function saves")
+    parser.add_argument("--max-lag-share", type=float, default=0.5,
+                        help="allowed worst loop lag of the kernel function saves, as a share of the inline one")
+    args = parser.parse_args()
+    rng = random.Random(11)
+    plans = [synthetic_plan(args.weeks, rng) for _ in range(10)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repository = PlanRepository(tmp, format="pretty")
+        kernel = Kernel()
+        kernel.add_plugin(StudyPlanPlugin(repository), plugin_name=STUDY_PLAN_PLUGIN_NAME)
+        function = kernel.get_function(STUDY_PLAN_PLUGIN_NAME, "save_study_plan_to_json")
+
+        async def idle():
+            await asyncio.sleep(0.5)
+
+        async def inline_save(index: int):
+            repository.save(f"student-{index}", plans[index % len(plans)])
+
+        async def plugin_save(index: int):
+            current_student.set(f"student-{index}")
+            result = await kernel.invoke(function, KernelArguments(study_plan=plans[index % len(plans)]))
+            assert str(result).startswith("Study plan saved"), result
+
+        baseline = await measure("idle", idle)
+        inline = await measure("inline (blocking)", lambda: asyncio.gather(*(inline_save(i) for i in range(args.saves))))
+        offloaded = await measure("kernel function", lambda: asyncio.gather(*(plugin_save(i) for i in range(args.saves))))
+        assert repository.record("student-0").version == 2
+        repository.close()
+
+    bound = baseline + args.max_lag_ms / 1000
+    print(f"bound: max lag <= {bound * 1000:.2f}ms (idle {baseline * 1000:.2f}ms + {args.max_lag_ms:.0f}ms)  "
+          f"inline {'within' if inline <= bound else 'over'}, kernel function {'within' if offloaded <= bound else 'over'}")
+    print(f"kernel function max lag is {offloaded / inline:.0%} of the inline one (allowed {args.max_lag_share:.0%})")
+    if offloaded > bound:
+        sys.exit(f"FAIL: saving {args.saves} plans through the kernel function lagged the event loop "
+                 f"{offloaded * 1000:.2f}ms, over the {bound * 1000:.2f}ms bound")
+    if offloaded > inline * args.max_lag_share:
+        sys.exit(f"FAIL: the kernel function saves lagged the event loop {offloaded * 1000:.2f}ms, not below "
+                 f"{args.max_lag_share:.0%} of the {inline * 1000:.2f}ms of the inline saves")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+# author: Jairo Monassa
+"""Blocking planning loop vs the streaming ``PlanningSession`` against a local stub.
+
+"question" is an ordinary assistant turn: the blocking loop shows nothing until
+the whole answer arrived, the session shows the first token. "save" is the
+turn that ends with the study plan tool call: the blocking loop waits for the
+whole non-streamed tool call and then pays a second completion for the
+confirmation, the session executes the tool as soon as its arguments close
+and answers with a local template.
+
+    python benchmarks/bench_planning_session.py --turns 20 --ttft 0.4 --tokens-per-sec 60
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import AsyncOpenAI, OpenAI  # noqa: E402
+
+import agent_planning  # noqa: E402
+from planning_session import Confirmation, PlanningSession, TextDelta  # noqa: E402
+from stub_server import stub_server_process  # noqa: E402
+
+PLAN = {f"semana{w}": {"dias1e2": {"topico": f"Tópico {w}", "subtopicos": ["a", "b"], "meta": "revisar"}}
+        for w in range(1, 9)}
+
+
+def make_saver(folder: str):
+    def save(study_plan: dict) -> str:
+        path = os.path.join(folder, "plan.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(study_plan, f, ensure_ascii=False)
+        return f"Plano de estudos salvo com sucesso em {path}"
+    return save
+
+
+def blocking_turn(client: OpenAI, messages: list, save) -> tuple[float, float, int]:
+    """The original ``agent_planning.main()`` turn; returns (first visible, total, completions)."""
+    t0 = time.perf_counter()
+    calls = 1
+    response = client.chat.completions.create(
+        model="stub", messages=messages, tools=agent_planning.tools, tool_choice="auto"
+    )
+    message = response.choices[0].message
+    if message.tool_calls:
+        messages = messages + [message.model_dump(exclude_none=True)]
+        for tool_call in message.tool_calls:
+            result = save(json.loads(tool_call.function.arguments))
+            messages.append({"tool_call_id": tool_call.id, "role": "tool",
+                             "name": tool_call.function.name, "content": result})
+        client.chat.completions.create(model="stub", messages=messages)
+        calls += 1
+    elapsed = time.perf_counter() - t0
+    return elapsed, elapsed, calls
+
+
+async def streaming_turn(client: AsyncOpenAI, messages: list, save) -> tuple[float, float, int]:
+    session = PlanningSession(
+        client=client,
+        model="stub",
+        messages=list(messages),
+        tools=agent_planning.tools,
+        functions={"save_study_plan_to_json": save},
+        confirmations={"save_study_plan_to_json": agent_planning.save_confirmation},
+    )
+    t0 = time.perf_counter()
+    first = None
+    async for event in session.send():
+        if first is None and isinstance(event, (TextDelta, Confirmation)):
+            first = time.perf_counter() - t0
+    total = time.perf_counter() - t0
+    return first, total, 1
+
+
+def report(label: str, results: list[tuple[float, float, int]]) -> None:
+    first = statistics.median(r[0] for r in results) * 1000
+    total = statistics.median(r[1] for r in results) * 1000
+    calls = sum(r[2] for r in results) / len(results)
+    print(f"{label:<22} first visible p50={first:7.1f}ms  turn p50={total:7.1f}ms  completions/turn={calls:.1f}")
+
+
+async def run(args, base_url: str, save) -> dict:
+    messages = agent_planning.build_messages("Cálculo I")
+    sync_client = OpenAI(base_url=base_url, api_key="stub")
+    async_client = AsyncOpenAI(base_url=base_url, api_key="stub")
+    results = {"blocking": [], "streaming": []}
+    for _ in range(args.turns):
+        results["blocking"].append(await asyncio.to_thread(blocking_turn, sync_client, messages, save))
+        results["streaming"].append(await streaming_turn(async_client, messages, save))
+    await async_client.close()
+    sync_client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--ttft", type=float, default=0.4)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    args = parser.parse_args()
+    stub = dict(ttft=args.ttft, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec)
+
+    with tempfile.TemporaryDirectory() as folder:
+        save = make_saver(folder)
+        with stub_server_process(**stub) as base_url:
+            question = asyncio.run(run(args, base_url, save))
+        tool_call = {"name": "save_study_plan_to_json", "arguments": json.dumps(PLAN, ensure_ascii=False)}
+        with stub_server_process(**stub, tool_call=tool_call) as base_url:
+            saving = asyncio.run(run(args, base_url, save))
+
+    report("question  blocking", question["blocking"])
+    report("question  streaming", question["streaming"])
+    report("save      blocking", saving["blocking"])
+    report("save      streaming", saving["streaming"])
+
+
+if __name__ == "__main__":
+    main()
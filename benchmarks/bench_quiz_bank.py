@@ -0,0 +1,176 @@
+# author: Jairo Monassa
+"""Quiz latency: generated live when asked vs served from the pregenerated quiz bank.
+
+``--students`` students have a saved study plan with ``--plan-topics`` topics
+drawn from a pool of ``--topics`` shared topics, and each asks for
+``--quizzes`` quizzes on topics of their plan, one request every
+``--interval`` seconds, against the offline stub:
+
+- ``live``: Quiz_Simulation_Agent writes the quiz while the student waits
+  (one streamed completion of about ``--tokens`` tokens per quiz);
+- ``bank``: the plans are prefetched in the background first
+  (``QuizBank.prefetch_student``, one JSON completion per banked quiz,
+  ``json_object`` or with ``--structured`` a strict ``json_schema``),
+  then every request is ``quiz_for`` + ``serve_quiz``, which registers the
+  quiz and shows it with no model call;
+- ``cold``: requests on topics that are in no plan, which the bank answers
+  with None (the app then generates live) without queueing anything.
+
+Reported: latency p50/p95 of the quiz requests, model calls, and how many
+topic prefetches the bank deduplicated across students.
+
+    python benchmarks/bench_quiz_bank.py --students 40 --topics 12 --interval 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import AsyncOpenAI  # noqa: E402
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion  # noqa: E402
+from semantic_kernel.contents import ChatHistory  # noqa: E402
+
+from quiz_bank import QuizBank, serve_quiz  # noqa: E402
+from stub_server import stub_server_process  # noqa: E402
+
+QUIZ = {"questions": [
+    {"question": f"Question {n} about the topic?", "choices": ["first", "second", "third", "fourth"], "answer": "B"}
+    for n in range(1, 4)
+] + [{"question": f"Explain part {n} of the topic.", "choices": [], "answer": ""} for n in range(4, 6)]}
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else 0.0
+
+
+def stub_requests(base_url: str) -> int:
+    with urllib.request.urlopen(base_url.rsplit("/v1", 1)[0] + "/stats") as response:
+        return json.loads(response.read())["requests"]
+
+
+def make_plans(students: int, topics: list[str], plan_topics: int, rng: random.Random) -> dict[str, list[str]]:
+    from plan_repository import get_repository
+
+    plans = {}
+    for index in range(students):
+        student = f"student-{index:04d}"
+        chosen = rng.sample(topics, plan_topics)
+        get_repository().save(student, {f"week{w}": {
+            "days1and2": {"topic": topic, "subtopics": ["theory", "exercises"], "goal": "solve the exercises"},
+        } for w, topic in enumerate(chosen, 1)})
+        plans[student] = chosen
+    return plans
+
+
+async def live(service, requests: list[tuple[str, str]], interval: float) -> list[float]:
+    async def one(index: int, student: str, topic: str) -> float:
+        await asyncio.sleep(index * interval)
+        history = ChatHistory(system_message="You write practice quizzes.")
+        history.add_user_message(f"Give me a quiz on {topic}")
+        t0 = time.perf_counter()
+        async for _ in service.get_streaming_chat_message_contents(
+                chat_history=history, settings=service.get_prompt_execution_settings_class()()):
+            pass
+        return time.perf_counter() - t0
+
+    return await asyncio.gather(*(one(index, *request) for index, request in enumerate(requests)))
+
+
+async def served(bank: QuizBank, requests: list[tuple[str, str]], interval: float = 0.0) -> tuple[list[float], int]:
+    async def push(text: str) -> None:
+        pass
+
+    async def one(index: int, student: str, topic: str) -> float | None:
+        await asyncio.sleep(index * interval)
+        t0 = time.perf_counter()
+        quiz = await bank.quiz_for(student, f"Give me a quiz on {topic}")
+        if quiz is None:
+            return None
+        await serve_quiz(quiz, student, f"Give me a quiz on {topic}", ChatHistory(), push, "Quiz_Simulation_Agent")
+        return time.perf_counter() - t0
+
+    results = await asyncio.gather(*(one(index, *request) for index, request in enumerate(requests)))
+    return [r for r in results if r is not None], sum(r is None for r in results)
+
+
+def report(label: str, latencies: list[float], calls: int, extra: str = "") -> None:
+    print(f"{label:<6} requests={len(latencies):4d} p50={percentile(latencies, 50) * 1000:8.1f}ms "
+          f"p95={percentile(latencies, 95) * 1000:8.1f}ms model calls={calls:4d} {extra}")
+
+
+async def run(base_url: str, args) -> None:
+    rng = random.Random(24)
+    topics = [f"Topic {n}" for n in range(args.topics)]
+    plans = make_plans(args.students, topics, args.plan_topics, rng)
+    requests = [(student, rng.choice(chosen)) for student, chosen in plans.items() for _ in range(args.quizzes)]
+    client = AsyncOpenAI(base_url=base_url, api_key="stub", max_retries=0)
+    service = OpenAIChatCompletion(ai_model_id="stub", async_client=client)
+
+    before = stub_requests(base_url)
+    latencies = await live(service, requests, args.interval)
+    report("live", latencies, stub_requests(base_url) - before)
+
+    bank = QuizBank(service, depth=args.depth, workers=args.workers, structured=args.structured)
+    before = stub_requests(base_url)
+    t0 = time.perf_counter()
+    for student in plans:
+        bank.prefetch_student(student)
+    await bank.drain()
+    warm = time.perf_counter() - t0
+    generations = stub_requests(base_url) - before
+    prefetches = args.students * args.plan_topics
+    print(f"prefetch: {prefetches} plan topics of {args.students} students -> {len(topics)} distinct, "
+          f"{generations} background generations in {warm:.1f}s "
+          f"(deduplicated {bank.stats.deduplicated}, failed {bank.stats.failed})")
+
+    # Each quiz taken queues a refill of its topic in the background while the next requests come in
+    before = stub_requests(base_url)
+    latencies, cold = await served(bank, requests, args.interval)
+    await bank.drain()
+    report("bank", latencies, stub_requests(base_url) - before,
+           f"cold={cold} hits={bank.stats.hits} (calls are background refills)")
+
+    unknown = [(student, f"Extra subject {n}") for n, student in enumerate(list(plans)[:args.topics])]
+    _, cold = await served(bank, unknown)
+    before = stub_requests(base_url)
+    await bank.drain()
+    print(f"cold   {cold}/{len(unknown)} unplanned topics fell back to live generation; "
+          f"background generations for them: {stub_requests(base_url) - before}")
+    await bank.close()
+    await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=40)
+    parser.add_argument("--topics", type=int, default=12)
+    parser.add_argument("--plan-topics", type=int, default=4)
+    parser.add_argument("--quizzes", type=int, default=2)
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--structured", action="store_true", help="strict json_schema instead of json_object")
+    parser.add_argument("--ttft", type=float, default=0.4)
+    parser.add_argument("--tokens", type=int, default=250)
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        os.environ["PLAN_STORE_DIR"] = os.path.join(folder, "plans")
+        os.environ["QUIZ_STORE_PATH"] = os.path.join(folder, "quizzes.db")
+        with stub_server_process(ttft=args.ttft, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec,
+                                 json_answer=json.dumps(QUIZ)) as base_url:
+            asyncio.run(run(base_url, args))
+
+
+if __name__ == "__main__":
+    main()
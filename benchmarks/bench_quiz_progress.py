@@ -0,0 +1,123 @@
+# author: Jairo Monassa
+"""Progress queries: full-thread model pass vs quiz aggregates.
+
+Simulates students who took ``--quizzes`` quizzes each (5 questions, 3 of them
+multiple choice, answered in assorted formats), grades them with the local
+engine and reports:
+
+- grading agreement with the ground truth and grading time;
+- progress lookup latency in a store with ``--students`` students;
+- prompt tokens of the progress request: the old full-thread pass vs the
+  short rendering call on the aggregates.
+
+    python benchmarks/bench_quiz_progress.py --students 2000 --quizzes 20
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent_registry import PROGRESS_MONITORING_AGENT_NAME, SPECIALIST_INSTRUCTIONS  # noqa: E402
+from quiz_engine import (  # noqa: E402
+    PROGRESS_RENDER_INSTRUCTIONS, Quiz, QuizStore, grade, parse_answers, parse_questions,
+)
+from token_counting import estimate_tokens  # noqa: E402
+
+TOPICS = ["derivatives", "limits", "integrals", "series", "vectors", "matrices"]
+FORMATS = ["{n}-{a}", "{n} {a}", "{n}: {a}", "{n}) {a}", "{n}.{a}", "{n} - ({a})"]
+WORDS = "the function limit value point curve slope area rule chain product quotient".split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words)).capitalize() + "?"
+
+
+def make_quiz(rng: random.Random, student: str, week: int) -> Quiz:
+    questions = [
+        {"question": sentence(rng, 12), "choices": [sentence(rng, 4) for _ in range(4)], "answer": rng.choice("ABCD")}
+        for _ in range(3)
+    ] + [{"question": sentence(rng, 15)} for _ in range(2)]
+    return Quiz(quiz_id=uuid.uuid4().hex, student_id=student, topic=TOPICS[week % len(TOPICS)],
+                week=f"week{week}", questions=parse_questions(questions), created_at=time.time())
+
+
+def student_reply(rng: random.Random, quiz: Quiz) -> tuple[str, int]:
+    """Reply text with mixed answer formats, plus how many answers are right."""
+    parts, right = [], 0
+    for q in quiz.questions:
+        if q.multiple_choice:
+            letter = q.answer if rng.random() < 0.7 else rng.choice([c for c in "ABCD" if c != q.answer])
+            right += letter == q.answer
+            parts.append(rng.choice(FORMATS).format(n=q.number, a=rng.choice([letter, letter.lower()])))
+        else:
+            parts.append(f"{q.number}. {sentence(rng, 20)}")
+    return ", ".join(parts), right
+
+
+def thread_text(quiz: Quiz, reply: str, rng: random.Random) -> str:
+    """Roughly what one quiz turn leaves in the chat history."""
+    shown = "\n".join(f"{q.number}. {q.text} " + " ".join(f"{l}) {c}" for l, c in zip("ABCD", q.choices))
+                      for q in quiz.questions)
+    feedback = " ".join(sentence(rng, 14) for _ in range(6))
+    return f"Give me a quiz on {quiz.topic}\n{shown}\n{reply}\n{feedback}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--quizzes", type=int, default=20)
+    args = parser.parse_args()
+    rng = random.Random(21)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = QuizStore(os.path.join(tmp, "quizzes.db"))
+        agree = total = 0
+        grading = []
+        history: list[str] = []
+        t0 = time.perf_counter()
+        for index in range(args.students):
+            student = f"student-{index}"
+            for week in range(1, args.quizzes + 1):
+                quiz = make_quiz(rng, student, week)
+                store.save_quiz(quiz)
+                reply, right = student_reply(rng, quiz)
+                pending = store.pending_quiz(student)
+                g0 = time.perf_counter()
+                result = grade(pending, parse_answers(reply))
+                grading.append(time.perf_counter() - g0)
+                store.record_grade(pending, result)
+                agree += result.correct == right and result.answered == result.total
+                total += 1
+                if index == 0:
+                    history.append(thread_text(quiz, reply, rng))
+        build = time.perf_counter() - t0
+        print(f"graded {total} quizzes for {args.students} students in {build:.1f}s; "
+              f"agreement with ground truth {agree / total:.1%}; grade p50 {statistics.median(grading) * 1e6:.0f}us")
+
+        lookups = []
+        for _ in range(2000):
+            student = f"student-{rng.randrange(args.students)}"
+            t1 = time.perf_counter()
+            progress = store.progress(student)
+            lookups.append(time.perf_counter() - t1)
+        lookups.sort()
+        print(f"progress lookup p50={lookups[len(lookups) // 2] * 1e6:.0f}us p99={lookups[int(len(lookups) * .99)] * 1e6:.0f}us "
+              f"({len(progress['topic'])} topics, {len(progress['week'])} weeks)")
+
+        full = estimate_tokens(SPECIALIST_INSTRUCTIONS[PROGRESS_MONITORING_AGENT_NAME]) + sum(map(estimate_tokens, history))
+        short = estimate_tokens(PROGRESS_RENDER_INSTRUCTIONS) + estimate_tokens(json.dumps(store.progress("student-0")))
+        print(f"progress prompt after {args.quizzes} quizzes: full thread ~{full} tokens, aggregates ~{short} tokens "
+              f"({1 - short / full:.0%} fewer; the full pass also grows with every turn)")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# author: Jairo Monassa
+"""Goodput of a shared model quota at 3x oversubscription, with and without the rate limiter.
+
+The stub enforces ``--rpm`` requests and ``--tpm`` tokens per ``--window``
+seconds (a minute of the real quota, compressed) and answers 429 with
+``retry-after`` beyond it. Requests of ``--sessions`` students arrive as a
+Poisson stream at ``--oversubscription`` times the request quota; each must
+finish within ``--deadline`` seconds or the student gives up.
+
+- ``retries``: every request goes straight out and retries 429s
+  (``resilience`` with ``retry-after``), i.e. the apps before the limiter;
+- ``limiter``: the process-wide token buckets configured with the quota,
+  with the fair per-session admission queue;
+- ``learned``: the same limiter with no configured quota, learning it from
+  the ``x-ratelimit-*`` headers.
+
+Goodput is the completed requests per second (and as a share of the quota);
+fairness is Jain's index of the per-session completion ratios.
+
+    python benchmarks/bench_rate_limiter.py --duration 40 --window 10 --rpm 30
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from openai import AsyncOpenAI  # noqa: E402
+
+from rate_limiter import QueueFullError, RateLimiter, current_session  # noqa: E402
+from resilience import Endpoint, ResilienceConfig, ResilientCompletions  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+def jain(values: list[float]) -> float:
+    return sum(values) ** 2 / (len(values) * sum(v * v for v in values)) if any(values) else 0.0
+
+
+async def scenario(label: str, args, limiter: RateLimiter | None) -> None:
+    async with StubServer(ttft=args.ttft, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec,
+                          rpm_limit=args.rpm, tpm_limit=args.tpm, quota_window=args.window) as server:
+        client = AsyncOpenAI(api_key="bench", base_url=server.base_url, max_retries=0)
+        completions = ResilientCompletions(
+            [Endpoint("stub", client)],
+            ResilienceConfig(max_attempts=args.attempts, backoff=0.25, backoff_max=args.window, breaker_failures=10**6),
+            limiter,
+        )
+        outcomes = Counter()
+        offered = Counter()
+        completed = Counter()
+        latencies = []
+        rng = random.Random(7)
+
+        async def request(session: str) -> None:
+            current_session.set(session)
+            offered[session] += 1
+            t0 = time.perf_counter()
+            try:
+                async with asyncio.timeout(args.deadline):
+                    stream = await completions.create(
+                        model="gpt-4o-mini", stream=True, max_tokens=args.tokens,
+                        messages=[{"role": "user", "content": "Explain the water cycle. " * 20}],
+                    )
+                    async for _ in stream:
+                        pass
+            except TimeoutError:
+                outcomes["timed out"] += 1
+                return
+            except QueueFullError:
+                outcomes["rejected"] += 1
+                return
+            except Exception:
+                outcomes["failed"] += 1
+                return
+            outcomes["completed"] += 1
+            completed[session] += 1
+            latencies.append(time.perf_counter() - t0)
+
+        rate = args.oversubscription * args.rpm / args.window
+        sessions = [f"student-{i}" for i in range(args.sessions)]
+        # A few students send most of the traffic (screening prompts, tool loops, quick retries)
+        weights = [3 if i < args.sessions // 5 else 1 for i in range(args.sessions)]
+        tasks = []
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < args.duration:
+            tasks.append(asyncio.create_task(request(rng.choices(sessions, weights)[0])))
+            await asyncio.sleep(rng.expovariate(rate))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+
+        quota = args.rpm / args.window * args.duration
+        ratios = [completed[s] / offered[s] for s in offered]
+        print(f"{label:<8} offered={len(tasks)} completed={outcomes['completed']} ({outcomes['completed'] / quota:4.0%} of quota) "
+              f"goodput={outcomes['completed'] / elapsed:5.2f}/s timed_out={outcomes['timed out']} "
+              f"rejected={outcomes['rejected']} failed={outcomes['failed']} 429s={server.throttled} "
+              f"sent={server.requests} latency p50={percentile(latencies, .5):4.1f}s p95={percentile(latencies, .95):4.1f}s "
+              f"fairness={jain(ratios):.2f}")
+        if limiter is not None:
+            print(f"{'':<8} limiter: " + " ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+                                                   for k, v in limiter.stats.as_dict().items()))
+
+
+async def run(args) -> None:
+    print(f"quota {args.rpm} requests / {args.tpm} tokens per {args.window:.0f}s, arrivals at "
+          f"{args.oversubscription:.0f}x for {args.duration:.0f}s, {args.sessions} students, deadline {args.deadline:.0f}s")
+    per_minute = 60 / args.window
+    await scenario("retries", args, None)
+    # Turn away what could not be admitted well before the student gives up
+    options = dict(max_queue=args.max_queue, burst_seconds=args.window, max_wait=args.deadline / 2)
+    await scenario("limiter", args, RateLimiter(args.rpm * per_minute, args.tpm * per_minute, **options))
+    await scenario("learned", args, RateLimiter(**options))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=40.0)
+    parser.add_argument("--window", type=float, default=10.0, help="seconds standing in for the quota minute")
+    parser.add_argument("--rpm", type=int, default=30, help="requests per window")
+    parser.add_argument("--tpm", type=int, default=12000, help="tokens per window")
+    parser.add_argument("--oversubscription", type=float, default=3.0)
+    parser.add_argument("--sessions", type=int, default=30)
+    parser.add_argument("--deadline", type=float, default=15.0)
+    parser.add_argument("--attempts", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=256)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# author: Jairo Monassa
+"""Success rate and tail latency of streamed completions with retries, failover and hedging.
+
+Two stub endpoints stand in for ``models.inference.ai.azure.com`` (primary)
+and ``models.github.ai`` (fallback). The primary throttles or fails
+``--error-rate`` of the requests and stalls ``--slow-rate`` of them for
+``--slow-ttft`` seconds before the first token. Scenarios:
+
+- ``openai``: the plain client with its own retries (``max_retries=2``);
+- ``retry``: ``ResilientCompletions`` on the primary alone;
+- ``failover``: primary then fallback;
+- ``hedged``: failover plus a hedge request after the p95 first-token time;
+- ``outage``: the primary answers nothing but 503; the circuit breaker
+  keeps the requests off it after the first few failures.
+
+The last line streams through the Semantic Kernel service
+(``ResilientChatCompletion``) to check that the answer arrives whole.
+
+    python benchmarks/bench_resilience.py --requests 400 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from openai import AsyncOpenAI  # noqa: E402
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings  # noqa: E402
+from semantic_kernel.contents import ChatHistory  # noqa: E402
+
+from resilience import Endpoint, ResilienceConfig, ResilientChatCompletion, ResilientCompletions  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Explain photosynthesis in one paragraph."}]
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+async def one_request(create) -> tuple[float, float] | None:
+    """TTFT and total time of one streamed answer, None when it failed."""
+    t0 = time.perf_counter()
+    first = None
+    try:
+        stream = await create(model="gpt-4o-mini", messages=MESSAGES, stream=True,
+                              stream_options={"include_usage": True})
+        async for chunk in stream:
+            if first is None and chunk.choices and chunk.choices[0].delta.content:
+                first = time.perf_counter() - t0
+    except Exception:
+        return None
+    return first or float("nan"), time.perf_counter() - t0
+
+
+async def scenario(label: str, create, requests: int, concurrency: int, servers: list[StubServer],
+                   completions: ResilientCompletions | None = None) -> None:
+    before = [server.requests for server in servers]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded():
+        async with semaphore:
+            return await one_request(create)
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(bounded() for _ in range(requests)))
+    elapsed = time.perf_counter() - t0
+    ok = [r for r in results if r is not None]
+    ttft = [r[0] for r in ok]
+    sent = "/".join(str(server.requests - b) for server, b in zip(servers, before))
+    print(f"{label:<9} ok={len(ok) / requests:6.1%} ttft p50={percentile(ttft, .5) * 1000:5.0f}ms "
+          f"p95={percentile(ttft, .95) * 1000:5.0f}ms p99={percentile(ttft, .99) * 1000:5.0f}ms "
+          f"max={max(ttft, default=float('nan')) * 1000:5.0f}ms sent primary/fallback={sent} wall={elapsed:.1f}s")
+    if completions is not None:
+        stats = completions.stats.as_dict()
+        print(f"{'':<9} " + " ".join(f"{key}={value}" for key, value in stats.items() if key != "requests"))
+
+
+async def run(args) -> None:
+    primary_kwargs = dict(ttft=args.ttft, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec,
+                          error_rate=args.error_rate, slow_rate=args.slow_rate, slow_ttft=args.slow_ttft, seed=1)
+    async with StubServer(**primary_kwargs) as primary, \
+            StubServer(ttft=args.ttft * 1.3, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec,
+                       error_rate=args.error_rate / 5, slow_rate=args.slow_rate / 5, slow_ttft=args.slow_ttft,
+                       seed=2) as fallback, \
+            StubServer(ttft=args.ttft, tokens=args.tokens, error_rate=1.0, error_statuses=(503,), seed=3) as down:
+        servers = [primary, fallback]
+
+        def client(server: StubServer, **kwargs) -> AsyncOpenAI:
+            return AsyncOpenAI(api_key="bench", base_url=server.base_url, **kwargs)
+
+        def resilient(*targets: StubServer, hedge: bool = False) -> ResilientCompletions:
+            endpoints = [Endpoint(f"stub{i}", client(server, max_retries=0)) for i, server in enumerate(targets)]
+            return ResilientCompletions(endpoints, ResilienceConfig(max_attempts=3, hedge=hedge,
+                                                                    hedge_delay=args.ttft * 3, breaker_reset=5.0))
+
+        print(f"{args.requests} streamed requests, {args.concurrency} concurrent; primary: ttft {args.ttft * 1000:.0f}ms, "
+              f"{args.error_rate:.0%} 429/5xx, {args.slow_rate:.0%} stalled {args.slow_ttft:.1f}s")
+        plain = client(primary)
+        await scenario("openai", plain.chat.completions.create, args.requests, args.concurrency, servers)
+        for label, completions in [("retry", resilient(primary)), ("failover", resilient(primary, fallback)),
+                                   ("hedged", resilient(primary, fallback, hedge=True))]:
+            await scenario(label, completions.create, args.requests, args.concurrency, servers, completions)
+
+        print("\nprimary down (every request 503):")
+        servers = [down, fallback]
+        await scenario("openai", client(down).chat.completions.create, args.requests // 4, args.concurrency, servers)
+        completions = resilient(down, fallback)
+        await scenario("outage", completions.create, args.requests, args.concurrency, servers, completions)
+
+        service = ResilientChatCompletion(service_id="bench", ai_model_id="gpt-4o-mini", async_client=client(primary),
+                                          completions=resilient(primary, fallback, hedge=True))
+        history = ChatHistory()
+        history.add_user_message(MESSAGES[0]["content"])
+        pieces = []
+        for _ in range(20):
+            async for messages in service.get_streaming_chat_message_contents(history, OpenAIChatPromptExecutionSettings()):
+                pieces.extend(message.content for message in messages if message.content)
+        print(f"\nSemantic Kernel stream: {len(pieces)} of {20 * args.tokens} tokens in 20 answers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ttft", type=float, default=3.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# author: Jairo Monassa
+"""Session-start latency and RSS per 1,000 sessions, before and after the agent registry.
+
+"before" rebuilds the client, kernel, service and roster for every session (the
+old ``on_chat_start``); "after" reuses the process-wide registry. Each session
+keeps what it stored in ``cl.user_session`` alive, so the RSS delta is the real
+memory cost of 1,000 connected students.
+
+    python benchmarks/bench_session_start.py --sessions 1000
+"""
+
+import argparse
+import gc
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import AsyncOpenAI  # noqa: E402
+
+import agent_registry  # noqa: E402
+from model_backends import ModelServices  # noqa: E402
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def make_client() -> AsyncOpenAI:
+    return AsyncOpenAI(api_key="bench", base_url="http://127.0.0.1:9/v1")
+
+
+def start_before() -> dict:
+    registry = agent_registry.build_registry(ModelServices.single(make_client(), "gpt-4o-mini"))
+    return {"agent": registry.main_agent, "thread": None}
+
+
+def start_after() -> dict:
+    registry = agent_registry.get_registry("gpt-4o-mini", make_client)
+    return {"agent": registry.main_agent, "thread": None}
+
+
+def run(label: str, start, sessions: int) -> None:
+    gc.collect()
+    rss_start = rss_mb()
+    kept = []
+    latencies = []
+    for _ in range(sessions):
+        t0 = time.perf_counter()
+        kept.append(start())
+        latencies.append((time.perf_counter() - t0) * 1000)
+    gc.collect()
+    rss_delta = rss_mb() - rss_start
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{label:<7} sessions={sessions} mean={statistics.mean(latencies):.3f}ms "
+        f"p95={p95:.3f}ms rss_delta={rss_delta:.1f}MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1000)
+    args = parser.parse_args()
+    # Warm up imports and the shared registry so neither side pays them
+    start_after()
+    run("before", start_before, args.sessions)
+    run("after", start_after, args.sessions)
+
+
+if __name__ == "__main__":
+    main()
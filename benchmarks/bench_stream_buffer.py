@@ -0,0 +1,98 @@
+# author: Jairo Monassa
+"""Frames, event-loop lag and CPU per streamed response, with and without coalescing.
+
+Simulates ``--sessions`` students streaming a ``--tokens`` long answer at the
+same time. The fake message mirrors ``cl.Message.stream_token`` (content
+concatenation plus one JSON-encoded socket.io frame and an await per call).
+A probe task measures event-loop lag while the responses stream.
+
+    python benchmarks/bench_stream_buffer.py --sessions 200 --tokens 800
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_buffer import TokenCoalescer  # noqa: E402
+
+
+class FakeMessage:
+    """Same work per call as cl.Message.stream_token + the socket.io emit."""
+
+    def __init__(self):
+        self.id = "msg"
+        self.content = ""
+        self.frames = 0
+
+    async def stream_token(self, token: str) -> None:
+        self.content += token
+        packet = json.dumps(["stream_token", {"id": self.id, "token": token, "isSequence": False}])
+        self.frames += len(packet) > 0
+        await asyncio.sleep(0)
+
+
+async def model_stream(tokens: int, tokens_per_sec: float):
+    # Models deliver tokens in small bursts rather than one per tick
+    burst = 4
+    for index in range(0, tokens, burst):
+        for _ in range(min(burst, tokens - index)):
+            yield "tok "
+        await asyncio.sleep(burst / tokens_per_sec)
+
+
+async def respond(tokens: int, tokens_per_sec: float, max_chars: int, max_delay: float) -> int:
+    message = FakeMessage()
+    async with TokenCoalescer(message, max_chars=max_chars, max_delay=max_delay) as stream:
+        async for token in model_stream(tokens, tokens_per_sec):
+            await stream.push(token)
+    assert len(message.content) == tokens * 4
+    return message.frames
+
+
+async def probe(lags: list, stop: asyncio.Event, interval: float = 0.005) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - t0 - interval) * 1000)
+
+
+async def run(label: str, args, max_chars: int, max_delay: float) -> None:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    frames = await asyncio.gather(*(
+        respond(args.tokens, args.tokens_per_sec, max_chars, max_delay) for _ in range(args.sessions)
+    ))
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    stop.set()
+    await probe_task
+    lags.sort()
+    print(
+        f"{label:<16} frames/response={statistics.mean(frames):.0f} "
+        f"loop lag p50={lags[len(lags) // 2]:.2f}ms p99={lags[int(len(lags) * 0.99)]:.2f}ms max={lags[-1]:.2f}ms "
+        f"cpu/response={1000 * cpu / args.sessions:.2f}ms wall={wall:.2f}s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=800)
+    parser.add_argument("--tokens-per-sec", type=float, default=400)
+    args = parser.parse_args()
+
+    await run("per-token", args, max_chars=0, max_delay=0)
+    await run("64ch/30ms", args, max_chars=64, max_delay=0.03)
+    await run("64ch/50ms", args, max_chars=64, max_delay=0.05)
+    await run("256ch/50ms", args, max_chars=256, max_delay=0.05)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+# author: Jairo Monassa
+"""Completion tokens and latency per study plan: plan written as text and tool JSON vs one structured output.
+
+A student who has already given their availability and deadline asks for
+the plan, against the offline stub, in three flows of ``PlanningSession``:
+
+- ``original``: the model writes the plan as text, then again as the
+  ``save_study_plan_to_json`` arguments once the student approves, then a
+  confirmation (as ``agent_planning.main()`` first did);
+- ``tool``: the same with the confirmation templated locally
+  (``PLAN_GENERATION=tool``);
+- ``structured``: the model calls ``create_study_plan`` with a short brief,
+  the plan comes from one ``json_schema`` completion and the preview is
+  rendered locally (``structured_plan``).
+
+Each generation streams about one piece per 4 characters of what the model
+writes (the rendered plan, its JSON, the structured answer), so completion
+tokens follow the size of the content. Latency is the model time of the
+turns from "here is my information" to the saved plan.
+
+    python benchmarks/bench_structured_plan.py --plans 10 --weeks 8
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import AsyncOpenAI  # noqa: E402
+
+import agent_planning  # noqa: E402
+from planning_session import PlanningSession  # noqa: E402
+from structured_plan import CREATE_TOOL_NAME, render_plan  # noqa: E402
+from study_plan_stream import StudyPlanParser  # noqa: E402
+from stub_server import stub_server_process  # noqa: E402
+from token_counting import estimate_tokens  # noqa: E402
+
+INFORMATION = "Tenho 10 horas por semana e a prova é daqui a dois meses. Meu nível é iniciante."
+APPROVAL = "Está ótimo, pode salvar o plano."
+BRIEF = "Cálculo I, iniciante, 10 horas por semana, prova em dois meses: cobrir limites, derivadas e integrais."
+
+
+def plan(weeks: int) -> dict:
+    return {f"semana{w}": {
+        "dias1e2": {"topico": f"Derivadas parte {w}", "subtopicos": ["definição", "regras", "exercícios"],
+                    "meta": "resolver a lista de exercícios da semana"},
+        "dia3": {"topico": f"Revisão {w}", "subtopicos": ["resumo", "simulado curto"], "meta": "revisar os erros"},
+    } for w in range(1, weeks + 1)}
+
+
+def structured(study_plan: dict) -> str:
+    return json.dumps({"weeks": [{"days": [
+        {"day_block": day, "topic": block["topico"], "subtopics": block["subtopicos"], "goal": block["meta"]}
+        for day, block in days.items()
+    ]} for days in study_plan.values()]}, ensure_ascii=False)
+
+
+def stub_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(base_url.rsplit("/v1", 1)[0] + "/stats") as response:
+        return json.loads(response.read())
+
+
+async def one_plan(client: AsyncOpenAI, flow: str) -> float:
+    if flow == "structured":
+        session = PlanningSession.for_subject(client, "stub", "Cálculo I", structured=True)
+        messages = [INFORMATION + " Pode gerar o plano."]
+    else:
+        session = PlanningSession(
+            client=client,
+            model="stub",
+            messages=agent_planning.build_messages("Cálculo I"),
+            tools=agent_planning.tools,
+            functions={"save_study_plan_to_json": agent_planning.save_study_plan_to_json},
+            confirmations={} if flow == "original" else {"save_study_plan_to_json": agent_planning.save_confirmation},
+            argument_parsers={"save_study_plan_to_json": StudyPlanParser},
+        )
+        messages = [INFORMATION, APPROVAL]
+    t0 = time.perf_counter()
+    for message in messages:
+        async for _ in session.send(message):
+            pass
+    if flow != "original" and not session.plan_saved:
+        raise RuntimeError(f"{flow}: no plan saved")
+    return time.perf_counter() - t0
+
+
+async def measure(base_url: str, flow: str, plans: int) -> None:
+    client = AsyncOpenAI(base_url=base_url, api_key="stub", max_retries=0)
+    before = stub_stats(base_url)
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(plans):
+            latencies.append(await one_plan(client, flow))
+    after = stub_stats(base_url)
+    await client.close()
+    latencies.sort()
+    print(f"{flow:<11} completions/plan={(after['requests'] - before['requests']) / plans:4.1f} "
+          f"completion tokens/plan={(after['completion_tokens'] - before['completion_tokens']) / plans:6.0f} "
+          f"prompt tokens/plan={(after['prompt_tokens'] - before['prompt_tokens']) / plans:6.0f} "
+          f"latency p50={latencies[len(latencies) // 2] * 1000:7.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plans", type=int, default=10)
+    parser.add_argument("--weeks", type=int, default=8)
+    parser.add_argument("--ttft", type=float, default=0.4)
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+    args = parser.parse_args()
+
+    study_plan = plan(args.weeks)
+    arguments = json.dumps({"study_plan": study_plan}, ensure_ascii=False)
+    script = [
+        {"match": "salvar", "name": "save_study_plan_to_json", "arguments": arguments,
+         "tokens": estimate_tokens(arguments)},
+        {"match": "gerar", "name": CREATE_TOOL_NAME, "arguments": json.dumps({"brief": BRIEF}, ensure_ascii=False),
+         "tokens": estimate_tokens(BRIEF) + 5},
+    ]
+    preview = render_plan(study_plan)
+    print(f"{args.weeks}-week plan: {estimate_tokens(preview)} tokens as text, {estimate_tokens(arguments)} as tool "
+          f"arguments, {estimate_tokens(structured(study_plan))} as structured output")
+    with tempfile.TemporaryDirectory() as folder:
+        os.environ["PLAN_STORE_DIR"] = folder
+        # Text answers are the plan written out by the model
+        with stub_server_process(ttft=args.ttft, tokens=estimate_tokens(preview), tokens_per_sec=args.tokens_per_sec,
+                                 script=script, json_answer=structured(study_plan)) as base_url:
+            for flow in ("original", "tool", "structured"):
+                asyncio.run(measure(base_url, flow, args.plans))
+
+
+if __name__ == "__main__":
+    main()
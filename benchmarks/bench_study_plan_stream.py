@@ -0,0 +1,168 @@
+# author: Jairo Monassa
+"""Incremental study plan parsing on large synthetic plans.
+
+Feeds 52-week plans to ``StudyPlanParser`` in token-sized fragments and
+reports:
+
+- parser CPU per plan against one ``json.loads`` at the end;
+- when the first week can be rendered;
+- for a plan with one invalid block and for one with broken JSON, when the
+  problem is detected and how much has to be generated again: the whole plan
+  before, only the block (or only the rest of the plan) now.
+
+Generation time is simulated from ``--tokens-per-sec`` (4 characters per token).
+
+    python benchmarks/bench_study_plan_stream.py --weeks 52 --days 5 --tokens-per-sec 60
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from study_plan_stream import BlockError, PlanSyntaxError, PlanWeek, StudyPlanParser, validate_plan  # noqa: E402
+from token_counting import CHARS_PER_TOKEN  # noqa: E402
+
+WORDS = "derivadas limites integrais séries vetores matrizes revisão exercícios prova capítulo".split()
+
+
+def synthetic_plan(weeks: int, days: int, rng: random.Random) -> dict:
+    return {
+        f"week{w}": {
+            f"day{d}": {
+                "topic": " ".join(rng.choices(WORDS, k=3)),
+                "subtopics": [" ".join(rng.choices(WORDS, k=4)) for _ in range(4)],
+                "goal": " ".join(rng.choices(WORDS, k=10)),
+            }
+            for d in range(1, days + 1)
+        }
+        for w in range(1, weeks + 1)
+    }
+
+
+def fragments(text: str, rng: random.Random) -> list[str]:
+    parts, i = [], 0
+    while i < len(text):
+        n = rng.randint(2, 2 * CHARS_PER_TOKEN)
+        parts.append(text[i:i + n])
+        i += n
+    return parts
+
+
+def seconds(chars: int, tokens_per_sec: float) -> float:
+    return chars / CHARS_PER_TOKEN / tokens_per_sec
+
+
+def feed_all(parts: list[str]):
+    """Returns (parser, chars fed when the first week closed, first error, chars at first error)."""
+    parser = StudyPlanParser()
+    first_week = first_error_at = None
+    first_error = None
+    fed = 0
+    for part in parts:
+        fed += len(part)
+        try:
+            events = parser.feed(part)
+        except PlanSyntaxError as e:
+            return parser, first_week, e, fed
+        for event in events:
+            if isinstance(event, PlanWeek) and first_week is None:
+                first_week = fed
+            if isinstance(event, BlockError) and first_error is None:
+                first_error, first_error_at = event, fed
+    try:
+        parser.close()
+    except PlanSyntaxError as e:
+        return parser, first_week, e, fed
+    return parser, first_week, first_error, first_error_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--plans", type=int, default=20)
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    args = parser.parse_args()
+    rng = random.Random(7)
+    tps = args.tokens_per_sec
+
+    plan = synthetic_plan(args.weeks, args.days, rng)
+    text = json.dumps({"study_plan": plan}, ensure_ascii=False)
+    parts = fragments(text, rng)
+    print(f"plan: {args.weeks} weeks x {args.days} blocks, {len(text) / 1024:.0f}KB, {len(parts)} fragments, "
+          f"~{seconds(len(text), tps):.0f}s to generate at {tps:.0f} tok/s")
+
+    # --- CPU ---
+    loads, incremental, worst = [], [], 0.0
+    for _ in range(args.plans):
+        t0 = time.perf_counter()
+        json.loads("".join(parts))
+        loads.append(time.perf_counter() - t0)
+        p = StudyPlanParser()
+        t0 = time.perf_counter()
+        for part in parts:
+            t1 = time.perf_counter()
+            p.feed(part)
+            worst = max(worst, time.perf_counter() - t1)
+        incremental.append(time.perf_counter() - t0)
+        assert p.close() == {"study_plan": plan}
+    for empty in ("{}", '{"study_plan": {}}'):
+        p = StudyPlanParser()
+        p.feed(empty)
+        p.close()
+        assert [e.reason for e in p.errors] == [e.reason for e in validate_plan({})], empty
+    block = plan["week1"]["day1"]
+    for arrays in ({"week1": [], "week2": {"day1": block}}, {"week1": [[block]], "week2": {"day1": block}},
+                   {"week1": {"day1": [block], "day2": block}}):
+        p = StudyPlanParser()
+        for part in fragments(json.dumps(arrays), random.Random(0)):
+            p.feed(part)
+        p.close()
+        expected = validate_plan(arrays)
+        assert [(e.week, e.day, e.reason) for e in p.errors] == [(e.week, e.day, e.reason) for e in expected], arrays
+    try:
+        StudyPlanParser().feed("[1, 2]")
+        raise AssertionError("a top-level array was accepted as a plan")
+    except PlanSyntaxError:
+        pass
+    print(f"cpu       json.loads at end={statistics.median(loads) * 1000:.2f}ms  "
+          f"incremental={statistics.median(incremental) * 1000:.2f}ms per plan "
+          f"({statistics.median(incremental) / len(parts) * 1e6:.1f}us/fragment, worst {worst * 1000:.2f}ms)")
+
+    # --- progressive rendering ---
+    _, first_week, _, _ = feed_all(parts)
+    print(f"render    first week after {seconds(first_week, tps):.1f}s instead of {seconds(len(text), tps):.1f}s")
+
+    # --- invalid block in the middle ---
+    week = f"week{args.weeks // 2}"
+    broken = json.loads(text)
+    del broken["study_plan"][week]["day2"]["goal"]
+    bad_text = json.dumps(broken, ensure_ascii=False)
+    _, _, error, at = feed_all(fragments(bad_text, rng))
+    block_chars = len(json.dumps(plan[week]["day2"], ensure_ascii=False))
+    print(f"schema    {error.week}/{error.day} ({error.reason}) detected after {seconds(at, tps):.1f}s "
+          f"instead of {seconds(len(bad_text), tps):.1f}s; regenerate {block_chars / CHARS_PER_TOKEN:.0f} tokens "
+          f"instead of {len(bad_text) / CHARS_PER_TOKEN:.0f} (repaired while the plan streams: ready after "
+          f"{seconds(max(len(bad_text), at + block_chars), tps):.0f}s vs {seconds(2 * len(bad_text), tps):.0f}s)")
+
+    # --- broken JSON in the middle ---
+    cut = text.index(f'"{week}"')
+    cut = text.index('"goal"', cut)
+    syntax_text = text[:cut] + text[cut + 1:]  # drop a quote
+    parsed, _, error, at = feed_all(fragments(syntax_text, rng))
+    assert isinstance(error, PlanSyntaxError)
+    rest = len(syntax_text) - len(json.dumps(parsed.plan, ensure_ascii=False))
+    print(f"syntax    '{error.reason}' detected after {seconds(at, tps):.1f}s "
+          f"instead of {seconds(len(syntax_text), tps):.1f}s; continue with {rest / CHARS_PER_TOKEN:.0f} tokens "
+          f"instead of {len(syntax_text) / CHARS_PER_TOKEN:.0f} "
+          f"(plan ready after {seconds(at + rest, tps):.0f}s vs {seconds(2 * len(syntax_text), tps):.0f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# author: Jairo Monassa
+"""Memory per idle session and rehydration latency of the thread cache.
+
+"in-memory" keeps every student's thread alive like ``cl.user_session`` did;
+"cache" persists each thread to SQLite after its turns and keeps only the
+``--capacity`` most recently active ones. Then every evicted thread is loaded
+again to time rehydration.
+
+    python benchmarks/bench_thread_store.py --sessions 2000 --turns 20 --capacity 200
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_kernel.agents import ChatHistoryAgentThread  # noqa: E402
+from semantic_kernel.contents import ChatMessageContent  # noqa: E402
+from semantic_kernel.contents.utils.author_role import AuthorRole  # noqa: E402
+
+from conversation_memory import ConversationMemory  # noqa: E402
+from thread_store import SQLiteThreadStore, ThreadCache  # noqa: E402
+
+WORDS = "plan week quiz topic goal hours exam review chapter practice derivative".split()
+
+
+def text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+async def converse(thread: ChatHistoryAgentThread, turns: int, rng: random.Random) -> None:
+    for _ in range(turns):
+        await thread.on_new_message(ChatMessageContent(role=AuthorRole.USER, content=text(rng, 20)))
+        await thread.on_new_message(
+            ChatMessageContent(role=AuthorRole.ASSISTANT, content=text(rng, 120), name="Main_Tutor_Agent")
+        )
+
+
+def new_memory() -> ConversationMemory:
+    return ConversationMemory(token_budget=100_000)
+
+
+async def in_memory(args) -> None:
+    rng = random.Random(1)
+    gc.collect()
+    tracemalloc.start()
+    sessions = {}
+    for index in range(args.sessions):
+        thread = ChatHistoryAgentThread(chat_history=new_memory())
+        await converse(thread, args.turns, rng)
+        sessions[f"t{index}"] = thread
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"in-memory  live={len(sessions)} memory={used / 2**20:.1f}MB "
+          f"per idle session={used / args.sessions / 1024:.1f}KB")
+
+
+async def cached(args, path: str) -> None:
+    rng = random.Random(1)
+    store = SQLiteThreadStore(path)
+    cache = ThreadCache(store, new_memory, capacity=args.capacity)
+    gc.collect()
+    tracemalloc.start()
+    for index in range(args.sessions):
+        key = f"t{index}"
+        entry = await cache.get(key)
+        await converse(entry.thread, args.turns, rng)
+        await cache.save(key, entry)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"cache      live={len(cache)} memory={used / 2**20:.1f}MB "
+          f"per idle session={used / args.sessions / 1024:.1f}KB db={os.path.getsize(path) / 2**20:.1f}MB")
+
+    latencies = []
+    for index in range(args.sessions - args.capacity):
+        t0 = time.perf_counter()
+        entry = await cache.get(f"t{index}")
+        latencies.append((time.perf_counter() - t0) * 1000)
+        assert len(entry.memory.messages) == 2 * args.turns
+    latencies.sort()
+    print(f"rehydrate  n={len(latencies)} p50={latencies[len(latencies) // 2]:.2f}ms "
+          f"p95={latencies[int(len(latencies) * 0.95)]:.2f}ms max={latencies[-1]:.2f}ms")
+    store.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--capacity", type=int, default=200)
+    args = parser.parse_args()
+    await in_memory(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        await cached(args, os.path.join(tmp, "threads.db"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+# author: Jairo Monassa
+"""Input tokens and latency of Main_Tutor_Agent turns with and without per-turn tool selection.
+
+Replays labelled conversations through Main_Tutor_Agent against the offline
+stub: each turn names the specialist the tutor should forward to (or None)
+and whether the student has an ungraded quiz. The stub answers a turn whose
+specialist is among the offered tools with a call to it, so a specialist the
+selector left out shows up as a lost forward. ``--prefill-rate`` (prompt
+tokens per second) makes a longer prompt delay the first token the way
+prompt processing does.
+
+- ``all tools``: the main agent with every specialist and forward rule;
+- ``selected``: ``ToolSelector`` picks the specialists of each turn.
+
+Both rosters are measured: app.py's eight specialists and app_v1.py's nine.
+
+    python benchmarks/bench_tool_selection.py --prefill-rate 5000 --repeat 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from openai import AsyncOpenAI  # noqa: E402
+from semantic_kernel.agents import ChatHistoryAgentThread  # noqa: E402
+from semantic_kernel.contents import ChatHistory  # noqa: E402
+
+from agent_registry import (  # noqa: E402
+    BULLYING_AGENT_NAME,
+    BURNOUT_AGENT_NAME,
+    CONFLICTS_AGENT_NAME,
+    EVALUATION_CONTENT_AGENT_NAME,
+    MOTIVATION_AGENT_NAME,
+    PLANNING_AGENT_NAME,
+    PROGRESS_MONITORING_AGENT_NAME,
+    SIMULATION_AGENT_NAME,
+    build_registry,
+)
+from model_backends import ModelServices  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+from tool_selection import ToolSelector  # noqa: E402
+
+# (student message, specialist the tutor should forward to, ungraded quiz pending)
+CONVERSATIONS = [
+    [("Hi! I have my calculus exam in three weeks.", None, False),
+     ("Can you make me a study plan? I can study 2 hours on weekdays.", PLANNING_AGENT_NAME, False),
+     ("Add more practice on integrals please", PLANNING_AGENT_NAME, False),
+     ("Thanks, that looks good.", None, False)],
+    [("I want to test my knowledge of photosynthesis", SIMULATION_AGENT_NAME, False),
+     ("Give me a quiz with 3 questions", SIMULATION_AGENT_NAME, False),
+     ("1-A, 2-C, 3-B", SIMULATION_AGENT_NAME, True),
+     ("How am I doing so far?", PROGRESS_MONITORING_AGENT_NAME, False)],
+    [("I feel exhausted, I study until 2am every day and can't rest", BURNOUT_AGENT_NAME, False),
+     ("My parents keep fighting about my grades", CONFLICTS_AGENT_NAME, False),
+     ("Can you help me organise my week so I sleep more?", PLANNING_AGENT_NAME, False)],
+    [("What is the difference between mitosis and meiosis?", None, False),
+     ("Explain it like I'm 12", None, False),
+     ("Can you quiz me on it?", SIMULATION_AGENT_NAME, False),
+     ("The second one is B I think", SIMULATION_AGENT_NAME, True),
+     ("I don't feel like studying anymore, what's the point", MOTIVATION_AGENT_NAME, False)],
+    [("Some kids at school keep making fun of me and took my phone", BULLYING_AGENT_NAME, False),
+     ("Anyway, can we go over the causes of World War I?", None, False),
+     ("Could you evaluate my essay about it?", EVALUATION_CONTENT_AGENT_NAME, False),
+     ("Here it is: the war started because of alliances and nationalism.", EVALUATION_CONTENT_AGENT_NAME, False)],
+]
+
+FORWARD_ARGUMENTS = json.dumps({"messages": "Forwarded by the tutor."})
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+def stub_script(conversations) -> list[dict]:
+    """Forward each labelled turn to its specialist, when the tool is offered."""
+    return [{"match": f"^{re.escape(message)}$", "name": expected, "arguments": FORWARD_ARGUMENTS}
+            for conversation in conversations for message, expected, _ in conversation if expected]
+
+
+async def replay(label: str, server: StubServer, include_evaluation: bool, selector: ToolSelector | None,
+                 repeat: int, concurrency: int) -> None:
+    client = AsyncOpenAI(api_key="bench", base_url=server.base_url, max_retries=0)
+    registry = build_registry(ModelServices.single(client, "gpt-4o-mini"), include_evaluation)
+    conversations = [[turn for turn in conversation if turn[1] in registry.agents or turn[1] is None]
+                     for conversation in CONVERSATIONS] * repeat
+    expected_forwards = sum(1 for conversation in conversations for _, expected, _ in conversation if expected)
+    ttfts, latencies, offered = [], [], []
+    missed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def conversation(turns) -> None:
+        nonlocal missed
+        async with semaphore:
+            thread = ChatHistoryAgentThread(chat_history=ChatHistory())
+            for message, expected, pending_quiz in turns:
+                t0 = time.perf_counter()
+                agent = registry.main_agent
+                if selector is not None:
+                    history = thread._chat_history.messages
+                    selection = selector.select(message, history, registry, pending_quiz=pending_quiz)
+                    agent = registry.main_agent_for(selection.agents)
+                    offered.append(len(selection.agents))
+                    missed += expected is not None and expected not in selection.agents
+                first = None
+                async for response in agent.invoke_stream(messages=message, thread=thread):
+                    if first is None and response.content:
+                        first = time.perf_counter()
+                    thread = response.thread
+                ttfts.append((first or time.perf_counter()) - t0)
+                latencies.append(time.perf_counter() - t0)
+
+    before = server.stats()
+    await asyncio.gather(*(conversation(turns) for turns in conversations))
+    after = server.stats()
+    turns = len(latencies)
+    prompt = after["prompt_tokens"] - before["prompt_tokens"]
+    forwards = after["tool_calls"] - before["tool_calls"]
+    tools = f"{sum(offered) / len(offered):.1f}" if offered else f"{len(registry.agents)}"
+    print(f"{label:<22} turns={turns} tools/turn={tools} input tokens/turn={prompt / turns:6.0f} "
+          f"requests={after['requests'] - before['requests']} ttft p50={percentile(ttfts, .5) * 1000:5.0f}ms "
+          f"p95={percentile(ttfts, .95) * 1000:5.0f}ms latency p50={percentile(latencies, .5) * 1000:5.0f}ms "
+          f"p95={percentile(latencies, .95) * 1000:5.0f}ms forwards={forwards}/{expected_forwards} "
+          f"left out={missed}")
+    if selector is not None:
+        print(f"{'':<22} selector: " + " ".join(f"{key}={value}" for key, value in selector.stats.as_dict().items()))
+
+
+async def run(args) -> None:
+    async with StubServer(ttft=args.ttft, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec,
+                          prefill_rate=args.prefill_rate, script=stub_script(CONVERSATIONS)) as server:
+        print(f"stub: ttft {args.ttft * 1000:.0f}ms + prompt at {args.prefill_rate:.0f} tokens/s, "
+              f"{args.tokens} tokens per answer, {len(CONVERSATIONS) * args.repeat} conversations")
+        for roster, include_evaluation in (("app.py", False), ("app_v1.py", True)):
+            await replay(f"{roster} all tools", server, include_evaluation, None, args.repeat, args.concurrency)
+            await replay(f"{roster} selected", server, include_evaluation, ToolSelector(), args.repeat,
+                         args.concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="copies of the labelled conversations")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ttft", type=float, default=0.3)
+    parser.add_argument("--prefill-rate", type=float, default=5000.0, help="prompt tokens per second")
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
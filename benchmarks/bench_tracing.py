@@ -0,0 +1,73 @@
+# author: Jairo Monassa
+"""Cost of the tracing hot path: nested spans exported to JSONL and Prometheus.
+
+Each simulated turn opens a turn span with a screening span, two completion
+spans and a tool span inside, i.e. about what one real turn records.
+
+    python benchmarks/bench_tracing.py --turns 20000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracing import JsonlExporter, PrometheusExporter, Tracer, annotate_turn  # noqa: E402
+
+
+class Usage:
+    prompt_tokens = 900
+    completion_tokens = 120
+
+
+def turn(tracer: Tracer) -> None:
+    with tracer.span("turn", "turn"):
+        annotate_turn("Planning_Agent", route="router")
+        with tracer.span("screening.Burnout_Support_Agent", "screening", agent="Burnout_Support_Agent"):
+            pass
+        for _ in range(2):
+            span = tracer.start("chat.completions", "completion", model="stub", stream=True)
+            span.first_token()
+            span.add_usage(Usage)
+            tracer.end(span)
+        with tracer.span("StudyPlan-save_study_plan_to_json", "tool"):
+            pass
+
+
+def run(label: str, tracer: Tracer, turns: int) -> None:
+    t0 = time.perf_counter()
+    for _ in range(turns):
+        turn(tracer)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<22} {elapsed / turns * 1e6:6.1f}us per turn ({elapsed / turns / 5 * 1e6:5.1f}us per span)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20000)
+    parser.add_argument("--port", type=int, default=9465)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run("disabled", Tracer([], enabled=False), args.turns)
+        jsonl = JsonlExporter(os.path.join(tmp, "traces.jsonl"))
+        run("jsonl", Tracer([jsonl]), args.turns)
+        prometheus = PrometheusExporter()
+        prometheus.serve(args.port)
+        run("jsonl + prometheus", Tracer([jsonl, prometheus]), args.turns)
+        jsonl.close()
+        with open(jsonl.path, encoding="utf-8") as f:
+            lines = sum(1 for _ in f)
+        with urllib.request.urlopen(f"http://127.0.0.1:{args.port}/metrics") as response:
+            metrics = response.read().decode()
+        prometheus.close()
+        print(f"{lines} spans written; /metrics is {len(metrics.splitlines())} lines, e.g.")
+        print("\n".join(line for line in metrics.splitlines() if line.startswith("tutor_tokens_total")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# author: Jairo Monassa
+"""Time-to-first-token under concurrent sessions: per-session clients vs the shared pool.
+
+"per-session" creates a new AsyncOpenAI client for every session (the old
+``on_chat_start``); "shared" uses ``transport.async_openai_client``. Sessions
+arrive in waves of ``--sessions`` concurrent students, each doing ``--turns``
+streamed turns. Both run against the local stub server, which charges
+``--connect-delay-ms`` on every new TCP connection to stand in for the TCP/TLS
+handshake of the real endpoint.
+
+    python benchmarks/bench_transport.py --sessions 50 --turns 3 --waves 3
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import AsyncOpenAI  # noqa: E402
+
+import transport  # noqa: E402
+import httpx  # noqa: E402
+from stub_server import stub_server_process  # noqa: E402
+
+
+async def session(client: AsyncOpenAI, turns: int, ttfts: list) -> None:
+    for _ in range(turns):
+        t0 = time.perf_counter()
+        first = None
+        stream = await client.chat.completions.create(
+            model="stub", messages=[{"role": "user", "content": "hi"}], stream=True
+        )
+        async for chunk in stream:
+            if first is None and chunk.choices and chunk.choices[0].delta.content:
+                first = time.perf_counter() - t0
+        ttfts.append(first * 1000)
+
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def server_connections(base_url: str) -> int:
+    return httpx.get(base_url.rsplit("/v1", 1)[0] + "/stats").json()["connections"]
+
+
+async def run(label: str, make_client, args) -> None:
+    with stub_server_process(ttft=args.ttft_ms / 1000, tokens=args.tokens,
+                             connect_delay=args.connect_delay_ms / 1000) as base_url:
+        # Each wave is a fresh batch of students opening the app at the same time
+        for wave in range(1, args.waves + 1):
+            ttfts: list[float] = []
+            connections = server_connections(base_url)
+            clients = [make_client(base_url) for _ in range(args.sessions)]
+            t0 = time.perf_counter()
+            await asyncio.gather(*(session(client, args.turns, ttfts) for client in clients))
+            elapsed = time.perf_counter() - t0
+            print(
+                f"{label:<12} wave={wave} ttft p50={percentile(ttfts, 0.50):.1f}ms "
+                f"p95={percentile(ttfts, 0.95):.1f}ms max={max(ttfts):.1f}ms mean={statistics.mean(ttfts):.1f}ms "
+                f"new_connections={server_connections(base_url) - connections - 1} wall={elapsed:.2f}s"
+            )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--waves", type=int, default=3)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--ttft-ms", type=float, default=50)
+    parser.add_argument("--connect-delay-ms", type=float, default=30)
+    args = parser.parse_args()
+
+    await run("per-session", lambda url: AsyncOpenAI(base_url=url, api_key="bench"), args)
+    await run("shared", lambda url: transport.async_openai_client(base_url=url, api_key="bench"), args)
+    print("pool", transport.pool_stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,207 @@
+# author: Jairo Monassa
+"""Tokens generated for nobody when students interrupt long answers, with and without turn cancellation.
+
+Each app is started with ``chainlit run --headless`` against the offline
+stub, whose answers are long (``--tokens`` at ``--tokens-per-sec``). After
+one student has had a whole answer (what the apps estimate the tokens saved
+from), every student asks for a long explanation and, ``--interrupt`` seconds after its
+first token on average, either sends a follow-up (half of them) or closes
+the tab (the other half):
+
+- ``TURN_CANCEL=off``: the turns run as before, side by side;
+- ``TURN_CANCEL=on``: the follow-up or the disconnect cancels the turn in
+  flight (``turn_manager.py``).
+
+Reported: completion tokens the stub actually streamed and the streams the
+client closed early, the follow-up's time to first token and full answer,
+the cancelled turns and estimated tokens saved from the turn spans, and the
+stored threads whose turns interleave (a student message stored without its
+answer before the next one).
+
+    python benchmarks/bench_turn_cancel.py --students 20 --apps app.py,app_v1.py
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from semantic_kernel.contents import ChatHistory  # noqa: E402
+from semantic_kernel.contents.utils.author_role import AuthorRole  # noqa: E402
+
+from bench_chainlit_load import ROOT, Session, free_port, percentile, start_app  # noqa: E402
+from stub_server import stub_server_process  # noqa: E402
+from trace_report import load_spans  # noqa: E402
+
+QUESTION = "Explain photosynthesis in detail, step by step"
+FOLLOW_UP = "Actually, just give me the short version"
+
+
+class Student(Session):
+    """A tab that can send a message without waiting for the answer before it."""
+
+    def __init__(self, url: str, stats: dict, turn_timeout: float):
+        super().__init__(url, stats, turn_timeout)
+        # Answer message id -> [created at, first token at, chars]
+        self.answers: dict[str, list] = {}
+        # The first token of a message comes with the whole step
+        self.client.on("stream_start", self._on_stream_start)
+
+    async def _on_message(self, step: dict) -> None:
+        await super()._on_message(step)
+        if step.get("type") == "assistant_message" and self.started.is_set():
+            self.answers.setdefault(step["id"], [time.perf_counter(), None, 0])
+
+    async def _on_token(self, data: dict) -> None:
+        await super()._on_token(data)
+        answer = self.answers.get(data.get("id"))
+        if answer is not None and data.get("token"):
+            answer[1] = answer[1] or time.perf_counter()
+            answer[2] += len(data["token"])
+
+    async def _on_stream_start(self, step: dict) -> None:
+        await self._on_token({"id": step.get("id"), "token": step.get("output")})
+
+    async def send(self, text: str) -> float:
+        sent_at = time.perf_counter()
+        await self.client.emit("client_message", {"message": {
+            "id": str(uuid.uuid4()), "threadId": "", "name": "User", "type": "user_message", "output": text,
+            "createdAt": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        }, "fileReferences": None})
+        return sent_at
+
+    async def answer_after(self, sent_at: float, chars: int) -> list:
+        """Wait for the first answer created after ``sent_at`` to stream ``chars`` characters."""
+        deadline = time.perf_counter() + self.turn_timeout
+        while time.perf_counter() < deadline:
+            for answer in self.answers.values():
+                if answer[0] >= sent_at and answer[2] >= chars:
+                    return answer
+            await asyncio.sleep(0.02)
+        raise asyncio.TimeoutError
+
+
+async def drive(port: int, args) -> dict:
+    stats = {"follow_up_ttft": [], "follow_up_latency": [], "welcome": [], "errors": 0, "timeouts": 0}
+    url = f"http://127.0.0.1:{port}"
+    rng = random.Random(7)
+    # The stub answers "tok " per token; the ends of the answer are stripped of their spaces
+    answer_chars = int(4 * args.tokens * 0.98)
+
+    async def student(index: int) -> None:
+        await asyncio.sleep(args.ramp * index / max(1, args.students))
+        interrupt = rng.uniform(0.5, 1.5) * args.interrupt
+        session = Student(url, stats, args.turn_timeout)
+        try:
+            await session.connect()
+            await session.answer_after(await session.send(QUESTION), 1)
+            await asyncio.sleep(interrupt)
+            if index % 2 == 0:
+                sent_at = await session.send(FOLLOW_UP)
+                created, first, _ = await session.answer_after(sent_at, answer_chars)
+                stats["follow_up_ttft"].append(first - sent_at)
+                stats["follow_up_latency"].append(time.perf_counter() - sent_at)
+                # Let the turn be stored before the tab closes
+                await asyncio.sleep(0.5)
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+        finally:
+            await session.client.disconnect()
+
+    # One whole answer first: the apps estimate the tokens saved from the answers they completed
+    session = Student(url, stats, args.turn_timeout)
+    try:
+        await session.connect()
+        await session.answer_after(await session.send(QUESTION), answer_chars)
+        await asyncio.sleep(0.5)
+    finally:
+        await session.client.disconnect()
+    await asyncio.gather(*(student(i) for i in range(args.students)))
+    return stats
+
+
+def stub_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(base_url.rsplit("/v1", 1)[0] + "/stats") as response:
+        return json.loads(response.read())
+
+
+def interleaved_threads(path: str) -> tuple[int, int]:
+    """Stored threads, and those with a student message not answered before the next one."""
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute("SELECT data FROM threads").fetchall()
+    broken = 0
+    for (data,) in rows:
+        roles = [m.role for m in ChatHistory.restore_chat_history(data).messages if m.role != AuthorRole.SYSTEM]
+        broken += any(a == b == AuthorRole.USER for a, b in zip(roles, roles[1:])) or roles[-1:] == [AuthorRole.USER]
+    return len(rows), broken
+
+
+async def measure(app: str, base_url: str, label: str, args, **env: str) -> None:
+    with tempfile.TemporaryDirectory() as folder:
+        port = free_port()
+        trace_file = os.path.join(folder, "traces.jsonl")
+        process = start_app(app, port, base_url, folder, TRACE_FILE=trace_file, **env)
+        try:
+            before = stub_stats(base_url)
+            t0 = time.perf_counter()
+            stats = await drive(port, args)
+            # Turns that were not cancelled stream on to their end
+            await asyncio.sleep(args.tokens / args.tokens_per_sec + 1)
+            after = stub_stats(base_url)
+            seconds = time.perf_counter() - t0
+        finally:
+            process.terminate()
+            process.wait()
+        threads, broken = interleaved_threads(os.path.join(folder, "threads.db"))
+        turns = [span for span in load_spans(trace_file) if span["kind"] == "turn"]
+    cancelled = [(span.get("attributes") or {}) for span in turns]
+    cancelled = [attributes for attributes in cancelled if "cancelled" in attributes]
+    reasons = {}
+    for attributes in cancelled:
+        reasons[attributes["cancelled"]] = reasons.get(attributes["cancelled"], 0) + 1
+    ttft = [t * 1000 for t in stats["follow_up_ttft"]]
+    latency = [t * 1000 for t in stats["follow_up_latency"]]
+    print(f"{app:<10} {label:<11} completion tokens={after['completion_tokens'] - before['completion_tokens']:6d} "
+          f"requests={after['requests'] - before['requests']} aborted streams={after['aborted'] - before['aborted']} "
+          f"in {seconds:.1f}s | follow-up ttft p50={percentile(ttft, .5):5.0f}ms answer p50={percentile(latency, .5):5.0f}ms")
+    print(f"{'':<10} {'':<11} turns={len(turns)} cancelled={reasons} tokens saved (estimated)="
+          f"{sum(attributes.get('tokens_saved', 0) for attributes in cancelled)} "
+          f"threads={threads} interleaved={broken} timeouts={stats['timeouts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apps", default="app.py,app_v1.py")
+    parser.add_argument("--students", type=int, default=20)
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which the students connect")
+    parser.add_argument("--interrupt", type=float, default=1.0, help="mean seconds of answer read before interrupting")
+    parser.add_argument("--turn-timeout", type=float, default=60.0)
+    parser.add_argument("--ttft", type=float, default=0.4)
+    parser.add_argument("--tokens", type=int, default=400)
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+    args = parser.parse_args()
+
+    # chainlit run writes a default chainlit.md next to the apps when there is none
+    readme = os.path.join(ROOT, "chainlit.md")
+    had_readme = os.path.exists(readme)
+    with stub_server_process(ttft=args.ttft, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec) as base_url:
+        for app in (app.strip() for app in args.apps.split(",")):
+            asyncio.run(measure(app, base_url, "cancel off", args, TURN_CANCEL="off"))
+            asyncio.run(measure(app, base_url, "cancel on", args))
+    if not had_readme and os.path.exists(readme):
+        os.remove(readme)
+
+
+if __name__ == "__main__":
+    main()
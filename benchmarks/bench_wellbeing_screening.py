@@ -0,0 +1,98 @@
+# author: Jairo Monassa
+"""Wellbeing screening latency: the four prompts one after the other vs at once.
+
+"sequential" is what chained delegation costs (bullying, then self-harm, then
+burnout, then conflicts), "concurrent" is ``WellbeingScreener.screen()``. The
+second stub never answers within ``--timeout``, which shows that a stuck
+screening caps the added latency instead of holding the turn.
+
+The apps hold the first token of the answer until the screening is done, but
+for at most ``--wait`` seconds (``await_screening``, ``WELLBEING_WAIT``):
+"first token held" compares that bound with waiting for the whole screening.
+
+    python benchmarks/bench_wellbeing_screening.py --messages 20 --ttft 0.4 --tokens-per-sec 60 --wait 1.0
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import AsyncOpenAI  # noqa: E402
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion  # noqa: E402
+
+from stub_server import stub_server_process  # noqa: E402
+from wellbeing_screening import WellbeingScreener, await_screening  # noqa: E402
+
+MESSAGES = [
+    "I can't sleep before the exam and I feel like giving up on everything",
+    "My classmates keep laughing at me in the group chat",
+    "Can you explain the chain rule again?",
+    "My father says I will never pass calculus",
+]
+
+
+async def held(screener: WellbeingScreener, message: str, wait: float) -> float:
+    """Seconds the answer's first token waits for the screening in the apps."""
+    t0 = time.perf_counter()
+    _, late = await await_screening(asyncio.create_task(screener.screen(message)), wait)
+    seconds = time.perf_counter() - t0
+    if late is not None:
+        await late
+    return seconds
+
+
+async def run(args, base_url: str, timeout: float) -> dict[str, list[float]]:
+    client = AsyncOpenAI(base_url=base_url, api_key="stub")
+    screener = WellbeingScreener(OpenAIChatCompletion(ai_model_id="stub", async_client=client), timeout=timeout)
+    results = {"sequential": [], "concurrent": [], "held": []}
+    for index in range(args.messages):
+        message = MESSAGES[index % len(MESSAGES)]
+        results["sequential"].append((await screener.screen_sequentially(message)).seconds)
+        results["concurrent"].append((await screener.screen(message)).seconds)
+        results["held"].append(await held(screener, message, args.wait))
+    await client.close()
+    results["timeouts"] = screener.timeouts
+    return results
+
+
+def report(label: str, results: dict) -> None:
+    for mode in ("sequential", "concurrent"):
+        seconds = sorted(results[mode])
+        print(f"{label:<10} {mode:<11} p50={statistics.median(seconds) * 1000:7.1f}ms "
+              f"max={seconds[-1] * 1000:7.1f}ms")
+    awaited, bounded = sorted(results["concurrent"]), sorted(results["held"])
+    print(f"{label:<10} first token held: max={awaited[-1] * 1000:7.1f}ms awaiting the screening, "
+          f"max={bounded[-1] * 1000:7.1f}ms with the wait bound")
+    print(f"{label:<10} screenings timed out: {results['timeouts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--ttft", type=float, default=0.4)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    parser.add_argument("--timeout", type=float, default=1.5)
+    parser.add_argument("--wait", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with stub_server_process(ttft=args.ttft, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec) as base_url:
+        healthy = asyncio.run(run(args, base_url, args.timeout))
+    with stub_server_process(ttft=args.timeout * 4, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec) as base_url:
+        stuck = asyncio.run(run(argparse.Namespace(messages=2, wait=args.wait), base_url, args.timeout))
+
+    report("healthy", healthy)
+    report("stuck", stuck)
+    added = statistics.median(healthy["concurrent"])
+    saved = statistics.median(healthy["sequential"]) - added
+    print(f"added latency per turn: {added * 1000:.0f}ms concurrent vs {(added + saved) * 1000:.0f}ms sequential "
+          f"(the apps overlap it with loading the thread and trimming the history)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+# author: Jairo Monassa
+"""Minimal OpenAI-compatible chat completions stub for offline benchmarks.
+
+Speaks HTTP/1.1 with keep-alive and streams Server-Sent Events like
+``/chat/completions`` does. ``connect_delay`` is paid once per new TCP
+connection to stand in for the TCP/TLS handshake of the real endpoint.
+
+With ``tool_call={"name": ..., "arguments": "..."}`` a request that offers
+``tools`` and does not already end with a tool result is answered with that
+tool call, its arguments streamed in ``tokens`` pieces. ``script`` is a list
+of such tool calls with an optional ``"match"`` regex on the last user
+message; the first rule whose tool is offered (by name or ``Plugin-name``
+suffix) and whose regex matches is used, otherwise the answer is text. A
+rule's ``tokens`` overrides the number of pieces its arguments stream in.
+Requests with ``response_format`` ``json_object`` get a JSON text answer
+(``json_answer`` when given, also for ``json_schema``, in 4-character pieces), and
+``usage`` (with a rough prompt token count) is reported like the API does,
+in the last chunk when ``stream_options.include_usage`` is set. A request's
+``max_tokens`` caps the answer at fewer than ``tokens`` pieces.
+
+Error injection: ``error_rate`` of the requests is answered with one of
+``error_statuses`` (429 carries ``retry-after``), and ``drop_rate`` of the
+streamed answers is cut off halfway without the final chunk. Latency
+injection: ``slow_rate`` of the requests wait ``slow_ttft`` instead of
+``ttft`` for their first token, and with ``prefill_rate`` (prompt tokens per
+second) a longer prompt delays the first token the way prompt processing
+does. ``seed`` makes all of it reproducible. The stats count the answer
+pieces actually sent (``completion_tokens``, streamed or not) and the streams
+the client closed before their end (``aborted``).
+
+Quota: with ``rpm_limit``/``tpm_limit`` the stub enforces a sliding window of
+``quota_window`` seconds like the real endpoint does per minute: requests
+over it get a 429 with ``retry-after``, and every answer carries
+``x-ratelimit-limit-*``/``x-ratelimit-remaining-*`` headers (per-minute
+figures, scaled when the window is shorter).
+
+Run it standalone to point an app at it (``MODEL_BASE_URL``)::
+
+    python benchmarks/stub_server.py --port 8001 --ttft 0.4 --tokens-per-sec 60 --script script.json
+"""
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import json
+import multiprocessing
+import random
+import re
+import time
+
+ERROR_MESSAGES = {
+    429: "Rate limit exceeded. Please retry after 1 second.",
+    500: "The server had an error while processing your request.",
+    502: "Bad gateway.",
+    503: "The engine is currently overloaded, please try again later.",
+}
+
+
+class StubServer:
+    def __init__(self, ttft: float = 0.05, tokens: int = 20, tokens_per_sec: float = 200.0,
+                 connect_delay: float = 0.0, tool_call: dict | None = None, script: list[dict] | None = None,
+                 error_rate: float = 0.0, error_statuses: tuple[int, ...] = (429, 500, 503),
+                 drop_rate: float = 0.0, slow_rate: float = 0.0, slow_ttft: float = 3.0,
+                 rpm_limit: int | None = None, tpm_limit: int | None = None, quota_window: float = 60.0,
+                 prefill_rate: float = 0.0, json_answer: str | None = None, seed: int | None = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.ttft = ttft
+        self.tokens = tokens
+        self.tokens_per_sec = tokens_per_sec
+        self.connect_delay = connect_delay
+        self.script = ([tool_call] if tool_call else []) + list(script or [])
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.drop_rate = drop_rate
+        self.slow_rate = slow_rate
+        self.slow_ttft = slow_ttft
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.quota_window = quota_window
+        self.prefill_rate = prefill_rate
+        self.json_answer = json_answer
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.throttled = 0
+        self._window: collections.deque[tuple[float, int]] = collections.deque()
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.dropped = 0
+        self.aborted = 0
+        self.tool_calls = 0
+        self.slow = 0
+        self._random = random.Random(seed)
+        self._server: asyncio.AbstractServer | None = None
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def __aenter__(self) -> "StubServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+
+    def stats(self) -> dict:
+        return {"connections": self.connections, "requests": self.requests, "errors": self.errors,
+                "dropped": self.dropped, "tool_calls": self.tool_calls, "slow": self.slow,
+                "throttled": self.throttled, "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens, "aborted": self.aborted}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._writers.add(writer)
+        if self.connect_delay:
+            await asyncio.sleep(self.connect_delay)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    if ":" in line:
+                        key, value = line.split(":", 1)
+                        headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if head.startswith(b"GET /stats"):
+                    self._write_json(writer, 200, self.stats())
+                    await writer.drain()
+                    continue
+                if head.startswith(b"GET ") and b"/models " in head.split(b"\r\n", 1)[0]:
+                    self._write_json(writer, 200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+                    await writer.drain()
+                    continue
+                self.requests += 1
+                if not await self._respond(writer, json.loads(body or b"{}")):
+                    break
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _write_json(self, writer: asyncio.StreamWriter, status: int, payload: dict, extra: bytes = b"") -> None:
+        body = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n".encode()
+                     + b"Content-Type: application/json\r\n" + extra
+                     + b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+
+    def _quota(self, request: dict) -> tuple[bytes, float | None]:
+        """Quota headers of this request, and its retry-after when it is over the quota."""
+        if not (self.rpm_limit or self.tpm_limit):
+            return b"", None
+        now = time.monotonic()
+        while self._window and now - self._window[0][0] >= self.quota_window:
+            self._window.popleft()
+        tokens = self._usage(request)["total_tokens"]
+        used_tokens = sum(t for _, t in self._window)
+        over = ((self.rpm_limit and len(self._window) >= self.rpm_limit)
+                or (self.tpm_limit and used_tokens + tokens > self.tpm_limit))
+        if not over:
+            self._window.append((now, tokens))
+            used_tokens += tokens
+        scale = 60 / self.quota_window
+        headers = b""
+        for kind, limit, used in (("requests", self.rpm_limit, len(self._window)), ("tokens", self.tpm_limit, used_tokens)):
+            if limit:
+                headers += (f"x-ratelimit-limit-{kind}: {int(limit * scale)}\r\n"
+                            f"x-ratelimit-remaining-{kind}: {int(max(0, limit - used) * scale)}\r\n").encode()
+        if not over:
+            return headers, None
+        retry_after = max(0.05, self.quota_window - (now - self._window[0][0])) if self._window else 1.0
+        return headers, retry_after
+
+    def _chunk(self, model: str, delta: dict, finish_reason: str | None = None) -> bytes:
+        payload = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n".encode()
+
+    def _pick_tool_call(self, request: dict) -> dict | None:
+        """The first script rule that applies to this request, with the tool name as offered."""
+        messages = request.get("messages") or [{}]
+        if not self.script or not request.get("tools") or messages[-1].get("role") == "tool":
+            return None
+        offered = [tool.get("function", {}).get("name", "") for tool in request["tools"]]
+        last_user = next((str(m.get("content") or "") for m in reversed(messages) if m.get("role") == "user"), "")
+        for rule in self.script:
+            name = next((o for o in offered if o == rule["name"] or o.endswith("-" + rule["name"])), None)
+            if name and re.search(rule.get("match", ""), last_user, re.IGNORECASE):
+                return {"name": name, "arguments": rule["arguments"], "tokens": rule.get("tokens")}
+        return None
+
+    def _tokens(self, request: dict) -> int:
+        return min(self.tokens, request.get("max_tokens") or request.get("max_completion_tokens") or self.tokens)
+
+    def _usage(self, request: dict) -> dict:
+        # Rough prompt size: 4 characters per token of the messages and tool schemas
+        prompt = len(json.dumps(request.get("messages", [])) + json.dumps(request.get("tools", []))) // 4
+        tokens = self._tokens(request)
+        return {"prompt_tokens": prompt, "completion_tokens": tokens, "total_tokens": prompt + tokens}
+
+    def _text(self, request: dict) -> tuple[list[str], bool]:
+        """Content pieces of a text answer and whether it must be JSON."""
+        kind = (request.get("response_format") or {}).get("type")
+        if self.json_answer and kind in ("json_object", "json_schema"):
+            # About 4 characters per token, like the "tok " pieces of a text answer
+            return [self.json_answer[i:i + 4] for i in range(0, len(self.json_answer), 4)], True
+        if kind == "json_object":
+            words = " ".join(["tok"] * max(1, self._tokens(request) - 2))
+            return ['{"text": "', *(words[i:i + 4] for i in range(0, len(words), 4)), '"}'], True
+        return ["tok "] * self._tokens(request), False
+
+    async def _respond(self, writer: asyncio.StreamWriter, request: dict) -> bool:
+        """Answer one request; returns False when the connection was cut on purpose."""
+        model = request.get("model", "stub")
+        quota_headers, retry_after = self._quota(request)
+        if retry_after is not None:
+            self.throttled += 1
+            self._write_json(writer, 429, {"error": {
+                "message": ERROR_MESSAGES[429], "type": "rate_limit_error", "code": "429",
+            }}, quota_headers + f"retry-after: {retry_after:.2f}\r\n".encode())
+            await writer.drain()
+            return True
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            status = self._random.choice(self.error_statuses)
+            await asyncio.sleep(self.ttft / 4)
+            self._write_json(writer, status, {"error": {
+                "message": ERROR_MESSAGES.get(status, "Injected error."),
+                "type": "rate_limit_error" if status == 429 else "server_error", "code": str(status),
+            }}, b"retry-after: 1\r\n" if status == 429 else b"")
+            await writer.drain()
+            return True
+        prompt_tokens = self._usage(request)["prompt_tokens"]
+        self.prompt_tokens += prompt_tokens
+        if self.prefill_rate:
+            await asyncio.sleep(prompt_tokens / self.prefill_rate)
+        if self.slow_rate and self._random.random() < self.slow_rate:
+            self.slow += 1
+            await asyncio.sleep(self.slow_ttft)
+        else:
+            await asyncio.sleep(self.ttft)
+        tool_call = self._pick_tool_call(request)
+        if tool_call:
+            self.tool_calls += 1
+        if tool_call:
+            arguments = tool_call["arguments"]
+            step = max(1, -(-len(arguments) // (tool_call["tokens"] or self._tokens(request))))
+            pieces = [arguments[start:start + step] for start in range(0, len(arguments), step)]
+        else:
+            pieces, _ = self._text(request)
+        if not request.get("stream"):
+            # A non-streamed answer still takes the whole generation time
+            await asyncio.sleep(len(pieces) / self.tokens_per_sec)
+            self.completion_tokens += len(pieces)
+            if tool_call:
+                message = {"role": "assistant", "content": None, "tool_calls": [{
+                    "id": "call_stub", "type": "function",
+                    "function": {"name": tool_call["name"], "arguments": tool_call["arguments"]},
+                }]}
+            else:
+                message = {"role": "assistant", "content": "".join(pieces)}
+            self._write_json(writer, 200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "tool_calls" if tool_call else "stop",
+                             "message": message}],
+                "usage": self._usage(request),
+            }, quota_headers)
+            await writer.drain()
+            return True
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n"
+                     + quota_headers + b"\r\n")
+
+        def send(data: bytes) -> None:
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        drop_at = len(pieces) // 2 if self.drop_rate and self._random.random() < self.drop_rate else None
+
+        send(self._chunk(model, {"role": "assistant", "content": ""}))
+        try:
+            for index, piece in enumerate(pieces):
+                if index == drop_at:
+                    self.dropped += 1
+                    await writer.drain()
+                    return False
+                if tool_call:
+                    function = {"arguments": piece}
+                    call = {"index": 0, "function": function}
+                    if index == 0:
+                        call.update(id="call_stub", type="function")
+                        function["name"] = tool_call["name"]
+                    send(self._chunk(model, {"tool_calls": [call]}))
+                else:
+                    send(self._chunk(model, {"content": piece}))
+                self.completion_tokens += 1
+                await writer.drain()
+                await asyncio.sleep(1 / self.tokens_per_sec)
+        except ConnectionError:
+            # The client closed the stream before its end
+            self.aborted += 1
+            raise
+        send(self._chunk(model, {}, "tool_calls" if tool_call else "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            usage = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [], "usage": self._usage(request)}
+            send(f"data: {json.dumps(usage)}\n\n".encode())
+        send(b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return True
+
+
+def _serve(kwargs: dict, ports) -> None:
+    async def serve():
+        async with StubServer(**kwargs) as server:
+            ports.put(server.port)
+            await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+@contextlib.contextmanager
+def stub_server_process(**kwargs):
+    """Run a StubServer in a child process so it does not share the client's CPU.
+
+    Yields the base URL; ``GET /stats`` on the server root returns its counters.
+    """
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(kwargs, ports), daemon=True)
+    process.start()
+    try:
+        yield f"http://{kwargs.get('host', '127.0.0.1')}:{ports.get(timeout=10)}/v1"
+    finally:
+        process.terminate()
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft", type=float, default=0.4)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    parser.add_argument("--connect-delay", type=float, default=0.0)
+    parser.add_argument("--script", help="JSON file with a list of {match, name, arguments} tool calls")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-statuses", default="429,500,503")
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ttft", type=float, default=3.0)
+    parser.add_argument("--rpm-limit", type=int)
+    parser.add_argument("--tpm-limit", type=int)
+    parser.add_argument("--quota-window", type=float, default=60.0)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+
+    async def serve():
+        async with StubServer(ttft=args.ttft, tokens=args.tokens, tokens_per_sec=args.tokens_per_sec,
+                              connect_delay=args.connect_delay, script=script, error_rate=args.error_rate,
+                              error_statuses=tuple(int(s) for s in args.error_statuses.split(",")),
+                              drop_rate=args.drop_rate, slow_rate=args.slow_rate, slow_ttft=args.slow_ttft,
+                              rpm_limit=args.rpm_limit, tpm_limit=args.tpm_limit, quota_window=args.quota_window,
+                              seed=args.seed, host=args.host, port=args.port) as server:
+            print(f"stub listening on {server.base_url}")
+            await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# author: Jairo Monassa
+"""Token-budgeted conversation memory with a rolling summary.
+
+``ConversationMemory`` is a Semantic Kernel ``ChatHistoryReducer``, so it is
+passed to ``ChatHistoryAgentThread(chat_history=...)`` like any ChatHistory.
+Before each turn ``prepare_turn()`` checks the history against the token
+budget. When it is over, the oldest turns (never the last ``keep_turns``) are
+folded into a running summary together with the previous summary, until the
+history is back under ``fold_ratio`` of the budget. Pinned messages, such as
+the current study plan or quiz results, are never folded.
+
+The apps set ``current_memory`` to the thread's memory for each turn, so the
+tools that save a plan, serve or grade a quiz pin what they produced
+(``pin_context``) without being handed the thread.
+"""
+
+import logging
+import os
+import sys
+from contextvars import ContextVar
+
+if sys.version < "3.11":
+    from typing_extensions import Self  # pragma: no cover
+else:
+    from typing import Self  # type: ignore # pragma: no cover
+
+from pydantic import Field
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
+from semantic_kernel.contents import ChatHistory, ChatMessageContent
+from semantic_kernel.contents.history_reducer.chat_history_reducer import ChatHistoryReducer
+from semantic_kernel.contents.history_reducer.chat_history_reducer_utils import SUMMARY_METADATA_KEY
+from semantic_kernel.contents.utils.author_role import AuthorRole
+
+from token_counting import estimate_message_tokens, estimate_tokens, message_text
+
+logger = logging.getLogger(__name__)
+
+PINNED_METADATA_KEY = "__pinned__"
+# Pin keys of the tools' context
+PLAN_PIN = "study_plan"
+QUIZ_PIN = "quiz"
+QUIZ_RESULTS_PIN = "quiz_results"
+
+SUMMARY_PREFIX = "Summary of the earlier conversation with the student: "
+
+FOLD_INSTRUCTIONS = (
+    "You keep a running summary of a tutoring conversation. "
+    "Merge the previous summary with the new messages into one concise summary of at most 8 sentences. "
+    "Keep the student's subject, goals, deadlines, availability, difficulties, feelings and any decisions taken. "
+    "Do not add anything that was not said."
+)
+
+
+class ConversationMemory(ChatHistoryReducer):
+    """ChatHistory that keeps itself under a prompt-token budget.
+
+    Args:
+        token_budget: Target prompt tokens for the history (pinned + summary + turns).
+        keep_turns: Number of most recent turns always kept verbatim.
+        fold_ratio: After folding, the history is brought down to this share of the budget.
+        max_summary_tokens: Cap of the local summary when no service is configured.
+        service: ChatCompletion service used to fold turns into the summary, optional.
+    """
+
+    target_count: int = Field(default=1, gt=0)
+    token_budget: int = Field(default=3000, gt=0)
+    keep_turns: int = Field(default=6, ge=1)
+    fold_ratio: float = Field(default=0.75, gt=0, le=1)
+    max_summary_tokens: int = Field(default=400, gt=0)
+    service: ChatCompletionClientBase | None = Field(default=None, exclude=True)
+    turn_prompt_tokens: list[int] = Field(default_factory=list, exclude=True)
+
+    @classmethod
+    def from_env(cls, service: ChatCompletionClientBase | None = None) -> "ConversationMemory":
+        """Memory configured by ``MEMORY_TOKEN_BUDGET`` and ``MEMORY_KEEP_TURNS``."""
+        return cls(
+            token_budget=int(os.getenv("MEMORY_TOKEN_BUDGET", 3000)),
+            keep_turns=int(os.getenv("MEMORY_KEEP_TURNS", 6)),
+            service=service,
+        )
+
+    # --- Pinned context ---
+    def pin(self, key: str, content: str) -> None:
+        """Pin (or replace) a context message that is never folded, e.g. ``study_plan``."""
+        message = ChatMessageContent(role=AuthorRole.SYSTEM, content=content, metadata={PINNED_METADATA_KEY: key})
+        for index, existing in enumerate(self.messages):
+            if existing.metadata.get(PINNED_METADATA_KEY) == key:
+                self.messages[index] = message
+                return
+        self.messages.insert(len(self.pinned_messages()), message)
+
+    def unpin(self, key: str) -> None:
+        self.messages = [m for m in self.messages if m.metadata.get(PINNED_METADATA_KEY) != key]
+
+    def pinned_messages(self) -> list[ChatMessageContent]:
+        return [m for m in self.messages if PINNED_METADATA_KEY in m.metadata]
+
+    def summary_message(self) -> ChatMessageContent | None:
+        return next((m for m in self.messages if SUMMARY_METADATA_KEY in m.metadata), None)
+
+    def prompt_tokens(self) -> int:
+        """Estimated prompt tokens this history adds to the next call."""
+        return estimate_message_tokens(self.messages)
+
+    # --- Reduction ---
+    async def prepare_turn(self) -> int:
+        """Reduce if needed and record the estimated prompt tokens of the coming turn."""
+        await self.reduce()
+        tokens = self.prompt_tokens()
+        self.turn_prompt_tokens.append(tokens)
+        logger.info("Turn %d: ~%d history prompt tokens", len(self.turn_prompt_tokens), tokens)
+        return tokens
+
+    async def reduce(self) -> Self | None:
+        if self.prompt_tokens() <= self.token_budget:
+            return None
+
+        pinned = self.pinned_messages()
+        summary = self.summary_message()
+        body = [m for m in self.messages if PINNED_METADATA_KEY not in m.metadata and SUMMARY_METADATA_KEY not in m.metadata]
+
+        # Turns start at each user message; the last keep_turns are never folded
+        turn_starts = [index for index, message in enumerate(body) if message.role == AuthorRole.USER]
+        if len(turn_starts) <= self.keep_turns:
+            return None
+        foldable = turn_starts[1:len(turn_starts) - self.keep_turns + 1]
+
+        # Fold the shortest prefix of whole turns that brings the history under the fold target
+        target = int(self.token_budget * self.fold_ratio)
+        fixed = estimate_message_tokens(pinned) + (estimate_message_tokens([summary]) if summary else 0)
+        cut = foldable[-1]
+        for candidate in foldable:
+            if fixed + estimate_message_tokens(body[candidate:]) <= target:
+                cut = candidate
+                break
+
+        folded, kept = body[:cut], body[cut:]
+        previous = str(summary.content)[len(SUMMARY_PREFIX):] if summary else ""
+        summary_text = await self._fold(previous, folded)
+        new_summary = ChatMessageContent(
+            role=AuthorRole.SYSTEM,
+            content=SUMMARY_PREFIX + summary_text,
+            metadata={SUMMARY_METADATA_KEY: True},
+        )
+        self.messages = [*pinned, new_summary, *kept]
+        logger.info("Folded %d messages into the running summary", len(folded))
+        return self
+
+    async def _fold(self, previous: str, messages: list[ChatMessageContent]) -> str:
+        """Merge ``messages`` into the previous summary."""
+        transcript = "\n".join(
+            f"{message.name or message.role.value}: {text}"
+            for message in messages
+            if (text := message_text(message))
+        )
+        if self.service is not None:
+            try:
+                history = ChatHistory()
+                history.add_system_message(FOLD_INSTRUCTIONS)
+                history.add_user_message(f"Previous summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}")
+                settings = self.service.get_prompt_execution_settings_from_settings(PromptExecutionSettings())
+                response = await self.service.get_chat_message_content(chat_history=history, settings=settings)
+                if response is not None and response.content:
+                    return str(response.content)
+            except Exception as e:
+                logger.warning(f"Summarization failed, using the local summary: {e}")
+        return self._local_fold(previous, messages)
+
+    def _local_fold(self, previous: str, messages: list[ChatMessageContent]) -> str:
+        """Extractive fallback: first sentence of each message, newest kept within the cap."""
+        lines = [previous] if previous else []
+        for message in messages:
+            text = message_text(message).strip()
+            if text:
+                first_sentence = text.split(". ")[0][:200]
+                lines.append(f"{message.name or message.role.value}: {first_sentence}")
+        summary = " | ".join(lines)
+        max_chars = self.max_summary_tokens * 4
+        return summary if estimate_tokens(summary) <= self.max_summary_tokens else "..." + summary[-max_chars:]
+
+
+current_memory: ContextVar[ConversationMemory | None] = ContextVar("current_memory", default=None)
+
+
+def pin_context(key: str, content: str, memory: ChatHistory | None = None) -> None:
+    """Pin ``content`` under ``key`` in ``memory`` or the turn's ``current_memory`` (a plain ChatHistory is left alone)."""
+    memory = memory if memory is not None else current_memory.get()
+    if isinstance(memory, ConversationMemory):
+        memory.pin(key, content)
+
+
+def unpin_context(key: str, memory: ChatHistory | None = None) -> None:
+    memory = memory if memory is not None else current_memory.get()
+    if isinstance(memory, ConversationMemory):
+        memory.unpin(key)
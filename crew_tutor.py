@@ -0,0 +1,294 @@
+# author: Jairo Monassa
+"""The CrewAI tutor of ``crewai_tutor.ipynb`` as an importable runner.
+
+The notebook rebuilt ``history_txt`` from the whole ``history`` list on every
+follow-up and kicked the whole crew off again, so every turn re-concatenated
+the conversation and reran ``motivation_task`` and ``study_plan_task`` from
+scratch, one student at a time. ``CrewTutor`` keeps per student:
+
+- a ``CrewMemory``: each turn is rendered once and appended to the prompt
+  text, which is trimmed from its oldest turns to a character budget;
+- the output of each specialist task with the facts it was computed from:
+  the student's first message plus the later ones that match the task's
+  ``TASK_TRIGGERS``. A turn only reruns a task when it brings new facts for
+  it; otherwise the cached output is handed to the tutor's answer as is.
+
+Each turn is one kickoff: the specialist tasks that have to run, then the
+tutor answering the student with their outputs and the conversation. Turns
+of different students run concurrently through ``Crew.kickoff_async``, at
+most ``max_concurrency`` at a time, and a student's own turns run in order.
+Every kickoff runs on a copy of a template crew, as
+``Crew.kickoff_for_each_async`` does, since CrewAI agents keep per-run state.
+
+Needs ``crewai`` (``pip install crewai``, as the notebook does). ``llm`` can be
+any CrewAI ``LLM``/``BaseLLM``, so it can be stubbed
+(``benchmarks/bench_crew_tutor.py``).
+
+Settings: ``CREW_LLM_MODEL`` (default the notebook's Nova Pro on Bedrock),
+``CREW_MAX_CONCURRENCY`` (default 4), ``CREW_HISTORY_CHARS`` (default 12000)
+and ``CREW_TASK_CACHE`` ("on"/"off").
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from textwrap import dedent
+
+from crewai import LLM, Agent, Crew, Process, Task
+
+logger = logging.getLogger(__name__)
+
+MOTIVATION_AGENT_NAME = "motivation_agent"
+PLANNING_AGENT_NAME = "planning_Agent"
+MAIN_AGENT_NAME = "Main_Tutor_Agent"
+
+MOTIVATION_TASK = "motivation"
+STUDY_PLAN_TASK = "study_plan"
+SPECIALIST_TASKS = (MOTIVATION_TASK, STUDY_PLAN_TASK)
+
+# Messages that bring new facts for a task, so its cached output no longer holds
+TASK_TRIGGERS = {
+    MOTIVATION_TASK: [
+        r"\b(motivat\w*|unmotivated|bored|lazy|procrastinat\w*|give up|giving up|quit|tired|exhausted)\b",
+        r"\b(feel|feeling|felt|anxious|stress\w*|worried|nervous|confident|sad|frustrated)\b",
+        r"\bwhat'?s the point\b",
+        r"\b(desmotivad\w*|pregui[cç]a|desistir|cansad[oa]|ansios[oa])\b",
+    ],
+    STUDY_PLAN_TASK: [
+        r"\b(plan|plans|planning|schedule|timetable|calendar|routine|deadline)\b",
+        r"\b(exam|exams|test|tests|certification)\b",
+        r"\b\d+\s*(hours?|h|days?|weeks?|months?)\b",
+        r"\b(per|a|by|each|every) (day|week|month)\b",
+        r"\b(level|beginner|advanced|subject|syllabus)\b",
+        r"\b(plano|cronograma|rotina|prova|horas?|semanas?)\b",
+    ],
+}
+
+
+class CrewMemory:
+    """Conversation text of one student, grown one turn at a time.
+
+    Args:
+        max_chars: Budget of the text; the oldest turns are dropped beyond it
+            (the last turn is always kept).
+    """
+
+    def __init__(self, max_chars: int = 12000):
+        self.max_chars = max_chars
+        self.turns = 0
+        self.trimmed = 0
+        self._sizes: list[int] = []
+        self._text = ""
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def add_turn(self, user: str, answer: str) -> None:
+        rendered = f"User: {user}\nAgent: {answer}\n"
+        self._text += rendered
+        self._sizes.append(len(rendered))
+        self.turns += 1
+        drop = 0
+        while len(self._text) - drop > self.max_chars and len(self._sizes) > 1:
+            drop += self._sizes.pop(0)
+            self.trimmed += 1
+        if drop:
+            self._text = self._text[drop:]
+
+
+@dataclass
+class StudentState:
+    memory: CrewMemory
+    facts: dict[str, list[str]] = field(default_factory=dict)
+    # task -> (number of facts it was computed from, output)
+    outputs: dict[str, tuple[int, str]] = field(default_factory=dict)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+@dataclass
+class CrewStats:
+    turns: int = 0
+    tasks_run: int = 0
+    tasks_cached: int = 0
+    failures: int = 0
+    queued_seconds: float = 0.0
+    kickoff_seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _facts_text(facts: list[str]) -> str:
+    return "\n".join(f"- {fact}" for fact in facts)
+
+
+class CrewTutor:
+    """Runs the tutor crew for many students.
+
+    Args:
+        llm: CrewAI LLM shared by the agents.
+        max_concurrency: Kickoffs running at once (each one holds a worker thread).
+        history_chars: Budget of each student's conversation text.
+        cache: Reuse the specialist outputs a turn does not invalidate.
+        triggers: Patterns per specialist task (default ``TASK_TRIGGERS``).
+        verbose: CrewAI's console output of the agents.
+    """
+
+    def __init__(self, llm, max_concurrency: int = 4, history_chars: int = 12000, cache: bool = True,
+                 triggers: dict[str, list[str]] | None = None, verbose: bool = False):
+        self.llm = llm
+        self.history_chars = history_chars
+        self.cache = cache
+        self.verbose = verbose
+        triggers = TASK_TRIGGERS if triggers is None else triggers
+        self.triggers = {
+            task: [re.compile(pattern, re.IGNORECASE) for pattern in patterns] for task, patterns in triggers.items()
+        }
+        self.stats = CrewStats()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._students: dict[str, StudentState] = {}
+        self._templates: dict[tuple[str, ...], Crew] = {}
+
+    # --- Crew ---
+    def _agents(self) -> dict[str, Agent]:
+        tutor = Agent(
+            role="Tutor Agent for student",
+            goal="You are an online tutor who helps students study.",
+            backstory=dedent(
+                "Always greet the student, and pay attention to their tone of response to assess how they are feeling. "
+                "After they study a topic and let you know, ask them how they are doing. "
+                "After they take a simulation/quiz, ask them if they are feeling more confident. "
+                "Try to understand the student by asking about their difficulties and goals. "
+                "Use the motivational plan and the study plan of the specialists when they help the student."
+            ),
+            verbose=self.verbose,
+            allow_delegation=False,
+            llm=self.llm,
+        )
+        motivation = Agent(
+            role="Motivation Agent",
+            goal="check the student's motivation level and suggest a motivational plan",
+            backstory="student motivation specialist",
+            verbose=self.verbose,
+            llm=self.llm,
+        )
+        planning = Agent(
+            role="Planning Agent",
+            goal="create a personalized study plan",
+            backstory="study plan specialist.",
+            verbose=self.verbose,
+            llm=self.llm,
+        )
+        return {MAIN_AGENT_NAME: tutor, MOTIVATION_AGENT_NAME: motivation, PLANNING_AGENT_NAME: planning}
+
+    def _template(self, stale: tuple[str, ...]) -> Crew:
+        """Crew running the ``stale`` specialist tasks and the tutor's answer, built once per combination."""
+        crew = self._templates.get(stale)
+        if crew is None:
+            agents = self._agents()
+            specialists = {
+                MOTIVATION_TASK: Task(
+                    description=(
+                        "Talk to the student, assess motivation and propose motivational actions.\n"
+                        "What the student said:\n{motivation_facts}"
+                    ),
+                    expected_output="Personalized motivational plan.",
+                    agent=agents[MOTIVATION_AGENT_NAME],
+                ),
+                STUDY_PLAN_TASK: Task(
+                    description=(
+                        "Collect information, such as available study time per week, and create a personalized "
+                        "study plan.\nWhat the student said:\n{study_plan_facts}"
+                    ),
+                    expected_output="Study plan",
+                    agent=agents[PLANNING_AGENT_NAME],
+                ),
+            }
+            tasks = [specialists[key] for key in stale]
+            answer = Task(
+                description=(
+                    "Answer the student's last message as their tutor.\n\n"
+                    "Motivational plan:\n{motivation}\n\nStudy plan:\n{study_plan}\n\n"
+                    "Conversation so far:\n{history}\nUser: {message}"
+                ),
+                expected_output="The tutor's answer to the student.",
+                agent=agents[MAIN_AGENT_NAME],
+                context=tasks,
+            )
+            crew = self._templates[stale] = Crew(
+                agents=list(agents.values()), tasks=[*tasks, answer], process=Process.sequential, verbose=self.verbose
+            )
+        return crew
+
+    # --- Turns ---
+    def _stale_tasks(self, state: StudentState, message: str) -> tuple[str, ...]:
+        """Record the facts ``message`` brings and return the specialist tasks that must run."""
+        for task in SPECIALIST_TASKS:
+            facts = state.facts.setdefault(task, [])
+            # The first message introduces the student to every specialist
+            if not facts or any(pattern.search(message) for pattern in self.triggers.get(task, [])):
+                facts.append(message)
+        return tuple(
+            task for task in SPECIALIST_TASKS
+            if not self.cache or state.outputs.get(task, (None,))[0] != len(state.facts[task])
+        )
+
+    async def turn(self, student: str, message: str) -> str:
+        """Answer ``message`` of ``student``, running only the tasks the message invalidates."""
+        state = self._students.get(student)
+        if state is None:
+            state = self._students[student] = StudentState(CrewMemory(self.history_chars))
+        async with state.lock:
+            stale = self._stale_tasks(state, message)
+            inputs = {
+                "message": message,
+                "history": state.memory.text or "(first message)",
+                **{f"{task}_facts": _facts_text(state.facts[task]) for task in SPECIALIST_TASKS},
+                # Tasks that run this turn reach the answer through its context instead
+                **{task: "(see the context below)" if task in stale else state.outputs[task][1]
+                   for task in SPECIALIST_TASKS},
+            }
+            crew = self._template(stale).copy()
+            t0 = time.perf_counter()
+            async with self._semaphore:
+                t1 = time.perf_counter()
+                try:
+                    result = await crew.kickoff_async(inputs=inputs)
+                except Exception:
+                    self.stats.failures += 1
+                    raise
+                finally:
+                    self.stats.queued_seconds += t1 - t0
+                    self.stats.kickoff_seconds += time.perf_counter() - t1
+            for task, output in zip(stale, result.tasks_output):
+                state.outputs[task] = (len(state.facts[task]), output.raw)
+            answer = result.raw
+            state.memory.add_turn(message, answer)
+            self.stats.turns += 1
+            self.stats.tasks_run += len(stale)
+            self.stats.tasks_cached += len(SPECIALIST_TASKS) - len(stale)
+            logger.debug("Turn of %s ran %s", student, stale or "no specialist")
+            return answer
+
+    def forget(self, student: str) -> None:
+        self._students.pop(student, None)
+
+
+def build_crew_llm() -> LLM:
+    """The notebook's LLM, from ``CREW_LLM_MODEL``."""
+    return LLM(model=os.getenv("CREW_LLM_MODEL", "bedrock/us.amazon.nova-pro-v1:0"), temperature=0.7,
+               max_tokens=4 * 1024)
+
+
+def build_crew_tutor(llm=None) -> CrewTutor:
+    """Crew tutor from ``CREW_MAX_CONCURRENCY``, ``CREW_HISTORY_CHARS`` and ``CREW_TASK_CACHE``."""
+    return CrewTutor(
+        llm if llm is not None else build_crew_llm(),
+        max_concurrency=int(os.getenv("CREW_MAX_CONCURRENCY", 4)),
+        history_chars=int(os.getenv("CREW_HISTORY_CHARS", 12000)),
+        cache=os.getenv("CREW_TASK_CACHE", "on").lower() != "off",
+    )
@@ -0,0 +1,445 @@
+# author: Jairo Monassa
+"""Uploaded files, streamed to disk and indexed for local passage retrieval.
+
+Chainlit accepts spontaneous uploads (``config.toml``: 20 files of up to
+500 MB), but the apps ignored ``message.elements``, so students pasted whole
+essays and notes into the chat and every later prompt carried them. Now:
+
+- ``DocumentIndex.ingest`` copies each upload into ``UPLOAD_DIR`` in 1 MB
+  chunks (hashing it on the way, so the same file is indexed once per
+  student id), extracts its text as a stream (plain text and code of any size,
+  ``.docx`` with the standard library, ``.pdf`` when ``pypdf`` is installed)
+  and splits it into overlapping passages of ``DOCUMENT_PASSAGE_WORDS`` words.
+- Passages go to an SQLite FTS5 index of the student's own (diacritics
+  folded, so "aceleração" matches "aceleracao"), ranked with its built-in
+  BM25; nothing leaves the server and no index service is needed.
+- Each turn, ``context_for`` retrieves the ``DOCUMENT_TOP_K`` passages of the
+  student's files that best match the message and hands them to the agent as
+  a system note, which ``forget_context`` drops from the thread afterwards,
+  so the history only keeps what was said. ``DocumentPlugin`` lets
+  Evaluation_Content_Agent (and the tutor) search the files themselves when a
+  turn is forwarded to them.
+
+The "student" of the index is whatever id the caller passes. The apps pass
+Chainlit's thread id, as they do for plans and quizzes, so uploads belong to
+one chat thread: a new conversation starts without the files of the
+previous one, and the same file uploaded there is indexed again.
+
+Settings: ``DOCUMENT_INDEX`` ("on"/"off"), ``UPLOAD_DIR`` (files and
+indexes, default uploads), ``DOCUMENT_TOP_K`` (default 4) and
+``DOCUMENT_PASSAGE_WORDS`` (default 120).
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import unicodedata
+import zipfile
+from dataclasses import asdict, dataclass
+from typing import Annotated, BinaryIO, Iterable, Iterator
+from xml.etree import ElementTree
+
+from semantic_kernel.contents import ChatHistory, ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+from semantic_kernel.functions import kernel_function
+
+from study_plan_plugin import current_student
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_PLUGIN_NAME = "Documents"
+CONTEXT_METADATA_KEY = "__documents__"
+CHUNK_BYTES = 1 << 20
+_INSERT_BATCH = 2000
+# Query terms in more than this share of a student's passages barely move BM25 and make the search walk most of them
+COMMON_SHARE = 0.1
+
+TEXT_EXTENSIONS = {
+    ".txt", ".md", ".markdown", ".rst", ".csv", ".tsv", ".json", ".jsonl", ".xml", ".html", ".htm", ".tex",
+    ".py", ".ipynb", ".js", ".ts", ".java", ".c", ".cpp", ".h", ".cs", ".go", ".rb", ".php", ".sql", ".yaml", ".yml",
+}
+
+_WORD = re.compile(r"\w+")
+_DOCX_TEXT = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t"
+_DOCX_PARAGRAPH = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p"
+
+# Words that match almost every passage (English and Portuguese)
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i in is it its me my of on or so that the their
+this to was what when where which who why will with you your about into there these those then than also not
+o os as um uma uns umas e ou de do da dos das em no na nos nas por para com sem que se eu meu minha voce ele ela
+isso isto esse essa este esta como qual quando onde porque mais menos muito ja ser estar tem sao foi ao aos
+""".split())
+
+
+@dataclass
+class IngestResult:
+    name: str
+    bytes: int
+    passages: int = 0
+    seconds: float = 0.0
+    duplicate: bool = False  # the same file was already indexed for this student id (chat thread in the apps)
+    error: str | None = None
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class Passage:
+    document: str
+    ordinal: int
+    text: str
+    score: float
+
+
+def store_upload(source: BinaryIO, path: str) -> tuple[str, int]:
+    """Copy ``source`` to ``path`` in ``CHUNK_BYTES`` chunks; returns its SHA-256 and size."""
+    digest = hashlib.sha256()
+    size = 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as out:
+        while chunk := source.read(CHUNK_BYTES):
+            digest.update(chunk)
+            size += len(chunk)
+            out.write(chunk)
+    return digest.hexdigest(), size
+
+
+def _is_text(path: str, mime: str | None) -> bool:
+    if (mime or "").startswith("text/") or os.path.splitext(path)[1].lower() in TEXT_EXTENSIONS:
+        return True
+    with open(path, "rb") as f:
+        head = f.read(4096)
+    return bool(head) and b"\x00" not in head
+
+
+def _docx_text(path: str) -> Iterator[str]:
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        for event, element in ElementTree.iterparse(xml, events=("end",)):
+            if element.tag == _DOCX_TEXT and element.text:
+                yield element.text
+            elif element.tag == _DOCX_PARAGRAPH:
+                yield "\n"
+                element.clear()
+
+
+def _pdf_text(path: str) -> Iterator[str]:
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PyPdfError
+    except ImportError:
+        raise ValueError("PDF uploads need the 'pypdf' package") from None
+    try:
+        for page in PdfReader(path).pages:
+            yield (page.extract_text() or "") + "\n"
+    except PyPdfError as e:  # corrupt or encrypted PDF
+        raise ValueError(f"unreadable PDF: {e}") from None
+
+
+def extract_text(path: str, mime: str | None = None) -> Iterator[str]:
+    """The text of a stored upload, in pieces (never the whole file at once); ValueError if unsupported."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".docx":
+        yield from _docx_text(path)
+    elif extension == ".pdf" or mime == "application/pdf":
+        yield from _pdf_text(path)
+    elif _is_text(path, mime):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            while piece := f.read(CHUNK_BYTES):
+                yield piece
+    else:
+        raise ValueError(f"no text to extract from this type of file ({mime or extension or 'unknown'})")
+
+
+def split_passages(pieces: Iterable[str], words: int = 120, overlap: int = 20) -> Iterator[str]:
+    """Passages of ``words`` words, each starting ``overlap`` words before the end of the previous one."""
+    step = max(1, words - overlap)
+    window: list[str] = []
+    tail = ""
+    yielded = False
+    for piece in pieces:
+        text = tail + piece
+        # A word cut at the end of the piece continues in the next one (unless there is no whitespace at all)
+        cut = len(text) if text[-1:].isspace() else max(text.rfind(" "), text.rfind("\n")) + 1
+        if not cut and len(text) > CHUNK_BYTES:
+            cut = len(text)
+        tail = text[cut:]
+        window.extend(text[:cut].split())
+        while len(window) >= words:
+            yield " ".join(window[:words])
+            yielded = True
+            del window[:step]
+    window.extend(tail.split())
+    # The first ``overlap`` words left are already at the end of the last passage
+    if len(window) > (overlap if yielded else 0):
+        yield " ".join(window)
+
+
+def query_terms(text: str, limit: int = 24) -> list[str]:
+    """Distinct content words of ``text``, in order and folded as the index folds them."""
+    terms = []
+    for word in _WORD.findall(text.casefold()):
+        plain = "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c))
+        if len(plain) < 3 or plain in STOPWORDS or plain in terms:
+            continue
+        terms.append(plain)
+        if len(terms) == limit:
+            break
+    return terms
+
+
+class DocumentIndex:
+    """The students' uploaded files, each student's passages in their own SQLite FTS5 index.
+
+    One index file per student (next to their files) keeps a search to that
+    student's passages, and lets students upload at the same time without
+    waiting on a shared writer.
+
+    Args:
+        upload_dir: Where the uploaded files and the indexes are kept.
+        passage_words: Words per passage.
+        overlap: Words shared by consecutive passages.
+    """
+
+    INDEX_FILE = "index.db"
+
+    def __init__(self, upload_dir: str = "uploads", passage_words: int = 120, overlap: int = 20):
+        self.upload_dir = upload_dir
+        self.passage_words = passage_words
+        self.overlap = overlap
+
+    def student_dir(self, student_id: str) -> str:
+        """Directory of one student's uploads, safe for any id and spread over 256 buckets."""
+        digest = hashlib.sha1(student_id.encode("utf-8")).hexdigest()
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", student_id)[:48]
+        return os.path.join(self.upload_dir, digest[:2], f"{slug}-{digest[:10]}")
+
+    def _connect(self, student_id: str, create: bool = False) -> sqlite3.Connection | None:
+        path = os.path.join(self.student_dir(student_id), self.INDEX_FILE)
+        if not create and not os.path.exists(path):
+            return None
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        if create:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS documents (document_id INTEGER PRIMARY KEY, name TEXT NOT NULL, "
+                "sha256 TEXT NOT NULL UNIQUE, path TEXT NOT NULL, bytes INTEGER NOT NULL, "
+                "passage_count INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL);"
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(text, document_id UNINDEXED, "
+                "ordinal UNINDEXED, tokenize='unicode61 remove_diacritics 2');"
+                "CREATE VIRTUAL TABLE IF NOT EXISTS passage_terms USING fts5vocab(passages, row);"
+            )
+        return conn
+
+    def has_documents(self, student_id: str) -> bool:
+        return os.path.exists(os.path.join(self.student_dir(student_id), self.INDEX_FILE))
+
+    def ingest(self, student_id: str, name: str, source: str | BinaryIO, mime: str | None = None) -> IngestResult:
+        """Store and index one upload (a path or a binary file object) for the student."""
+        t0 = time.perf_counter()
+        extension = os.path.splitext(name)[1].lower()
+        folder = self.student_dir(student_id)
+        partial = os.path.join(folder, f".{os.getpid()}-{threading.get_ident()}{extension}.part")
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                sha256, size = store_upload(f, partial)
+        else:
+            sha256, size = store_upload(source, partial)
+        result = IngestResult(name=name, bytes=size)
+        path = os.path.join(folder, f"{sha256[:16]}{extension}")
+        conn = self._connect(student_id, create=True)
+        stored = committed = False
+        try:
+            if conn.execute("SELECT 1 FROM documents WHERE sha256 = ?", (sha256,)).fetchone():
+                result.duplicate = True
+                return result
+            shutil.move(partial, path)
+            stored = True
+            document_id = conn.execute(
+                "INSERT INTO documents (name, sha256, path, bytes, created_at) VALUES (?, ?, ?, ?, ?)",
+                (name, sha256, path, size, time.time()),
+            ).lastrowid
+            batch = []
+            try:
+                passages = split_passages(extract_text(path, mime), self.passage_words, self.overlap)
+                for ordinal, text in enumerate(passages):
+                    batch.append((text, document_id, ordinal))
+                    if len(batch) == _INSERT_BATCH:
+                        conn.executemany("INSERT INTO passages (text, document_id, ordinal) VALUES (?, ?, ?)", batch)
+                        result.passages += len(batch)
+                        batch.clear()
+                conn.executemany("INSERT INTO passages (text, document_id, ordinal) VALUES (?, ?, ?)", batch)
+                result.passages += len(batch)
+            except (ValueError, OSError, zipfile.BadZipFile, ElementTree.ParseError, KeyError) as e:
+                result.error = str(e)
+                return result
+            conn.execute("UPDATE documents SET passage_count = ? WHERE document_id = ?", (result.passages, document_id))
+            conn.commit()
+            committed = True
+        finally:
+            if stored and not committed:
+                # Nothing to search in it, or extraction failed: forget the file
+                conn.rollback()
+                os.remove(path)
+            conn.close()
+            if os.path.exists(partial):
+                os.remove(partial)
+            result.seconds = time.perf_counter() - t0
+        return result
+
+    def search(self, student_id: str, query: str, k: int = 4) -> list[Passage]:
+        """The ``k`` passages of the student's files that best match ``query`` (BM25), best first."""
+        terms = query_terms(query)
+        conn = self._connect(student_id) if terms else None
+        if conn is None:
+            return []
+        try:
+            terms = self._selective(conn, terms)
+            if not terms:
+                return []
+            rows = conn.execute(
+                "SELECT d.name, p.ordinal, p.text, p.rank FROM passages p JOIN documents d ON d.document_id = p.document_id "
+                "WHERE passages MATCH ? ORDER BY p.rank LIMIT ?",
+                (" OR ".join(f'"{term}"' for term in terms), k),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [Passage(document=name, ordinal=ordinal, text=text, score=-rank) for name, ordinal, text, rank in rows]
+
+    @staticmethod
+    def _selective(conn: sqlite3.Connection, terms: list[str]) -> list[str]:
+        """The terms of ``terms`` in the index, without those in most passages unless nothing rarer is left."""
+        placeholders = ", ".join("?" * len(terms))
+        counts = dict(conn.execute(f"SELECT term, doc FROM passage_terms WHERE term IN ({placeholders})", terms))
+        present = [term for term in terms if counts.get(term)]
+        total = conn.execute("SELECT COALESCE(SUM(passage_count), 0) FROM documents").fetchone()[0]
+        rare = [term for term in present if counts[term] <= COMMON_SHARE * total]
+        return rare or sorted(present, key=counts.get)[:2]
+
+    def documents(self, student_id: str) -> list[dict]:
+        conn = self._connect(student_id)
+        if conn is None:
+            return []
+        try:
+            rows = conn.execute("SELECT name, bytes, passage_count, created_at FROM documents ORDER BY created_at").fetchall()
+        finally:
+            conn.close()
+        return [{"name": name, "bytes": size, "passages": passages, "created_at": created_at}
+                for name, size, passages, created_at in rows]
+
+    async def context_for(self, student_id: str, message: str, k: int | None = None) -> ChatMessageContent | None:
+        """System note with the passages of the student's files relevant to ``message``, or None."""
+        if not message.strip() or not self.has_documents(student_id):
+            return None
+        passages = await asyncio.to_thread(self.search, student_id, message, k or top_k())
+        if not passages:
+            return None
+        return ChatMessageContent(
+            role=AuthorRole.SYSTEM,
+            content="Passages of the student's uploaded files relevant to their message:\n\n" + render_passages(passages),
+            metadata={CONTEXT_METADATA_KEY: True},
+        )
+
+
+def render_passages(passages: list[Passage]) -> str:
+    return "\n\n".join(f"[{p.document}, passage {p.ordinal + 1}]\n{p.text}" for p in passages)
+
+
+def forget_context(memory: ChatHistory) -> None:
+    """Drop the retrieved passages from the thread once the turn is answered."""
+    memory.messages = [m for m in memory.messages if not (m.metadata or {}).get(CONTEXT_METADATA_KEY)]
+
+
+async def ingest_elements(index: DocumentIndex, student_id: str, elements: list) -> list[IngestResult]:
+    """Index the files attached to a Chainlit message (stored by Chainlit at ``element.path``)."""
+    results = []
+    for element in elements:
+        name = getattr(element, "name", None) or "upload"
+        path = getattr(element, "path", None)
+        content = getattr(element, "content", None)
+        if path is None and content is None:
+            continue
+        if path is None:
+            source = io.BytesIO(content if isinstance(content, bytes) else str(content).encode("utf-8"))
+        else:
+            source = path
+        try:
+            result = await asyncio.to_thread(index.ingest, student_id, name, source, getattr(element, "mime", None))
+        except Exception as e:
+            logger.exception(f"Could not index the upload {name!r} of {student_id}")
+            result = IngestResult(name=name, bytes=0, error=str(e))
+        results.append(result)
+    return results
+
+
+def ingest_summary(results: list[IngestResult]) -> str:
+    """What the student is told about their uploads."""
+    lines = []
+    for r in results:
+        if r.error:
+            lines.append(f"- {r.name}: could not read it ({r.error})")
+        elif r.duplicate:
+            lines.append(f"- {r.name}: already uploaded")
+        else:
+            lines.append(f"- {r.name}: {r.bytes / 1e6:.1f} MB, {r.passages} passages indexed")
+    return "I've read your files; I'll use the relevant parts when you ask about them.\n" + "\n".join(lines)
+
+
+class DocumentPlugin:
+    """Passage search over the current student's uploaded files."""
+
+    def __init__(self, index: "DocumentIndex | None" = None):
+        self._index = index
+
+    @property
+    def index(self) -> "DocumentIndex | None":
+        return self._index or get_document_index()
+
+    @kernel_function(
+        name="search_uploaded_files",
+        description=(
+            "Search the files the student uploaded and return the most relevant passages. "
+            "Use it when the student refers to their text, notes or files."
+        ),
+    )
+    async def search_uploaded_files(
+        self,
+        query: Annotated[str, "What to look for in the student's files."],
+    ) -> str:
+        index = self.index
+        if index is None:
+            return "File uploads are disabled."
+        passages = await asyncio.to_thread(index.search, current_student.get(), query, top_k())
+        if not passages:
+            return "No passage of the student's uploaded files matches this query."
+        return render_passages(passages)
+
+
+def top_k() -> int:
+    return int(os.getenv("DOCUMENT_TOP_K", 4))
+
+
+_index: DocumentIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_document_index() -> DocumentIndex | None:
+    """Process-wide index from the ``DOCUMENT_*`` settings, None when ``DOCUMENT_INDEX=off``."""
+    global _index
+    if os.getenv("DOCUMENT_INDEX", "on").lower() == "off":
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = DocumentIndex(
+                os.getenv("UPLOAD_DIR", "uploads"), passage_words=int(os.getenv("DOCUMENT_PASSAGE_WORDS", 120))
+            )
+        return _index
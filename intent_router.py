@@ -0,0 +1,271 @@
+# author: Jairo Monassa
+"""Local fast-path intent routing in front of Main_Tutor_Agent.
+
+Obvious requests ("quiz me on X", "make me a study plan", "check my progress")
+are classified in-process and dispatched straight to the specialist agent,
+skipping the Main_Tutor_Agent round-trip with every plugin schema in context.
+Anything ambiguous returns ``None`` and goes through the LLM router as before.
+
+Routers are pluggable: ``KeywordRouter`` uses regex rules,
+``NaiveBayesRouter`` is a tiny classifier trained from logged conversations
+(JSONL lines with ``message`` and ``agent``), and ``RoutingStage`` chains them
+and keeps the statistics.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Iterable, Protocol
+
+from agent_registry import (
+    EVALUATION_CONTENT_AGENT_NAME,
+    MAIN_AGENT_NAME,
+    PLANNING_AGENT_NAME,
+    PROGRESS_MONITORING_AGENT_NAME,
+    SIMULATION_AGENT_NAME,
+)
+from token_counting import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RouteDecision:
+    agent_name: str
+    router: str
+    confidence: float = 1.0
+
+
+class Router(Protocol):
+    name: str
+
+    def route(self, message: str, available: Iterable[str]) -> RouteDecision | None:
+        ...
+
+
+# --- Keyword rules ---
+DEFAULT_RULES = {
+    SIMULATION_AGENT_NAME: [
+        r"\bquiz (me|us)\b",
+        r"\b(give|make|create|start|take|do) (me )?(a |an |another )?(practice )?(quiz|mock exam|practice exam|practice test|simulation)\b",
+        r"\b(fazer|quero|crie|gere) (um )?simulado\b",
+    ],
+    PLANNING_AGENT_NAME: [
+        r"\b(make|create|build|generate|need|want) (me )?(a |an |my )?(personalized )?(study|studying|learning) (plan|schedule)\b",
+        r"\bplan (my|our) stud(y|ies)\b",
+        r"\b(crie|monte|fazer|quero) (um )?(plano|cronograma) de estudos?\b",
+    ],
+    PROGRESS_MONITORING_AGENT_NAME: [
+        r"\b(check|show|see|track|review) (me )?(my|our) (progress|results|scores?)\b",
+        r"\bhow (am i|i am) doing on (my )?(quiz|quizzes|tests|simulations)\b",
+        r"\b(ver|mostrar|verificar) (o )?meu progresso\b",
+    ],
+    EVALUATION_CONTENT_AGENT_NAME: [
+        r"\b(evaluate|review|grade|correct|check) (my|this) (text|essay|answer|writing)\b",
+        r"\b(avalie|corrija|revise) (meu|este) (texto|redação)\b",
+    ],
+}
+
+
+class KeywordRouter:
+    """Regex rules per agent; a message matching rules of two agents is ambiguous."""
+
+    name = "keywords"
+
+    def __init__(self, rules: dict[str, list[str]] | None = None):
+        rules = DEFAULT_RULES if rules is None else rules
+        self.rules = {
+            agent: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+            for agent, patterns in rules.items()
+        }
+
+    def route(self, message: str, available: Iterable[str]) -> RouteDecision | None:
+        available = set(available)
+        matches = {
+            agent
+            for agent, patterns in self.rules.items()
+            if agent in available and any(pattern.search(message) for pattern in patterns)
+        }
+        if len(matches) != 1:
+            return None
+        return RouteDecision(agent_name=matches.pop(), router=self.name)
+
+
+# --- Tiny classifier trained from logged conversations ---
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _tokens(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class NaiveBayesRouter:
+    """Multinomial naive Bayes over words, with a "none" label for LLM fallback.
+
+    Training lines whose ``agent`` is empty or ``Main_Tutor_Agent`` teach the
+    classifier what should *not* be routed locally.
+    """
+
+    name = "classifier"
+    NONE_LABEL = "__none__"
+
+    def __init__(self, min_confidence: float = 0.9):
+        self.min_confidence = min_confidence
+        self.word_counts: dict[str, Counter] = defaultdict(Counter)
+        self.label_counts: Counter = Counter()
+        self.vocabulary: set[str] = set()
+
+    def fit(self, examples: Iterable[tuple[str, str | None]]) -> "NaiveBayesRouter":
+        for message, agent in examples:
+            label = agent or self.NONE_LABEL
+            words = _tokens(message)
+            self.word_counts[label].update(words)
+            self.label_counts[label] += 1
+            self.vocabulary.update(words)
+        return self
+
+    @classmethod
+    def from_jsonl(cls, path: str, min_confidence: float = 0.9) -> "NaiveBayesRouter":
+        """Train from logged conversations: one ``{"message": ..., "agent": ...}`` per line."""
+
+        def examples():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        agent = row.get("agent")
+                        yield row["message"], None if agent == MAIN_AGENT_NAME else agent
+
+        return cls(min_confidence).fit(examples())
+
+    def route(self, message: str, available: Iterable[str]) -> RouteDecision | None:
+        if not self.label_counts:
+            return None
+        words = _tokens(message)
+        total = sum(self.label_counts.values())
+        vocabulary_size = len(self.vocabulary) + 1
+        scores = {}
+        for label, count in self.label_counts.items():
+            label_words = self.word_counts[label]
+            label_total = sum(label_words.values())
+            score = math.log(count / total)
+            for word in words:
+                score += math.log((label_words[word] + 1) / (label_total + vocabulary_size))
+            scores[label] = score
+        # Softmax over the log-scores to get a confidence
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(score - scores[best]) for score in scores.values())
+        confidence = 1 / norm
+        if best == self.NONE_LABEL or best not in set(available) or confidence < self.min_confidence:
+            return None
+        return RouteDecision(agent_name=best, router=self.name, confidence=confidence)
+
+
+# --- Routing stage ---
+@dataclass
+class RouterStats:
+    """Route-hit rate and the estimated cost of the LLM routing that was skipped."""
+
+    messages: int = 0
+    hits: int = 0
+    by_agent: Counter = field(default_factory=Counter)
+    routing_seconds: float = 0.0
+    # Prompt tokens of one Main_Tutor_Agent call (instructions + plugin schemas)
+    router_prompt_tokens: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.messages if self.messages else 0.0
+
+    @property
+    def tokens_saved(self) -> int:
+        # A forwarded message costs the router two calls: the tool call and the final answer
+        return self.hits * 2 * self.router_prompt_tokens
+
+    def as_dict(self) -> dict:
+        return {
+            "messages": self.messages,
+            "hits": self.hits,
+            "hit_rate": round(self.hit_rate, 4),
+            "by_agent": dict(self.by_agent),
+            "local_routing_ms_per_message": round(1000 * self.routing_seconds / self.messages, 4) if self.messages else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "tokens_saved_per_message": round(self.tokens_saved / self.messages, 1) if self.messages else 0.0,
+        }
+
+
+class RoutingStage:
+    """Runs the routers in order; the first confident decision wins."""
+
+    def __init__(self, routers: list[Router]):
+        self.routers = routers
+        self.stats = RouterStats()
+        self._lock = threading.Lock()
+
+    def route(self, message: str, available: Iterable[str]) -> RouteDecision | None:
+        available = list(available)
+        start = time.perf_counter()
+        decision = None
+        for router in self.routers:
+            decision = router.route(message, available)
+            if decision is not None:
+                break
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats.messages += 1
+            self.stats.routing_seconds += elapsed
+            if decision is not None:
+                self.stats.hits += 1
+                self.stats.by_agent[decision.agent_name] += 1
+        if decision is not None:
+            logger.info("Fast-path route to %s (%s, %.2f)", decision.agent_name, decision.router, decision.confidence)
+        return decision
+
+    def select_agent(self, message: str, registry):
+        """Return the specialist for an obvious intent, otherwise the main agent."""
+        if not self.stats.router_prompt_tokens:
+            self.stats.router_prompt_tokens = router_prompt_tokens(registry.main_agent)
+        decision = self.route(message, registry.agents)
+        if decision is None:
+            return registry.main_agent
+        return registry.get(decision.agent_name)
+
+
+def router_prompt_tokens(main_agent) -> int:
+    """Estimate the prompt tokens Main_Tutor_Agent spends on routing in every call."""
+    from semantic_kernel.connectors.ai.function_calling_utils import kernel_function_metadata_to_function_call_format
+
+    schemas = [
+        kernel_function_metadata_to_function_call_format(metadata)
+        for metadata in main_agent.kernel.get_full_list_of_function_metadata()
+    ]
+    return estimate_tokens(main_agent.instructions or "") + estimate_tokens(json.dumps(schemas))
+
+
+def build_routing_stage() -> RoutingStage:
+    """Routing stage from the environment.
+
+    ``INTENT_ROUTER`` is a comma list of ``keywords`` and ``classifier`` (default
+    ``keywords``; ``off`` disables the fast path). ``INTENT_ROUTER_TRAINING``
+    points the classifier at the logged conversations JSONL.
+    """
+    names = [name.strip() for name in os.getenv("INTENT_ROUTER", "keywords").split(",") if name.strip()]
+    routers: list[Router] = []
+    for name in names:
+        if name == "keywords":
+            routers.append(KeywordRouter())
+        elif name == "classifier":
+            path = os.getenv("INTENT_ROUTER_TRAINING")
+            if path and os.path.exists(path):
+                routers.append(NaiveBayesRouter.from_jsonl(path))
+            else:
+                logger.warning("INTENT_ROUTER=classifier but INTENT_ROUTER_TRAINING is not a file; skipping it.")
+        elif name != "off":
+            logger.warning("Unknown intent router '%s'; ignoring it.", name)
+    return RoutingStage(routers)
@@ -0,0 +1,231 @@
+# author: Jairo Monassa
+"""Config-driven model backends and per-agent model tiers.
+
+``models.toml`` (or ``MODEL_CONFIG``) declares:
+
+- backends: an OpenAI-compatible endpoint (GitHub Models, DeepSeek on
+  ``models.github.ai``) or Azure OpenAI;
+- tiers: a model on a backend, with its prices and optional fallbacks (the
+  same model on other backends), and whether the model takes strict
+  ``json_schema`` response formats (``structured_output``);
+- profiles: which tier each agent uses, with a default tier. Besides the
+  agents, the ``screening`` and ``memory`` roles (wellbeing screening and
+  history summaries) can be assigned too.
+
+``ModelServices`` builds one chat completion client per backend (on the
+shared connection pool) and one service per tier in use, whose requests go
+through ``resilience`` (retries, failover to the fallbacks, hedging) and
+the process-wide ``rate_limiter``. The
+agent registry gives each agent the execution settings of its tier's
+service, so one kernel serves every tier.
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+
+from openai import AsyncOpenAI
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
+from semantic_kernel.functions import KernelArguments
+
+from rate_limiter import get_rate_limiter
+from resilience import Endpoint, ResilienceConfig, ResilientChatCompletion, ResilientCompletions
+from transport import async_openai_client, get_async_http_client
+
+try:
+    import tomllib
+except ImportError:  # Python 3.10
+    import tomli as tomllib
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.toml")
+
+SCREENING_ROLE = "screening"
+MEMORY_ROLE = "memory"
+
+
+@dataclass
+class Backend:
+    name: str
+    kind: str = "openai"  # "openai" (any OpenAI-compatible endpoint) or "azure"
+    base_url: str | None = None
+    api_key_env: str | None = None
+    endpoint_env: str | None = None
+    api_version_env: str | None = None
+    max_retries: int | None = None  # Retries of the requests to this backend (default: MODEL_RETRY_ATTEMPTS - 1)
+
+
+@dataclass
+class Tier:
+    name: str
+    backend: str
+    model: str | None = None
+    model_env: str | None = None
+    price_prompt: float = 0.0  # USD per 1M tokens
+    price_completion: float = 0.0
+    fallbacks: list[dict] = field(default_factory=list)  # [{backend, model}] tried when the backend fails
+    structured_output: bool = False  # The model supports response_format json_schema (strict)
+
+    @property
+    def model_id(self) -> str:
+        model = os.getenv(self.model_env) if self.model_env else None
+        if not (model or self.model):
+            raise ValueError(f"Tier '{self.name}' has no model (set {self.model_env or 'model'})")
+        return model or self.model
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (prompt_tokens * self.price_prompt + completion_tokens * self.price_completion) / 1e6
+
+
+@dataclass
+class Profile:
+    name: str
+    default: str
+    agents: dict[str, str] = field(default_factory=dict)
+
+    def tier_name(self, agent_or_role: str) -> str:
+        return self.agents.get(agent_or_role, self.default)
+
+
+@dataclass
+class ModelConfig:
+    backends: dict[str, Backend]
+    tiers: dict[str, Tier]
+    profiles: dict[str, Profile]
+
+    @classmethod
+    def load(cls, path: str | None = None) -> "ModelConfig":
+        """Read ``path``, ``MODEL_CONFIG`` or the ``models.toml`` next to this module."""
+        with open(path or os.getenv("MODEL_CONFIG", DEFAULT_CONFIG_PATH), "rb") as f:
+            data = tomllib.load(f)
+        config = cls(
+            backends={name: Backend(name=name, **spec) for name, spec in data.get("backends", {}).items()},
+            tiers={name: Tier(name=name, **spec) for name, spec in data.get("tiers", {}).items()},
+            profiles={name: Profile(name=name, **spec) for name, spec in data.get("profiles", {}).items()},
+        )
+        config.validate()
+        return config
+
+    def validate(self) -> None:
+        for tier in self.tiers.values():
+            for backend in [tier.backend, *(fallback["backend"] for fallback in tier.fallbacks)]:
+                if backend not in self.backends:
+                    raise ValueError(f"Tier '{tier.name}' uses unknown backend '{backend}'")
+        for profile in self.profiles.values():
+            for tier in [profile.default, *profile.agents.values()]:
+                if tier not in self.tiers:
+                    raise ValueError(f"Profile '{profile.name}' uses unknown tier '{tier}'")
+
+    def profile(self, name: str) -> Profile:
+        if name not in self.profiles:
+            raise ValueError(f"Unknown model profile '{name}' (known: {', '.join(self.profiles)})")
+        return self.profiles[name]
+
+    def tier_for(self, profile: str, agent_or_role: str) -> Tier:
+        return self.tiers[self.profile(profile).tier_name(agent_or_role)]
+
+
+def make_client(backend: Backend) -> AsyncOpenAI:
+    """AsyncOpenAI (or AsyncAzureOpenAI) client of ``backend`` on the shared connection pool.
+
+    The client does not retry: ``resilience`` retries and fails over instead.
+    """
+    if backend.kind == "azure":
+        import azure.identity  # Only needed for Azure OpenAI deployments
+        from openai import AsyncAzureOpenAI
+
+        token_provider = azure.identity.get_bearer_token_provider(
+            azure.identity.DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"
+        )
+        return AsyncAzureOpenAI(
+            api_version=os.getenv(backend.api_version_env or "AZURE_OPENAI_API_VERSION"),
+            azure_endpoint=os.getenv(backend.endpoint_env or "AZURE_OPENAI_ENDPOINT"),
+            azure_ad_token_provider=token_provider,
+            http_client=get_async_http_client(),
+            max_retries=0,
+        )
+    return async_openai_client(
+        base_url=os.getenv("MODEL_BASE_URL", backend.base_url),
+        api_key=os.getenv(backend.api_key_env) if backend.api_key_env else None,
+        max_retries=0,
+    )
+
+
+class ModelServices:
+    """The chat services of one profile: one per tier, one client per backend.
+
+    Args:
+        config: The model configuration.
+        profile: Name of the profile to use.
+        clients: Optional ready clients by backend name (benchmarks, tests).
+    """
+
+    def __init__(self, config: ModelConfig, profile: str, clients: dict[str, AsyncOpenAI] | None = None):
+        self.config = config
+        self.profile = config.profile(profile)
+        self.clients: dict[str, AsyncOpenAI] = dict(clients or {})
+        self.services: dict[str, ResilientChatCompletion] = {}
+        self.default = self.for_tier(self.profile.default)
+
+    @classmethod
+    def single(cls, client: AsyncOpenAI, model_id: str) -> "ModelServices":
+        """Every agent on one model over a ready client (the pre-tier setup)."""
+        config = ModelConfig(
+            backends={"default": Backend(name="default")},
+            tiers={"default": Tier(name="default", backend="default", model=model_id)},
+            profiles={"default": Profile(name="default", default="default")},
+        )
+        return cls(config, "default", clients={"default": client})
+
+    def client(self, backend: str) -> AsyncOpenAI:
+        client = self.clients.get(backend)
+        if client is None:
+            client = self.clients[backend] = make_client(self.config.backends[backend])
+        return client
+
+    def completions(self, tier: Tier) -> ResilientCompletions:
+        """The tier's model on its backend, then on each fallback backend."""
+        routes = [(tier.backend, tier.model_id)] + [(f["backend"], f.get("model", tier.model_id)) for f in tier.fallbacks]
+        endpoints = [Endpoint(name=f"{backend}/{model}", client=self.client(backend), model=model)
+                     for backend, model in routes]
+        max_retries = self.config.backends[tier.backend].max_retries
+        overrides = {} if max_retries is None else {"max_attempts": max_retries + 1}
+        return ResilientCompletions(endpoints, ResilienceConfig.from_env(**overrides), get_rate_limiter())
+
+    def for_tier(self, tier_name: str) -> ResilientChatCompletion:
+        service = self.services.get(tier_name)
+        if service is None:
+            tier = self.config.tiers[tier_name]
+            service = self.services[tier_name] = ResilientChatCompletion(
+                service_id=tier_name, ai_model_id=tier.model_id, async_client=self.client(tier.backend),
+                completions=self.completions(tier),
+            )
+        return service
+
+    async def connect(self, connections: int = 1) -> None:
+        """Open ``connections`` pooled connections to the backend of every tier in use.
+
+        Any answer will do (``GET /models``): the point is that the TCP/TLS
+        handshakes and, for Azure, the token are done before the first student.
+        The requests run concurrently so each one opens its own connection.
+        """
+        backends = sorted({self.config.tiers[name].backend for name in self.services}) * connections
+        results = await asyncio.gather(
+            *(self.client(backend).with_options(timeout=10).models.list() for backend in backends),
+            return_exceptions=True,
+        )
+        for backend, result in zip(backends, results):
+            if isinstance(result, Exception):
+                logger.debug("Pre-warm request to backend %s failed: %r", backend, result)
+
+    def tier(self, agent_or_role: str) -> Tier:
+        return self.config.tiers[self.profile.tier_name(agent_or_role)]
+
+    def for_agent(self, agent_or_role: str) -> ResilientChatCompletion:
+        return self.for_tier(self.profile.tier_name(agent_or_role))
+
+    def arguments_for(self, agent_name: str) -> KernelArguments:
+        """Agent arguments that select the agent's tier service on the shared kernel."""
+        return KernelArguments(settings=OpenAIChatPromptExecutionSettings(service_id=self.profile.tier_name(agent_name)))
@@ -0,0 +1,286 @@
+# author: Jairo Monassa
+"""Study plans for a whole roster, without the interactive planning loop.
+
+``agent_planning.main()`` gathers the student's availability and deadline in a
+conversation, one student at a time. For a cohort the roster already has those
+answers: each row (CSV or JSONL) becomes the first user message, the
+information-gathering step is skipped and the model is made to call
+``save_study_plan_to_json`` right away, with the same tool schema, validation
+and block repairs as the interactive session (``PlanningSession``).
+
+Roster columns: ``student_id``, ``subject``, ``weekly_hours`` and ``deadline``
+(required), ``level`` and ``notes`` (optional).
+
+Plans are generated ``concurrency`` at a time (the requests also go through
+the shared rate limiter of ``agent_planning.create_client``) and each one is
+appended to the output JSONL as soon as it is done, with its tool arguments
+(``{"study_plan": {...}}``), token usage and cost. The output is the
+checkpoint: a rerun skips the students that already have a plan in it and
+retries the failed ones, so a crash or a quota outage only costs the plans in
+flight.
+
+    python plan_batch.py roster.csv --out plans.jsonl --concurrency 8
+
+Settings: those of ``agent_planning`` (``GITHUB_TOKEN``, ``GITHUB_MODEL``);
+``--save`` also stores every plan in the plan repository
+(``PLAN_STORE_DIR``, ``PLAN_FORMAT``, ``PLAN_FSYNC``).
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+
+from openai import AsyncOpenAI
+
+import agent_planning
+from model_backends import ModelConfig, Tier
+from planning_session import PlanningSession, TurnDone
+from study_plan_stream import StudyPlanParser
+
+logger = logging.getLogger(__name__)
+
+TOOL_NAME = "save_study_plan_to_json"
+REQUIRED_COLUMNS = ("student_id", "subject", "weekly_hours", "deadline")
+
+
+@dataclass
+class RosterEntry:
+    student_id: str
+    subject: str
+    weekly_hours: float
+    deadline: str
+    level: str = ""
+    notes: str = ""
+
+    def message(self) -> str:
+        """The answers of the information-gathering step, as the student's first message."""
+        hours = f"{self.weekly_hours:g}"
+        lines = [
+            f"Gostaria de um plano de estudos para {self.subject}.",
+            f"Disponibilidade: {hours} horas por semana.",
+            f"Prazo (exame ou certificado): {self.deadline}.",
+        ]
+        if self.level:
+            lines.append(f"Meu nível atual: {self.level}.")
+        if self.notes:
+            lines.append(f"Observações: {self.notes}.")
+        lines.append(
+            "Essas são todas as informações: não faça perguntas, gere o plano agora e salve-o com a "
+            f"ferramenta '{TOOL_NAME}'."
+        )
+        return "\n".join(lines)
+
+
+def _entry(row: dict, where: str) -> RosterEntry:
+    missing = [column for column in REQUIRED_COLUMNS if not str(row.get(column) or "").strip()]
+    if missing:
+        raise ValueError(f"{where}: missing {', '.join(missing)}")
+    try:
+        hours = float(str(row["weekly_hours"]).replace(",", "."))
+    except ValueError:
+        raise ValueError(f"{where}: weekly_hours is not a number: {row['weekly_hours']!r}") from None
+    return RosterEntry(
+        student_id=str(row["student_id"]).strip(),
+        subject=str(row["subject"]).strip(),
+        weekly_hours=hours,
+        deadline=str(row["deadline"]).strip(),
+        level=str(row.get("level") or "").strip(),
+        notes=str(row.get("notes") or "").strip(),
+    )
+
+
+def load_roster(path: str) -> list[RosterEntry]:
+    """Read a ``.csv`` (header row) or ``.jsonl`` roster; a repeated student keeps its first row."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            rows = [(json.loads(line), f"{path}:{number}") for number, line in enumerate(f, 1) if line.strip()]
+        else:
+            rows = [(row, f"{path}:{number}") for number, row in enumerate(csv.DictReader(f), 2)]
+    entries: dict[str, RosterEntry] = {}
+    for row, where in rows:
+        entry = _entry(row, where)
+        if entry.student_id in entries:
+            logger.warning("%s: student %s is already in the roster, row skipped", where, entry.student_id)
+            continue
+        entries[entry.student_id] = entry
+    return list(entries.values())
+
+
+def load_checkpoint(path: str) -> set[str]:
+    """Students that already have a plan in the output ``path``."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # The line being written when the previous run died
+                continue
+            if record.get("status") == "ok":
+                done.add(record["student_id"])
+    return done
+
+
+@dataclass
+class BatchStats:
+    students: int = 0
+    skipped: int = 0  # already in the checkpoint
+    planned: int = 0
+    failed: int = 0
+    completions: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    seconds: float = 0.0
+
+    @property
+    def plans_per_minute(self) -> float:
+        return self.planned / self.seconds * 60 if self.seconds else 0.0
+
+    @property
+    def tokens_per_plan(self) -> float:
+        return (self.prompt_tokens + self.completion_tokens) / self.planned if self.planned else 0.0
+
+    @property
+    def cost_per_plan(self) -> float:
+        return self.cost / self.planned if self.planned else 0.0
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "plans_per_minute": self.plans_per_minute, "tokens_per_plan": self.tokens_per_plan,
+                "cost_per_plan": self.cost_per_plan}
+
+
+class PlanBatch:
+    """Generates the plans of a roster into a JSONL file.
+
+    Args:
+        client: AsyncOpenAI client (``agent_planning.create_client()``).
+        model: Model name.
+        out_path: Output JSONL, also the checkpoint read on resume.
+        concurrency: Plans generated at once.
+        tier: Prices of the model, for the cost (None: no cost).
+        save: Also store each plan with ``save_study_plan_to_json`` in the plan repository.
+    """
+
+    def __init__(self, client: AsyncOpenAI, model: str, out_path: str, concurrency: int = 8,
+                 tier: Tier | None = None, save: bool = False):
+        self.client = client
+        self.model = model
+        self.out_path = out_path
+        self.concurrency = concurrency
+        self.tier = tier
+        self.save = save
+        self.stats = BatchStats()
+        self._out = None
+
+    def _session(self, entry: RosterEntry, plans: list[dict]) -> PlanningSession:
+        def save_plan(arguments: dict) -> str:
+            plans.append(arguments)
+            if self.save:
+                return agent_planning.save_study_plan_to_json(arguments, student_id=entry.student_id)
+            return f"Plano de estudos de {entry.student_id} gerado"
+
+        messages = agent_planning.build_messages(entry.subject)
+        messages[-1] = {"role": "user", "content": entry.message()}
+        return PlanningSession(
+            client=self.client,
+            model=self.model,
+            messages=messages,
+            tools=agent_planning.tools,
+            functions={TOOL_NAME: save_plan},
+            confirmations={TOOL_NAME: agent_planning.save_confirmation},
+            argument_parsers={TOOL_NAME: StudyPlanParser},
+            tool_choice={"type": "function", "function": {"name": TOOL_NAME}},
+            include_usage=True,
+        )
+
+    async def _plan(self, entry: RosterEntry, semaphore: asyncio.Semaphore) -> None:
+        plans: list[dict] = []
+        record = {"student_id": entry.student_id, "subject": entry.subject}
+        async with semaphore:
+            session = self._session(entry, plans)
+            t0 = time.perf_counter()
+            try:
+                done = None
+                async for event in session.send():
+                    if isinstance(event, TurnDone):
+                        done = event
+                if done is None or not done.plan_saved or not plans:
+                    raise ValueError(f"no plan saved: {(done.text if done else '')[:200] or 'empty answer'}")
+                arguments = plans[-1]
+                if set(arguments) != {"study_plan"}:
+                    arguments = {"study_plan": arguments}
+                record.update(status="ok", **arguments)
+                self.stats.planned += 1
+            except Exception as e:
+                logger.warning("Plan of %s failed: %s", entry.student_id, e)
+                record.update(status="error", error=f"{type(e).__name__}: {e}")
+                self.stats.failed += 1
+            cost = self.tier.cost(session.prompt_tokens, session.completion_tokens) if self.tier else None
+            record.update(completions=session.completions, prompt_tokens=session.prompt_tokens,
+                          completion_tokens=session.completion_tokens, cost=cost,
+                          seconds=round(time.perf_counter() - t0, 3))
+        self.stats.completions += session.completions
+        self.stats.prompt_tokens += session.prompt_tokens
+        self.stats.completion_tokens += session.completion_tokens
+        self.stats.cost += cost or 0.0
+        self._write(record)
+
+    def _write(self, record: dict) -> None:
+        self._out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._out.flush()
+
+    async def run(self, roster: list[RosterEntry]) -> BatchStats:
+        """Generate the plans of ``roster`` that are not in the checkpoint yet."""
+        done = load_checkpoint(self.out_path)
+        pending = [entry for entry in roster if entry.student_id not in done]
+        self.stats.students += len(roster)
+        self.stats.skipped += len(roster) - len(pending)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        t0 = time.perf_counter()
+        os.makedirs(os.path.dirname(self.out_path) or ".", exist_ok=True)
+        with open(self.out_path, "a+", encoding="utf-8") as self._out:
+            # A run that died mid-line left no newline after its last record
+            if self._out.tell():
+                self._out.seek(self._out.tell() - 1)
+                if self._out.read(1) != "\n":
+                    self._out.write("\n")
+            try:
+                await asyncio.gather(*(self._plan(entry, semaphore) for entry in pending))
+            finally:
+                self.stats.seconds += time.perf_counter() - t0
+        return self.stats
+
+
+def model_tier(model: str) -> Tier | None:
+    """The tier of ``models.toml`` serving ``model``, for its prices."""
+    return next((tier for tier in ModelConfig.load().tiers.values() if tier.model == model), None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("roster", help="CSV or JSONL with student_id, subject, weekly_hours, deadline")
+    parser.add_argument("--out", default="study_plans/batch.jsonl")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--save", action="store_true", help="also store the plans in the plan repository")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    roster = load_roster(args.roster)
+    batch = PlanBatch(agent_planning.create_client(), agent_planning.MODEL_NAME, args.out,
+                      concurrency=args.concurrency, tier=model_tier(agent_planning.MODEL_NAME), save=args.save)
+    stats = asyncio.run(batch.run(roster))
+    print(f"{stats.planned} plans ({stats.failed} failed, {stats.skipped} already in {args.out}) "
+          f"in {stats.seconds:.1f}s: {stats.plans_per_minute:.1f} plans/min, "
+          f"{stats.tokens_per_plan:.0f} tokens/plan, ${stats.cost_per_plan:.4f}/plan")
+
+
+if __name__ == "__main__":
+    main()
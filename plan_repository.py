@@ -0,0 +1,167 @@
+# author: Jairo Monassa
+"""Versioned, per-student storage of study plans.
+
+``save_study_plan_to_json`` used to overwrite ``study_plans/planning2.json``
+for everybody, writing straight to the final path. ``PlanRepository`` keeps
+every version of every student's plan:
+
+    study_plans/<hash prefix>/<student>-<hash>/v000001.json
+
+- Writes are atomic: the plan goes to a temp file in the same directory
+  (optionally fsynced), which is then renamed over its final name, so a crash
+  never leaves a truncated plan.
+- A SQLite index (WAL) maps (student, version) to the file, so the latest plan
+  loads with one indexed query instead of a directory scan. Version numbers
+  are allocated inside an ``IMMEDIATE`` transaction, so concurrent writers (also
+  from other processes) never get the same one.
+- ``format`` picks the encoding: "pretty" (indent=2, as before), "compact"
+  (no whitespace) or "gzip" (compact and gzipped).
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+FORMATS = {"pretty": ".json", "compact": ".json", "gzip": ".json.gz"}
+
+
+@dataclass
+class PlanRecord:
+    student_id: str
+    version: int
+    path: str
+    created_at: float
+    size: int
+
+
+class PlanRepository:
+    def __init__(self, root: str = "study_plans", format: str = "pretty", fsync: bool = True):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown plan format: {format} (use one of {', '.join(FORMATS)})")
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.format = format
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False,
+                                     isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS plans (student_id TEXT NOT NULL, version INTEGER NOT NULL, "
+            "path TEXT NOT NULL, created_at REAL NOT NULL, size INTEGER NOT NULL, "
+            "PRIMARY KEY (student_id, version))"
+        )
+
+    def student_dir(self, student_id: str) -> str:
+        """Directory of one student's plans, safe for any id and spread over 256 buckets."""
+        digest = hashlib.sha1(student_id.encode("utf-8")).hexdigest()
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", student_id)[:48]
+        return os.path.join(self.root, digest[:2], f"{slug}-{digest[:10]}")
+
+    def encode(self, plan: dict) -> bytes:
+        if self.format == "pretty":
+            return json.dumps(plan, indent=2, ensure_ascii=False).encode("utf-8")
+        data = json.dumps(plan, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        return gzip.compress(data, compresslevel=5) if self.format == "gzip" else data
+
+    @staticmethod
+    def decode(path: str, data: bytes) -> dict:
+        if path.endswith(".gz"):
+            data = gzip.decompress(data)
+        return json.loads(data)
+
+    def save(self, student_id: str, plan: dict) -> PlanRecord:
+        """Store a new version of the student's plan (blocking; call through a thread from async code)."""
+        folder = self.student_dir(student_id)
+        os.makedirs(folder, exist_ok=True)
+        data = self.encode(plan)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=FORMATS[self.format])
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = self._conn.execute(
+                        "SELECT COALESCE(MAX(version), 0) FROM plans WHERE student_id = ?", (student_id,)
+                    ).fetchone()
+                    record = PlanRecord(student_id, row[0] + 1, "", time.time(), len(data))
+                    record.path = os.path.join(folder, f"v{record.version:06d}{FORMATS[self.format]}")
+                    os.replace(tmp_path, record.path)
+                    self._conn.execute(
+                        "INSERT INTO plans (student_id, version, path, created_at, size) VALUES (?, ?, ?, ?, ?)",
+                        (student_id, record.version, os.path.relpath(record.path, self.root),
+                         record.created_at, record.size),
+                    )
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return record
+
+    def record(self, student_id: str, version: int | None = None) -> PlanRecord | None:
+        """Index entry of one version (the latest when ``version`` is None)."""
+        query = "SELECT student_id, version, path, created_at, size FROM plans WHERE student_id = ?"
+        params: tuple = (student_id,)
+        if version is None:
+            query += " ORDER BY version DESC LIMIT 1"
+        else:
+            query += " AND version = ?"
+            params += (version,)
+        with self._lock:
+            row = self._conn.execute(query, params).fetchone()
+        if row is None:
+            return None
+        return PlanRecord(row[0], row[1], os.path.join(self.root, row[2]), row[3], row[4])
+
+    def load(self, student_id: str, version: int | None = None) -> dict | None:
+        """The student's plan (latest version by default), or None if there is none."""
+        record = self.record(student_id, version)
+        if record is None:
+            return None
+        with open(record.path, "rb") as f:
+            return self.decode(record.path, f.read())
+
+    def versions(self, student_id: str) -> list[PlanRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT student_id, version, path, created_at, size FROM plans WHERE student_id = ? ORDER BY version",
+                (student_id,),
+            ).fetchall()
+        return [PlanRecord(r[0], r[1], os.path.join(self.root, r[2]), r[3], r[4]) for r in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_repository: PlanRepository | None = None
+_repository_lock = threading.Lock()
+
+
+def get_repository() -> PlanRepository:
+    """Process-wide repository from ``PLAN_STORE_DIR``, ``PLAN_FORMAT`` and ``PLAN_FSYNC``."""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = PlanRepository(
+                root=os.getenv("PLAN_STORE_DIR", "study_plans"),
+                format=os.getenv("PLAN_FORMAT", "pretty"),
+                fsync=os.getenv("PLAN_FSYNC", "1") != "0",
+            )
+        return _repository
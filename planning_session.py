@@ -0,0 +1,387 @@
+# author: Jairo Monassa
+"""Asyncio study-planning session engine with streaming and inline tool calls.
+
+``PlanningSession.send()`` streams one assistant turn as events: text deltas as
+they arrive, tool calls assembled from the same stream and executed inline,
+and a locally templated confirmation after a successful save, so there is no
+second completion round-trip just to say "saved".
+
+Tools with an argument parser (the study plan) are parsed while they stream
+(see ``study_plan_stream``): finished weeks are yielded for progressive
+rendering, an invalid day block is re-requested on its own as soon as it
+closes, and broken JSON stops the generation and asks only for the rest of
+the plan.
+
+The engine knows nothing about the UI, so the CLI (``agent_planning.py``)
+prints the events and a Chainlit handler can push them to a ``cl.Message``::
+
+    session = PlanningSession.for_subject(client, model, subject)
+    async for event in session.send(message.content):
+        if isinstance(event, TextDelta):
+            await stream.push(event.text)
+"""
+
+import asyncio
+import functools
+import inspect
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable
+
+from openai import AsyncOpenAI
+
+from structured_plan import CREATE_TOOL_NAME, structured_mode
+from study_plan_stream import BlockError, PlanBlock, PlanSyntaxError, StudyPlanParser
+
+logger = logging.getLogger(__name__)
+
+REPAIR_PROMPT = (
+    "The block {path} of the study plan you are generating is invalid: {reason}. "
+    "Reply only with a JSON object {shape} containing the corrected block, with the keys "
+    "topic/subtopics/goal (or topico/subtopicos/meta, as in the rest of the plan)."
+)
+CONTINUE_PROMPT = (
+    "The study plan JSON you were generating broke ({reason}). {position} "
+    "Reply only with a JSON object containing the rest of the plan, starting right after that "
+    "point, in the same week -> day block -> topic/subtopics/goal format."
+)
+
+
+# --- Events ---
+@dataclass
+class TextDelta:
+    text: str
+
+
+@dataclass
+class ToolCallStarted:
+    name: str
+
+
+@dataclass
+class ToolResult:
+    name: str
+    content: str
+    arguments: dict | None = None
+
+
+@dataclass
+class Confirmation:
+    """Assistant message produced locally instead of by another model call."""
+
+    text: str
+
+
+@dataclass
+class TurnDone:
+    text: str
+    plan_saved: bool = False
+
+
+@dataclass
+class _ToolCallBuffer:
+    id: str = ""
+    name: str = ""
+    arguments: list[str] = field(default_factory=list)
+    parser: StudyPlanParser | None = None
+    broken: PlanSyntaxError | None = None
+    repairs: list[asyncio.Task] = field(default_factory=list)
+
+
+class PlanningSession:
+    """One planning conversation: message history plus the tools the model may call.
+
+    Args:
+        client: AsyncOpenAI client (use ``transport.async_openai_client``).
+        model: Model name.
+        messages: Initial messages (system prompt and first user message).
+        tools: OpenAI tool schemas.
+        functions: Tool name -> Python function (sync functions run in a worker thread).
+        confirmations: Tool name -> function that turns the tool result into the
+            final assistant message, or returns None to let the model answer.
+        argument_parsers: Tool name -> parser factory for arguments validated while
+            they stream.
+        max_tool_rounds: Safety limit of tool round-trips within one turn.
+        tool_choice: ``tool_choice`` of the turns ("auto", or a tool the model must call).
+        include_usage: Ask for the token usage of the streams; the session sums it
+            in ``prompt_tokens``/``completion_tokens`` (``completions`` counts the calls).
+    """
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        model: str,
+        messages: list[dict],
+        tools: list[dict],
+        functions: dict[str, Callable],
+        confirmations: dict[str, Callable[[str], str | None]] | None = None,
+        argument_parsers: dict[str, Callable[[], StudyPlanParser]] | None = None,
+        max_tool_rounds: int = 3,
+        tool_choice: str | dict = "auto",
+        include_usage: bool = False,
+    ):
+        self.client = client
+        self.model = model
+        self.messages = messages
+        self.tools = tools
+        self.functions = functions
+        self.confirmations = confirmations or {}
+        self.argument_parsers = argument_parsers or {}
+        self.max_tool_rounds = max_tool_rounds
+        self.tool_choice = tool_choice
+        self.include_usage = include_usage
+        self.plan_saved = False
+        self.completions = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @classmethod
+    def for_subject(cls, client: AsyncOpenAI, model: str, subject: str,
+                    structured: bool | None = None) -> "PlanningSession":
+        """Session with the study-planning prompt and the tools of ``agent_planning``.
+
+        ``structured`` (default ``PLAN_GENERATION``): the model only gathers the
+        information and calls ``create_study_plan``, which generates the plan
+        with one structured-output completion (see ``structured_plan``);
+        otherwise the model writes the plan in the ``save_study_plan_to_json`` call.
+        """
+        import agent_planning
+
+        if structured is None:
+            structured = structured_mode()
+        if structured:
+            session = cls(
+                client=client,
+                model=model,
+                messages=agent_planning.build_messages(subject, structured=True),
+                tools=agent_planning.structured_tools,
+                functions={},
+                confirmations={CREATE_TOOL_NAME: agent_planning.structured_confirmation},
+            )
+            # The plan is generated from the conversation the session keeps growing
+            session.functions[CREATE_TOOL_NAME] = functools.partial(
+                agent_planning.create_study_plan, client, model, session.messages
+            )
+            return session
+        return cls(
+            client=client,
+            model=model,
+            messages=agent_planning.build_messages(subject),
+            tools=agent_planning.tools,
+            functions={"save_study_plan_to_json": agent_planning.save_study_plan_to_json},
+            confirmations={"save_study_plan_to_json": agent_planning.save_confirmation},
+            argument_parsers={"save_study_plan_to_json": StudyPlanParser},
+        )
+
+    async def send(self, user_input: str | None = None) -> AsyncIterator:
+        """Stream the assistant's answer to ``user_input`` (None: answer the current history)."""
+        if user_input:
+            self.messages.append({"role": "user", "content": user_input})
+
+        for _ in range(self.max_tool_rounds + 1):
+            text_parts: list[str] = []
+            calls: dict[int, _ToolCallBuffer] = {}
+
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=self.messages,
+                tools=self.tools,
+                tool_choice=self.tool_choice,
+                stream=True,
+                **self._stream_options(),
+            )
+            self.completions += 1
+            async for chunk in stream:
+                self._add_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    text_parts.append(delta.content)
+                    yield TextDelta(delta.content)
+                for call in delta.tool_calls or []:
+                    buffer = calls.get(call.index)
+                    if buffer is None:
+                        buffer = calls[call.index] = _ToolCallBuffer()
+                    if call.id:
+                        buffer.id = call.id
+                    if call.function and call.function.name:
+                        buffer.name = call.function.name
+                        factory = self.argument_parsers.get(buffer.name)
+                        buffer.parser = factory() if factory else None
+                        yield ToolCallStarted(buffer.name)
+                    if call.function and call.function.arguments:
+                        buffer.arguments.append(call.function.arguments)
+                        if buffer.parser is not None and buffer.broken is None:
+                            try:
+                                for event in buffer.parser.feed(call.function.arguments):
+                                    if isinstance(event, BlockError):
+                                        # Fix the block while the rest of the plan keeps streaming
+                                        buffer.repairs.append(asyncio.create_task(self._repair_block(event)))
+                                    yield event
+                            except PlanSyntaxError as e:
+                                buffer.broken = e
+                if any(c.broken for c in calls.values()):
+                    # Stop paying for a generation that can no longer be parsed
+                    await stream.close()
+                    break
+
+            text = "".join(text_parts)
+            if not calls:
+                self.messages.append({"role": "assistant", "content": text})
+                yield TurnDone(text=text, plan_saved=self.plan_saved)
+                return
+
+            ordered = [calls[index] for index in sorted(calls)]
+            parsed: dict[int, dict | str] = {}
+            for index, buffer in zip(sorted(calls), ordered):
+                if buffer.parser is not None:
+                    async for event in self._finish_parser(buffer):
+                        yield event
+                    parsed[index] = self._parsed_arguments(buffer)
+                    if isinstance(parsed[index], dict):
+                        buffer.arguments = [json.dumps(parsed[index], ensure_ascii=False)]
+
+            self.messages.append({
+                "role": "assistant",
+                "content": text or None,
+                "tool_calls": [
+                    {"id": c.id, "type": "function", "function": {"name": c.name, "arguments": "".join(c.arguments)}}
+                    for c in ordered
+                ],
+            })
+
+            confirmation = None
+            for index, buffer in zip(sorted(calls), ordered):
+                if isinstance(parsed.get(index), str):
+                    result = ToolResult(buffer.name, parsed[index])
+                else:
+                    result = await self._run_tool(buffer)
+                yield result
+                self.messages.append(
+                    {"tool_call_id": buffer.id, "role": "tool", "name": buffer.name, "content": result.content}
+                )
+                make_confirmation = self.confirmations.get(buffer.name)
+                if make_confirmation is not None:
+                    local = make_confirmation(result.content)
+                    if local is not None:
+                        confirmation = local
+                        self.plan_saved = True
+
+            if confirmation is not None:
+                # Successful save: answer locally instead of paying another completion
+                self.messages.append({"role": "assistant", "content": confirmation})
+                yield Confirmation(confirmation)
+                yield TurnDone(text=confirmation, plan_saved=True)
+                return
+            # A tool failed or has no local confirmation: let the model react to the result
+
+        yield TurnDone(text="", plan_saved=self.plan_saved)
+
+    def _stream_options(self) -> dict:
+        return {"stream_options": {"include_usage": True}} if self.include_usage else {}
+
+    def _add_usage(self, usage) -> None:
+        if usage is not None:
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    async def _finish_parser(self, buffer: _ToolCallBuffer) -> AsyncIterator:
+        """Apply the block repairs and, after broken JSON, stream the rest of the plan."""
+        parser = buffer.parser
+        if buffer.broken is None and not parser.done:
+            buffer.broken = PlanSyntaxError("arguments ended before the plan was complete", parser.last_block)
+        if buffer.broken is not None:
+            error = buffer.broken
+            if error.after:
+                position = f"Everything up to and including {error.after[0]}/{error.after[1]} is valid."
+            else:
+                position = "Nothing of the plan was valid yet."
+            continuation = StudyPlanParser()
+            try:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=self.messages + [
+                        {"role": "user", "content": CONTINUE_PROMPT.format(reason=error.reason, position=position)}
+                    ],
+                    response_format={"type": "json_object"},
+                    stream=True,
+                    **self._stream_options(),
+                )
+                self.completions += 1
+                async for chunk in stream:
+                    self._add_usage(chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        for event in continuation.feed(chunk.choices[0].delta.content):
+                            if isinstance(event, BlockError):
+                                buffer.repairs.append(asyncio.create_task(self._repair_block(event)))
+                            yield event
+                continuation.close(continuation=True)
+                parser.merge(continuation)
+                parser.errors.extend(continuation.errors)
+                buffer.broken = None
+            except Exception as e:
+                logger.warning(f"Could not continue the broken study plan: {e}")
+        for repair in buffer.repairs:
+            fixed = await repair
+            if fixed is not None:
+                parser.merge(fixed)
+                for week, days in fixed.plan.items():
+                    for day, block in days.items():
+                        yield PlanBlock(week, day, block)
+
+    def _parsed_arguments(self, buffer: _ToolCallBuffer) -> dict | str:
+        """The validated arguments, or the error text sent back to the model."""
+        parser = buffer.parser
+        if buffer.broken is not None:
+            return f"Erro: Argumentos inválidos (não JSON) para {buffer.name}: {buffer.broken.reason}."
+        parser.require_plan()
+        if parser.errors:
+            details = "; ".join(f"{e.week}/{e.day or '*'}: {e.reason}" for e in parser.errors)
+            return f"Erro: Plano de estudos inválido ({details})."
+        return parser.arguments()
+
+    async def _repair_block(self, error: BlockError) -> StudyPlanParser | None:
+        """Ask for one invalid day block (or week) again; None if the answer is still invalid."""
+        if error.day is None:
+            path, shape = error.week, f'{{"{error.week}": {{"<day>": {{...}}, ...}}}}'
+        else:
+            path, shape = f"{error.week}/{error.day}", f'{{"{error.week}": {{"{error.day}": {{...}}}}}}'
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=self.messages + [
+                    {"role": "user", "content": REPAIR_PROMPT.format(path=path, reason=error.reason, shape=shape)}
+                ],
+                response_format={"type": "json_object"},
+            )
+            self.completions += 1
+            self._add_usage(response.usage)
+            fixed = StudyPlanParser()
+            fixed.feed(response.choices[0].message.content or "")
+            fixed.close()
+        except Exception as e:
+            logger.warning(f"Could not repair study plan block {path}: {e}")
+            return None
+        if fixed.errors or error.week not in fixed.plan or (error.day and error.day not in fixed.plan[error.week]):
+            return None
+        return fixed
+
+    async def _run_tool(self, buffer: _ToolCallBuffer) -> ToolResult:
+        function = self.functions.get(buffer.name)
+        if function is None:
+            logger.warning(f"Model tried to call unknown function: {buffer.name}")
+            return ToolResult(buffer.name, f"Erro: Função '{buffer.name}' não encontrada.")
+        try:
+            arguments = json.loads("".join(buffer.arguments) or "{}")
+        except json.JSONDecodeError:
+            return ToolResult(buffer.name, f"Erro: Argumentos inválidos (não JSON) para {buffer.name}.")
+        try:
+            if inspect.iscoroutinefunction(function):
+                content = await function(arguments)
+            else:
+                content = await asyncio.to_thread(function, arguments)
+        except Exception as e:
+            return ToolResult(buffer.name, f"Erro ao executar a função {buffer.name}: {e}", arguments)
+        return ToolResult(buffer.name, str(content), arguments)
@@ -0,0 +1,441 @@
+# author: Jairo Monassa
+"""Quizzes generated ahead of time for the topics of the saved study plans.
+
+Quiz_Simulation_Agent wrote five fresh questions every time a student asked
+for a quiz, so the student waited for a whole generation right when they
+wanted to start. The topics are known long before that: they are the
+``topic``/``subtopics`` of the student's study plan. ``QuizBank`` keeps a few
+ready quizzes per topic:
+
+- ``prefetch_student`` reads the student's latest plan (in the background, once
+  per plan version) and queues its topics; background workers generate the
+  quizzes with one completion each (answer keys included, validated by
+  ``quiz_engine.parse_questions``): a strict ``json_schema`` response format
+  on tiers with ``structured_output``, otherwise a ``json_object`` answer in
+  the shape the prompt spells out, checked locally the same way.
+- Topics are keyed by their normalized text, so students whose plans share a
+  topic share its bank; a topic that is already banked or queued is not
+  generated again.
+- Each banked quiz is served once. Taking one queues a refill of its topic;
+  quizzes older than ``ttl`` are dropped, and beyond ``max_topics`` the least
+  recently used topics are evicted.
+- ``quiz_for`` finds the topic of the student's plan named in a quiz request
+  and returns a banked quiz, or None, and the request goes to
+  Quiz_Simulation_Agent live as before. A cold plan topic is queued for the
+  next time; a request on anything else queues nothing, so chat fragments
+  never become bank topics.
+  ``serve_quiz`` registers the quiz like ``create_quiz`` does and shows it
+  without the answers, with no model call.
+
+The workers run in a context of their own (not the turn that started them):
+their generations take their share of the rate-limited quota as the session
+"quiz-bank", queue behind the students' own requests fairly, and are traced
+and reported to nobody's chat.
+
+Settings: ``QUIZ_BANK`` ("on"/"off"), ``QUIZ_BANK_DEPTH`` (ready quizzes per
+topic, default 2), ``QUIZ_BANK_TTL`` (seconds, default 86400),
+``QUIZ_BANK_MAX_TOPICS`` (default 500) and ``QUIZ_BANK_WORKERS`` (concurrent
+generations, default 2).
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable
+
+from semantic_kernel.contents import ChatHistory, ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+
+from quiz_engine import (
+    CHOICE_LETTERS,
+    Quiz,
+    QuizQuestion,
+    get_quiz_store,
+    is_answer_sheet,
+    parse_questions,
+    pin_quiz,
+    plan_week_for_topic,
+)
+from rate_limiter import current_session, queue_listener
+
+logger = logging.getLogger(__name__)
+
+BANK_SESSION = "quiz-bank"
+
+QUIZ_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "questions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "choices": {"type": "array", "items": {"type": "string"}},
+                    "answer": {
+                        "type": "string",
+                        "description": "Letter of the right choice (A, B, ...); empty for open-ended questions.",
+                    },
+                },
+                "required": ["question", "choices", "answer"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["questions"],
+    "additionalProperties": False,
+}
+
+RESPONSE_FORMAT = {"type": "json_schema", "json_schema": {"name": "quiz", "strict": True, "schema": QUIZ_SCHEMA}}
+
+QUIZ_PROMPT = (
+    "You write practice quizzes for students. Create {questions} questions on the topic below: "
+    "{multiple_choice} multiple-choice questions with 4 choices each and the letter of the right one in 'answer', "
+    "then {open_ended} open-ended questions with no choices and an empty 'answer'. "
+    "Write them in the language of the topic."
+)
+# Tiers without strict json_schema: JSON mode, with the schema spelled out in the prompt
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+QUIZ_JSON_SHAPE = (
+    ' Reply only with JSON: {"questions": [{"question": "...", "choices": ["...", "..."], '
+    '"answer": "<letter of the right choice, or empty>"}]}.'
+)
+
+def topic_key(topic: str) -> str:
+    return " ".join(topic.casefold().split())
+
+
+def plan_topics(plan: dict | None) -> list[tuple[str, list[str]]]:
+    """(topic, subtopics) of every day block of ``plan``, in plan order, each topic once."""
+    topics: dict[str, tuple[str, list[str]]] = {}
+    for days in (plan or {}).values():
+        if not isinstance(days, dict):
+            continue
+        for block in days.values():
+            if not isinstance(block, dict):
+                continue
+            topic = block.get("topic") or block.get("topico")
+            if not isinstance(topic, str) or not topic.strip():
+                continue
+            subtopics = [s for s in block.get("subtopics") or block.get("subtopicos") or [] if isinstance(s, str)]
+            known = topics.setdefault(topic_key(topic), (topic.strip(), []))
+            known[1].extend(s for s in subtopics if s not in known[1])
+    return list(topics.values())
+
+
+@dataclass
+class BankedQuiz:
+    topic: str
+    questions: list[QuizQuestion]
+    created_at: float
+
+
+@dataclass
+class TopicBank:
+    topic: str
+    subtopics: list[str] = field(default_factory=list)
+    quizzes: deque = field(default_factory=deque)
+
+
+@dataclass
+class QuizBankStats:
+    hits: int = 0
+    cold: int = 0  # quiz requests on a topic with no ready quiz
+    generated: int = 0
+    failed: int = 0
+    deduplicated: int = 0  # prefetches of a topic already banked or queued
+    expired: int = 0
+    evicted: int = 0  # topics dropped as least recently used
+    generation_seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class QuizBank:
+    """Ready quizzes per plan topic, filled by background workers.
+
+    Args:
+        service: Chat completion service of Quiz_Simulation_Agent's tier.
+        depth: Ready quizzes kept per topic.
+        ttl: Seconds a generated quiz stays servable.
+        max_topics: Topics kept; the least recently used are evicted beyond it.
+        workers: Concurrent background generations.
+        questions: Questions per quiz, of which ``multiple_choice`` are multiple choice.
+    """
+
+    def __init__(self, service, depth: int = 2, ttl: float = 86400.0, max_topics: int = 500, workers: int = 2,
+                 questions: int = 5, multiple_choice: int = 3, structured: bool = False):
+        self.service = service
+        self.structured = structured  # the service takes strict json_schema response formats
+        self.depth = depth
+        self.ttl = ttl
+        self.max_topics = max_topics
+        self.workers = workers
+        self.questions = questions
+        self.multiple_choice = multiple_choice
+        self.stats = QuizBankStats()
+        self._topics: OrderedDict[str, TopicBank] = OrderedDict()
+        self._queue: asyncio.Queue | None = None
+        self._pending: dict[str, int] = {}  # generations queued or in flight per topic
+        self._tasks: list[asyncio.Task] = []
+        self._background: set[asyncio.Task] = set()
+        self._plan_versions: dict[str, int] = {}
+
+    # --- Bank ---
+    def ready(self, topic: str) -> int:
+        """Servable quizzes of ``topic``."""
+        bank = self._topics.get(topic_key(topic))
+        if bank is None:
+            return 0
+        self._expire(bank)
+        return len(bank.quizzes)
+
+    def prefetch(self, topic: str, subtopics: list[str] | None = None) -> bool:
+        """Queue ``topic`` for generation unless it is banked or queued already; True if queued."""
+        key = topic_key(topic)
+        bank = self._topics.get(key)
+        if bank is None:
+            bank = self._topics[key] = TopicBank(topic.strip())
+            self._evict()
+        else:
+            self._topics.move_to_end(key)
+        bank.subtopics.extend(s for s in subtopics or [] if s not in bank.subtopics)
+        return self._refill(key, bank)
+
+    def prefetch_plan(self, plan: dict | None) -> int:
+        """Queue the topics of ``plan``; returns how many were queued."""
+        return sum(self.prefetch(topic, subtopics) for topic, subtopics in plan_topics(plan))
+
+    def prefetch_student(self, student_id: str) -> None:
+        """Queue the topics of the student's latest plan in the background, once per plan version."""
+        task = _detached(self._prefetch_student(student_id))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _prefetch_student(self, student_id: str) -> None:
+        from plan_repository import get_repository
+
+        try:
+            record = await asyncio.to_thread(get_repository().record, student_id)
+            if record is None or self._plan_versions.get(student_id) == record.version:
+                return
+            self._plan_versions[student_id] = record.version
+            plan = await asyncio.to_thread(get_repository().load, student_id, record.version)
+            self.prefetch_plan(plan)
+        except Exception:
+            logger.exception(f"Could not prefetch the quizzes of {student_id}'s plan")
+
+    def take(self, topic: str) -> BankedQuiz | None:
+        """A ready quiz of ``topic`` (served once), queueing a refill; None if the topic is cold.
+
+        A cold topic is not queued here: ``prefetch`` it if it is worth banking.
+        """
+        key = topic_key(topic)
+        bank = self._topics.get(key)
+        if bank is not None:
+            self._topics.move_to_end(key)
+            self._expire(bank)
+        if bank is None or not bank.quizzes:
+            self.stats.cold += 1
+            return None
+        quiz = bank.quizzes.popleft()
+        self.stats.hits += 1
+        self._refill(key, bank)
+        return quiz
+
+    def _refill(self, key: str, bank: TopicBank) -> bool:
+        self._expire(bank)
+        missing = self.depth - len(bank.quizzes) - self._pending.get(key, 0)
+        if missing <= 0:
+            self.stats.deduplicated += 1
+            return False
+        # One job per missing quiz, so a popular topic is refilled by several workers at once
+        self._pending[key] = self._pending.get(key, 0) + missing
+        self._start()
+        for _ in range(missing):
+            self._queue.put_nowait(key)
+        return True
+
+    def _expire(self, bank: TopicBank) -> None:
+        deadline = time.time() - self.ttl
+        while bank.quizzes and bank.quizzes[0].created_at < deadline:
+            bank.quizzes.popleft()
+            self.stats.expired += 1
+
+    def _evict(self) -> None:
+        while len(self._topics) > self.max_topics:
+            key, _ = self._topics.popitem(last=False)
+            self._pending.pop(key, None)
+            self.stats.evicted += 1
+
+    # --- Background generation ---
+    def _start(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if not self._tasks:
+            self._tasks = [_detached(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self) -> None:
+        # Background requests queue for the quota as one session of their own, with no chat to report to
+        current_session.set(BANK_SESSION)
+        queue_listener.set(None)
+        while True:
+            key = await self._queue.get()
+            try:
+                bank = self._topics.get(key)
+                if bank is not None:
+                    questions = await self.generate(bank.topic, bank.subtopics)
+                    bank.quizzes.append(BankedQuiz(bank.topic, questions, time.time()))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats.failed += 1
+                logger.warning(f"Could not generate a quiz on {key!r}: {e}")
+            finally:
+                if key in self._pending:
+                    self._pending[key] -= 1
+                    if not self._pending[key]:
+                        del self._pending[key]
+                self._queue.task_done()
+
+    async def generate(self, topic: str, subtopics: list[str] | None = None) -> list[QuizQuestion]:
+        """One quiz on ``topic`` with its answer keys, from one JSON completion; ValueError if it is not a quiz."""
+        t0 = time.perf_counter()
+        prompt = QUIZ_PROMPT.format(
+            questions=self.questions, multiple_choice=self.multiple_choice,
+            open_ended=self.questions - self.multiple_choice,
+        )
+        history = ChatHistory(system_message=prompt if self.structured else prompt + QUIZ_JSON_SHAPE)
+        history.add_user_message(f"Topic: {topic}" + (f"\nSubtopics: {', '.join(subtopics)}" if subtopics else ""))
+        settings = self.service.get_prompt_execution_settings_class()(
+            response_format=RESPONSE_FORMAT if self.structured else JSON_OBJECT_FORMAT
+        )
+        try:
+            response = await self.service.get_chat_message_content(chat_history=history, settings=settings)
+            data = json.loads(str(response.content) if response is not None else "")
+            items = data.get("questions") if isinstance(data, dict) else None
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                raise ValueError("the answer is not a quiz")
+            # Open-ended questions come with an empty answer and no choices
+            questions = parse_questions([
+                {key: value for key, value in item.items() if value not in ("", [])} for item in items
+            ])
+        finally:
+            self.stats.generation_seconds += time.perf_counter() - t0
+        self.stats.generated += 1
+        return questions
+
+    async def drain(self) -> None:
+        """Wait until the queued topics are generated (benchmarks, boot warm-up)."""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        for task in [*self._tasks, *self._background]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._background, return_exceptions=True)
+        self._tasks = []
+
+    # --- Quiz requests ---
+    async def quiz_for(self, student_id: str, message: str) -> BankedQuiz | None:
+        """A banked quiz on the topic ``message`` asks about, or None (no topic, cold topic, or answers)."""
+        if is_answer_sheet(message):
+            return None
+        from plan_repository import get_repository
+
+        try:
+            plan = await asyncio.to_thread(get_repository().load, student_id)
+        except Exception:
+            logger.exception(f"Could not read the study plan of {student_id}")
+            plan = None
+        topics = dict(plan_topics(plan))
+        topic = request_topic(message, list(topics))
+        if topic is None:
+            return None
+        quiz = self.take(topic)
+        if quiz is None:
+            # A topic of the plan, so worth having ready next time
+            self.prefetch(topic, topics[topic])
+        return quiz
+
+
+def request_topic(message: str, topics: list[str]) -> str | None:
+    """The plan topic named in a quiz request (the longest one), or None."""
+    text = topic_key(message)
+    named = [topic for topic in topics if re.search(rf"(?<!\w){re.escape(topic_key(topic))}(?!\w)", text)]
+    return max(named, key=len) if named else None
+
+
+def _detached(coroutine) -> asyncio.Task:
+    """A task run in an empty context instead of a copy of the current one.
+
+    Background tasks outlive the turn that starts them, so they must not carry
+    its student, session, queue listener, trace span or Chainlit context.
+    """
+    return contextvars.Context().run(asyncio.create_task, coroutine)
+
+
+def render_quiz(topic: str, questions: list[QuizQuestion]) -> str:
+    """The quiz as shown to the student: numbered questions, lettered choices, no answers."""
+    lines = [f"Here is your practice quiz on **{topic}**:", ""]
+    for question in questions:
+        lines.append(f"{question.number}. {question.text}")
+        lines.extend(f"   {CHOICE_LETTERS[i]}) {choice}" for i, choice in enumerate(question.choices))
+        lines.append("")
+    lines.append("Reply with your answers like '1-B, 2-C', and write your answers to the open-ended questions.")
+    return "\n".join(lines)
+
+
+async def serve_quiz(quiz: BankedQuiz, student_id: str, message: str, memory: ChatHistory,
+                     push: Callable[[str], Awaitable[None]], agent_name: str) -> None:
+    """Register a banked quiz for the student (as ``create_quiz`` does), show it and record the turn."""
+    from plan_repository import get_repository
+
+    def register() -> None:
+        week = None
+        try:
+            week = plan_week_for_topic(get_repository().load(student_id), quiz.topic)
+        except Exception:
+            logger.exception(f"Could not read the study plan of {student_id}")
+        get_quiz_store().save_quiz(Quiz(quiz_id=uuid.uuid4().hex, student_id=student_id, topic=quiz.topic,
+                                        week=week, questions=quiz.questions, created_at=time.time()))
+
+    await asyncio.to_thread(register)
+    text = render_quiz(quiz.topic, quiz.questions)
+    await push(text)
+    pin_quiz(quiz.topic, quiz.questions, memory)
+    memory.add_user_message(message)
+    memory.add_message(ChatMessageContent(role=AuthorRole.ASSISTANT, content=text, name=agent_name))
+
+
+_banks: dict[int, QuizBank] = {}
+
+
+def get_quiz_bank(service, structured: bool = False) -> QuizBank | None:
+    """Shared bank for ``service``, from ``QUIZ_BANK`` and the ``QUIZ_BANK_*`` settings.
+
+    ``structured``: the service's tier takes strict ``json_schema`` response formats.
+    """
+    if os.getenv("QUIZ_BANK", "on").lower() == "off":
+        return None
+    bank = _banks.get(id(service))
+    if bank is None:
+        bank = _banks[id(service)] = QuizBank(
+            service,
+            depth=int(os.getenv("QUIZ_BANK_DEPTH", 2)),
+            ttl=float(os.getenv("QUIZ_BANK_TTL", 86400)),
+            max_topics=int(os.getenv("QUIZ_BANK_MAX_TOPICS", 500)),
+            workers=int(os.getenv("QUIZ_BANK_WORKERS", 2)),
+            structured=structured,
+        )
+    return bank
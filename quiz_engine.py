@@ -0,0 +1,392 @@
+# author: Jairo Monassa
+"""Structured quizzes, local grading and per-student progress aggregates.
+
+Progress_Monitoring_Agent used to answer "how am I doing?" by re-reading the
+whole thread through the model. Now:
+
+- Quiz_Simulation_Agent registers its questions (multiple-choice items with
+  their answer keys) through ``create_quiz`` before showing them.
+- ``grade_quiz_answers`` parses the student's answers ("1-B, 2 c, 3: A") and
+  grades the multiple-choice items locally. Open-ended questions are still
+  evaluated by the agent.
+- Every graded quiz updates running aggregates (total, by topic, by study plan
+  week) in a SQLite table keyed by (student, dimension, key).
+- A progress query reads those rows with one indexed lookup, and
+  ``render_progress`` turns them into text with one short model call.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Annotated, AsyncIterator, Awaitable, Callable
+
+from semantic_kernel.contents import ChatHistory, ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+from semantic_kernel.functions import kernel_function
+
+from conversation_memory import QUIZ_PIN, QUIZ_RESULTS_PIN, pin_context, unpin_context
+from study_plan_plugin import current_student
+
+logger = logging.getLogger(__name__)
+
+QUIZ_PLUGIN_NAME = "Quiz"
+CHOICE_LETTERS = "ABCDEFGH"
+# A reply made only of answers ("1b 2c", "1-B, 2 c") may use any separator or none
+_LOOSE_ANSWER = r"(\d+)\s*[\-:.)=]?\s*\(?\s*([A-Ha-h])\)?(?![A-Za-z])"
+_ANSWER_LIST = re.compile(rf"\s*(?:{_LOOSE_ANSWER}[\s,;/]*)+", re.DOTALL)
+_ANSWER = re.compile(_LOOSE_ANSWER)
+_SHEET_ITEM = re.compile(r"[,;\n]+")
+# In prose ("3 a bit harder", "2 e 3") only an explicit separator, "(b)" or an uppercase letter counts
+_PROSE_ANSWER = re.compile(r"(\d+)\s*(?:[\-:.)=]\s*\(?\s*([A-Ha-h])|\(\s*([A-Ha-h])\s*\)|([A-H]))(?![A-Za-z])")
+
+PROGRESS_RENDER_INSTRUCTIONS = (
+    "You are a tutor. Summarize the student's quiz progress below in a few short sentences: "
+    "overall score, strongest and weakest topics or weeks, and one suggestion. "
+    "Use only these numbers."
+)
+
+
+@dataclass
+class QuizQuestion:
+    number: int
+    text: str
+    choices: list[str] = field(default_factory=list)
+    answer: str | None = None  # letter of the right choice; None for open-ended questions
+
+    @property
+    def multiple_choice(self) -> bool:
+        return bool(self.choices) and self.answer is not None
+
+
+@dataclass
+class Quiz:
+    quiz_id: str
+    student_id: str
+    topic: str
+    week: str | None
+    questions: list[QuizQuestion]
+    created_at: float = 0.0
+
+
+@dataclass
+class GradeResult:
+    correct: int
+    answered: int
+    total: int
+    wrong: list[int]
+    unanswered: list[int]
+
+
+def parse_questions(questions: list[dict]) -> list[QuizQuestion]:
+    """Validate the agent's question objects; raises ValueError with the reason."""
+    if not isinstance(questions, list) or not questions:
+        raise ValueError("questions must be a non-empty list")
+    parsed = []
+    for number, item in enumerate(questions, start=1):
+        if not isinstance(item, dict) or not str(item.get("question", "")).strip():
+            raise ValueError(f"question {number} has no 'question' text")
+        choices = [str(c) for c in item.get("choices") or []]
+        answer = item.get("answer")
+        if choices:
+            if len(choices) > len(CHOICE_LETTERS):
+                raise ValueError(f"question {number} has more than {len(CHOICE_LETTERS)} choices")
+            answer = str(answer or "").strip().upper()[:1]
+            if not answer or answer not in CHOICE_LETTERS[:len(choices)]:
+                raise ValueError(f"question {number} needs 'answer' as one of {CHOICE_LETTERS[:len(choices)]}")
+        else:
+            answer = None
+        parsed.append(QuizQuestion(number=number, text=str(item["question"]).strip(), choices=choices, answer=answer))
+    return parsed
+
+
+def parse_answers(text: str) -> dict[int, str]:
+    """Answers like "1-B, 2 c, 3: A" -> {1: "B", 2: "C", 3: "A"} (the last answer of a number wins).
+
+    A reply that is only a list of answers is read loosely; inside other text a
+    bare lowercase letter after a number is prose, not an answer.
+    """
+    if _ANSWER_LIST.fullmatch(text):
+        return {int(number): letter.upper() for number, letter in _ANSWER.findall(text)}
+    # An answer sheet with open-ended answers: mostly numbered items, the lettered ones read loosely
+    items = [item.strip() for item in _SHEET_ITEM.split(text) if item.strip()]
+    numbered = [item for item in items if item[0].isdigit()]
+    if len(numbered) >= 2 and 2 * len(numbered) >= len(items):
+        return {int(number): letter.upper() for item in numbered if _ANSWER_LIST.fullmatch(item)
+                for number, letter in _ANSWER.findall(item)}
+    return {int(number): (a or b or c).upper() for number, a, b, c in _PROSE_ANSWER.findall(text)}
+
+
+def is_answer_sheet(text: str) -> bool:
+    """Whether ``text`` answers a quiz (see ``parse_answers``), rather than talking about one."""
+    return bool(parse_answers(text))
+
+
+def grade(quiz: Quiz, answers: dict[int, str]) -> GradeResult:
+    graded = [q for q in quiz.questions if q.multiple_choice]
+    answered = [q for q in graded if q.number in answers]
+    wrong = [q.number for q in answered if answers[q.number] != q.answer]
+    return GradeResult(
+        correct=len(answered) - len(wrong),
+        answered=len(answered),
+        total=len(graded),
+        wrong=wrong,
+        unanswered=[q.number for q in graded if q.number not in answers],
+    )
+
+
+def pin_quiz(topic: str, questions: list[QuizQuestion], memory: ChatHistory | None = None) -> None:
+    """Pin the quiz the student is answering (questions only, never the answer keys)."""
+    pin_context(QUIZ_PIN, f"Open quiz on {topic}, answered like '1-B, 2-C': "
+                + " | ".join(f"{q.number}. {q.text}" for q in questions), memory)
+
+
+def pin_results(quiz: Quiz, result: GradeResult, memory: ChatHistory | None = None) -> None:
+    """Replace the pinned open quiz with its results."""
+    unpin_context(QUIZ_PIN, memory)
+    pin_context(QUIZ_RESULTS_PIN, f"Latest quiz results ({quiz.topic}): {result.correct}/{result.total} "
+                f"multiple-choice correct, wrong: {result.wrong or 'none'}, unanswered: {result.unanswered or 'none'}.",
+                memory)
+
+
+def plan_week_for_topic(plan: dict | None, topic: str) -> str | None:
+    """Week of the study plan whose blocks mention ``topic`` (first match), if any."""
+    if not plan or not topic:
+        return None
+    needle = topic.casefold()
+    for week, days in plan.items():
+        if not isinstance(days, dict):
+            continue
+        for block in days.values():
+            if not isinstance(block, dict):
+                continue
+            texts = [block.get("topic"), block.get("topico"), *(block.get("subtopics") or block.get("subtopicos") or [])]
+            if any(isinstance(t, str) and needle in t.casefold() for t in texts):
+                return week
+    return None
+
+
+class QuizStore:
+    """Quizzes and running aggregates in one SQLite file (WAL, one shared connection)."""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS quizzes (quiz_id TEXT PRIMARY KEY, student_id TEXT NOT NULL, "
+            "topic TEXT NOT NULL, week TEXT, questions TEXT NOT NULL, created_at REAL NOT NULL, graded INTEGER NOT NULL DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS quizzes_pending ON quizzes (student_id, graded, created_at);"
+            "CREATE TABLE IF NOT EXISTS progress (student_id TEXT NOT NULL, dimension TEXT NOT NULL, key TEXT NOT NULL, "
+            "quizzes INTEGER NOT NULL, answered INTEGER NOT NULL, correct INTEGER NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (student_id, dimension, key));"
+        )
+        self._conn.commit()
+
+    def save_quiz(self, quiz: Quiz) -> None:
+        questions = json.dumps([asdict(q) for q in quiz.questions], ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO quizzes (quiz_id, student_id, topic, week, questions, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (quiz.quiz_id, quiz.student_id, quiz.topic, quiz.week, questions, quiz.created_at),
+            )
+            self._conn.commit()
+
+    def pending_quiz(self, student_id: str) -> Quiz | None:
+        """The student's most recent quiz that was not graded yet."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT quiz_id, student_id, topic, week, questions, created_at FROM quizzes "
+                "WHERE student_id = ? AND graded = 0 ORDER BY created_at DESC LIMIT 1",
+                (student_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        questions = [QuizQuestion(**q) for q in json.loads(row[4])]
+        return Quiz(quiz_id=row[0], student_id=row[1], topic=row[2], week=row[3], questions=questions, created_at=row[5])
+
+    def record_grade(self, quiz: Quiz, result: GradeResult) -> None:
+        """Mark the quiz graded and add it to the total, topic and week aggregates in one transaction."""
+        now = time.time()
+        keys = [("total", "all"), ("topic", quiz.topic.strip().casefold())]
+        if quiz.week:
+            keys.append(("week", quiz.week))
+        with self._lock:
+            self._conn.execute("UPDATE quizzes SET graded = 1 WHERE quiz_id = ?", (quiz.quiz_id,))
+            self._conn.executemany(
+                "INSERT INTO progress (student_id, dimension, key, quizzes, answered, correct, updated_at) "
+                "VALUES (?, ?, ?, 1, ?, ?, ?) ON CONFLICT(student_id, dimension, key) DO UPDATE SET "
+                "quizzes = quizzes + 1, answered = answered + excluded.answered, "
+                "correct = correct + excluded.correct, updated_at = excluded.updated_at",
+                [(quiz.student_id, dimension, key, result.answered, result.correct, now) for dimension, key in keys],
+            )
+            self._conn.commit()
+
+    def progress(self, student_id: str) -> dict:
+        """{"total": {...}, "topic": {key: {...}}, "week": {key: {...}}} for one student."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT dimension, key, quizzes, answered, correct FROM progress WHERE student_id = ?",
+                (student_id,),
+            ).fetchall()
+        progress: dict = {"total": None, "topic": {}, "week": {}}
+        for dimension, key, quizzes, answered, correct in rows:
+            stats = {"quizzes": quizzes, "answered": answered, "correct": correct}
+            if dimension == "total":
+                progress["total"] = stats
+            else:
+                progress[dimension][key] = stats
+        return progress
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class QuizPlugin:
+    """Kernel functions Quiz_Simulation_Agent and Progress_Monitoring_Agent call.
+
+    The student comes from ``current_student``, like ``StudyPlanPlugin``. Store
+    calls run in a worker thread.
+    """
+
+    def __init__(self, store: QuizStore | None = None, plan_repository=None):
+        self._store = store
+        self._plan_repository = plan_repository
+
+    @property
+    def store(self) -> QuizStore:
+        if self._store is None:
+            self._store = get_quiz_store()
+        return self._store
+
+    def _plan_week(self, student: str, topic: str) -> str | None:
+        if self._plan_repository is None:
+            from plan_repository import get_repository
+
+            self._plan_repository = get_repository()
+        try:
+            return plan_week_for_topic(self._plan_repository.load(student), topic)
+        except Exception:
+            logger.exception(f"Could not read the study plan of {student}")
+            return None
+
+    @kernel_function(
+        name="create_quiz",
+        description=(
+            "Register a quiz BEFORE showing it to the student. Multiple-choice questions need 'choices' "
+            "and the letter of the right one in 'answer'; open-ended questions have neither. "
+            "Never show the answers to the student."
+        ),
+    )
+    async def create_quiz(
+        self,
+        topic: Annotated[str, "The topic of the quiz, as written in the study plan when there is one."],
+        questions: Annotated[
+            list[dict],
+            "Questions in display order: {'question': str, 'choices': [str, ...], 'answer': 'A'|'B'|...} "
+            "for multiple choice, {'question': str} for open-ended.",
+        ],
+        week: Annotated[str | None, "The study plan week of the topic (e.g. 'week3'), if known."] = None,
+    ) -> str:
+        student = current_student.get()
+        try:
+            parsed = parse_questions(questions)
+        except ValueError as e:
+            return f"Error: {e}. Fix the questions and call create_quiz again."
+        if not week:
+            week = await asyncio.to_thread(self._plan_week, student, topic)
+        quiz = Quiz(quiz_id=uuid.uuid4().hex, student_id=student, topic=topic, week=week,
+                    questions=parsed, created_at=time.time())
+        await asyncio.to_thread(self.store.save_quiz, quiz)
+        pin_quiz(topic, parsed)
+        mc = sum(q.multiple_choice for q in parsed)
+        return (
+            f"Quiz registered ({mc} multiple-choice, {len(parsed) - mc} open-ended). "
+            "Show the questions numbered 1..n with lettered choices, without the answers, and ask the student "
+            "to reply like '1-B, 2-C'."
+        )
+
+    @kernel_function(
+        name="grade_quiz_answers",
+        description=(
+            "Grade the student's answers to their latest quiz. Pass the student's reply exactly as written. "
+            "Multiple-choice items are graded here; evaluate the open-ended answers yourself."
+        ),
+    )
+    async def grade_quiz_answers(
+        self,
+        answers: Annotated[str, "The student's reply with their answers, e.g. '1-B, 2-C, 3-A'."],
+    ) -> str:
+        student = current_student.get()
+        if not is_answer_sheet(answers):
+            return "No multiple-choice answers found. Ask the student to answer like '1-B, 2-C'."
+        quiz = await asyncio.to_thread(self.store.pending_quiz, student)
+        if quiz is None:
+            return "There is no pending quiz for this student. Create one with create_quiz first."
+        result = grade(quiz, parse_answers(answers))
+        if result.answered == 0 and result.total:
+            return "No multiple-choice answers found. Ask the student to answer like '1-B, 2-C'."
+        await asyncio.to_thread(self.store.record_grade, quiz, result)
+        pin_results(quiz, result)
+        keys = ", ".join(f"{q.number}-{q.answer}" for q in quiz.questions if q.multiple_choice)
+        return (
+            f"Multiple choice: {result.correct}/{result.total} correct. Wrong: {result.wrong or 'none'}. "
+            f"Unanswered: {result.unanswered or 'none'}. Answer key: {keys}."
+        )
+
+    @kernel_function(
+        name="get_student_progress",
+        description="The student's quiz results so far: total, by topic and by study plan week.",
+    )
+    async def get_student_progress(self) -> str:
+        progress = await asyncio.to_thread(self.store.progress, current_student.get())
+        return json.dumps(progress, ensure_ascii=False)
+
+
+async def render_progress(service, progress: dict) -> AsyncIterator[str]:
+    """Stream a short text summary of ``progress`` with one small model call."""
+    if not progress.get("total"):
+        yield "You haven't finished any quiz yet. Ask me for a practice quiz on a topic of your plan!"
+        return
+    history = ChatHistory(system_message=PROGRESS_RENDER_INSTRUCTIONS)
+    history.add_user_message(json.dumps(progress, ensure_ascii=False))
+    settings = service.get_prompt_execution_settings_class()(max_tokens=200)
+    async for chunks in service.get_streaming_chat_message_contents(chat_history=history, settings=settings):
+        for chunk in chunks:
+            if chunk.content:
+                yield str(chunk.content)
+
+
+async def progress_turn(service, student_id: str, message: str, memory: ChatHistory,
+                        push: Callable[[str], Awaitable[None]], agent_name: str) -> None:
+    """Answer a progress question from the aggregates and record the turn in the thread."""
+    progress = await asyncio.to_thread(get_quiz_store().progress, student_id)
+    parts = []
+    async for text in render_progress(service, progress):
+        parts.append(text)
+        await push(text)
+    memory.add_user_message(message)
+    memory.add_message(ChatMessageContent(role=AuthorRole.ASSISTANT, content="".join(parts), name=agent_name))
+
+
+_store: QuizStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_quiz_store() -> QuizStore:
+    """Process-wide store from ``QUIZ_STORE_PATH`` (default sessions/quizzes.db)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = QuizStore(os.getenv("QUIZ_STORE_PATH", os.path.join("sessions", "quizzes.db")))
+        return _store
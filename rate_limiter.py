@@ -0,0 +1,354 @@
+# author: Jairo Monassa
+"""Process-wide token buckets for the shared model quota, with a fair admission queue.
+
+Every session shares one ``GITHUB_TOKEN``, whose quota counts requests per
+minute and tokens per minute. ``RateLimiter.acquire`` admits a completion
+request only when both buckets hold enough for it (its estimated prompt plus
+``max_tokens``); otherwise the request waits in an admission queue:
+
+- fair: the queue is served round-robin across sessions, so one student's
+  burst (screening prompts, tool loops) cannot starve the others;
+- bounded: beyond ``max_queue`` waiting requests (or ``max_per_session`` for
+  one session), or when the request rate says the wait would exceed
+  ``max_wait`` seconds, ``QueueFullError`` is raised at once instead of
+  queueing work that would time out anyway;
+- visible: while a session has requests waiting, the listener in
+  ``queue_listener`` gets the position of its first one, then None (the
+  Chainlit apps show "you are #3 in line").
+
+The buckets follow the server: ``x-ratelimit-limit-*`` headers set their
+rates when none were configured, ``x-ratelimit-remaining-*`` lower their
+levels, and a 429 with ``retry-after`` pauses admissions. ``Admission.settle``
+corrects the token bucket with the usage the API reports.
+
+Settings: ``MODEL_RATE_LIMIT`` ("on"/"off"), ``MODEL_RATE_LIMIT_RPM``,
+``MODEL_RATE_LIMIT_TPM`` (unset: learned from the headers),
+``MODEL_ADMISSION_QUEUE``, ``MODEL_ADMISSION_PER_SESSION`` and
+``MODEL_ADMISSION_MAX_WAIT``.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Mapping
+
+from token_counting import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Whose requests these are (the Chainlit thread id); requests without one share a session
+current_session: ContextVar[str | None] = ContextVar("current_session", default=None)
+# Called with the session's queue position while its requests wait, then with None
+queue_listener: ContextVar[Callable[[int | None], Awaitable[None]] | None] = ContextVar("queue_listener", default=None)
+
+DEFAULT_COMPLETION_TOKENS = 512
+
+
+class QueueFullError(RuntimeError):
+    """The admission queue is full; the request was not queued."""
+
+
+class TokenBucket:
+    """``rate`` units per second, holding up to ``burst`` seconds' worth; ``rate=None`` means unlimited."""
+
+    def __init__(self, rate: float | None, burst: float = 60.0):
+        self.rate = rate
+        self.burst = burst
+        self.capacity = rate * burst if rate else None
+        self.level = self.capacity or 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` is available (0 when it is now)."""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        # A request larger than the whole bucket is admitted once the bucket is full
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        if self.rate:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+
+    def give(self, amount: float) -> None:
+        if self.rate:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+    def configure(self, per_minute: float) -> None:
+        unlimited = not self.rate
+        self._refill()
+        self.rate = per_minute / 60
+        self.capacity = self.rate * self.burst
+        self.level = self.capacity if unlimited else min(self.level, self.capacity)
+
+    def clamp(self, remaining: float) -> None:
+        """The server says only ``remaining`` is left."""
+        if self.rate:
+            self._refill()
+            self.level = min(self.level, remaining)
+
+
+@dataclass
+class _Waiter:
+    session: str | None
+    tokens: int
+    listener: Callable[[int | None], Awaitable[None]] | None
+    moved: asyncio.Event = field(default_factory=asyncio.Event)
+    admitted: bool = False
+
+
+@dataclass
+class LimiterStats:
+    admitted: int = 0
+    queued: int = 0
+    rejected: int = 0
+    throttled: int = 0
+    wait_seconds: float = 0.0
+    max_queue: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class Admission:
+    """A request let through; ``settle`` it with the real token usage."""
+
+    def __init__(self, limiter: "RateLimiter", tokens: int):
+        self.limiter = limiter
+        self.tokens = tokens
+
+    def settle(self, used_tokens: int | None) -> None:
+        if used_tokens is not None:
+            self.limiter.tokens.give(self.tokens - used_tokens)
+            self.tokens = used_tokens
+
+
+class RateLimiter:
+    """Requests/min and tokens/min buckets in front of the model endpoints.
+
+    Args:
+        requests_per_minute: Request quota (None: unlimited until a header says otherwise).
+        tokens_per_minute: Token quota (same).
+        max_queue: Waiting requests beyond which new ones are rejected.
+        max_per_session: Waiting requests of one session beyond which its new ones are rejected.
+        burst_seconds: How many seconds of quota may be spent at once.
+        max_wait: Expected queue wait (seconds) beyond which new requests are rejected.
+    """
+
+    def __init__(self, requests_per_minute: float | None = None, tokens_per_minute: float | None = None,
+                 max_queue: int = 256, max_per_session: int = 16, burst_seconds: float = 60.0,
+                 max_wait: float = 30.0):
+        self.requests = TokenBucket(requests_per_minute / 60 if requests_per_minute else None, burst_seconds)
+        self.tokens = TokenBucket(tokens_per_minute / 60 if tokens_per_minute else None, burst_seconds)
+        self.configured = (requests_per_minute is not None, tokens_per_minute is not None)
+        self.max_queue = max_queue
+        self.max_per_session = max_per_session
+        self.max_wait = max_wait
+        self.paused_until = 0.0
+        self.stats = LimiterStats()
+        # Session -> its waiting requests; the first session is served next
+        self._queues: OrderedDict[str | None, deque[_Waiter]] = OrderedDict()
+        self._waiting = 0
+        self._timer: asyncio.TimerHandle | None = None
+
+    def __len__(self) -> int:
+        return self._waiting
+
+    @property
+    def full(self) -> bool:
+        """No room for one more request: too many waiting, or it would wait too long."""
+        if self._waiting >= self.max_queue:
+            return True
+        return bool(self.requests.rate) and (self._waiting + 1) / self.requests.rate > self.max_wait
+
+    def _wait_time(self, tokens: int) -> float:
+        return max(self.paused_until - time.monotonic(), self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _take(self, tokens: int) -> None:
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.stats.admitted += 1
+
+    def try_acquire(self, tokens: int) -> Admission | None:
+        """Admit at once if nobody is waiting and there is quota, otherwise None."""
+        if not self._waiting and self._wait_time(tokens) == 0:
+            self._take(tokens)
+            return Admission(self, tokens)
+        return None
+
+    async def acquire(self, tokens: int, session: str | None = None) -> Admission:
+        """Wait for quota for one request of about ``tokens`` tokens."""
+        admission = self.try_acquire(tokens)
+        if admission is not None:
+            return admission
+
+        queue = self._queues.get(session)
+        if self.full or (queue is not None and len(queue) >= self.max_per_session):
+            self.stats.rejected += 1
+            raise QueueFullError(f"Admission queue full ({self._waiting} waiting)")
+        waiter = _Waiter(session, tokens, queue_listener.get())
+        if queue is None:
+            queue = self._queues[session] = deque()
+        queue.append(waiter)
+        self._waiting += 1
+        self.stats.queued += 1
+        self.stats.max_queue = max(self.stats.max_queue, self._waiting)
+        t0 = time.monotonic()
+        notified = None
+        try:
+            self._dispatch()
+            while not waiter.admitted:
+                waiter.moved.clear()
+                position = self.session_position(waiter.session)
+                if waiter.listener is not None and position != notified:
+                    notified = position
+                    await self._notify(waiter, position)
+                    if waiter.admitted:
+                        break
+                await waiter.moved.wait()
+        except BaseException:
+            if waiter.admitted:
+                # Admitted while being cancelled: give the quota back
+                self.requests.give(1)
+                self.tokens.give(tokens)
+            else:
+                self._remove(waiter)
+                self._dispatch()
+            raise
+        finally:
+            self.stats.wait_seconds += time.monotonic() - t0
+        if notified is not None and waiter.session not in self._queues:
+            await self._notify(waiter, None)
+        return Admission(self, tokens)
+
+    def session_position(self, session: str | None) -> int | None:
+        """Position of the first waiting request of ``session``, None when it has none."""
+        queue = self._queues.get(session)
+        return self.position(queue[0]) if queue else None
+
+    def position(self, waiter: _Waiter) -> int:
+        """1-based place of ``waiter`` in the round-robin order of the queue."""
+        queue = self._queues.get(waiter.session) or deque()
+        index = queue.index(waiter) if waiter in queue else 0
+        ahead = 0
+        before = True
+        for session, other in self._queues.items():
+            if session == waiter.session:
+                before = False
+                continue
+            # Sessions served before this one in the rotation get one more turn
+            ahead += min(len(other), index + 1 if before else index)
+        return ahead + index + 1
+
+    async def _notify(self, waiter: _Waiter, position: int | None) -> None:
+        try:
+            await waiter.listener(position)
+        except Exception as e:
+            logger.debug(f"Queue listener failed: {e}")
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.session)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[waiter.session]
+
+    def _dispatch(self) -> None:
+        """Admit waiting requests round-robin while the buckets allow; otherwise wake up later."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        moved = False
+        while self._queues:
+            session, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+            wait = self._wait_time(waiter.tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                break
+            queue.popleft()
+            self._waiting -= 1
+            del self._queues[session]
+            if queue:
+                self._queues[session] = queue  # Back of the rotation
+            self._take(waiter.tokens)
+            waiter.admitted = True
+            waiter.moved.set()
+            moved = True
+        if moved:
+            # Everyone behind moved up
+            for queue in self._queues.values():
+                for waiter in queue:
+                    waiter.moved.set()
+
+    def observe(self, headers: Mapping[str, str], status: int = 200) -> None:
+        """Feed the quota headers of a response (or a 429) back into the buckets."""
+
+        def number(name: str) -> float | None:
+            try:
+                value = headers.get(name)
+                return float(value) if value is not None else None
+            except (TypeError, ValueError):
+                return None
+
+        for bucket, kind, configured in ((self.requests, "requests", self.configured[0]),
+                                         (self.tokens, "tokens", self.configured[1])):
+            limit = number(f"x-ratelimit-limit-{kind}")
+            if limit and not configured and (not bucket.rate or abs(bucket.rate * 60 - limit) > 0.5):
+                bucket.configure(limit)
+            remaining = number(f"x-ratelimit-remaining-{kind}")
+            if remaining is not None:
+                # The headers count per minute; the bucket holds burst seconds of quota
+                bucket.clamp(remaining * bucket.burst / 60)
+        if status == 429:
+            self.stats.throttled += 1
+            retry_after = number("retry-after") or 1.0
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            # Nothing left in this window either
+            self.requests.clamp(0)
+        if self._queues:
+            self._dispatch()
+
+
+def estimate_request_tokens(request: dict) -> int:
+    """Prompt plus the completion budget of a ``chat.completions.create`` request."""
+    prompt = estimate_tokens(json.dumps(request.get("messages", []), default=str))
+    prompt += estimate_tokens(json.dumps(request.get("tools") or [], default=str))
+    completion = request.get("max_tokens") or request.get("max_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+    return prompt + completion
+
+
+_limiter: RateLimiter | None = None
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """The process-wide limiter from the ``MODEL_RATE_LIMIT*`` and ``MODEL_ADMISSION_*`` settings."""
+    global _limiter
+    if os.getenv("MODEL_RATE_LIMIT", "on").lower() == "off":
+        return None
+    if _limiter is None:
+        rpm = os.getenv("MODEL_RATE_LIMIT_RPM")
+        tpm = os.getenv("MODEL_RATE_LIMIT_TPM")
+        _limiter = RateLimiter(
+            requests_per_minute=float(rpm) if rpm else None,
+            tokens_per_minute=float(tpm) if tpm else None,
+            max_queue=int(os.getenv("MODEL_ADMISSION_QUEUE", 256)),
+            max_per_session=int(os.getenv("MODEL_ADMISSION_PER_SESSION", 16)),
+            max_wait=float(os.getenv("MODEL_ADMISSION_MAX_WAIT", 30.0)),
+        )
+    return _limiter
@@ -0,0 +1,406 @@
+# author: Jairo Monassa
+"""Retries, failover and hedging of chat completion requests across endpoints.
+
+A model tier can be served by several endpoints (the same model on
+``models.inference.ai.azure.com`` and ``models.github.ai``, see the
+``fallbacks`` of ``models.toml``). ``ResilientCompletions.create`` takes the
+arguments of ``client.chat.completions.create`` and:
+
+- retries throttling (429), server errors (5xx), timeouts and dropped
+  connections with full-jitter exponential backoff, honouring ``retry-after``
+  when it retries the same endpoint;
+- fails over to the next endpoint on every retry, skipping endpoints whose
+  circuit breaker is open (too many consecutive failures; one probe request
+  is let through after ``breaker_reset`` seconds);
+- optionally hedges: when the first token has not arrived by the p95 of the
+  recent first-token latencies, a second request goes to another endpoint
+  and whichever answers first wins; the other one is cancelled.
+
+With a ``rate_limiter.RateLimiter`` each request first waits for its share
+of the quota (hedges only go out when there is quota to spare), and the
+quota headers and usage of the answers are fed back into it.
+
+Streams are only handed over once their first content, tool call or usage
+chunk has arrived, so everything above (the Semantic Kernel service, the
+token coalescer, the Chainlit message) sees one ordinary stream no matter
+how many requests it took. A stream that breaks after its first token
+raises as before: its tokens are already on the student's screen.
+
+The endpoint clients should not retry themselves (``max_retries=0``).
+
+Settings: ``MODEL_RETRY_ATTEMPTS``, ``MODEL_RETRY_BACKOFF``,
+``MODEL_RETRY_BACKOFF_MAX``, ``MODEL_BREAKER_FAILURES``,
+``MODEL_BREAKER_RESET``, ``MODEL_HEDGE`` ("on"/"off"),
+``MODEL_HEDGE_QUANTILE`` and ``MODEL_HEDGE_DELAY`` (used until enough
+latencies are known).
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from types import SimpleNamespace
+from typing import Any, Callable
+
+import httpx
+import openai
+from openai import AsyncOpenAI, AsyncStream
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
+from semantic_kernel.connectors.ai.open_ai.exceptions.content_filter_ai_exception import ContentFilterAIException
+from semantic_kernel.exceptions import ServiceResponseException
+
+from rate_limiter import Admission, RateLimiter, current_session, estimate_request_tokens
+from tracing import TracedChatCompletion
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class ResilienceConfig:
+    max_attempts: int = 3
+    backoff: float = 0.25
+    backoff_max: float = 8.0
+    breaker_failures: int = 5
+    breaker_reset: float = 30.0
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_delay: float = 2.0
+    hedge_min_samples: int = 20
+
+    @classmethod
+    def from_env(cls, **overrides) -> "ResilienceConfig":
+        """Read the settings from ``MODEL_RETRY_*``, ``MODEL_BREAKER_*`` and ``MODEL_HEDGE*``."""
+        settings = dict(
+            max_attempts=int(os.getenv("MODEL_RETRY_ATTEMPTS", cls.max_attempts)),
+            backoff=float(os.getenv("MODEL_RETRY_BACKOFF", cls.backoff)),
+            backoff_max=float(os.getenv("MODEL_RETRY_BACKOFF_MAX", cls.backoff_max)),
+            breaker_failures=int(os.getenv("MODEL_BREAKER_FAILURES", cls.breaker_failures)),
+            breaker_reset=float(os.getenv("MODEL_BREAKER_RESET", cls.breaker_reset)),
+            hedge=os.getenv("MODEL_HEDGE", "off").lower() in ("1", "on", "true", "yes"),
+            hedge_quantile=float(os.getenv("MODEL_HEDGE_QUANTILE", cls.hedge_quantile)),
+            hedge_delay=float(os.getenv("MODEL_HEDGE_DELAY", cls.hedge_delay)),
+        )
+        settings.update(overrides)
+        return cls(**settings)
+
+
+class CircuitBreaker:
+    """Opens after ``failures`` consecutive failures; lets one probe through after ``reset`` seconds."""
+
+    def __init__(self, failures: int = 5, reset: float = 30.0):
+        self.failures = failures
+        self.reset = reset
+        self.consecutive = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset else "open"
+
+    @property
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self._probing)
+
+    def begin(self) -> None:
+        """A request is sent; when half-open it is the probe."""
+        if self.opened_at is not None:
+            self._probing = True
+
+    def record_success(self) -> None:
+        self.consecutive = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.consecutive += 1
+        if self._probing or self.consecutive >= self.failures:
+            if self.opened_at is None or self._probing:
+                logger.warning("Circuit opened after %d consecutive failures", self.consecutive)
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self) -> None:
+        """Give the probe slot back when the probe was cancelled (e.g. it lost a hedge)."""
+        self._probing = False
+
+
+@dataclass
+class Endpoint:
+    """One way to reach a model: a client and the model's name on that endpoint."""
+
+    name: str
+    client: AsyncOpenAI
+    model: str | None = None
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+
+
+@dataclass
+class ResilienceStats:
+    requests: int = 0
+    attempts: int = 0
+    retries: int = 0
+    failovers: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    breaker_skips: int = 0
+    failures: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class EndpointsUnavailableError(openai.APIConnectionError):
+    """Every endpoint's circuit breaker is open."""
+
+    def __init__(self, endpoints: list[Endpoint]):
+        names = ", ".join(endpoint.name for endpoint in endpoints)
+        request = httpx.Request("POST", str(endpoints[0].client.base_url) if endpoints else "http://unavailable")
+        super().__init__(message=f"No model endpoint available (circuit open: {names})", request=request)
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return not isinstance(error, EndpointsUnavailableError)
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUSES or error.status_code >= 500
+    return False
+
+
+def _retry_after(error: BaseException) -> float | None:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after")) if response is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _first_token(chunk) -> bool:
+    if getattr(chunk, "usage", None) is not None:
+        return True
+    return any(choice.delta.content or choice.delta.tool_calls or choice.finish_reason
+               for choice in chunk.choices or [])
+
+
+async def _await_first_token(stream: AsyncStream, on_usage: Callable[[Any], None] | None = None) -> AsyncStream:
+    """Read ``stream`` up to its first token and put the chunks read back in front of it.
+
+    ``on_usage`` gets the usage of the last chunk, if the stream reports one.
+    """
+    buffered = []
+    try:
+        while True:
+            try:
+                chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                break
+            buffered.append(chunk)
+            if _first_token(chunk):
+                break
+    except BaseException:
+        await stream.close()
+        raise
+
+    rest = stream._iterator  # AsyncStream iterates this generator in __anext__ and __aiter__
+
+    async def replay():
+        for chunk in buffered:
+            yield chunk
+        try:
+            async for chunk in rest:
+                if on_usage is not None and chunk.usage is not None:
+                    on_usage(chunk.usage)
+                yield chunk
+        except BaseException:
+            # A cancelled turn closes the connection, so the endpoint stops generating
+            await stream.close()
+            raise
+
+    stream._iterator = replay()
+    return stream
+
+
+async def _discard(response) -> None:
+    if isinstance(response, AsyncStream):
+        await response.close()
+
+
+class ResilientCompletions:
+    """``chat.completions.create`` over several endpoints with retries, failover and hedging.
+
+    Args:
+        endpoints: Endpoints in order of preference.
+        config: Retry, breaker and hedging settings (default: from the environment).
+        limiter: Shared quota every request is admitted by (None: no limit).
+    """
+
+    def __init__(self, endpoints: list[Endpoint], config: ResilienceConfig | None = None,
+                 limiter: RateLimiter | None = None):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.config = config or ResilienceConfig.from_env()
+        self.endpoints = endpoints
+        self.limiter = limiter
+        for endpoint in endpoints:
+            endpoint.breaker.failures = self.config.breaker_failures
+            endpoint.breaker.reset = self.config.breaker_reset
+        self.stats = ResilienceStats()
+        # First-token latencies of streamed and whole non-streamed answers, kept apart
+        self._latencies = {True: deque(maxlen=500), False: deque(maxlen=500)}
+
+    def hedge_delay(self, stream: bool) -> float:
+        latencies = self._latencies[stream]
+        if len(latencies) < self.config.hedge_min_samples:
+            return self.config.hedge_delay
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.config.hedge_quantile))]
+
+    def _candidates(self, attempt: int) -> list[Endpoint]:
+        """Endpoints whose breaker lets a request through, rotated so each retry fails over."""
+        shift = attempt % len(self.endpoints)
+        rotated = self.endpoints[shift:] + self.endpoints[:shift]
+        allowed = [endpoint for endpoint in rotated if endpoint.breaker.available]
+        self.stats.breaker_skips += len(rotated) - len(allowed)
+        return allowed
+
+    def _backoff(self, attempt: int, error: BaseException, same_endpoint: bool) -> float:
+        delay = random.uniform(0, min(self.config.backoff_max, self.config.backoff * 2 ** attempt))
+        retry_after = _retry_after(error)
+        if same_endpoint and retry_after is not None:
+            delay = max(delay, min(retry_after, self.config.backoff_max))
+        return delay
+
+    async def create(self, **kwargs) -> Any:
+        self.stats.requests += 1
+        previous: Endpoint | None = None
+        for attempt in range(self.config.max_attempts):
+            candidates = self._candidates(attempt)
+            if not candidates:
+                self.stats.failures += 1
+                raise EndpointsUnavailableError(self.endpoints)
+            if previous is not None and candidates[0] is not previous:
+                self.stats.failovers += 1
+                logger.info("Failing over from %s to %s", previous.name, candidates[0].name)
+            try:
+                return await self._race(candidates, kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.config.max_attempts - 1:
+                    self.stats.failures += 1
+                    raise
+                logger.info("Completion on %s failed (%s); retrying", candidates[0].name, e)
+                self.stats.retries += 1
+                previous = candidates[0]
+                next_first = self.endpoints[(attempt + 1) % len(self.endpoints)]
+                await asyncio.sleep(self._backoff(attempt, e, same_endpoint=next_first is previous))
+
+    async def _race(self, candidates: list[Endpoint], kwargs: dict) -> Any:
+        """One attempt on ``candidates[0]``, hedged on the next candidate if it is slow."""
+        stream = bool(kwargs.get("stream"))
+        tokens = estimate_request_tokens(kwargs) if self.limiter is not None else 0
+        admission = await self.limiter.acquire(tokens, current_session.get()) if self.limiter is not None else None
+        primary = asyncio.create_task(self._attempt(candidates[0], kwargs, admission))
+        tasks = [primary]
+        try:
+            if self.config.hedge:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(stream))
+                if not done:
+                    hedge = candidates[1] if len(candidates) > 1 else candidates[0]
+                    # A hedge never waits for quota: it is only worth it when it goes out now
+                    spare = self.limiter.try_acquire(tokens) if self.limiter is not None else None
+                    if (hedge is candidates[0] or hedge.breaker.available) and (self.limiter is None or spare):
+                        self.stats.hedges += 1
+                        tasks.append(asyncio.create_task(self._attempt(hedge, kwargs, spare)))
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in tasks if task in done and task.exception() is None]
+                if winners:
+                    for task in winners[1:]:
+                        await _discard(task.result())
+                    if winners[0] is not primary:
+                        self.stats.hedge_wins += 1
+                    return winners[0].result()
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            # The loser is cancelled, which closes its connection
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _attempt(self, endpoint: Endpoint, kwargs: dict, admission: Admission | None = None) -> Any:
+        self.stats.attempts += 1
+        request = dict(kwargs, model=endpoint.model) if endpoint.model else kwargs
+        t0 = time.perf_counter()
+        endpoint.breaker.begin()
+        try:
+            if admission is None:
+                response = await endpoint.client.chat.completions.create(**request)
+            else:
+                raw = await endpoint.client.chat.completions.with_raw_response.create(**request)
+                self.limiter.observe(raw.headers)
+                response = raw.parse()
+            if isinstance(response, AsyncStream):
+                on_usage = (lambda usage: admission.settle(usage.total_tokens)) if admission is not None else None
+                response = await _await_first_token(response, on_usage)
+            elif admission is not None and response.usage is not None:
+                admission.settle(response.usage.total_tokens)
+        except asyncio.CancelledError:
+            endpoint.breaker.release()
+            raise
+        except Exception as e:
+            if self.limiter is not None and isinstance(e, openai.APIStatusError):
+                self.limiter.observe(e.response.headers, e.status_code)
+            if is_retryable(e):
+                endpoint.breaker.record_failure()
+            else:
+                endpoint.breaker.release()
+            raise
+        endpoint.breaker.record_success()
+        self._latencies[bool(kwargs.get("stream"))].append(time.perf_counter() - t0)
+        return response
+
+
+class ResilientClient:
+    """Stands in for an ``AsyncOpenAI`` client where only ``chat.completions.create`` is used."""
+
+    def __init__(self, completions: ResilientCompletions):
+        self.chat = SimpleNamespace(completions=completions)
+
+
+class ResilientChatCompletion(TracedChatCompletion):
+    """``TracedChatCompletion`` whose requests go through ``ResilientCompletions``."""
+
+    completions: ResilientCompletions | None = None
+
+    def __init__(self, completions: ResilientCompletions | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self.completions = completions
+
+    async def _send_completion_request(self, settings: OpenAIChatPromptExecutionSettings):
+        if self.completions is None:
+            return await super()._send_completion_request(settings)
+        settings_dict = settings.prepare_settings_dict()
+        self._handle_structured_output(settings, settings_dict)
+        if settings.tools is None:
+            settings_dict.pop("parallel_tool_calls", None)
+        try:
+            response = await self.completions.create(**settings_dict)
+        except openai.BadRequestError as ex:
+            if ex.code == "content_filter":
+                raise ContentFilterAIException(f"{type(self)} service encountered a content error", ex) from ex
+            raise ServiceResponseException(f"{type(self)} service failed to complete the prompt", ex) from ex
+        except Exception as ex:
+            raise ServiceResponseException(f"{type(self)} service failed to complete the prompt", ex) from ex
+        self.store_usage(response)
+        return response
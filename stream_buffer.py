@@ -0,0 +1,103 @@
+# author: Jairo Monassa
+"""Coalesce streamed tokens before pushing them to the websocket.
+
+``agent.invoke_stream`` yields one chunk per model token. Sending each one
+with ``cl.Message.stream_token`` costs a websocket frame and an await per
+token; ``TokenCoalescer`` buffers them and flushes when the buffer reaches
+``max_chars``, when ``max_delay`` has passed since the first buffered token,
+or at the end of the stream.
+
+Defaults come from ``STREAM_FLUSH_CHARS`` and ``STREAM_FLUSH_MS``; setting
+either to 0 turns buffering off (one frame per token, the old behaviour).
+"""
+
+import asyncio
+import os
+import time
+
+
+class TokenCoalescer:
+    """Buffered ``stream_token`` for one streamed message.
+
+    Usage::
+
+        async with TokenCoalescer(answer) as stream:
+            async for response in agent.invoke_stream(...):
+                if response.content:
+                    await stream.push(str(response.content))
+    """
+
+    def __init__(self, message, max_chars: int | None = None, max_delay: float | None = None):
+        self.message = message
+        self.max_chars = int(os.getenv("STREAM_FLUSH_CHARS", 64)) if max_chars is None else max_chars
+        self.max_delay = int(os.getenv("STREAM_FLUSH_MS", 40)) / 1000 if max_delay is None else max_delay
+        self.frames = 0
+        self.tokens = 0
+        self.first_token_at: float | None = None  # perf_counter() of the first push
+        self.send_seconds = 0.0  # time spent awaiting the websocket
+        self._buffer: list[str] = []
+        self._buffered_chars = 0
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.TimerHandle | None = None
+        self._pending: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_chars > 0 and self.max_delay > 0
+
+    async def __aenter__(self) -> "TokenCoalescer":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def push(self, token: str) -> None:
+        """Add a token; flushes on the size threshold."""
+        if not token:
+            return
+        self.tokens += 1
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        if not self.enabled:
+            self.frames += 1
+            await self._send(token)
+            return
+        self._buffer.append(token)
+        self._buffered_chars += len(token)
+        if self._buffered_chars >= self.max_chars:
+            await self.flush()
+        elif self._timer is None:
+            # First token of a new batch: flush it at the latest after max_delay
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.max_delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._pending = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> None:
+        """Send everything buffered as one frame."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self._buffer:
+                return
+            text = "".join(self._buffer)
+            self._buffer.clear()
+            self._buffered_chars = 0
+            self.frames += 1
+            await self._send(text)
+
+    async def _send(self, text: str) -> None:
+        t0 = time.perf_counter()
+        await self.message.stream_token(text)
+        self.send_seconds += time.perf_counter() - t0
+
+    async def close(self) -> None:
+        """End of stream: wait for a timer flush in progress and send the rest."""
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+        await self.flush()
+
@@ -0,0 +1,164 @@
+# author: Jairo Monassa
+"""Single-shot study plan generation with schema-constrained output.
+
+The planning prompts had the model write the plan three times: as text to
+show the student, again as the JSON arguments of ``save_study_plan_to_json``,
+and once more in the "saved successfully" message. In structured mode the
+conversation only gathers the student's availability, deadline and goals;
+then one completion with ``response_format`` ``json_schema`` (strict) returns
+the plan, which is validated, saved and rendered to text locally
+(``render_plan``), so the plan is generated exactly once.
+
+Strict schemas cannot have free keys such as ``week1``/``days1and2``, so the
+schema has arrays of weeks and day blocks; ``parse_plan`` turns the answer
+into the usual ``week -> day block -> {topic, subtopics, goal}`` dict, with
+the English keys of the Chainlit agents or the Portuguese ones of
+``agent_planning.py`` (``semana``/``dia``, ``topico``/``subtopicos``/``meta``).
+
+Only models that take strict ``json_schema`` response formats can do this, so
+it is opt-in: ``PLAN_GENERATION`` ("structured", or "tool" for the plan written
+in the ``save_study_plan_to_json`` call as before) decides when set; otherwise
+the Chainlit apps follow ``structured_output`` of Planning_Agent's tier in
+``models.toml`` and ``agent_planning.py`` uses the tool.
+"""
+
+import json
+import os
+import re
+
+from study_plan_stream import DAY_KEY, validate_plan
+
+CREATE_TOOL_NAME = "create_study_plan"
+
+# Week key, day key and block fields of each plan language
+PLAN_KEYS = {
+    "en": ("week", "day", ("topic", "subtopics", "goal")),
+    "pt": ("semana", "dia", ("topico", "subtopicos", "meta")),
+}
+
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "weeks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "days": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "day_block": {
+                                    "type": "string",
+                                    "description": "Days of the week the block covers, e.g. 'days1and2' or 'day3'.",
+                                },
+                                "topic": {"type": "string"},
+                                "subtopics": {"type": "array", "items": {"type": "string"}},
+                                "goal": {"type": "string"},
+                            },
+                            "required": ["day_block", "topic", "subtopics", "goal"],
+                            "additionalProperties": False,
+                        },
+                    },
+                },
+                "required": ["days"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["weeks"],
+    "additionalProperties": False,
+}
+
+RESPONSE_FORMAT = {"type": "json_schema", "json_schema": {"name": "study_plan", "strict": True, "schema": PLAN_SCHEMA}}
+
+PLAN_PROMPT = {
+    "en": (
+        "You are an expert study planning assistant. Create the student's personalized study plan from the "
+        "information below: one entry per week, each with day blocks that have a topic, its subtopics and a goal. "
+        "Adapt the number of weeks and the distribution of topics to the student's availability, deadline and goals."
+    ),
+    "pt": (
+        "Você é um assistente especialista em planejamento de estudos. Crie o plano de estudos personalizado do "
+        "estudante a partir das informações abaixo: uma entrada por semana, cada uma com blocos de dias que têm um "
+        "tópico, seus subtópicos e uma meta. Escreva o conteúdo em português e adapte a quantidade de semanas e a "
+        "distribuição dos tópicos à disponibilidade, ao prazo e às metas do estudante."
+    ),
+}
+
+# Labels of the rendered plan
+_GOAL_LABEL = {"en": "Goal", "pt": "Meta"}
+
+
+def structured_mode(tier=None) -> bool:
+    """Whether plans are generated with structured output: ``PLAN_GENERATION``, else ``tier.structured_output``."""
+    mode = os.getenv("PLAN_GENERATION", "").lower()
+    if mode:
+        return mode == "structured"
+    return bool(tier is not None and tier.structured_output)
+
+
+def plan_messages(brief: str, conversation: list[dict] | None = None, language: str = "en") -> list[dict]:
+    """The request of the structured completion: the conversation so far (text only) and the brief."""
+    messages = [{"role": "system", "content": PLAN_PROMPT[language]}]
+    for message in conversation or []:
+        if message.get("role") in ("user", "assistant") and message.get("content") and not message.get("tool_calls"):
+            messages.append({"role": message["role"], "content": message["content"]})
+    messages.append({"role": "user", "content": brief})
+    return messages
+
+
+def parse_plan(text: str, language: str = "en") -> dict:
+    """The ``week -> day block -> block`` plan of a structured answer; ValueError if it is not a valid plan."""
+    week_key, day_key, (topic, subtopics, goal) = PLAN_KEYS[language]
+    try:
+        weeks = json.loads(text)["weeks"]
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"the answer is not a structured study plan ({e})") from None
+    plan = {}
+    for number, week in enumerate(weeks, 1):
+        days = {}
+        for index, block in enumerate(week.get("days") or [], 1):
+            key = re.sub(r"\s+", "", str(block.get("day_block") or ""))
+            if not DAY_KEY.match(key) or key in days:
+                key = f"{day_key}{index}"
+            days[key] = {topic: block.get("topic"), subtopics: block.get("subtopics"), goal: block.get("goal")}
+        plan[f"{week_key}{number}"] = days
+    errors = validate_plan(plan)
+    if errors:
+        raise ValueError("invalid study plan: " + "; ".join(f"{e.week}/{e.day or '*'}: {e.reason}" for e in errors[:10]))
+    return plan
+
+
+def _label(key: str) -> str:
+    # "days1and2" -> "Days 1 and 2", "semana3" -> "Semana 3"
+    return re.sub(r"(?<=\D)(?=\d)|(?<=\d)(?=\D)", " ", key).capitalize()
+
+
+def render_plan(plan: dict) -> str:
+    """Markdown preview of a plan, rendered locally instead of written by the model."""
+    lines = []
+    for week, days in plan.items():
+        lines.append(f"**{_label(week)}**")
+        for day, block in days.items():
+            language = "en" if "topic" in block else "pt"
+            topic, subtopics, goal = PLAN_KEYS[language][2]
+            line = f"- {_label(day)}: {block[topic]}"
+            if block[subtopics]:
+                line += f" ({', '.join(block[subtopics])})"
+            lines.append(f"{line}. {_GOAL_LABEL[language]}: {block[goal]}")
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+
+def plan_outline(plan: dict, max_chars: int = 1500) -> str:
+    """One line of topics per week, short enough to stay pinned in the conversation memory."""
+    lines = []
+    for week, days in plan.items():
+        topics = [block.get("topic") or block.get("topico") for block in days.values() if isinstance(block, dict)]
+        lines.append(f"{_label(week)}: {'; '.join(t for t in topics if t)}")
+    text = "\n".join(lines)
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit("\n", 1)[0] + f"\n... ({len(plan)} weeks in total)"
@@ -0,0 +1,177 @@
+# author: Jairo Monassa
+"""``save_study_plan_to_json`` as a Semantic Kernel plugin for the Chainlit apps.
+
+Planning_Agent is told to call this tool after generating the plan. The
+plugin validates the plan and stores a new version in the
+``PlanRepository``. The file write runs in a worker thread, so saving a large
+plan never stalls the event loop that streams the other students' answers.
+
+The kernel is shared by every session, so the student is not a constructor
+argument: the apps set ``current_student`` before invoking the agents and
+the value follows the turn into the nested plugin calls.
+
+``StructuredStudyPlanPlugin`` (``structured_mode``) adds
+``create_study_plan``: Planning_Agent only passes a brief of what it learned
+from the student, the plan is generated with one structured-output
+completion (``structured_plan``) and saved, so the agent no longer writes the
+plan as text and again as tool arguments. When the app sets
+``plan_listener``, the rendered plan goes straight to it (the student's
+answer) and the agents only get a short result, instead of writing the plan
+out again on its way back through Planning_Agent and Main_Tutor_Agent.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from contextvars import ContextVar
+from typing import Annotated, Awaitable, Callable
+
+from semantic_kernel.contents import ChatHistory
+from semantic_kernel.functions import kernel_function
+
+from conversation_memory import PLAN_PIN, pin_context, unpin_context
+from plan_repository import PlanRepository, get_repository
+from structured_plan import CREATE_TOOL_NAME, PLAN_PROMPT, RESPONSE_FORMAT, parse_plan, plan_outline, render_plan
+from study_plan_stream import WRAPPER_KEY, validate_plan
+
+logger = logging.getLogger(__name__)
+
+STUDY_PLAN_PLUGIN_NAME = "StudyPlan"
+
+current_student: ContextVar[str] = ContextVar("current_student", default="anonymous")
+# Shows the rendered plan of create_study_plan to the student (set per turn by the apps)
+plan_listener: ContextVar[Callable[[str], Awaitable[None]] | None] = ContextVar("plan_listener", default=None)
+
+
+class StudyPlanPlugin:
+    """Kernel plugin that validates and stores study plans off the event loop.
+
+    Args:
+        repository: Where plans are stored (the process-wide one by default).
+        max_concurrent_writes: Saves running in worker threads at once
+            (``PLAN_SAVE_CONCURRENCY``, default 2). Encoding a plan holds the GIL,
+            so a burst of parallel writers would still starve the event loop;
+            extra saves wait on the loop instead.
+    """
+
+    def __init__(self, repository: PlanRepository | None = None, max_concurrent_writes: int | None = None):
+        self._repository = repository
+        if max_concurrent_writes is None:
+            max_concurrent_writes = int(os.getenv("PLAN_SAVE_CONCURRENCY", 2))
+        self._writes = asyncio.Semaphore(max_concurrent_writes)
+
+    @property
+    def repository(self) -> PlanRepository:
+        # Resolved on first save so importing the apps does not open the index
+        if self._repository is None:
+            self._repository = get_repository()
+        return self._repository
+
+    @kernel_function(
+        name="save_study_plan_to_json",
+        description=(
+            "Save the generated structured study plan as the student's current plan. "
+            "Call it ONLY AFTER gathering the student's information and generating the plan."
+        ),
+    )
+    async def save_study_plan_to_json(
+        self,
+        study_plan: Annotated[
+            dict | str,
+            "The study plan JSON object: keys 'week1', 'week2', ...; inside each week, day block keys "
+            "like 'days1and2', 'day3'; each day block has 'topic' (string), 'subtopics' (array of "
+            "strings) and 'goal' (string).",
+        ],
+    ) -> str:
+        if isinstance(study_plan, str):
+            try:
+                study_plan = json.loads(study_plan)
+            except json.JSONDecodeError as e:
+                return f"Error: the study plan is not valid JSON ({e.msg}). Send it again as a JSON object."
+        student = current_student.get()
+        try:
+            async with self._writes:
+                result = await asyncio.to_thread(self._validate_and_save, student, study_plan)
+        except Exception as e:
+            logger.exception(f"Could not save the study plan of {student}")
+            return f"Error saving the study plan: {e}"
+        if not result.startswith("Error"):
+            pin_plan(study_plan)
+        return result
+
+    def _validate_and_save(self, student: str, study_plan) -> str:
+        """Worker-thread part: validating a year-long plan is CPU work too."""
+        if isinstance(study_plan, dict) and set(study_plan) == {WRAPPER_KEY}:
+            study_plan = study_plan[WRAPPER_KEY]
+        errors = validate_plan(study_plan)
+        if errors:
+            details = "; ".join(f"{e.week}/{e.day or '*'}: {e.reason}" for e in errors[:10])
+            return f"Error: the study plan is invalid ({details}). Fix these blocks and call the tool again."
+        record = self.repository.save(student, study_plan)
+        return f"Study plan saved successfully (version {record.version})."
+
+
+class StructuredStudyPlanPlugin(StudyPlanPlugin):
+    """``StudyPlanPlugin`` that also generates the plan itself, with structured output.
+
+    Args:
+        service: Chat service of Planning_Agent's model tier.
+        repository: See ``StudyPlanPlugin``.
+        max_concurrent_writes: See ``StudyPlanPlugin``.
+    """
+
+    def __init__(self, service, repository: PlanRepository | None = None, max_concurrent_writes: int | None = None):
+        super().__init__(repository, max_concurrent_writes)
+        self.service = service
+
+    @kernel_function(
+        name=CREATE_TOOL_NAME,
+        description=(
+            "Generate the student's structured study plan from a brief of their information, save it as the "
+            "student's current plan and return it rendered for the student. "
+            "Call it ONLY AFTER gathering the student's information."
+        ),
+    )
+    async def create_study_plan(
+        self,
+        brief: Annotated[
+            str,
+            "What the plan must fit: subject, weekly availability, deadline or milestone, level, goals and "
+            "the adjustments the student asked for.",
+        ],
+    ) -> str:
+        history = ChatHistory(system_message=PLAN_PROMPT["en"])
+        history.add_user_message(brief)
+        settings = self.service.get_prompt_execution_settings_class()(response_format=RESPONSE_FORMAT)
+        student = current_student.get()
+        try:
+            response = await self.service.get_chat_message_content(chat_history=history, settings=settings)
+            plan = parse_plan(str(response.content) if response is not None else "")
+        except ValueError as e:
+            return f"Error: {e}. Call the tool again."
+        except Exception as e:
+            logger.exception(f"Could not generate the study plan of {student}")
+            return f"Error generating the study plan: {e}"
+        try:
+            async with self._writes:
+                result = await asyncio.to_thread(self._validate_and_save, student, plan)
+        except Exception as e:
+            logger.exception(f"Could not save the study plan of {student}")
+            return f"Error saving the study plan: {e}"
+        if result.startswith("Error"):
+            return result
+        pin_plan(plan)
+        listener = plan_listener.get()
+        if listener is None:
+            return f"{render_plan(plan)}\n\n{result}"
+        await listener(render_plan(plan))
+        return f"{result} The student already sees the plan."
+
+
+def pin_plan(study_plan: dict) -> None:
+    """Pin the saved plan in the turn's conversation memory, replacing the previous one."""
+    if set(study_plan) == {WRAPPER_KEY}:
+        study_plan = study_plan[WRAPPER_KEY]
+    unpin_context(PLAN_PIN)
+    pin_context(PLAN_PIN, "Current study plan of the student (saved):\n" + plan_outline(study_plan))
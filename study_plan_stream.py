@@ -0,0 +1,337 @@
+# author: Jairo Monassa
+"""Incremental parsing and validation of a streamed study plan.
+
+The plan arrives as the ``arguments`` string of one tool call, fragment by
+fragment. ``StudyPlanParser.feed()`` scans each fragment once, keeping only the
+text of the block that is still open, and validates every day block as soon
+as its closing brace arrives:
+
+    {"week1": {"days1and2": {"topic": "...", "subtopics": ["..."], "goal": "..."}, ...}, ...}
+
+Both the English keys of the Chainlit agents (week/day, topic/subtopics/goal)
+and the Portuguese ones of ``agent_planning.py`` (semana/dia,
+topico/subtopicos/meta) are accepted, with or without the ``study_plan``
+wrapper of the tool schema.
+
+Valid blocks are reported as ``PlanBlock`` / ``PlanWeek`` events so a UI can
+render the plan week by week, a block with the wrong shape as ``BlockError``
+(the stream goes on), and broken JSON raises ``PlanSyntaxError`` right away so
+the caller can stop the generation and ask only for the rest of the plan.
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+
+WEEK_KEY = re.compile(r"^(week|semana)\s*_?\d+$", re.IGNORECASE)
+DAY_KEY = re.compile(r"^(days?|dias?)\s*_?\d", re.IGNORECASE)
+BLOCK_FIELDS = (("topic", "subtopics", "goal"), ("topico", "subtopicos", "meta"))
+WRAPPER_KEY = "study_plan"
+EMPTY_PLAN = "plan is not a non-empty object"
+NOT_A_WEEK = "week is not an object with day blocks"
+NOT_A_BLOCK = "day block is not an object"
+
+_TOKEN = re.compile(r'["{}\[\],:]')
+_STRING_STOP = re.compile(r'["\\]')
+
+
+@dataclass
+class PlanBlock:
+    week: str
+    day: str
+    block: dict
+
+
+@dataclass
+class PlanWeek:
+    week: str
+    days: dict
+
+
+@dataclass
+class BlockError:
+    week: str
+    day: str | None
+    reason: str
+
+
+class PlanSyntaxError(ValueError):
+    """The arguments stopped being valid JSON; ``after`` is the last valid (week, day)."""
+
+    def __init__(self, reason: str, after: tuple[str, str] | None):
+        super().__init__(reason)
+        self.reason = reason
+        self.after = after
+
+
+def validate_block(block) -> str | None:
+    """Reason why a day block does not match {topic, subtopics, goal}, or None."""
+    if not isinstance(block, dict):
+        return NOT_A_BLOCK
+    for topic, subtopics, goal in BLOCK_FIELDS:
+        if topic in block or subtopics in block or goal in block:
+            break
+    missing = [key for key in (topic, subtopics, goal) if key not in block]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    if not isinstance(block[topic], str) or not block[topic].strip():
+        return f"'{topic}' must be a non-empty string"
+    if not isinstance(block[subtopics], list) or not all(isinstance(s, str) for s in block[subtopics]):
+        return f"'{subtopics}' must be a list of strings"
+    if not isinstance(block[goal], str) or not block[goal].strip():
+        return f"'{goal}' must be a non-empty string"
+    return None
+
+
+def validate_plan(plan) -> list[BlockError]:
+    """Every problem of a complete plan dict (the non-streaming counterpart of the parser)."""
+    if not isinstance(plan, dict) or not plan:
+        return [BlockError("*", None, EMPTY_PLAN)]
+    errors = []
+    for week, days in plan.items():
+        if not WEEK_KEY.match(week):
+            errors.append(BlockError(week, None, f"'{week}' is not a week key"))
+        elif not isinstance(days, dict) or not days:
+            errors.append(BlockError(week, None, NOT_A_WEEK))
+        else:
+            for day, block in days.items():
+                reason = f"'{day}' is not a day key" if not DAY_KEY.match(day) else validate_block(block)
+                if reason:
+                    errors.append(BlockError(week, day, reason))
+    return errors
+
+
+# Object states: waiting for a key, for ':', for a value, or for ',' / '}'
+_KEY, _COLON, _VALUE, _AFTER = range(4)
+
+
+@dataclass
+class _Frame:
+    is_object: bool
+    start: int
+    name: str | None
+    key: str | None = None
+    state: int = _KEY
+    scalar: bool = False  # the current value is a string/number, not an object
+
+
+@dataclass
+class StudyPlanParser:
+    """Streaming parser of one study plan tool call (see module docstring)."""
+
+    plan: dict = field(default_factory=dict)
+    errors: list[BlockError] = field(default_factory=list)
+    wrapped: bool = False
+    done: bool = False
+    last_block: tuple[str, str] | None = None
+    chars: int = 0
+
+    def __post_init__(self):
+        self._text = ""
+        self._pos = 0
+        self._stack: list[_Frame] = []
+        self._in_string = False
+        self._string_start = 0
+        self._base: int | None = None  # 1 when the plan is wrapped in {"study_plan": ...}
+
+    def feed(self, fragment: str) -> list:
+        """Consume the next fragment; returns the PlanBlock/PlanWeek/BlockError events it completed."""
+        self.chars += len(fragment)
+        self._text += fragment
+        events = []
+        self._scan(events)
+        self._compact()
+        return events
+
+    def close(self, continuation: bool = False) -> dict:
+        """Check the arguments ended with a complete object and return them (same shape as sent).
+
+        A plan without any week is recorded as an error, as ``validate_plan``
+        reports it, unless it continues another plan (``merge``), which may
+        have nothing left to add.
+        """
+        if not self.done:
+            raise PlanSyntaxError("arguments ended before the plan was complete", self.last_block)
+        if not continuation:
+            self.require_plan()
+        return self.arguments()
+
+    def require_plan(self) -> None:
+        """Record an empty plan (``{}``, ``{"study_plan": {}}``) as a BlockError."""
+        if not self.plan and not self.errors:
+            self.errors.append(BlockError("*", None, EMPTY_PLAN))
+
+    def arguments(self) -> dict:
+        """Validated part of the plan, wrapped like the model sent it."""
+        return {WRAPPER_KEY: self.plan} if self.wrapped else self.plan
+
+    def merge(self, other: "StudyPlanParser") -> None:
+        """Add the valid blocks of a repair/continuation answer to this plan."""
+        for week, days in other.plan.items():
+            self.plan.setdefault(week, {}).update(days)
+        self.errors = [
+            e for e in self.errors
+            if e.week not in other.plan or (e.day is not None and e.day not in other.plan[e.week])
+        ]
+
+    # --- scanning ---
+    def _scan(self, events: list) -> None:
+        text = self._text
+        pos = self._pos
+        end = len(text)
+        stack = self._stack
+        while pos < end:
+            if self._in_string:
+                match = _STRING_STOP.search(text, pos)
+                if match is None:
+                    pos = end
+                    break
+                pos = match.start()
+                if match.group() == "\\":
+                    if pos + 1 >= end:
+                        break  # wait for the escaped character
+                    pos += 2
+                    continue
+                self._in_string = False
+                pos += 1
+                frame = stack[-1] if stack else None
+                if frame is not None and frame.is_object:
+                    if frame.state == _KEY:
+                        frame.key = json.loads(text[self._string_start:pos])
+                        frame.state = _COLON
+                    else:
+                        frame.state = _AFTER
+                        frame.scalar = True
+                continue
+
+            match = _TOKEN.search(text, pos)
+            if match is None:
+                pos = end
+                break
+            char = match.group()
+            pos = match.end()
+            frame = stack[-1] if stack else None
+            if char == '"':
+                if frame is not None and frame.is_object and frame.state not in (_KEY, _VALUE):
+                    self._syntax("expected ':'" if frame.state == _COLON else "expected ',' or '}'")
+                self._in_string = True
+                self._string_start = match.start()
+            elif char in "{[":
+                if frame is None and self.done:
+                    self._syntax("unexpected data after the plan")
+                if frame is None and char == "[":
+                    self._syntax("the plan is not an object")
+                if frame is not None and frame.is_object:
+                    if frame.state != _VALUE:
+                        self._syntax(f"unexpected '{char}'")
+                    frame.state = _AFTER
+                    frame.scalar = False
+                if self._base is None and len(stack) == 1 and char == "{":
+                    self.wrapped = frame.key == WRAPPER_KEY
+                    self._base = 1 if self.wrapped else 0
+                stack.append(_Frame(is_object=char == "{", start=match.start(),
+                                    name=frame.key if frame is not None and frame.is_object else None))
+            elif char in "}]":
+                if frame is None or frame.is_object != (char == "}"):
+                    self._syntax(f"unexpected '{char}'")
+                if frame.is_object and frame.state in (_COLON, _KEY) and frame.key is not None:
+                    self._syntax(f"unexpected '{char}'")
+                self._check_value(frame, events)
+                stack.pop()
+                self._closed(frame, text, match.end(), events)
+                if stack and stack[-1].is_object:
+                    stack[-1].state = _AFTER
+            elif char == ":":
+                if frame is None or not frame.is_object or frame.state != _COLON:
+                    self._syntax("unexpected ':'")
+                frame.state = _VALUE
+            else:  # ","
+                if frame is None or frame.is_object and frame.state not in (_VALUE, _AFTER):
+                    self._syntax("unexpected ','")
+                self._check_value(frame, events)
+                if frame.is_object:
+                    frame.state = _KEY
+                    frame.key = None
+        self._pos = pos
+
+    def _check_value(self, frame: _Frame, events: list) -> None:
+        """A scalar where the plan expects a week or day object."""
+        if frame.is_object and frame.key is not None and (frame.scalar or frame.state == _VALUE):
+            level = len(self._stack) - 1 - (self._base or 0)
+            error = None
+            if level == 0:
+                error = BlockError(frame.key, None, NOT_A_WEEK)
+            elif level == 1:
+                error = BlockError(frame.name, frame.key, NOT_A_BLOCK)
+            if error is not None:
+                self.errors.append(error)
+                events.append(error)
+        frame.scalar = False
+
+    def _closed(self, frame: _Frame, text: str, end: int, events: list) -> None:
+        base = self._base or 0
+        level = len(self._stack) - base  # 0: the plan, 1: a week, 2: a day block
+        if len(self._stack) == 0:
+            self.done = True
+        if level < 1 or not self._stack[-1].is_object:
+            return  # the plan itself, or inside an array that is reported when it closes
+        if not frame.is_object:
+            # An array where the plan expects a week or a day block; arrays deeper in a block are its fields
+            if level == 1:
+                error = BlockError(frame.name, None, f"'{frame.name}' is not a week key"
+                                   if not WEEK_KEY.match(frame.name or "") else NOT_A_WEEK)
+            elif level == 2:
+                error = BlockError(self._stack[-1].name, frame.name, NOT_A_BLOCK)
+            else:
+                return
+            self.errors.append(error)
+            events.append(error)
+            return
+        if level == 2:
+            week, day = self._stack[-1].name, frame.name
+            try:
+                block = json.loads(text[frame.start:end])
+            except json.JSONDecodeError as e:
+                self._syntax(f"invalid JSON in {week}/{day}: {e.msg}")
+            reason = None
+            if not WEEK_KEY.match(week or ""):
+                reason = f"'{week}' is not a week key"
+            elif not DAY_KEY.match(day or ""):
+                reason = f"'{day}' is not a day key"
+            else:
+                reason = validate_block(block)
+            if reason:
+                error = BlockError(week, day, reason)
+                self.errors.append(error)
+                events.append(error)
+                return
+            self.plan.setdefault(week, {})[day] = block
+            self.last_block = (week, day)
+            events.append(PlanBlock(week, day, block))
+        elif level == 1:
+            week = frame.name
+            if week in self.plan:
+                events.append(PlanWeek(week, self.plan[week]))
+            elif not any(e.week == week for e in self.errors):
+                error = BlockError(week, None, NOT_A_WEEK)
+                self.errors.append(error)
+                events.append(error)
+
+    def _syntax(self, reason: str):
+        raise PlanSyntaxError(reason, self.last_block)
+
+    def _compact(self) -> None:
+        """Drop scanned text nobody needs: only an open day block is parsed again on close."""
+        keep = self._pos
+        depth = len(self._stack) - (self._base or 0)
+        if depth >= 3:
+            keep = self._stack[(self._base or 0) + 2].start
+        if self._in_string:
+            keep = min(keep, self._string_start)
+        if keep <= 0:
+            return
+        self._text = self._text[keep:]
+        self._pos -= keep
+        self._string_start -= keep
+        for frame in self._stack:
+            frame.start -= keep
@@ -0,0 +1,167 @@
+# author: Jairo Monassa
+"""Durable, bounded storage for the students' conversation threads.
+
+Threads used to live only in ``cl.user_session``, so a restart lost every
+conversation and idle students kept their whole history in memory for the
+15-day session timeout. ``ThreadCache`` keeps only the recently active threads
+in an in-memory LRU, persists each thread after every turn to a pluggable
+``ThreadStore`` (SQLite by default) and lazily rehydrates evicted threads on
+the student's next message.
+
+Threads are keyed by the Chainlit thread id, which the browser sends again
+when it reconnects after a restart.
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Protocol
+
+from semantic_kernel.agents import ChatHistoryAgentThread
+from semantic_kernel.contents import ChatHistory
+
+from conversation_memory import ConversationMemory
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadStore(Protocol):
+    """Blocking key/value store of serialized chat histories."""
+
+    def load(self, key: str) -> str | None:
+        ...
+
+    def save(self, key: str, data: str) -> None:
+        ...
+
+    def delete(self, key: str) -> None:
+        ...
+
+
+class SQLiteThreadStore:
+    """One row per thread in a local SQLite file (WAL mode, one shared connection)."""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS threads (key TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM threads WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, key: str, data: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO threads (key, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (key, data, time.time()),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM threads WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class ThreadEntry:
+    """A live thread plus the memory that backs its chat history."""
+
+    thread: ChatHistoryAgentThread
+    memory: ConversationMemory
+
+
+class ThreadCache:
+    """LRU of live threads in front of a ``ThreadStore``.
+
+    Store calls run in a worker thread so SQLite I/O never blocks the event loop.
+    """
+
+    def __init__(self, store: ThreadStore, new_memory: Callable[[], ConversationMemory], capacity: int = 500):
+        self.store = store
+        self.new_memory = new_memory
+        self.capacity = capacity
+        self._entries: OrderedDict[str, ThreadEntry] = OrderedDict()
+        self._loading: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.rehydrated = 0
+        self.created = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> ThreadEntry:
+        """Return the live thread for ``key``, rehydrating or creating it if needed."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        # Two messages of the same student arriving together share one load
+        loading = self._loading.get(key)
+        if loading is not None:
+            return await loading
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        try:
+            entry = await self._load(key)
+            self._put(key, entry)
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._loading[key]
+
+    async def _load(self, key: str) -> ThreadEntry:
+        memory = self.new_memory()
+        data = await asyncio.to_thread(self.store.load, key)
+        if data is not None:
+            memory.messages = ChatHistory.restore_chat_history(data).messages
+            self.rehydrated += 1
+        else:
+            self.created += 1
+        return ThreadEntry(thread=ChatHistoryAgentThread(chat_history=memory, thread_id=key), memory=memory)
+
+    def _put(self, key: str, entry: ThreadEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            # Already persisted after its last turn, so eviction only frees memory
+            self._entries.popitem(last=False)
+
+    async def save(self, key: str, entry: ThreadEntry) -> None:
+        """Persist the thread after a turn."""
+        data = ChatHistory(messages=list(entry.memory.messages)).serialize()
+        await asyncio.to_thread(self.store.save, key, data)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+        await asyncio.to_thread(self.store.delete, key)
+
+
+def build_thread_cache(new_memory: Callable[[], ConversationMemory]) -> ThreadCache:
+    """Thread cache from ``THREAD_STORE_PATH`` and ``THREAD_CACHE_SIZE``."""
+    store = SQLiteThreadStore(os.getenv("THREAD_STORE_PATH", os.path.join("sessions", "threads.db")))
+    return ThreadCache(store, new_memory, capacity=int(os.getenv("THREAD_CACHE_SIZE", 500)))
@@ -0,0 +1,36 @@
+# author: Jairo Monassa
+"""Cheap prompt-token estimates shared by the routing, memory and metrics code.
+
+No tokenizer is bundled; about 4 characters per token is close enough for
+English/Portuguese prompts to compare budgets and report savings.
+"""
+
+CHARS_PER_TOKEN = 4
+# Role/name framing the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str | None) -> int:
+    """Rough token count of ``text``."""
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def message_text(message) -> str:
+    """Everything of a ``ChatMessageContent`` that is sent to the model: text, tool calls and results."""
+    parts = []
+    for item in getattr(message, "items", None) or []:
+        for attribute in ("text", "arguments", "result"):
+            value = getattr(item, attribute, None)
+            if value:
+                parts.append(value if isinstance(value, str) else str(value))
+                break
+    if not parts and getattr(message, "content", None):
+        parts.append(str(message.content))
+    return " ".join(parts)
+
+
+def estimate_message_tokens(messages) -> int:
+    """Rough token count of a list of ``ChatMessageContent``."""
+    return sum(MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message_text(message)) for message in messages)
@@ -0,0 +1,219 @@
+# author: Jairo Monassa
+"""Per-turn selection of the specialists Main_Tutor_Agent can forward to.
+
+Every specialist is a tool of Main_Tutor_Agent with its full instructions as
+the description, plus a forward rule in the main instructions: a fixed
+prompt-token tax on each message, even mid-quiz when only the quiz and
+progress agents matter. ``ToolSelector`` picks the subset that can matter
+this turn from the conversation state, and the registry serves the main
+agent variant that offers only those (``AgentRegistry.main_agent_for``):
+
+- the safety agents (bullying, self-harm, burnout, conflicts) are always in;
+- agents whose topic words appear in the message;
+- agents that answered, or were forwarded to, in the last turns of the thread;
+- the quiz and progress agents while the student has an ungraded quiz;
+- ``DEFAULT_AGENTS`` when nothing else points anywhere.
+
+Settings: ``TOOL_SELECTION`` ("on"/"off") and ``TOOL_SELECTION_TURNS`` (how
+many recent turns keep an agent in, default 3).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from semantic_kernel.contents import ChatMessageContent, FunctionCallContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+
+from agent_registry import (
+    EVALUATION_CONTENT_AGENT_NAME,
+    MOTIVATION_AGENT_NAME,
+    PLANNING_AGENT_NAME,
+    PROGRESS_MONITORING_AGENT_NAME,
+    SAFETY_AGENTS,
+    SIMULATION_AGENT_NAME,
+    AgentRegistry,
+    main_agent_instructions,
+    offered_plugins,
+)
+from quiz_engine import get_quiz_store
+from token_counting import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Words that make a specialist worth offering; looser than the router's rules,
+# since offering one too many only costs its schema
+TOPIC_PATTERNS = {
+    MOTIVATION_AGENT_NAME: [
+        r"\b(motivat\w*|unmotivated|bored|lazy|procrastinat\w*|give up|giving up|quit)\b",
+        r"\bwhat'?s the point\b",
+        r"\b(desmotivad\w*|pregui[cç]a|desistir)\b",
+    ],
+    PLANNING_AGENT_NAME: [
+        r"\b(plan|plans|planning|schedule|timetable|calendar|routine|organi[sz]e|deadline)\b",
+        r"\b(exam|exams|test|tests|certification) (is |in |on |next )",
+        r"\b(hours?|days?) (a|per|each) (day|week)\b",
+        r"\b(plano|cronograma|rotina)\b",
+    ],
+    SIMULATION_AGENT_NAME: [
+        r"\b(quiz\w*|mock|practice|simulation|questions?|exercises?)\b",
+        r"\btest (me|my)\b",
+        r"^\s*1\s*[-:.)=]?\s*\(?[A-Ha-h]\b",  # answers to a quiz ("1-A, 2-C")
+        r"\b(simulado|quest[õo]es|exerc[íi]cios?)\b",
+    ],
+    PROGRESS_MONITORING_AGENT_NAME: [
+        r"\b(progress|scores?|results?|grades?|performance)\b",
+        r"\bhow (am i|i am|i'm) doing\b",
+        r"\b(progresso|desempenho|notas?)\b",
+    ],
+    EVALUATION_CONTENT_AGENT_NAME: [
+        r"\b(evaluate|feedback|essay|proofread|my (text|writing|answer))\b",
+        r"\b(correct|review|check) (my|this)\b",
+        r"\b(texto|reda[cç][aã]o|avalie|corrija)\b",
+    ],
+}
+
+# Offered when neither the message, the thread nor a pending quiz points anywhere:
+# the tutor watches the student's mood, and most sessions come for a plan
+DEFAULT_AGENTS = [MOTIVATION_AGENT_NAME, PLANNING_AGENT_NAME]
+
+# The specialists an ungraded quiz keeps in
+QUIZ_AGENTS = [SIMULATION_AGENT_NAME, PROGRESS_MONITORING_AGENT_NAME]
+
+
+@dataclass
+class ToolSelection:
+    """The specialists offered this turn, with why each one is in."""
+
+    agents: list[str]
+    reasons: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class SelectionStats:
+    """How many specialists the selector offered, and the prompt tokens that saved."""
+
+    turns: int = 0
+    offered: int = 0
+    available: int = 0
+    by_reason: Counter = field(default_factory=Counter)
+    prompt_tokens_full: int = 0
+    prompt_tokens_selected: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.prompt_tokens_full - self.prompt_tokens_selected
+
+    def as_dict(self) -> dict:
+        return {
+            "turns": self.turns,
+            "offered_per_turn": round(self.offered / self.turns, 2) if self.turns else 0.0,
+            "available_per_turn": round(self.available / self.turns, 2) if self.turns else 0.0,
+            "by_reason": dict(self.by_reason),
+            # Per Main_Tutor_Agent request: instructions plus tool schemas
+            "prompt_tokens_per_turn": round(self.prompt_tokens_selected / self.turns, 1) if self.turns else 0.0,
+            "tokens_saved_per_turn": round(self.tokens_saved / self.turns, 1) if self.turns else 0.0,
+        }
+
+
+def recent_agents(messages: list[ChatMessageContent], available: Iterable[str], turns: int) -> list[str]:
+    """Specialists that answered, or were forwarded to, in the last ``turns`` student turns."""
+    available = set(available)
+    found: list[str] = []
+    seen_turns = 0
+    for message in reversed(messages):
+        if message.role == AuthorRole.USER:
+            seen_turns += 1
+            if seen_turns >= turns:
+                break
+            continue
+        names = [message.name] + [item.plugin_name for item in message.items if isinstance(item, FunctionCallContent)]
+        for name in names:
+            if name in available and name not in found:
+                found.append(name)
+    return found
+
+
+class ToolSelector:
+    """Picks the specialists Main_Tutor_Agent offers for one turn."""
+
+    def __init__(self, patterns: dict[str, list[str]] | None = None, turns: int = 3):
+        patterns = TOPIC_PATTERNS if patterns is None else patterns
+        self.patterns = {
+            agent: [re.compile(pattern, re.IGNORECASE) for pattern in agent_patterns]
+            for agent, agent_patterns in patterns.items()
+        }
+        self.turns = turns
+        self.stats = SelectionStats()
+        self._prompt_tokens: dict[tuple[str, ...], int] = {}
+        self._lock = threading.Lock()
+
+    def select(
+        self,
+        message: str,
+        history: list[ChatMessageContent],
+        registry: AgentRegistry,
+        pending_quiz: bool = False,
+    ) -> ToolSelection:
+        """The specialists of ``registry`` to offer for ``message``, in roster order."""
+        available = list(registry.agents)
+        reasons: dict[str, str] = {name: "safety" for name in SAFETY_AGENTS if name in available}
+
+        def add(names: Iterable[str], reason: str) -> None:
+            for name in names:
+                if name in available and name not in reasons:
+                    reasons[name] = reason
+
+        add((agent for agent, patterns in self.patterns.items() if any(p.search(message) for p in patterns)), "message")
+        add(recent_agents(history, available, self.turns), "thread")
+        if pending_quiz:
+            add(QUIZ_AGENTS, "quiz")
+        if all(reason == "safety" for reason in reasons.values()):
+            add(DEFAULT_AGENTS, "default")
+        selection = ToolSelection(agents=[name for name in available if name in reasons], reasons=reasons)
+        logger.debug("Offering %s", reasons)
+        full = self.prompt_tokens(registry, available)
+        selected = self.prompt_tokens(registry, selection.agents)
+        with self._lock:
+            self.stats.turns += 1
+            self.stats.offered += len(selection.agents)
+            self.stats.available += len(available)
+            self.stats.by_reason.update(selection.reasons.values())
+            self.stats.prompt_tokens_full += full
+            self.stats.prompt_tokens_selected += selected
+        return selection
+
+    async def select_turn(
+        self, message: str, history: list[ChatMessageContent], student: str, registry: AgentRegistry
+    ) -> ToolSelection:
+        """``select`` with the student's pending quiz looked up in the quiz store."""
+        pending = await asyncio.to_thread(get_quiz_store().pending_quiz, student)
+        return self.select(message, history, registry, pending_quiz=pending is not None)
+
+    def prompt_tokens(self, registry: AgentRegistry, specialists: list[str]) -> int:
+        """Estimated instruction and tool-schema tokens of Main_Tutor_Agent offering ``specialists``."""
+        key = tuple(specialists)
+        tokens = self._prompt_tokens.get(key)
+        if tokens is None:
+            from semantic_kernel.connectors.ai.function_calling_utils import (
+                kernel_function_metadata_to_function_call_format,
+            )
+
+            metadata = registry.kernel.get_list_of_function_metadata({"included_plugins": offered_plugins(specialists)})
+            schemas = [kernel_function_metadata_to_function_call_format(m) for m in metadata]
+            tokens = estimate_tokens(main_agent_instructions(specialists)) + estimate_tokens(json.dumps(schemas))
+            self._prompt_tokens[key] = tokens
+        return tokens
+
+
+def build_tool_selector() -> ToolSelector | None:
+    """Tool selector from the environment, None when ``TOOL_SELECTION`` is "off"."""
+    if os.getenv("TOOL_SELECTION", "on").lower() == "off":
+        return None
+    return ToolSelector(turns=int(os.getenv("TOOL_SELECTION_TURNS", 3)))
@@ -0,0 +1,139 @@
+# author: Jairo Monassa
+"""Rank the agents by latency and token spend from the ``tracing`` JSONL file.
+
+For each agent: turns it answered and the route that chose it, p50/p95 of
+its turn latency and time to first token, p95 of its calls as a plugin of
+Main_Tutor_Agent, and the prompt/completion tokens of its completions
+(optionally priced per million tokens). A second table splits the turns'
+wall time into screening, model, tools and websocket, and the cancelled
+turns are counted with the answer tokens their cancellation saved.
+
+    python trace_report.py sessions/traces.jsonl --sort tokens --price-prompt 0.15 --price-completion 0.6
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+
+
+def load_spans(path: str, since: float | None = None) -> list[dict]:
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                span = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if since is None or span["start"] >= since:
+                spans.append(span)
+    return spans
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def ms(value: float | None) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+
+def agent_table(spans: list[dict]) -> list[dict]:
+    rows = defaultdict(lambda: {"turns": 0, "routes": Counter(), "latency": [], "ttft": [], "calls": [],
+                                "completions": 0, "prompt": 0, "completion": 0})
+    for span in spans:
+        agent = span.get("agent") or "(none)"
+        row = rows[agent]
+        if span["kind"] == "turn":
+            row["turns"] += 1
+            row["routes"][(span.get("attributes") or {}).get("route", "?")] += 1
+            row["latency"].append(span["duration"])
+            if span.get("ttft") is not None:
+                row["ttft"].append(span["ttft"])
+        elif span["kind"] in ("agent", "screening"):
+            row["calls"].append(span["duration"])
+        elif span["kind"] == "completion":
+            row["completions"] += 1
+            row["prompt"] += span["prompt_tokens"]
+            row["completion"] += span["completion_tokens"]
+    return [{"agent": agent, **row} for agent, row in rows.items()]
+
+
+def time_breakdown(spans: list[dict]) -> dict[str, float]:
+    """Wall seconds of turn time per kind of direct child span, summed over turns.
+
+    Concurrent children of one kind (the screening prompts) count once.
+    """
+    children = defaultdict(lambda: defaultdict(list))
+    turns = {span["span_id"]: span for span in spans if span["kind"] == "turn"}
+    for span in spans:
+        if span.get("parent_id") in turns:
+            children[span["parent_id"]][span["kind"]].append((span["start"], span["start"] + span["duration"]))
+
+    totals = defaultdict(float)
+    for turn_id, turn in turns.items():
+        totals["turn"] += turn["duration"]
+        totals["websocket"] += (turn.get("attributes") or {}).get("ui_seconds", 0.0)
+        for kind, intervals in children[turn_id].items():
+            end = float("-inf")
+            for start, stop in sorted(intervals):
+                totals[kind] += max(0.0, stop - max(start, end))
+                end = max(end, stop)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", default=os.getenv("TRACE_FILE", os.path.join("sessions", "traces.jsonl")))
+    parser.add_argument("--sort", choices=["latency", "tokens"], default="latency")
+    parser.add_argument("--since", type=float, help="only spans of the last N minutes")
+    parser.add_argument("--price-prompt", type=float, default=0.0, help="price per 1M prompt tokens")
+    parser.add_argument("--price-completion", type=float, default=0.0, help="price per 1M completion tokens")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        sys.exit(f"No trace file at {args.path}")
+    spans = load_spans(args.path, time.time() - args.since * 60 if args.since else None)
+    if not spans:
+        sys.exit("No spans")
+
+    rows = agent_table(spans)
+    if args.sort == "tokens":
+        rows.sort(key=lambda r: r["prompt"] + r["completion"], reverse=True)
+    else:
+        rows.sort(key=lambda r: percentile(r["latency"] or r["calls"], 0.95) or 0.0, reverse=True)
+    priced = args.price_prompt or args.price_completion
+    total_tokens = sum(r["prompt"] + r["completion"] for r in rows) or 1
+
+    print(f"{len(spans)} spans, {sum(r['turns'] for r in rows)} turns\n")
+    print(f"{'agent':<32} {'turns':>5} {'routes':<24} {'turn p50':>8} {'p95':>7} {'ttft p50':>8} {'p95':>7} "
+          f"{'call p95':>8} {'calls':>5} {'prompt':>9} {'compl':>8} {'share':>6}" + (f" {'cost':>9}" if priced else ""))
+    for r in rows:
+        routes = ",".join(f"{k}:{v}" for k, v in r["routes"].most_common(3))
+        cost = (r["prompt"] * args.price_prompt + r["completion"] * args.price_completion) / 1e6
+        print(f"{r['agent'][:32]:<32} {r['turns']:>5} {routes[:24]:<24} {ms(percentile(r['latency'], .5)):>8} "
+              f"{ms(percentile(r['latency'], .95)):>7} {ms(percentile(r['ttft'], .5)):>8} "
+              f"{ms(percentile(r['ttft'], .95)):>7} {ms(percentile(r['calls'], .95)):>8} {len(r['calls']):>5} "
+              f"{r['prompt']:>9} {r['completion']:>8} {(r['prompt'] + r['completion']) / total_tokens:>6.0%}"
+              + (f" {cost:>9.4f}" if priced else ""))
+
+    totals = time_breakdown(spans)
+    if totals.get("turn"):
+        print("\nwhere the turn time went (direct children of the turns; different kinds can overlap):")
+        for kind in ("screening", "completion", "agent", "tool", "websocket"):
+            if totals.get(kind):
+                print(f"  {kind:<11} {totals[kind]:9.1f}s  {totals[kind] / totals['turn']:6.1%}")
+
+    cancelled = [span["attributes"] for span in spans if span["kind"] == "turn" and "cancelled" in (span.get("attributes") or {})]
+    if cancelled:
+        reasons = Counter(attributes["cancelled"] for attributes in cancelled)
+        print(f"\ncancelled turns: {len(cancelled)} ({', '.join(f'{k}:{v}' for k, v in reasons.most_common())}), "
+              f"~{sum(attributes.get('tokens_saved', 0) for attributes in cancelled)} answer tokens saved")
+
+
+if __name__ == "__main__":
+    main()
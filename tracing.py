@@ -0,0 +1,387 @@
+# author: Jairo Monassa
+"""Per-agent spans, time to first token and token usage of every turn.
+
+A turn of the Chainlit apps becomes a tree of spans:
+
+- ``turn``: the whole ``on_message``, with the chosen route and agent, the
+  time to the first token shown to the student and the time spent pushing
+  tokens to the websocket (and, for a cancelled turn, why and the answer
+  tokens that saved);
+- ``agent`` / ``tool``: every kernel function call, i.e. a specialist agent
+  invoked by Main_Tutor_Agent as a plugin, or a StudyPlan/Quiz function;
+- ``screening``: the wellbeing screening prompts;
+- ``completion``: every chat completion request, with its TTFT and the
+  prompt/completion tokens reported by the API.
+
+Completions are attributed to the agent of the nearest enclosing span, so
+the tokens a specialist spends inside Main_Tutor_Agent's turn count for the
+specialist. Finished spans go to the exporters: a JSONL file written by a
+background thread and, optionally, Prometheus-style aggregates served on
+``/metrics``. ``trace_report.py`` ranks the agents from the JSONL file.
+
+Settings: ``TRACING`` ("on"/"off"), ``TRACE_FILE`` (default
+``sessions/traces.jsonl``, empty for none) and ``TRACE_PROMETHEUS_PORT``.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncGenerator, Iterator
+
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion
+from semantic_kernel.contents import FunctionCallContent
+from semantic_kernel.filters import FunctionInvocationContext
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str
+    trace_id: str
+    parent_id: str | None = None
+    agent: str | None = None
+    span_id: str = field(default_factory=lambda: f"{random.getrandbits(64):016x}")
+    start: float = field(default_factory=time.time)
+    t0: float = field(default_factory=time.perf_counter)
+    duration: float = 0.0
+    ttft: float | None = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    error: str | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    def first_token(self, at: float | None = None) -> None:
+        """Record the time to first token (now, or at ``perf_counter()`` value ``at``)."""
+        if self.ttft is None:
+            self.ttft = (at if at is not None else time.perf_counter()) - self.t0
+
+    def add_usage(self, usage) -> None:
+        """Add a ``CompletionUsage`` (or any object with prompt/completion_tokens)."""
+        self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "kind": self.kind, "agent": self.agent, "start": round(self.start, 6),
+            "duration": round(self.duration, 6), "ttft": None if self.ttft is None else round(self.ttft, 6),
+            "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens,
+            "error": self.error, **({"attributes": self.attributes} if self.attributes else {}),
+        }
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+class JsonlExporter:
+    """Appends one JSON line per span; a daemon thread does the file I/O."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, name="trace-jsonl", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span.to_dict())
+
+    def _write(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+
+class PrometheusExporter:
+    """Aggregates spans into counters and histograms in the Prometheus text format.
+
+    ``serve(port)`` exposes them on ``/metrics`` from a daemon thread.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._durations: dict[tuple, list] = {}
+        self._ttft: dict[tuple, list] = {}
+        self._tokens: dict[tuple, int] = defaultdict(int)
+        self._turns: dict[tuple, int] = defaultdict(int)
+        self._errors: dict[tuple, int] = defaultdict(int)
+        self._cancelled: dict[str, int] = defaultdict(int)
+        self._tokens_saved = 0
+        self._server: ThreadingHTTPServer | None = None
+
+    def _observe(self, histograms: dict, key: tuple, value: float) -> None:
+        # [count, sum, bucket counts...]
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0, 0.0] + [0] * len(self.buckets)
+        histogram[0] += 1
+        histogram[1] += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram[2 + index] += 1
+
+    def export(self, span: Span) -> None:
+        key = (span.kind, span.agent or "")
+        with self._lock:
+            self._observe(self._durations, key, span.duration)
+            if span.ttft is not None:
+                self._observe(self._ttft, key, span.ttft)
+            if span.kind == "completion":
+                self._tokens[(span.agent or "", "prompt")] += span.prompt_tokens
+                self._tokens[(span.agent or "", "completion")] += span.completion_tokens
+            if span.kind == "turn":
+                self._turns[(span.attributes.get("route", ""), span.agent or "")] += 1
+                if "cancelled" in span.attributes:
+                    self._cancelled[span.attributes["cancelled"]] += 1
+                    self._tokens_saved += span.attributes.get("tokens_saved", 0)
+            if span.error:
+                self._errors[key] += 1
+
+    def render(self) -> str:
+        lines = []
+
+        def histogram(name: str, help_text: str, data: dict) -> None:
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} histogram"])
+            for (kind, agent), (count, total, *buckets) in sorted(data.items()):
+                labels = f'kind="{kind}",agent="{agent}"'
+                for bound, value in zip(self.buckets, buckets):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {value}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {count}")
+
+        with self._lock:
+            histogram("tutor_span_seconds", "Span duration by kind and agent.", self._durations)
+            histogram("tutor_ttft_seconds", "Time to first token by kind and agent.", self._ttft)
+            lines.extend(["# HELP tutor_tokens_total Tokens spent per agent.", "# TYPE tutor_tokens_total counter"])
+            for (agent, kind), value in sorted(self._tokens.items()):
+                lines.append(f'tutor_tokens_total{{agent="{agent}",type="{kind}"}} {value}')
+            lines.extend(["# HELP tutor_turns_total Turns by route and agent.", "# TYPE tutor_turns_total counter"])
+            for (route, agent), value in sorted(self._turns.items()):
+                lines.append(f'tutor_turns_total{{route="{route}",agent="{agent}"}} {value}')
+            lines.extend(["# HELP tutor_turns_cancelled_total Cancelled turns by reason.",
+                          "# TYPE tutor_turns_cancelled_total counter"])
+            for reason, value in sorted(self._cancelled.items()):
+                lines.append(f'tutor_turns_cancelled_total{{reason="{reason}"}} {value}')
+            lines.extend(["# HELP tutor_tokens_saved_total Estimated answer tokens not generated by cancelled turns.",
+                          "# TYPE tutor_tokens_saved_total counter", f"tutor_tokens_saved_total {self._tokens_saved}"])
+            lines.extend(["# HELP tutor_span_errors_total Failed spans.", "# TYPE tutor_span_errors_total counter"])
+            for (kind, agent), value in sorted(self._errors.items()):
+                lines.append(f'tutor_span_errors_total{{kind="{kind}",agent="{agent}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> None:
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="trace-metrics", daemon=True).start()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the exporters.
+
+    Args:
+        exporters: Objects with ``export(span)`` (and optionally ``close()``).
+        enabled: When False, spans are still yielded (so call sites need no
+            checks) but nothing is exported.
+    """
+
+    def __init__(self, exporters: list | None = None, enabled: bool = True):
+        self.exporters = list(exporters or [])
+        self.enabled = enabled
+
+    def start(self, name: str, kind: str, agent: str | None = None, **attributes) -> Span:
+        """A span that is not made current; finish it with ``end()``. For leaves like completions."""
+        parent = _current_span.get()
+        return Span(
+            name=name, kind=kind,
+            trace_id=parent.trace_id if parent else f"{random.getrandbits(128):032x}",
+            parent_id=parent.span_id if parent else None,
+            agent=agent or (parent.agent if parent else None),
+            attributes=attributes,
+        )
+
+    def end(self, span: Span, error: BaseException | None = None) -> None:
+        span.duration = time.perf_counter() - span.t0
+        if error is not None and span.error is None:
+            span.error = type(error).__name__
+        if not self.enabled:
+            return
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception:
+                logger.exception(f"Trace exporter {type(exporter).__name__} failed")
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: str, agent: str | None = None, **attributes) -> Iterator[Span]:
+        """Current span for the duration of the block; nested spans become its children."""
+        span = self.start(name, kind, agent, **attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end(span, error)
+
+    def close(self) -> None:
+        for exporter in self.exporters:
+            close = getattr(exporter, "close", None)
+            if close is not None:
+                close()
+
+
+_tracer: Tracer | None = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer from ``TRACING``, ``TRACE_FILE`` and ``TRACE_PROMETHEUS_PORT``."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                enabled = os.getenv("TRACING", "on").lower() != "off"
+                exporters = []
+                if enabled:
+                    path = os.getenv("TRACE_FILE", os.path.join("sessions", "traces.jsonl"))
+                    if path:
+                        exporters.append(JsonlExporter(path))
+                    port = os.getenv("TRACE_PROMETHEUS_PORT")
+                    if port:
+                        prometheus = PrometheusExporter()
+                        prometheus.serve(int(port))
+                        exporters.append(prometheus)
+                _tracer = Tracer(exporters, enabled=enabled and bool(exporters))
+    return _tracer
+
+
+def trace_turn(handler):
+    """Wrap a Chainlit ``on_message`` handler in a ``turn`` span."""
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        with get_tracer().span("turn", "turn"):
+            return await handler(*args, **kwargs)
+
+    return wrapper
+
+
+def annotate_turn(agent: str | None = None, stream=None, **attributes) -> None:
+    """Record the route/agent of the current turn, or its ``TokenCoalescer`` timings."""
+    span = current_span()
+    if span is None:
+        return
+    if agent is not None:
+        span.agent = agent
+    if stream is not None:
+        if stream.first_token_at is not None:
+            span.first_token(stream.first_token_at)
+        attributes.update(ui_seconds=round(stream.send_seconds, 6), frames=stream.frames)
+    span.set(**attributes)
+
+
+async def trace_function_invocation(context: FunctionInvocationContext, next) -> None:
+    """Kernel filter: one span per kernel function call (specialist agents and tools)."""
+    plugin = context.function.plugin_name
+    is_agent = plugin == context.function.name  # Agents are added as a plugin named after themselves
+    name = plugin if is_agent else f"{plugin}-{context.function.name}"
+    with get_tracer().span(name, "agent" if is_agent else "tool", agent=plugin if is_agent else None):
+        await next(context)
+
+
+class TracedChatCompletion(OpenAIChatCompletion):
+    """``OpenAIChatCompletion`` that records a ``completion`` span per request."""
+
+    async def _inner_get_chat_message_contents(self, chat_history, settings):
+        tracer = get_tracer()
+        span = tracer.start("chat.completions", "completion", model=self.ai_model_id, stream=False)
+        error = None
+        try:
+            contents = await super()._inner_get_chat_message_contents(chat_history, settings)
+            span.first_token()
+            for content in contents[:1]:
+                span.add_usage(content.metadata.get("usage"))
+            return contents
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            tracer.end(span, error)
+
+    async def _inner_get_streaming_chat_message_contents(
+        self, chat_history, settings, function_invoke_attempt: int = 0
+    ) -> AsyncGenerator[list, Any]:
+        tracer = get_tracer()
+        span = tracer.start("chat.completions", "completion", model=self.ai_model_id, stream=True)
+        error = None
+        try:
+            async for messages in super()._inner_get_streaming_chat_message_contents(
+                chat_history, settings, function_invoke_attempt
+            ):
+                for message in messages[:1]:
+                    if message.content or any(isinstance(item, FunctionCallContent) for item in message.items):
+                        span.first_token()
+                    usage = message.metadata.get("usage")
+                    if usage is not None:
+                        span.add_usage(usage)
+                yield messages
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            tracer.end(span, error)
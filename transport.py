@@ -0,0 +1,339 @@
+# author: Jairo Monassa
+"""Shared, pooled HTTP transport for every model call.
+
+One ``httpx`` client per process (async for the Chainlit apps, sync for the
+``agent_planning.py`` CLI) so TCP/TLS connections are kept alive and reused
+across students instead of being opened per session. The pool is bounded,
+optionally speaks HTTP/2 (needs the ``h2`` package) and enforces a per-host
+concurrency limit. ``pool_stats()`` exposes pool occupancy.
+
+Settings come from environment variables (see ``TransportConfig.from_env``).
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TransportConfig:
+    """Connection pool settings shared by the async and sync clients."""
+
+    max_connections: int = 64
+    max_keepalive_connections: int = 64
+    keepalive_expiry: float = 60.0
+    per_host_limit: int = 50
+    connections_per_shard: int = 8
+    http2: bool = False
+    connect_timeout: float = 10.0
+    read_timeout: float = 120.0
+
+    @classmethod
+    def from_env(cls) -> "TransportConfig":
+        """Read the settings from ``MODEL_HTTP_*`` environment variables."""
+        return cls(
+            max_connections=int(os.getenv("MODEL_HTTP_MAX_CONNECTIONS", cls.max_connections)),
+            max_keepalive_connections=int(os.getenv("MODEL_HTTP_MAX_KEEPALIVE", cls.max_keepalive_connections)),
+            keepalive_expiry=float(os.getenv("MODEL_HTTP_KEEPALIVE_EXPIRY", cls.keepalive_expiry)),
+            per_host_limit=int(os.getenv("MODEL_HTTP_PER_HOST_LIMIT", cls.per_host_limit)),
+            connections_per_shard=int(os.getenv("MODEL_HTTP_CONNECTIONS_PER_SHARD", cls.connections_per_shard)),
+            http2=os.getenv("MODEL_HTTP_HTTP2", "false").lower() in ("1", "true", "yes"),
+            connect_timeout=float(os.getenv("MODEL_HTTP_CONNECT_TIMEOUT", cls.connect_timeout)),
+            read_timeout=float(os.getenv("MODEL_HTTP_READ_TIMEOUT", cls.read_timeout)),
+        )
+
+    @property
+    def shards(self) -> int:
+        return max(1, -(-self.max_connections // self.connections_per_shard))
+
+    @property
+    def shard_limits(self) -> httpx.Limits:
+        """Limits of one pool shard; the shards together honour the global bounds."""
+        return httpx.Limits(
+            max_connections=-(-self.max_connections // self.shards),
+            max_keepalive_connections=-(-self.max_keepalive_connections // self.shards),
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def http2_enabled(self) -> bool:
+        """HTTP/2 is only used when requested and the ``h2`` package is installed."""
+        if not self.http2:
+            return False
+        if importlib.util.find_spec("h2") is None:
+            logger.warning("MODEL_HTTP_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1.")
+            return False
+        return True
+
+
+class PoolMetrics:
+    """Counters for requests in flight, waiting on a host slot and completed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = defaultdict(int)
+        self.waiting = defaultdict(int)
+        self.completed = defaultdict(int)
+
+    def add(self, counter: dict, host: str, delta: int) -> None:
+        with self._lock:
+            counter[host] += delta
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            hosts = set(self.in_flight) | set(self.waiting) | set(self.completed)
+            return {
+                host: {
+                    "in_flight": self.in_flight[host],
+                    "waiting": self.waiting[host],
+                    "completed": self.completed[host],
+                }
+                for host in sorted(hosts)
+            }
+
+
+def _connection_stats(shards: list) -> dict:
+    # httpx does not expose its httpcore pool publicly; read it defensively
+    connections = []
+    for transport in shards:
+        pool = getattr(transport, "_pool", None)
+        connections.extend(getattr(pool, "connections", []) or [])
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {"shards": len(shards), "open": len(connections), "idle": idle, "active": len(connections) - idle}
+
+
+class _Shards:
+    """Small independent connection pools picked by least in-flight requests.
+
+    httpcore re-scans every connection of a pool against every queued request
+    on each assignment, which gets expensive with dozens of concurrent streams
+    in one pool; several small pools keep that scan short.
+    """
+
+    def __init__(self, transports: list):
+        self.transports = transports
+        self.load = [0] * len(transports)
+
+    def pick(self) -> int:
+        return min(range(len(self.load)), key=self.load.__getitem__)
+
+
+class _ReleasingAsyncStream(httpx.AsyncByteStream):
+    """Releases the per-host slot once the (streamed) response body is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class _ReleasingSyncStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class PooledAsyncTransport(httpx.AsyncBaseTransport):
+    """``httpx.AsyncHTTPTransport`` with a per-host concurrency limit and metrics."""
+
+    def __init__(self, config: TransportConfig, metrics: PoolMetrics | None = None):
+        self.config = config
+        self.metrics = metrics or PoolMetrics()
+        http2 = config.http2_enabled()
+        self._shards = _Shards([
+            httpx.AsyncHTTPTransport(limits=config.shard_limits, http2=http2) for _ in range(config.shards)
+        ])
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        slots = self._host_slots.get(host)
+        if slots is None:
+            slots = self._host_slots[host] = asyncio.Semaphore(self.config.per_host_limit)
+        self.metrics.add(self.metrics.waiting, host, 1)
+        try:
+            await slots.acquire()
+        finally:
+            self.metrics.add(self.metrics.waiting, host, -1)
+        self.metrics.add(self.metrics.in_flight, host, 1)
+        shard = self._shards.pick()
+        self._shards.load[shard] += 1
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                slots.release()
+                self._shards.load[shard] -= 1
+                self.metrics.add(self.metrics.in_flight, host, -1)
+                self.metrics.add(self.metrics.completed, host, 1)
+
+        try:
+            response = await self._shards.transports[shard].handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _ReleasingAsyncStream(response.stream, release)
+        return response
+
+    def connection_stats(self) -> dict:
+        return _connection_stats(self._shards.transports)
+
+    async def aclose(self) -> None:
+        for transport in self._shards.transports:
+            await transport.aclose()
+
+
+class PooledTransport(httpx.BaseTransport):
+    """Sync counterpart of ``PooledAsyncTransport`` for the CLI."""
+
+    def __init__(self, config: TransportConfig, metrics: PoolMetrics | None = None):
+        self.config = config
+        self.metrics = metrics or PoolMetrics()
+        http2 = config.http2_enabled()
+        self._shards = _Shards([
+            httpx.HTTPTransport(limits=config.shard_limits, http2=http2) for _ in range(config.shards)
+        ])
+        self._host_slots: dict[str, threading.BoundedSemaphore] = {}
+        self._slots_lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        with self._slots_lock:
+            slots = self._host_slots.get(host)
+            if slots is None:
+                slots = self._host_slots[host] = threading.BoundedSemaphore(self.config.per_host_limit)
+        self.metrics.add(self.metrics.waiting, host, 1)
+        try:
+            slots.acquire()
+        finally:
+            self.metrics.add(self.metrics.waiting, host, -1)
+        self.metrics.add(self.metrics.in_flight, host, 1)
+        with self._slots_lock:
+            shard = self._shards.pick()
+            self._shards.load[shard] += 1
+
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                slots.release()
+                with self._slots_lock:
+                    self._shards.load[shard] -= 1
+                self.metrics.add(self.metrics.in_flight, host, -1)
+                self.metrics.add(self.metrics.completed, host, 1)
+
+        try:
+            response = self._shards.transports[shard].handle_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _ReleasingSyncStream(response.stream, release)
+        return response
+
+    def connection_stats(self) -> dict:
+        return _connection_stats(self._shards.transports)
+
+    def close(self) -> None:
+        for transport in self._shards.transports:
+            transport.close()
+
+
+# --- Process-wide clients ---
+_config: TransportConfig | None = None
+_metrics = PoolMetrics()
+_async_transport: PooledAsyncTransport | None = None
+_sync_transport: PooledTransport | None = None
+_async_http_client: httpx.AsyncClient | None = None
+_sync_http_client: httpx.Client | None = None
+_lock = threading.Lock()
+
+
+def configure(config: TransportConfig) -> None:
+    """Override the environment settings; must be called before the first client is created."""
+    global _config
+    if _async_http_client is not None or _sync_http_client is not None:
+        raise RuntimeError("The shared HTTP clients already exist; call configure() at startup.")
+    _config = config
+
+
+def get_config() -> TransportConfig:
+    global _config
+    if _config is None:
+        _config = TransportConfig.from_env()
+    return _config
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the shared async httpx client used by every AsyncOpenAI client."""
+    global _async_http_client, _async_transport
+    with _lock:
+        if _async_http_client is None:
+            config = get_config()
+            _async_transport = PooledAsyncTransport(config, _metrics)
+            _async_http_client = httpx.AsyncClient(transport=_async_transport, timeout=config.timeout)
+    return _async_http_client
+
+
+def get_sync_http_client() -> httpx.Client:
+    """Return the shared sync httpx client used by the CLI."""
+    global _sync_http_client, _sync_transport
+    with _lock:
+        if _sync_http_client is None:
+            config = get_config()
+            _sync_transport = PooledTransport(config, _metrics)
+            _sync_http_client = httpx.Client(transport=_sync_transport, timeout=config.timeout)
+    return _sync_http_client
+
+
+def async_openai_client(base_url: str, api_key: str | None, **kwargs) -> AsyncOpenAI:
+    """AsyncOpenAI client on the shared connection pool."""
+    return AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=get_async_http_client(), **kwargs)
+
+
+def openai_client(base_url: str, api_key: str | None, **kwargs) -> OpenAI:
+    """Sync OpenAI client on the shared connection pool."""
+    return OpenAI(base_url=base_url, api_key=api_key, http_client=get_sync_http_client(), **kwargs)
+
+
+def pool_stats() -> dict:
+    """Pool occupancy: per-host request counters plus open/idle/active connections."""
+    stats = {"hosts": _metrics.snapshot()}
+    if _async_transport is not None:
+        stats["async_connections"] = _async_transport.connection_stats()
+    if _sync_transport is not None:
+        stats["sync_connections"] = _sync_transport.connection_stats()
+    return stats
@@ -0,0 +1,212 @@
+# author: Jairo Monassa
+"""One turn at a time per student: a new message or a disconnect cancels the turn in flight.
+
+Chainlit runs every message in a task of its own, so a follow-up sent while
+``agent.invoke_stream`` was still streaming a long study plan started a
+second turn next to the first one: both kept spending quota and wrote into
+the same thread, and a closed tab let the answer run to its end for nobody.
+``TurnManager.exclusive`` wraps ``on_message``: a new message of the same
+student cancels the turn in flight (its model streams, nested specialist and
+plugin calls, and the tasks linked to it such as the screening prompts) and
+waits for it to unwind before the new turn starts; ``cancel`` does the same
+from ``on_chat_end``. The Stop button of the UI cancels the turn too.
+
+Only completed turns are committed: ``Turn.guard`` checkpoints the history
+when the turn starts and a turn that ends before ``Turn.commit`` puts it
+back, so a half-streamed answer or a tool call without its result never
+reaches the next prompt or the thread store.
+
+The answer tokens a cancelled turn did not generate are estimated from the
+recent answers of its agent, and reported on the turn span (``cancelled``,
+``tokens_saved``) and in ``TurnManager.stats``.
+
+Settings: ``TURN_CANCEL`` ("on"/"off"; off lets a student's turns overlap as
+before, only the Stop button cancels).
+"""
+
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable
+
+from conversation_memory import ConversationMemory
+from stream_buffer import TokenCoalescer
+from tracing import annotate_turn
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class Turn:
+    """One ``on_message`` of a student, as the task that runs it."""
+
+    key: str
+    task: asyncio.Task
+    agent: str | None = None
+    reason: str | None = None  # why it was cancelled: "message", "disconnect" or "stop"
+    committed: bool = False
+    stream: TokenCoalescer | None = None
+    _linked: set = field(default_factory=set)
+    _checkpoints: list = field(default_factory=list)
+
+    @property
+    def tokens(self) -> int:
+        """Answer tokens streamed to the student so far."""
+        return self.stream.tokens if self.stream is not None else 0
+
+    def link(self, task: asyncio.Task) -> asyncio.Task:
+        """Cancel ``task`` together with the turn (e.g. the screening prompts)."""
+        self._linked.add(task)
+        task.add_done_callback(self._linked.discard)
+        return task
+
+    def guard(self, memory: ConversationMemory) -> None:
+        """Checkpoint ``memory``; it is restored unless the turn commits."""
+        self._checkpoints.append((memory, list(memory.messages)))
+
+    def watch(self, stream: TokenCoalescer, agent: str) -> None:
+        """The stream of the answer and the agent writing it."""
+        self.stream = stream
+        self.agent = agent
+
+    def commit(self) -> None:
+        """The answer is complete: keep what the turn added to the history."""
+        self.committed = True
+
+    def cancel(self, reason: str) -> None:
+        if not self.task.done():
+            self.reason = self.reason or reason
+            self.task.cancel()
+
+    def _rollback(self) -> None:
+        for memory, messages in reversed(self._checkpoints):
+            memory.messages = messages
+
+
+_current_turn: ContextVar[Turn | None] = ContextVar("current_turn", default=None)
+
+
+def current_turn() -> Turn | None:
+    return _current_turn.get()
+
+
+@dataclass
+class TurnStats:
+    started: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: Counter = field(default_factory=Counter)
+    tokens_streamed: int = 0  # answer tokens the cancelled turns had already streamed
+    tokens_saved: int = 0  # estimated answer tokens they did not generate
+
+    def as_dict(self) -> dict:
+        return {
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": dict(self.cancelled),
+            "tokens_streamed": self.tokens_streamed,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+class TurnManager:
+    """Runs each student's turns one at a time, cancelling the one in flight.
+
+    Args:
+        key: Returns the student of the current Chainlit context (the thread id).
+        enabled: Cancel a turn in flight on a new message or a disconnect.
+        history: Completed answers per agent kept to estimate the tokens saved.
+    """
+
+    def __init__(self, key: Callable[[], str], enabled: bool = True, history: int = 200):
+        self.key = key
+        self.enabled = enabled
+        self.stats = TurnStats()
+        self._turns: dict[str, list[Turn]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._answers: dict[str, deque[int]] = defaultdict(lambda: deque(maxlen=history))
+
+    def exclusive(self, handler):
+        """Wrap a Chainlit ``on_message`` handler so a student has one turn in flight."""
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            key = self.key()
+            turn = Turn(key, asyncio.current_task())
+            turns = self._turns.setdefault(key, [])
+            if self.enabled:
+                for other in turns:
+                    other.cancel("message")
+            # The cancelled turn unwinds (and rolls back) before this one reads the thread
+            lock = self._locks.setdefault(key, asyncio.Lock()) if self.enabled else contextlib.nullcontext()
+            turns.append(turn)
+            self.stats.started += 1
+            token = _current_turn.set(turn)
+            try:
+                async with lock:
+                    result = await handler(*args, **kwargs)
+                self._completed(turn)
+                return result
+            except asyncio.CancelledError:
+                if turn.committed:
+                    self._completed(turn)
+                else:
+                    self._cancelled(turn)
+                raise
+            except BaseException:
+                self.stats.failed += 1
+                if not turn.committed:
+                    turn._rollback()
+                raise
+            finally:
+                _current_turn.reset(token)
+                turns.remove(turn)
+                if not turns:
+                    del self._turns[key]
+                    self._locks.pop(key, None)
+
+        return wrapper
+
+    def cancel(self, key: str, reason: str = "disconnect") -> int:
+        """Cancel the turns in flight of ``key``; returns how many there were."""
+        if not self.enabled:
+            return 0
+        turns = self._turns.get(key, [])
+        for turn in turns:
+            turn.cancel(reason)
+        return len(turns)
+
+    def expected_tokens(self, agent: str | None) -> int:
+        """Average answer of ``agent`` (of any agent when it has none yet)."""
+        answers = self._answers.get(agent) if agent is not None else None
+        if not answers:
+            answers = [tokens for agent_answers in self._answers.values() for tokens in agent_answers]
+        return round(sum(answers) / len(answers)) if answers else 0
+
+    def _completed(self, turn: Turn) -> None:
+        self.stats.completed += 1
+        if turn.agent is not None and turn.stream is not None:
+            self._answers[turn.agent].append(turn.tokens)
+
+    def _cancelled(self, turn: Turn) -> None:
+        for task in list(turn._linked):
+            task.cancel()
+        turn._rollback()
+        reason = turn.reason or "stop"
+        saved = max(0, self.expected_tokens(turn.agent) - turn.tokens)
+        self.stats.cancelled[reason] += 1
+        self.stats.tokens_streamed += turn.tokens
+        self.stats.tokens_saved += saved
+        annotate_turn(cancelled=reason, tokens_saved=saved)
+        logger.info("Turn of %s cancelled (%s) after %d answer tokens, ~%d saved", turn.key, reason, turn.tokens, saved)
+
+
+def build_turn_manager(key: Callable[[], str]) -> TurnManager:
+    """Turn manager from ``TURN_CANCEL``."""
+    return TurnManager(key, enabled=os.getenv("TURN_CANCEL", "on").lower() != "off")
@@ -0,0 +1,204 @@
+# author: Jairo Monassa
+"""Concurrent wellbeing screening of each student message.
+
+The bullying, self-harm, burnout and conflict specialists were only reached
+when Main_Tutor_Agent happened to forward to them, one at a time.
+``WellbeingScreener.screen()`` sends the message to four short screening
+prompts at once (``asyncio.gather``, each under its own timeout) and merges
+the answers into one ``RiskAssessment``. The whole screening therefore costs
+one round-trip of wall-clock time instead of four.
+
+A screening that times out or answers garbage counts as "unknown" and never
+blocks the turn. The answer waits for the screening at most ``WELLBEING_WAIT``
+seconds (``await_screening``), not the whole ``WELLBEING_TIMEOUT``: a screening
+still running by then no longer delays the first token, and only a high risk
+it finds afterwards is acted on, by the specialist right after the answer.
+The screening note is for the turn it was made for; ``forget_screening``
+drops it from the thread afterwards.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+from semantic_kernel.contents import ChatHistory, ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+
+from agent_registry import (
+    BULLYING_AGENT_NAME,
+    BURNOUT_AGENT_NAME,
+    CONFLICTS_AGENT_NAME,
+    SELF_HARM_PREVENTION_AGENT_NAME,
+)
+from tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+RISK_LEVELS = ["none", "low", "medium", "high"]
+SCREENING_METADATA_KEY = "__screening__"
+
+SCREENING_FORMAT = (
+    ' Reply only with JSON: {"risk": "none" | "low" | "medium" | "high", "evidence": "<at most 15 words>"}.'
+)
+SCREENING_PROMPTS = {
+    BULLYING_AGENT_NAME: "You screen a student's message for signs that they are a victim of bullying." + SCREENING_FORMAT,
+    SELF_HARM_PREVENTION_AGENT_NAME: (
+        "You screen a student's message for signs of suicidal thoughts, self-harm or hopelessness." + SCREENING_FORMAT
+    ),
+    BURNOUT_AGENT_NAME: (
+        "You screen a student's message for signs of burnout: physical or mental exhaustion, "
+        "overload, no rest." + SCREENING_FORMAT
+    ),
+    CONFLICTS_AGENT_NAME: (
+        "You screen a student's message for signs of a personal conflict with a teacher or "
+        "within the family." + SCREENING_FORMAT
+    ),
+}
+
+
+@dataclass
+class ScreeningResult:
+    agent_name: str
+    risk: str  # one of RISK_LEVELS, or "unknown" (timeout / unreadable answer)
+    evidence: str = ""
+    seconds: float = 0.0
+
+
+@dataclass
+class RiskAssessment:
+    level: str
+    results: list[ScreeningResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def flagged(self) -> list[ScreeningResult]:
+        """Areas at "medium" or above, most severe first."""
+        hits = [r for r in self.results if r.risk in RISK_LEVELS and RISK_LEVELS.index(r.risk) >= 2]
+        return sorted(hits, key=lambda r: RISK_LEVELS.index(r.risk), reverse=True)
+
+    @property
+    def escalate_to(self) -> str | None:
+        """The specialist to hand the turn to directly when a risk is high."""
+        flagged = self.flagged
+        return flagged[0].agent_name if flagged and flagged[0].risk == "high" else None
+
+    def note(self) -> ChatMessageContent | None:
+        """System note for the agent answering this turn, or None when nothing was flagged."""
+        flagged = self.flagged
+        if not flagged:
+            return None
+        signals = "; ".join(f"{r.agent_name}: {r.risk} ({r.evidence})" for r in flagged)
+        return ChatMessageContent(
+            role=AuthorRole.SYSTEM,
+            content=(
+                f"Wellbeing screening of the student's last message: {signals}. "
+                "Take this into account and forward to the matching agent if appropriate."
+            ),
+            metadata={SCREENING_METADATA_KEY: True},
+        )
+
+
+class WellbeingScreener:
+    """Runs the screening prompts concurrently on one chat completion service.
+
+    Args:
+        service: The chat completion service of the agent registry.
+        timeout: Seconds each screening may take before it counts as "unknown".
+        prompts: Agent name -> screening instructions.
+    """
+
+    def __init__(self, service, timeout: float = 4.0, prompts: dict[str, str] | None = None):
+        self.service = service
+        self.timeout = timeout
+        self.prompts = prompts or SCREENING_PROMPTS
+        self.timeouts = 0
+
+    async def screen(self, message: str) -> RiskAssessment:
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(self._screen_one(name, prompt, message) for name, prompt in self.prompts.items()))
+        return _assess(list(results), time.perf_counter() - t0)
+
+    async def screen_sequentially(self, message: str) -> RiskAssessment:
+        """Same prompts one after the other, like chained delegation (for benchmarks)."""
+        t0 = time.perf_counter()
+        results = [await self._screen_one(name, prompt, message) for name, prompt in self.prompts.items()]
+        return _assess(results, time.perf_counter() - t0)
+
+    async def _screen_one(self, agent_name: str, prompt: str, message: str) -> ScreeningResult:
+        t0 = time.perf_counter()
+        history = ChatHistory(system_message=prompt)
+        history.add_user_message(message)
+        settings = self.service.get_prompt_execution_settings_class()(
+            max_tokens=60, temperature=0, response_format={"type": "json_object"}
+        )
+        try:
+            with get_tracer().span(f"screening.{agent_name}", "screening", agent=agent_name):
+                response = await asyncio.wait_for(
+                    self.service.get_chat_message_content(chat_history=history, settings=settings), self.timeout
+                )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return ScreeningResult(agent_name, "unknown", "timed out", time.perf_counter() - t0)
+        except Exception as e:
+            logger.warning(f"Screening {agent_name} failed: {e}")
+            return ScreeningResult(agent_name, "unknown", "failed", time.perf_counter() - t0)
+        return ScreeningResult(agent_name, *_parse(response.content if response else ""), time.perf_counter() - t0)
+
+
+def _assess(results: list[ScreeningResult], seconds: float) -> RiskAssessment:
+    known = [r.risk for r in results if r.risk in RISK_LEVELS]
+    level = max(known, key=RISK_LEVELS.index) if known else "unknown"
+    return RiskAssessment(level=level, results=results, seconds=seconds)
+
+
+def _parse(content: str) -> tuple[str, str]:
+    try:
+        data = json.loads(content)
+        risk = str(data.get("risk", "")).lower()
+        return (risk if risk in RISK_LEVELS else "unknown"), str(data.get("evidence", ""))[:200]
+    except (ValueError, AttributeError):
+        return "unknown", ""
+
+
+_screeners: dict[int, WellbeingScreener] = {}
+
+
+def get_screener(service) -> WellbeingScreener | None:
+    """Shared screener for ``service``, from ``WELLBEING_SCREENING`` ("on"/"off") and ``WELLBEING_TIMEOUT``."""
+    if os.getenv("WELLBEING_SCREENING", "on").lower() == "off":
+        return None
+    screener = _screeners.get(id(service))
+    if screener is None:
+        screener = _screeners[id(service)] = WellbeingScreener(
+            service, timeout=float(os.getenv("WELLBEING_TIMEOUT", 4.0))
+        )
+    return screener
+
+
+def screening_wait() -> float:
+    """Seconds the answer waits for the screening before it starts, from ``WELLBEING_WAIT``."""
+    return float(os.getenv("WELLBEING_WAIT", 1.0))
+
+
+def start_screening(service, message: str) -> asyncio.Task:
+    """Start screening ``message`` in the background; the task returns None when screening is off."""
+    screener = get_screener(service)
+
+    async def run() -> RiskAssessment | None:
+        return await screener.screen(message) if screener is not None else None
+
+    return asyncio.create_task(run())
+
+
+async def await_screening(screening: asyncio.Task, wait: float) -> tuple[RiskAssessment | None, asyncio.Task | None]:
+    """The assessment if ``screening`` finishes within ``wait`` seconds, else (None, the still running task)."""
+    done, _ = await asyncio.wait({screening}, timeout=wait)
+    return (screening.result(), None) if done else (None, screening)
+
+
+def forget_screening(memory: ChatHistory) -> None:
+    """Drop the screening notes from the thread once the turn is answered."""
+    memory.messages = [m for m in memory.messages if not (m.metadata or {}).get(SCREENING_METADATA_KEY)]